@@ -24,6 +24,7 @@ import csv
 from spambayes.Options import options
 from spambayes.tokenizer import tokenize
 from spambayes.storage import database_type, open_storage
+from spambayes.tokenindex import find_words
 
 prog = sys.argv[0]
 
@@ -35,12 +36,13 @@ def usage(msg=None):
 def print_spamcounts(tokens, db, use_re):
     if use_re:
         s = sets.Set()
-        keys = db._wordinfokeys()
         for pat in tokens:
-            for k in keys:
-                if re.search(pat, k) is not None:
-                    s.add(k)
+            # Patterns anchored with ^ only look at the words with the
+            # right prefix.
+            for k in find_words(db, re.compile(pat), search=True):
+                s.add(k)
         tokens = list(s)
+        tokens.sort()
 
     writer = csv.writer(sys.stdout)
     writer.writerow(("token", "nspam", "nham", "spam prob"))
@@ -50,7 +52,12 @@ def print_spamcounts(tokens, db, use_re):
             continue
         seen.add(t)
 
-        sc, hc = db._wordinfoget(t).__getstate__()
+        record = db._wordinfoget(t)
+        if record is None:
+            # Not in the database (or removed by another process since
+            # the word index was made).
+            continue
+        sc, hc = record.__getstate__()
         if sc == hc == 0:
             continue
 
@@ -32,10 +32,24 @@
 # sb_bnserver will close itself and remove its socket after a period of
 # inactivity to ensure it does not use up resources indefinitely.
 #
+# With --batch, the messages in one or more mailboxes are all sent over
+# one connection:
+#
+# * write a line containing BATCH to the socket
+# * meanwhile, in a separate thread, for each message:
+#     * write a line containing the filtering/training command line options
+#     * write a line containing the size of the message, and the message
+# * shutdown the sending side of the socket once all are sent
+# * for each message, read the response as above (a line containing the
+#   success/failure code, a line containing the byte count, and that
+#   many bytes), and write it to stdout (as a Unix mailbox, if filtering)
+#   or stderr
+#
 # Author: Toby Dickenson
 #
 
 """Usage: %(program)s [options]
+   or: %(program)s [options] --batch [MAILBOX ...]
 
 Where:
     -h
@@ -61,6 +75,13 @@ Where:
         Unix domain socket used to communicate with a short-lived server
         process. Default is ~/.sbbnsock-<hostname>
 
+    --batch
+        process every message in each MAILBOX (a Unix mailbox file or a
+        Maildir, or if there are none, a Unix mailbox on stdin) rather
+        than a single message on stdin, through a single connection to
+        the server.  When filtering, the results are written to stdout
+        as a Unix mailbox.
+
     These options will not take effect when connecting to a preloaded server:
 
     -p FILE
@@ -74,10 +95,13 @@ Where:
         timeout in seconds between requests before this server terminates
     -A number
         terminate this server after this many requests
+    -w number
+        handle this many requests at once, in separate worker processes
+        (only with a pickle as the persistent store)
 
 """
 
-import sys, getopt, socket, errno, os, time
+import sys, getopt, socket, errno, os, time, threading
 
 def usage(code, msg=''):
     """Print usage message and sys.exit(code)."""
@@ -89,7 +113,8 @@ def usage(code, msg=''):
         
 def main():
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hfgstGSd:p:o:a:A:k:')
+        opts, args = getopt.getopt(sys.argv[1:], 'hfgstGSd:p:o:a:A:w:k:',
+                                   ['batch'])
     except getopt.error, msg:
         usage(2, msg)
 
@@ -98,22 +123,27 @@ def main():
     
     action_options = []
     server_options = []
+    batch = False
     for opt, arg in opts:
         if opt == '-h':
             usage(0)
+        elif opt == '--batch':
+            batch = True
         elif opt in ('-f', '-g', '-s', '-t', '-G', '-S'):
             action_options.append(opt)
-        elif opt in ('-d', '-p', '-o', '-a', '-A'):
+        elif opt in ('-d', '-p', '-o', '-a', '-A', '-w'):
             server_options.append(opt)
             server_options.append(arg)
         elif opt == '-k':
             filename = arg
 
-    if args:
+    if args and not batch:
         usage(2)
         
     server_options.append(filename)
     s = make_socket(server_options, filename)
+    if batch:
+        sys.exit(send_batch(s, action_options, args or ['-']))
         
     # We have a connection to the existing shared server
     w_file = s.makefile('w')
@@ -157,6 +187,81 @@ def main():
     if error:
         sys.exit(error)
 
+def send_batch(s, action_options, names):
+    switches = ' '.join(action_options)
+    filtering = not action_options or '-f' in action_options or \
+                '-t' in action_options
+    w_file = s.makefile('wb')
+    r_file = s.makefile('rb')
+    w_file.write('BATCH\n')
+    # Send the messages in a separate thread, so that the responses can
+    # be read as they arrive; otherwise, once the responses had filled
+    # the socket's buffers, neither end could carry on.
+    sent = [0]
+    failure = []
+    def send():
+        try:
+            try:
+                for name in names:
+                    for message in raw_messages(name):
+                        w_file.write('%s\n%d\n%s' % (switches, len(message),
+                                                      message))
+                        sent[0] += 1
+                w_file.flush()
+            except:
+                failure.append(sys.exc_info())
+        finally:
+            s.shutdown(1)
+    sender = threading.Thread(target=send)
+    sender.start()
+
+    received = 0
+    errors = 0
+    while 1:
+        error = r_file.readline()
+        if not error:
+            break
+        expected_size = int(r_file.readline())
+        response = r_file.read(expected_size)
+        if len(response) != expected_size:
+            print >> sys.stderr, 'size mismatch %d != %d' % \
+                  (len(response), expected_size)
+            return 3
+        received += 1
+        if int(error):
+            errors += 1
+            sys.stderr.write('message %d: %s' % (received, response))
+        elif filtering:
+            if not response.startswith('From '):
+                sys.stdout.write('From sb_bnfilter %s\n' % (time.ctime(),))
+            sys.stdout.write(response)
+            if not response.endswith('\n'):
+                sys.stdout.write('\n')
+            sys.stdout.write('\n')
+    sys.stdout.flush()
+    sender.join()
+    if failure:
+        raise failure[0][0], failure[0][1], failure[0][2]
+    if received != sent[0]:
+        print >> sys.stderr, 'sent %d messages, but got %d responses' % \
+              (sent[0], received)
+        return 3
+    return errors and 1
+
+def raw_messages(name):
+    """Generate the text of each message in the named mailbox."""
+    import mailbox
+    def read(fp):
+        return fp.read()
+    if name == '-':
+        mbox = mailbox.PortableUnixMailbox(sys.stdin, read)
+    elif os.path.isdir(name):
+        mbox = mailbox.Maildir(name, read)
+    else:
+        mbox = mailbox.PortableUnixMailbox(open(name, 'rb'), read)
+    for message in mbox:
+        yield message
+
 def make_socket(server_options, filename):
     refused_count = 0
     no_server_count = 0
@@ -23,8 +23,27 @@ Where:
         timeout in seconds between requests before this server terminates
     -A number
         terminate this server after this many requests
+    -w number
+        handle requests in this many worker processes at once.  Each
+        worker terminates after -a seconds without a request or after
+        -A requests, and the server when they all have.  Only with a
+        pickle as the persistent store; with a database, requests are
+        handled in one process.
     FILE
         unix domain socket used on which we listen    
+
+With -w, the pickle is loaded before the workers are forked, so that
+they share one copy of it.  Requests that only filter are handled by the
+workers; requests that train (including filtering with the [Hammie]
+train_on_filter option) are passed on to the original process, which
+handles them one at a time, and stores the pickle after each.  Each
+worker reloads the pickle the next time it filters a message after it
+has been stored.  (A dbm or bsddb database can't safely be read by one
+process while another writes to it, so -w is ignored for those.)
+
+A connection normally carries one request.  sb_bnfilter --batch sends
+any number of them over one connection instead, without waiting for
+each response before sending the next request.
 """
 
 import os, getopt, sys, SocketServer, traceback, select, socket, errno
@@ -45,7 +64,7 @@ def usage(code, msg=''):
 def main():
     """Main program; parse options and go."""
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hd:p:o:a:A:')
+        opts, args = getopt.getopt(sys.argv[1:], 'hd:p:o:a:A:w:')
     except getopt.error, msg:
         usage(2, msg)
 
@@ -65,6 +84,7 @@ def main():
         try:
             from spambayes import Options, storage
             options = Options.options
+            workers = 1
         
             for opt, arg in opts:
                 if opt == '-h':
@@ -75,10 +95,19 @@ def main():
                     server.timeout = float(arg)
                 elif opt == '-A':
                     server.number = int(arg)
+                elif opt == '-w':
+                    workers = int(arg)
             h = make_HammieFilter()
             h.dbname, h.usedb = storage.database_type(opts)
             server.hammie = h
-            server.serve_until_idle()
+            if workers > 1 and h.usedb != "pickle":
+                print >> sys.stderr, "-w needs a pickle as the " \
+                      "persistent store; using one process"
+                workers = 1
+            if workers > 1:
+                serve_workers(server, workers)
+            else:
+                server.serve_until_idle()
             h.close()
         finally:
             try:
@@ -93,6 +122,10 @@ class BNServer(SocketServer.UnixStreamServer):
     allow_reuse_address = True
     timeout = 10.0
     number = 100
+    # In a worker process, the socket to the process that trains, and
+    # the database file's details when it was (re)opened.
+    writer = None
+    db_stamp = None
 
     def serve_until_idle(self):
         try:
@@ -104,49 +137,213 @@ class BNServer(SocketServer.UnixStreamServer):
     def get_request(self):
         r, w, e = select.select([self.socket], [], [], self.timeout)
         if r:
-            return self.socket.accept()
+            try:
+                return self.socket.accept()
+            except socket.timeout:
+                # With several workers, another one got there first, and
+                # nothing else has arrived since.
+                raise NowIdle()
         else:
             raise NowIdle()
-        
-class BNRequest(SocketServer.StreamRequestHandler):
-    def handle(self):
-        switches = self.rfile.readline()
-        body = self.rfile.read()
+
+    def handle_timeout(self):
+        # Python 2.6 and later wait for a request in handle_request(),
+        # rather than leaving it all to get_request().
+        raise NowIdle()
+
+    def respond(self, switches, body):
+        """Returns the response to a request, status and size included."""
+        if self.writer is not None:
+            if is_training(switches):
+                return self.writer.forward(switches, body)
+            self.refresh()
         try:
-            response = self._calc_response(switches, body)
-            self.wfile.write('0\n%d\n'%(len(response),))
-            self.wfile.write(response)
+            response = calc_response(self.hammie, switches, body)
+            return '0\n%d\n%s' % (len(response), response)
         except:
             response = traceback.format_exception_only(sys.exc_info()[0],
                                                        sys.exc_info()[1])[0]
-            self.wfile.write('1\n%d\n'%(len(response),))
-            self.wfile.write(response)
-       
-    def _calc_response(self, switches, body):
-        switches = switches.split()
-        actions = []
-        opts, args = getopt.getopt(switches, 'fgstGS')
-        h = self.server.hammie
-        for opt, arg in opts:
-            if opt == '-f':
-                actions.append(h.filter)
-            elif opt == '-g':
-                actions.append(h.train_ham)
-            elif opt == '-s':
-                actions.append(h.train_spam)
-            elif opt == '-t':
-                actions.append(h.filter_train)
-            elif opt == '-G':
-                actions.append(h.untrain_ham)
-            elif opt == '-S':
-                actions.append(h.untrain_spam)
-        if actions == []:
-            actions = [h.filter]
-        from spambayes import mboxutils
-        msg = mboxutils.get_message(body)
-        for action in actions:
-            action(msg)
-        return mboxutils.as_string(msg, 1)
+            return '1\n%d\n%s' % (len(response), response)
+
+    def refresh(self):
+        """Reopen the database if it has changed since it was opened."""
+        stamp = db_stamp(self.hammie.dbname)
+        if stamp != self.db_stamp:
+            # If it's still being written, carry on with the old copy
+            # rather than wait (for seconds) for the lock.
+            import lockfile
+            if lockfile.FileLock(self.hammie.dbname).is_locked():
+                return
+            self.hammie.close()
+            self.db_stamp = stamp
+
+
+class BNRequest(SocketServer.StreamRequestHandler):
+    def handle(self):
+        switches = self.rfile.readline()
+        if switches.strip() == BATCH:
+            # Any number of framed requests, each answered in turn.
+            while True:
+                request = read_request(self.rfile)
+                if request is None:
+                    break
+                self.wfile.write(self.server.respond(*request))
+            return
+        body = self.rfile.read()
+        self.wfile.write(self.server.respond(switches, body))
+
+
+# sb_bnfilter --batch starts a connection with this line, and then sends
+# each message framed as format_request() does; the responses are in the
+# usual form, one after the other, in the same order.
+BATCH = 'BATCH'
+
+def format_request(switches, body):
+    return '%s\n%d\n%s' % (switches.strip(), len(body), body)
+
+def read_request(rfile):
+    """Return the next (switches, body) framed by format_request(), or
+    None if the other end has finished sending."""
+    switches = rfile.readline()
+    if not switches:
+        return None
+    size = int(rfile.readline())
+    return switches, rfile.read(size)
+
+
+class Pipe:
+    """One end of a socket pair, that requests and responses are passed
+    along in the same form as in a BATCH connection."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+
+    def forward(self, switches, body):
+        """Pass on a request, and return the response."""
+        self.sock.sendall(format_request(switches, body))
+        status = self.rfile.readline()
+        size = self.rfile.readline()
+        return status + size + self.rfile.read(int(size))
+
+    def get_request(self):
+        """Return the next (switches, body) passed on, or None if the
+        other end has been closed."""
+        return read_request(self.rfile)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send_response(self, response):
+        self.sock.sendall(response)
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def serve_workers(server, number):
+    """Fork number workers to handle requests, and train on the requests
+    they pass back, until they have all finished."""
+    h = server.hammie
+    # Load it now, so that the workers share it (until they need to
+    # reload it).
+    h.open('r')
+    server.db_stamp = db_stamp(h.dbname)
+    # The workers all wait for connections on the one socket, so one
+    # may find that another has already accepted a connection; don't
+    # let it wait for the next one for ever.
+    server.socket.settimeout(server.timeout)
+    pipes = []
+    pids = []
+    for i in range(number):
+        ours, theirs = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            for pipe in pipes:
+                pipe.close()
+            ours.close()
+            server.writer = Pipe(theirs)
+            try:
+                server.serve_until_idle()
+            finally:
+                # Leave the database and the socket file to the
+                # original process.
+                os._exit(0)
+        theirs.close()
+        pipes.append(Pipe(ours))
+        pids.append(pid)
+    server.socket.close()
+
+    while pipes:
+        r, w, e = select.select(pipes, [], [])
+        for pipe in r:
+            request = pipe.get_request()
+            if request is None:
+                pipe.close()
+                pipes.remove(pipe)
+                continue
+            response = server.respond(*request)
+            # Training stores the database, but filtering and training
+            # (-t, or train_on_filter) doesn't; the workers need to see
+            # what was learnt either way.  (Storing it twice would only
+            # make the workers more likely to find it locked.)
+            if h.h is not None and not stores(request[0]):
+                h.h.store()
+            pipe.send_response(response)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+def is_training(switches):
+    """Does the request (given its switches) change the database?"""
+    for switch in switches.split():
+        if switch in ('-g', '-s', '-t', '-G', '-S'):
+            return True
+    from spambayes.Options import options
+    return options["Hammie", "train_on_filter"]
+
+
+def stores(switches):
+    """Do all the request's actions store the database themselves?"""
+    for switch in switches.split():
+        if switch not in ('-g', '-s', '-G', '-S'):
+            return False
+    return True
+
+
+def db_stamp(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime, st.st_size
+
+
+def calc_response(h, switches, body):
+    switches = switches.split()
+    actions = []
+    opts, args = getopt.getopt(switches, 'fgstGS')
+    for opt, arg in opts:
+        if opt == '-f':
+            actions.append(h.filter)
+        elif opt == '-g':
+            actions.append(h.train_ham)
+        elif opt == '-s':
+            actions.append(h.train_spam)
+        elif opt == '-t':
+            actions.append(h.filter_train)
+        elif opt == '-G':
+            actions.append(h.untrain_ham)
+        elif opt == '-S':
+            actions.append(h.untrain_spam)
+    if actions == []:
+        actions = [h.filter]
+    from spambayes import mboxutils
+    msg = mboxutils.get_message(body)
+    for action in actions:
+        action(msg)
+    return mboxutils.as_string(msg, 1)
 
 
 def make_HammieFilter():
@@ -121,11 +121,14 @@ if hasattr(sys, "frozen"):
     sys.stderr = sys.stdout
 
 import socket
+import errno
 import re
 import time
 import getopt
 import types
 import thread
+import Queue
+import threading
 import email
 import email.Parser
 from getpass import getpass
@@ -135,13 +138,15 @@ from spambayes import Stats
 from spambayes import message
 from spambayes.Options import options, optionsPathname
 from spambayes import storage, Dibbler
+from spambayes.rwlock import RWLock, LockedClassifier, LockedObject
+from spambayes.port import md5
 from spambayes.UserInterface import UserInterfaceServer
 from spambayes.ImapUI import IMAPUserInterface, LoginFailure
 
 from spambayes.Version import get_current_version
 
 from imaplib import IMAP4
-from imaplib import Time2Internaldate
+from imaplib import Time2Internaldate, MapCRLF
 try:
     if options["imap", "use_ssl"]:
         from imaplib import IMAP4_SSL as BaseIMAP
@@ -151,6 +156,26 @@ except ImportError:
     from imaplib import IMAP4 as BaseIMAP
 
 
+def message_set(numbers):
+    """Return an IMAP message set (like "3:5,9") covering the given
+    message numbers or UIDs."""
+    numbers = [int(n) for n in numbers]
+    numbers.sort()
+    ranges = []
+    for n in numbers:
+        if ranges and n <= ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    parts = []
+    for start, end in ranges:
+        if start == end:
+            parts.append(str(start))
+        else:
+            parts.append("%d:%d" % (start, end))
+    return ",".join(parts)
+
+
 class BadIMAPResponseError(Exception):
     """An IMAP command returned a non-"OK" response."""
     def __init__(self, command, response):
@@ -196,6 +221,14 @@ class IMAPSession(BaseIMAP):
             self.connected = False
         else:
             self.connected = True
+            # imaplib sends the end of a command that has a literal (like
+            # APPEND) separately, and Nagle's algorithm would hold that
+            # back until the server acknowledged the literal.
+            try:
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY,
+                                     1)
+            except (socket.error, AttributeError):
+                pass
         if not hasattr(self, "ssl"):
             self.readline = readline
         self.debug = debug
@@ -203,6 +236,8 @@ class IMAPSession(BaseIMAP):
         self.server = server
         self.port = port
         self.logged_in = False
+        self.username = None
+        self.login_capabilities = None
 
         # For efficiency, we remember which folder we are currently
         # in, and only send a select command to the IMAP server if
@@ -231,15 +266,15 @@ class IMAPSession(BaseIMAP):
             try:
                 data = self.sock.recv(1)
             except socket.error, e:
-                if e[0] == 10035:
+                if e[0] in (10035, errno.EAGAIN, errno.EWOULDBLOCK):
                     # Nothing to receive, keep going.
                     continue
                 raise
             if not data:
                 break
+            buffer.append(data)
             if data == '\n':
                 break
-            buffer.append(data)
         self.sock.setblocking(True)
         return "".join(buffer)
 
@@ -261,6 +296,7 @@ class IMAPSession(BaseIMAP):
                   "be incorrect." % (username, description)
             raise LoginFailure(msg)
         self.logged_in = True
+        self.username = username
 
     def logout(self):
         """Log off from the IMAP server, possibly expunging.
@@ -324,6 +360,138 @@ class IMAPSession(BaseIMAP):
             self.current_folder = folder
             return data
 
+    def has_capability(self, name):
+        """Return True if the server has the given capability."""
+        if name in self.capabilities:
+            return True
+        # Some servers only mention some capabilities once we have
+        # logged in.
+        if self.login_capabilities is None:
+            response = self.capability()
+            data = self.check_response("capability", response)
+            if data[-1] is None:
+                self.login_capabilities = ()
+            else:
+                self.login_capabilities = tuple(data[-1].upper().split())
+        return name in self.login_capabilities
+
+    def supports_idle(self):
+        """Return True if the server supports the IDLE command."""
+        return self.has_capability("IDLE")
+
+    EXISTS_RE = re.compile(r"\* \d+ EXISTS", re.IGNORECASE)
+    def idle(self, timeout):
+        """Wait, using the IDLE command, until the server says that
+        messages have arrived in the selected folder, or until timeout
+        seconds have passed.  Return True if messages have arrived.
+
+        The server must support IDLE (see supports_idle())."""
+        tag = self._new_tag()
+        self.send("%s IDLE\r\n" % (tag,))
+        line = self.readline()
+        if not line.startswith("+"):
+            raise BadIMAPResponseError("idle", line)
+        arrived = False
+        end = time.time() + timeout
+        while not arrived:
+            line = self._readline_within(end - time.time())
+            if line is None:
+                break
+            if not line:
+                raise BaseIMAP.abort("socket error: EOF during IDLE")
+            arrived = self.EXISTS_RE.match(line) is not None
+        self.send("DONE\r\n")
+        while True:
+            line = self.readline()
+            if not line:
+                raise BaseIMAP.abort("socket error: EOF during IDLE")
+            if line.startswith(tag + " "):
+                if line.split()[1].upper() != "OK":
+                    raise BadIMAPResponseError("idle", line)
+                return arrived
+            if self.EXISTS_RE.match(line):
+                arrived = True
+
+    def _readline_within(self, timeout):
+        """Read a line from the server, or return None if one doesn't
+        arrive within timeout seconds."""
+        if timeout <= 0:
+            return None
+        sock = getattr(self, "sslobj", self.sock)
+        sock.settimeout(timeout)
+        try:
+            try:
+                return self.readline()
+            except socket.timeout:
+                return None
+        finally:
+            sock.settimeout(None)
+
+    def append_many(self, folder, messages):
+        """Append several messages to a folder, as append() does for one,
+        but without waiting for each to be stored before sending the next.
+        messages is a list of (flags, date_time, message) tuples; a list
+        of the (type, data) responses, in the same order, is returned.
+
+        If the server supports LITERAL+, the messages are all sent
+        without waiting for the server at all; otherwise it still has to
+        be asked whether each message can be sent."""
+        literal_plus = self.has_capability("LITERAL+")
+        tags = []
+        for flags, date_time, text in messages:
+            args = [self._checkquote(folder)]
+            if flags:
+                if (flags[0], flags[-1]) != ('(', ')'):
+                    flags = "(%s)" % (flags,)
+                args.append(flags)
+            if date_time:
+                args.append(Time2Internaldate(date_time))
+            text = MapCRLF.sub("\r\n", text)
+            if literal_plus:
+                tag = self._new_tag()
+                self.tagged_commands[tag] = None
+                self.send("%s APPEND %s {%d+}\r\n%s\r\n" %
+                          (tag, " ".join(args), len(text), text))
+            else:
+                self.literal = text
+                tag = self._command("APPEND", *args)
+            tags.append(tag)
+        responses = []
+        for tag in tags:
+            try:
+                responses.append(self._command_complete("APPEND", tag))
+            except BaseIMAP.abort:
+                raise
+            except BaseIMAP.error, e:
+                responses.append(("BAD", [str(e)]))
+        return responses
+
+    def move(self, message_set, folder):
+        """Move the messages with the given UIDs from the selected folder
+        to another, with the UID MOVE command (which imaplib doesn't know
+        about).  The server must support MOVE."""
+        return self._simple_command("UID", "MOVE", message_set, folder)
+
+    UIDVALIDITY_RE = re.compile(r"UIDVALIDITY (\d+)")
+    UIDNEXT_RE = re.compile(r"UIDNEXT (\d+)")
+    def folder_status(self, folder):
+        """Return the UIDVALIDITY and UIDNEXT values of a folder (with a
+        single STATUS command), or None if the server doesn't give them.
+        The folder doesn't need to be selected."""
+        try:
+            response = self.status(folder, "(UIDVALIDITY UIDNEXT)")
+            data = self.check_response("status %s" % (folder,), response)
+        except (BadIMAPResponseError, BaseIMAP.error):
+            return None
+        # Some servers give us back the folder name as a literal.
+        text = " ".join([part for part in data
+                         if isinstance(part, types.StringTypes)])
+        uidvalidity = self.UIDVALIDITY_RE.search(text)
+        uidnext = self.UIDNEXT_RE.search(text)
+        if uidvalidity is None or uidnext is None:
+            return None
+        return int(uidvalidity.group(1)), int(uidnext.group(1))
+
     number_re = re.compile(r"{\d+}")
     folder_re = re.compile(r"\(([\w\\ ]*)\) ")
     def folder_list(self):
@@ -390,9 +558,13 @@ class IMAPSession(BaseIMAP):
     FETCH_RESPONSE_RE = re.compile(r"([0-9]+) \(([" + \
                                    re.escape(FLAG_CHARS) + r"\"\{\}\(\)\\ ]*)\)?")
     LITERAL_RE = re.compile(r"^\{[\d]+\}$")
-    def _extract_fetch_data(self, response):
+    def _extract_fetch_data(self, response, continued=False):
         """This does the real work of extracting the data, for each message
         number.
+
+        If continued is true, the response is the rest of a message's
+        data, following a literal, so doesn't start with the message
+        number.
         """
         # We support the following FETCH items:
         #  FLAGS
@@ -408,7 +580,7 @@ class IMAPSession(BaseIMAP):
 
         data = {}
         expected_literal = None
-        if self.UID_RE2.match(response[-1]):
+        if not continued and self.UID_RE2.match(response[-1]):
             response = response[:-1]
             
         for part in response:
@@ -425,13 +597,17 @@ class IMAPSession(BaseIMAP):
                 data[key] = part
                 expected_literal = None
                 continue
-            # The first item will always be the message number.
-            mo = self.FETCH_RESPONSE_RE.match(part)
-            if mo:
-                data["message_number"] = mo.group(1)
-                rest = mo.group(2)
+            if continued:
+                rest = part
+                continued = False
             else:
-                raise BadIMAPResponseError("FETCH response", response)
+                # The first item will always be the message number.
+                mo = self.FETCH_RESPONSE_RE.match(part)
+                if mo:
+                    data["message_number"] = mo.group(1)
+                    rest = mo.group(2)
+                else:
+                    raise BadIMAPResponseError("FETCH response", response)
             
             for r in [self.FLAGS_RE, self.INTERNALDATE_RE, self.RFC822_RE,
                       self.UID_RE, self.RFC822_HEADER_RE, self.BODY_PEEK_RE]:
@@ -457,7 +633,18 @@ class IMAPSession(BaseIMAP):
             response = (response,)
 
         data = {}
+        last = None
         for msg in response:
+            if isinstance(msg, types.TupleType):
+                first = msg[0]
+            else:
+                first = msg
+            if last is not None and not self.FETCH_RESPONSE_RE.match(first):
+                # The items after a literal (like ' UID 123)') come
+                # separately, but belong to the same message.  This
+                # matters when several messages are fetched at once.
+                last.update(self._extract_fetch_data(msg, continued=True))
+                continue
             msg_data = self._extract_fetch_data(msg)
             if msg_data:
                 # Maybe there are two about the same message number!
@@ -466,6 +653,7 @@ class IMAPSession(BaseIMAP):
                     data[num].update(msg_data)
                 else:
                     data[num] = msg_data
+                last = data[num]
         return data
 
     # Maximum amount of data that will be read at any one time.
@@ -494,6 +682,9 @@ class IMAPMessage(message.SBHeaderMessage):
         self.invalid = False
         self.could_not_retrieve = False
         self.imap_server = None
+        # A digest of the message as it is on the server, so that we can
+        # tell whether it has been changed - see content_changed below.
+        self.substance_digest = None
 
     def extractTime(self):
         """When we create a new copy of a message, we need to specify
@@ -580,7 +771,11 @@ class IMAPMessage(message.SBHeaderMessage):
                 break
         if rfc822_data is None:
             raise BadIMAPResponseError("FETCH response", response_data)
+        return self.with_substance(rfc822_data)
 
+    def with_substance(self, rfc822_data):
+        """Return a new IMAPMessage object that has the same details as
+        this message, and the given RFC822 data as its substance."""
         try:
             new_msg = email.message_from_string(rfc822_data, IMAPMessage)
         # We use a general 'except' because the email package doesn't
@@ -617,6 +812,7 @@ class IMAPMessage(message.SBHeaderMessage):
         new_msg.uid = self.uid
         new_msg.setId(self.id)
         new_msg.got_substance = True
+        new_msg.substance_digest = self._digest(rfc822_data)
 
         if not new_msg.has_key(options["Headers", "mailid_header_name"]):
             new_msg[options["Headers", "mailid_header_name"]] = self.id
@@ -625,6 +821,16 @@ class IMAPMessage(message.SBHeaderMessage):
             sys.stdout.write(chr(8) + "*")
         return new_msg
 
+    def _digest(self, text):
+        return md5(text.replace("\r\n", "\n")).digest()
+
+    def content_changed(self):
+        """Return True if the message (as as_string() gives it) may be
+        different from the copy on the server."""
+        if self.substance_digest is None:
+            return True
+        return self._digest(self.as_string()) != self.substance_digest
+
     def MoveTo(self, dest):
         '''Note that message should move to another folder.  No move is
         carried out until Save() is called, for efficiency.'''
@@ -795,6 +1001,11 @@ class IMAPFolder(object):
         self.imap_server = imap_server
         self.stats = stats
 
+        # If this is set, only messages with at least this UID are looked
+        # at - see changed_since_checkpoint below.
+        self.first_uid = None
+        self.status = None
+
         # Unique names for cached messages - see _generate_id below.
         self.lastBaseMessageName = ''
         self.uniquifier = 2
@@ -806,20 +1017,136 @@ class IMAPFolder(object):
         return cmp(self.name, obj.name)
 
     def __iter__(self):
-        """Iterate through the messages in this IMAP folder."""
-        for key in self.keys():
-            yield self[key]
+        """Iterate through the messages in this IMAP folder.
+
+        The headers of [imap] x-fetch_batch_size messages are fetched at
+        a time."""
+        keys = self.keys()
+        size = max(1, options["imap", "x-fetch_batch_size"])
+        if size == 1:
+            for key in keys:
+                yield self[key]
+            return
+        for i in xrange(0, len(keys), size):
+            for msg in self.get_messages(keys[i:i+size]):
+                yield msg
+
+    def full_messages(self, wanted=None):
+        """Iterate through the messages in this IMAP folder, as __iter__
+        does, except that those for which wanted(msg) is true (or all of
+        them, if wanted is None) already have their substance.
+
+        The substance of [imap] x-body_batch_size messages is fetched at
+        a time; messages are still produced in the same order."""
+        size = max(1, options["imap", "x-body_batch_size"])
+        pending = []
+        to_fetch = []
+        for msg in self:
+            if wanted is None or wanted(msg):
+                to_fetch.append(msg)
+            pending.append(msg)
+            if len(to_fetch) >= size:
+                for msg in self._fill_in(pending, to_fetch):
+                    yield msg
+                pending = []
+                to_fetch = []
+        for msg in self._fill_in(pending, to_fetch):
+            yield msg
+
+    def _fill_in(self, msgs, to_fetch):
+        """Return msgs, with those in to_fetch replaced by the full
+        messages."""
+        full = {}
+        for old_msg, new_msg in zip(to_fetch,
+                                    self._get_full_messages(to_fetch)):
+            full[id(old_msg)] = new_msg
+        return [full.get(id(msg), msg) for msg in msgs]
+
+    def _get_full_messages(self, msgs):
+        """Return a list of the full versions of the given messages (as
+        IMAPMessage.get_full_message() does), fetching them all with one
+        command."""
+        if len(msgs) < 2:
+            return [msg.get_full_message() for msg in msgs]
+        try:
+            self.imap_server.SelectFolder(self.name)
+            uids = message_set([msg.uid for msg in msgs])
+            # rfc822_command is something like "(BODY.PEEK[])".
+            command = "(UID %s" % (msgs[0].rfc822_command.lstrip("("),)
+            response = self.imap_server.uid("FETCH", uids, command)
+            response_data = self.imap_server.check_response(
+                "uid fetch %s" % (uids,), response)
+            data = self.imap_server.extract_fetch_data(response_data)
+        except (BadIMAPResponseError, MemoryError):
+            # Fall back to fetching them one at a time, which will deal
+            # with (and report) any problems.
+            return [msg.get_full_message() for msg in msgs]
+        rfc822_data = {}
+        for msg_data in data.itervalues():
+            if "UID" in msg_data and msgs[0].rfc822_key in msg_data:
+                rfc822_data[msg_data["UID"]] = msg_data[msgs[0].rfc822_key]
+        full_msgs = []
+        for msg in msgs:
+            if str(msg.uid) in rfc822_data:
+                full_msgs.append(msg.with_substance(
+                    rfc822_data[str(msg.uid)]))
+            else:
+                full_msgs.append(msg.get_full_message())
+        return full_msgs
 
     def keys(self):
         '''Returns *uids* for all the messages in the folder not
-        marked as deleted.'''
+        marked as deleted (or, if first_uid is set, for those of them
+        with at least that uid).'''
         self.imap_server.SelectFolder(self.name)
-        response = self.imap_server.uid("SEARCH", "UNDELETED")
-        data = self.imap_server.check_response("search undeleted", response)
-        if data[0]:
-            return data[0].split(' ')
+        if self.first_uid is None:
+            criteria = "UNDELETED"
         else:
+            criteria = "UID %d:* UNDELETED" % (self.first_uid,)
+        response = self.imap_server.uid("SEARCH", criteria)
+        data = self.imap_server.check_response("search " + criteria,
+                                               response)
+        if not data[0]:
             return []
+        keys = data[0].split(' ')
+        if self.first_uid is not None:
+            # "n:*" always includes the last message, even if its uid is
+            # less than n.
+            keys = [key for key in keys if int(key) >= self.first_uid]
+        return keys
+
+    def _checkpoint_key(self):
+        return (self.imap_server.server, self.imap_server.port,
+                self.imap_server.username, self.name)
+
+    def changed_since_checkpoint(self):
+        """Return False if nothing has arrived in this folder since the
+        last checkpoint, and otherwise arrange for only the messages that
+        have arrived since then to be looked at, and return True.
+
+        Unless the folder has been renumbered (its UIDVALIDITY has
+        changed) or has never been checkpointed, in which case all the
+        messages will be looked at.  Finding out takes a single command."""
+        self.status = self.imap_server.folder_status(self.name)
+        if self.status is None:
+            return True
+        db = IMAPMessage().message_info_db
+        checkpoint = db.get_folder_checkpoints().get(self._checkpoint_key())
+        if checkpoint is None or checkpoint[0] != self.status[0]:
+            self.first_uid = None
+        elif checkpoint[1] == self.status[1]:
+            return False
+        else:
+            self.first_uid = checkpoint[1]
+        return True
+
+    def checkpoint(self):
+        """Remember that all of the messages that were in this folder when
+        changed_since_checkpoint() was called have been dealt with."""
+        if self.status is None:
+            return
+        db = IMAPMessage().message_info_db
+        db.set_folder_checkpoint(self._checkpoint_key(), self.status)
 
     custom_header_id_re = re.compile(re.escape(\
         options["Headers", "mailid_header_name"]) + "\:\s*(\d+(?:\-\d)?)",
@@ -852,8 +1179,32 @@ class IMAPFolder(object):
                 break
         if headers is None:
             raise BadIMAPResponseError("FETCH response", response_data)
+        return self._make_message(key, headers)
 
-        # Create a new IMAPMessage object, which will be the return value.
+    def get_messages(self, keys):
+        """Return a list of the messages matching the given *uids*, as
+        __getitem__ does, but fetching all of their headers with one
+        command.
+
+        Messages that no longer exist are left out of the list."""
+        self.imap_server.SelectFolder(self.name)
+        uids = message_set(keys)
+        response = self.imap_server.uid("FETCH", uids, "(UID RFC822.HEADER)")
+        response_data = self.imap_server.check_response(\
+            "fetch %s rfc822.header" % (uids,), response)
+        data = self.imap_server.extract_fetch_data(response_data)
+        # Unlike __getitem__, we need to know which headers belong to
+        # which message, so we go by the UID, not the message number.
+        headers = {}
+        for msg_data in data.itervalues():
+            if "UID" in msg_data and "RFC822.HEADER" in msg_data:
+                headers[msg_data["UID"]] = msg_data["RFC822.HEADER"]
+        return [self._make_message(key, headers[str(key)])
+                for key in keys if str(key) in headers]
+
+    def _make_message(self, key, headers):
+        """Return a new IMAPMessage (without substance) for the message
+        with the given *uid* and headers."""
         msg = IMAPMessage()
         msg.folder = self
         msg.uid = key
@@ -897,10 +1248,112 @@ class IMAPFolder(object):
             self.uniquifier = 2
         return messageName
 
+    def _save_later(self, to_save, msg=None):
+        """Add msg to the list of messages waiting to be saved, and save
+        them once there are [imap] x-save_batch_size of them.  If msg is
+        None, save any that are waiting."""
+        if msg is not None:
+            to_save.append(msg)
+            if len(to_save) < options["imap", "x-save_batch_size"]:
+                return
+        self.save_messages(to_save)
+        del to_save[:]
+
+    def save_messages(self, msgs):
+        """Save messages from this folder, as IMAPMessage.Save() does for
+        each, but with a few commands for each folder they are going to,
+        rather than several for each message.
+
+        Messages whose content hasn't changed are copied on the server
+        (or moved, if it supports MOVE) rather than uploaded again, and
+        those staying in this folder are left alone.  The rest are
+        appended to their folders all at once.  Unlike Save(), this
+        doesn't look up the messages' new UIDs (which would take a
+        command for each message), so their uid is set to None."""
+        if len(msgs) < 2:
+            for msg in msgs:
+                msg.Save()
+            return
+        self.imap_server.SelectFolder(self.name)
+        uids = message_set([msg.uid for msg in msgs])
+        response = self.imap_server.uid("FETCH", uids,
+                                        "(UID FLAGS INTERNALDATE)")
+        command = "uid fetch %s (uid flags internaldate)" % (uids,)
+        response_data = self.imap_server.check_response(command, response)
+        data = self.imap_server.extract_fetch_data(response_data)
+        details = {}
+        for msg_data in data.itervalues():
+            flags = msg_data.get("FLAGS")
+            if flags is not None:
+                # As in Save(), \Recent can't be stored.
+                flags = IMAPMessage.recent_re.sub("", flags)
+            details[msg_data.get("UID")] = (flags,
+                                            msg_data.get("INTERNALDATE"))
+
+        to_copy = {}
+        to_append = {}
+        for msg in msgs:
+            if msg.content_changed():
+                to_append.setdefault(msg.folder.name, []).append(msg)
+            elif msg.folder != self:
+                to_copy.setdefault(msg.folder.name, []).append(msg)
+            msg.previous_folder = None
+
+        # The originals of these are marked as deleted at the end.
+        to_delete = []
+        use_move = self.imap_server.has_capability("MOVE")
+        for folder_name, folder_msgs in to_copy.items():
+            uids = message_set([msg.uid for msg in folder_msgs])
+            if use_move:
+                response = self.imap_server.move(uids, folder_name)
+                command = "uid move %s %s" % (uids, folder_name)
+            else:
+                response = self.imap_server.uid("COPY", uids, folder_name)
+                command = "uid copy %s %s" % (uids, folder_name)
+            try:
+                self.imap_server.check_response(command, response)
+            except BadIMAPResponseError, e:
+                print >> sys.stderr, "Could not save messages:", e
+                continue
+            for msg in folder_msgs:
+                if not use_move:
+                    to_delete.append(msg.uid)
+                msg.uid = None
+
+        for folder_name, folder_msgs in to_append.items():
+            appends = []
+            for msg in folder_msgs:
+                flags, msg_time = details.get(str(msg.uid), (None, None))
+                if msg_time is None:
+                    msg_time = msg.extractTime()
+                appends.append((flags, msg_time, msg.as_string()))
+            responses = self.imap_server.append_many(folder_name, appends)
+            for msg, (response_type, unused) in zip(folder_msgs, responses):
+                if response_type == "OK":
+                    to_delete.append(msg.uid)
+                    msg.uid = None
+                else:
+                    # Save() tries again without the flags and time,
+                    # which some servers need, and reports any problem.
+                    msg.previous_folder = self
+                    msg.Save()
+
+        if to_delete:
+            self.imap_server.SelectFolder(self.name)
+            uids = message_set(to_delete)
+            response = self.imap_server.uid("STORE", uids, "+FLAGS.SILENT",
+                                            "(\\Deleted \\Seen)")
+            command = "set %s to be deleted and seen" % (uids,)
+            self.imap_server.check_response(command, response)
+
     def Train(self, classifier, isSpam):
         """Train folder as spam/ham."""
         num_trained = 0
-        for msg in self:
+        to_save = []
+        # Messages already trained as this type are left alone, so we
+        # don't need their substance.
+        for msg in self.full_messages(
+            lambda msg: msg.GetTrained() != isSpam):
             if msg.GetTrained() == (not isSpam):
                 msg = msg.get_full_message()
                 if msg.could_not_retrieve:
@@ -944,7 +1397,8 @@ class IMAPFolder(object):
                         msg[header] = value
                     msg.MoveTo(IMAPFolder(options["imap", move_opt_name],
                                            self.imap_server, self.stats))
-                    msg.Save()
+                    self._save_later(to_save, msg)
+        self._save_later(to_save)
         return num_trained
 
     def Filter(self, classifier, spamfolder, unsurefolder, hamfolder):
@@ -952,7 +1406,12 @@ class IMAPFolder(object):
         count["ham"] = 0
         count["spam"] = 0
         count["unsure"] = 0
-        for msg in self:
+        to_save = []
+        # Messages that have already been classified are left alone
+        # (unless ham is being moved), so we don't need their substance.
+        for msg in self.full_messages(
+            lambda msg: msg.GetClassification() is None or
+                        hamfolder is not None):
             cls = msg.GetClassification()
             if cls is None or hamfolder is not None:
                 if options["globals", "verbose"]:
@@ -997,11 +1456,12 @@ class IMAPFolder(object):
                         print >> sys.stderr, "[imapfilter] moving to unsure folder:", msg.uid
                     msg.MoveTo(unsurefolder)
                     count["unsure"] += 1
-                msg.Save()
+                self._save_later(to_save, msg)
             else:
                 if options["globals", "verbose"]:
                     print >> sys.stderr, "[imapfilter] already classified:", msg.uid
                 
+        self._save_later(to_save)
         return count
 
 
@@ -1013,43 +1473,74 @@ class IMAPFilter(object):
         self.classifier = classifier
         self.imap_server = None
         self.stats = stats
+        # (server, folder, "train" or "filter", number of messages,
+        # seconds) for each folder dealt with.
+        self.timings = []
+
+    def _record_time(self, folder, action, count, start):
+        elapsed = time.time() - start
+        self.timings.append((self.imap_server.server, folder, action,
+                             count, elapsed))
+        if options["globals", "verbose"]:
+            print >> sys.stderr, "\n      %s %s: %d in %.4f seconds." % \
+                  (self.imap_server.server, folder, count, elapsed)
 
-    def Train(self):
+    def Train(self, folders=None):
+        """Train on the given folders, a list of (folder name, is_spam)
+        pairs (or those in the ham_train_folders and spam_train_folders
+        options)."""
         assert self.imap_server, "Cannot do anything without IMAP server."
+        if folders is None:
+            folders = [(fol, False)
+                       for fol in options["imap", "ham_train_folders"]] + \
+                      [(fol, True)
+                       for fol in options["imap", "spam_train_folders"]]
         
         if options["globals", "verbose"]:
             t = time.time()
 
         total_trained = 0
-        for is_spam, option_name in [(False, "ham_train_folders"),
-                                     (True, "spam_train_folders")]:
-            training_folders = options["imap", option_name]
-            for fol in training_folders:
-                # Select the folder to make sure it exists
-                try:
-                    self.imap_server.SelectFolder(fol)
-                except BadIMAPResponseError:
-                    print >> sys.stderr, "Skipping", fol, "as it cannot be selected."
-                    continue
-
-                if options['globals', 'verbose']:
-                    print >> sys.stderr, ("   Training %s folder %s" %
-                                          (["ham", "spam"][is_spam], fol))
-                folder = IMAPFolder(fol, self.imap_server, self.stats)
-                num_trained = folder.Train(self.classifier, is_spam)
-                total_trained += num_trained
+        trained_folders = []
+        for fol, is_spam in folders:
+            folder_start = time.time()
+            folder = IMAPFolder(fol, self.imap_server, self.stats)
+            if options["imap", "x-use_checkpoints"] and \
+               not folder.changed_since_checkpoint():
                 if options['globals', 'verbose']:
-                    print >> sys.stderr, "\n      ", num_trained, "trained."
+                    print >> sys.stderr, "   Nothing new in", fol
+                continue
+
+            # Select the folder to make sure it exists
+            try:
+                self.imap_server.SelectFolder(fol)
+            except BadIMAPResponseError:
+                print >> sys.stderr, "Skipping", fol, "as it cannot be selected."
+                continue
+
+            if options['globals', 'verbose']:
+                print >> sys.stderr, ("   Training %s folder %s" %
+                                      (["ham", "spam"][is_spam], fol))
+            num_trained = folder.Train(self.classifier, is_spam)
+            total_trained += num_trained
+            trained_folders.append(folder)
+            self._record_time(fol, "train", num_trained, folder_start)
 
         if total_trained:
             self.classifier.store()
+        # Only once the training has been stored.
+        if options["imap", "x-use_checkpoints"]:
+            for folder in trained_folders:
+                folder.checkpoint()
 
         if options["globals", "verbose"]:
             print >> sys.stderr, ("Training took %.4f seconds, %s messages were trained."
                                   % (time.time() - t, total_trained))
 
-    def Filter(self):
+    def Filter(self, folders=None):
+        """Filter the given folders (or the filter_folders option)."""
         assert self.imap_server, "Cannot do anything without IMAP server."
+        if folders is None:
+            folders = options["imap", "filter_folders"]
         if not self.spam_folder:
             spam_folder_name = options["imap", "spam_folder"]
             if options["globals", "verbose"]:
@@ -1098,7 +1589,16 @@ class IMAPFilter(object):
                 print >> sys.stderr, "Cannot select ham folder.  Please check configuration."
                 sys.exit(-1)
                 
-        for filter_folder in options["imap", "filter_folders"]:
+        for filter_folder in folders:
+            folder_start = time.time()
+            folder = IMAPFolder(filter_folder, self.imap_server, self.stats)
+            if options["imap", "x-use_checkpoints"] and \
+               not folder.changed_since_checkpoint():
+                if options["globals", "verbose"]:
+                    print >> sys.stderr, "[imapfilter] nothing new in", \
+                          filter_folder
+                continue
+
             # Select the folder to make sure it exists.
             try:
                 self.imap_server.SelectFolder(filter_folder)
@@ -1106,11 +1606,15 @@ class IMAPFilter(object):
                 print >> sys.stderr, "Cannot select", filter_folder, "... skipping." 
                 continue
 
-            folder = IMAPFolder(filter_folder, self.imap_server, self.stats)
             subcount = folder.Filter(self.classifier, self.spam_folder,
                                      self.unsure_folder, self.ham_folder)
             for key in count.keys():
                 count[key] += subcount.get(key, 0)
+            if options["imap", "x-use_checkpoints"]:
+                folder.checkpoint()
+            self._record_time(filter_folder, "filter",
+                              subcount["ham"] + subcount["spam"] +
+                              subcount["unsure"], folder_start)
 
         if options["globals", "verbose"]:
             if count is not None:
@@ -1119,6 +1623,82 @@ class IMAPFilter(object):
             print >> sys.stderr, "Classifying took %.4f seconds." % (time.time() - t,)
 
 
+class IMAPWatcher(object):
+    """Watches an IMAP folder, using the IDLE command, and reports when
+    messages arrive in it.
+
+    The watcher has its own connection to the server, and runs in its own
+    thread.  It doesn't do anything with the messages itself: each time
+    some arrive, it puts its key onto the queue it was given, and the
+    folder can then be filtered as usual.  If the server doesn't support
+    IDLE, the watcher stops straight away, and supported is False."""
+
+    # RFC 2177 says that the server may log us out after 30 minutes, so
+    # IDLE is restarted more often than that.
+    idle_timeout = 29 * 60
+    # How long to wait before reconnecting after something goes wrong.
+    retry_delay = 60
+
+    def __init__(self, server, debug, username, password, folder, queue,
+                 key):
+        self.server = server
+        self.debug = debug
+        self.username = username
+        self.password = password
+        self.folder = folder
+        self.queue = queue
+        self.key = key
+        self.supported = True
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.setDaemon(True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+
+    def run(self):
+        while not self.stopping:
+            # We never expunge; that is left to the main connection.
+            imap = IMAPSession(self.server, self.debug, False)
+            try:
+                try:
+                    if not imap.connected:
+                        raise BaseIMAP.error("cannot connect")
+                    imap.login(self.username, self.password)
+                    if not imap.supports_idle():
+                        if options["globals", "verbose"]:
+                            print >> sys.stderr, "[imapfilter] %s does " \
+                                  "not support IDLE; polling instead." % \
+                                  (imap.server,)
+                        self.supported = False
+                        imap.logout()
+                        return
+                    # We only watch, so EXAMINE is enough (and doesn't
+                    # change any flags).
+                    response = imap.select(self.folder, True)
+                    imap.check_response("examine %s" % (self.folder,),
+                                        response)
+                    while not self.stopping:
+                        if imap.idle(self.idle_timeout):
+                            self.queue.put(self.key)
+                    imap.logout()
+                except (BaseIMAP.error, BadIMAPResponseError, LoginFailure,
+                        socket.error), e:
+                    if options["globals", "verbose"]:
+                        print >> sys.stderr, "[imapfilter] watching %s " \
+                              "failed: %s" % (self.folder, e)
+            finally:
+                try:
+                    imap.shutdown()
+                except (BaseIMAP.error, socket.error, AttributeError):
+                    pass
+            if not self.stopping:
+                time.sleep(self.retry_delay)
+
+
 def servers(promptForPass = False):
     """Returns a list containing a tuple (server,user,passwd) for each IMAP server in options.
 
@@ -1136,7 +1716,60 @@ prompts the user for each server's password.
             pwds.append(getpass("Enter password for %s:" % (u,)))
             
     return zip(servers, usernames, pwds)
-            
+
+def run_in_parallel(jobs, size):
+    """Call each of the functions in jobs, with up to size of them running
+    at once (each in its own thread), and return once they have all
+    finished.  If any of them raise an exception, the first is raised
+    again here."""
+    queue = Queue.Queue()
+    for job in jobs:
+        queue.put(job)
+    errors = []
+    def work():
+        while True:
+            try:
+                job = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                job()
+            except:
+                errors.append(sys.exc_info())
+    threads = []
+    for i in range(min(size, len(jobs))):
+        thread = threading.Thread(target=work)
+        thread.setDaemon(True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+def parallel_jobs(indexes, train, classify):
+    """Return the jobs that deal with the accounts at indexes, each an
+    (index, train, classify, train_folders, filter_folders) tuple, in
+    batches: the jobs in a batch may be done at once, but each batch must
+    be finished before the next is started.  With a connection per
+    folder, everything is trained on before anything is filtered, as it
+    is when an account is dealt with over one connection."""
+    jobs = []
+    filter_jobs = []
+    for index in indexes:
+        if options["imap", "x-connection_per_folder"]:
+            if train:
+                for fol in options["imap", "ham_train_folders"]:
+                    jobs.append((index, True, False, [(fol, False)], None))
+                for fol in options["imap", "spam_train_folders"]:
+                    jobs.append((index, True, False, [(fol, True)], None))
+            if classify:
+                for fol in options["imap", "filter_folders"]:
+                    filter_jobs.append((index, False, True, None, [fol]))
+        else:
+            jobs.append((index, train, classify, None, None))
+    return [batch for batch in (jobs, filter_jobs) if batch]
+
 def run(force_UI=False):
     try:
         opts, args = getopt.getopt(sys.argv[1:], 'hbPtcvl:e:i:d:p:o:',
@@ -1189,6 +1822,22 @@ def run(force_UI=False):
 
     classifier = storage.open_storage(bdbname, useDBM)
     message_db = message.Message().message_info_db
+    workers = options["imap", "x-parallel_connections"]
+    if workers > 1 and options["URLRetriever", "x-slurp_urls"]:
+        # The pages x-slurp_urls retrieves are tokenized with some of the
+        # tokenizer options changed, which would affect other accounts'
+        # messages tokenized at the same time.
+        print >> sys.stderr, "x-parallel_connections can't be used with " \
+              "x-slurp_urls; accounts will be dealt with one at a time"
+        workers = 1
+    if workers > 1:
+        # Several accounts or folders are dealt with at once, so
+        # everything they share must be protected.  Only the pickle is
+        # all in memory, where any number of threads can read it at once.
+        classifier = LockedClassifier(classifier,
+                                      RWLock(useDBM == "pickle"))
+        message_db = LockedObject(message_db)
+        message.Message().message_info_db = message_db
 
     if options["globals", "verbose"]:
         print "Done."
@@ -1201,8 +1850,8 @@ def run(force_UI=False):
     
     # Load stats manager.
     stats = Stats.Stats(options, message_db)
-    
-    imap_filter = IMAPFilter(classifier, stats)
+    if workers > 1:
+        stats = LockedObject(stats)
 
     # Web interface.  We have changed the rules about this many times.
     # With 1.0.x, the rule is that the interface is served if we are
@@ -1268,57 +1917,119 @@ def run(force_UI=False):
         # XXX What about when we are running with -l and change options
         # XXX via the web interface?  We need to handle that, really.
         options.set_restore_point()
-        while True:
-            for (server, imapDebug, doExpunge), username, password in imaps:
-                imap = IMAPSession(server, imapDebug, doExpunge)
-                if options["globals", "verbose"]:
-                    print "Account: %s:%s" % (imap.server, imap.port)
-                if imap.connected:
-                    # As above, we load a separate configuration file
-                    # for each server, if it exists.  We look for a
-                    # file in the optionsPathname directory, with the
-                    # name server.name.ini or .spambayes_server_name_rc
-                    # XXX While 1.1 is in alpha these names can be
-                    # XXX changed if desired.  Please let Tony know!
-                    basedir = os.path.dirname(optionsPathname)
-                    fn1 = os.path.join(basedir, imap.server + ".ini")
-                    fn2 = os.path.join(basedir,
-                                       imap.server.replace(".", "_") + \
-                                       "_rc")
-                    for fn in (fn1, fn2):
-                        if os.path.exists(fn):
-                            options.merge_file(fn)
-
-                    try:                    
-                        imap.login(username, password)
-                    except LoginFailure, e:
-                        print str(e)
-                        continue
-                    imap_filter.imap_server = imap
-
-                    if doTrain:
-                        if options["globals", "verbose"]:
-                            print "Training"
-                        imap_filter.Train()
-                    if doClassify:
-                        if options["globals", "verbose"]:
-                            print "Classifying"
-                        imap_filter.Filter()
 
-                    imap.logout()
-                    options.revert_to_restore_point()
+        # With the [imap] x-use_idle option, each filter folder is also
+        # watched (see IMAPWatcher), and filtered as soon as something
+        # arrives in it, rather than at the next run.
+        watchers = {}
+        arrived = Queue.Queue()
+
+        def options_files(server):
+            # As above, we load a separate configuration file for each
+            # server, if it exists.  We look for a file in the
+            # optionsPathname directory, with the name server.name.ini
+            # or .spambayes_server_name_rc
+            # XXX While 1.1 is in alpha these names can be
+            # XXX changed if desired.  Please let Tony know!
+            server = server.split(":")[0]
+            basedir = os.path.dirname(optionsPathname)
+            fn1 = os.path.join(basedir, server + ".ini")
+            fn2 = os.path.join(basedir, server.replace(".", "_") + "_rc")
+            return [fn for fn in (fn1, fn2) if os.path.exists(fn)]
+
+        def process(index, train, classify, train_folders=None,
+                    filter_folders=None):
+            (server, imapDebug, doExpunge), username, password = imaps[index]
+            imap = IMAPSession(server, imapDebug, doExpunge)
+            if options["globals", "verbose"]:
+                print "Account: %s:%s" % (imap.server, imap.port)
+            if not imap.connected:
+                # Failed to connect.  This may be a temporary problem,
+                # so just continue on and try again.  If we are only
+                # running once we will end, otherwise we'll try again
+                # in sleepTime seconds.
+                # XXX Maybe we should log this error message?
+                return
+            for fn in options_files(server):
+                options.merge_file(fn)
+            try:
+                try:
+                    imap.login(username, password)
+                except LoginFailure, e:
+                    print str(e)
+                    return
+                imap_filter = IMAPFilter(classifier, stats)
+                imap_filter.imap_server = imap
+
+                if train:
+                    if options["globals", "verbose"]:
+                        print "Training"
+                    imap_filter.Train(train_folders)
+                if classify:
+                    if options["globals", "verbose"]:
+                        print "Classifying"
+                    imap_filter.Filter(filter_folders)
+                    if sleepTime and options["imap", "x-use_idle"]:
+                        for folder in (filter_folders or
+                                       options["imap", "filter_folders"]):
+                            if (index, folder) not in watchers:
+                                watcher = IMAPWatcher(server, imapDebug,
+                                                      username, password,
+                                                      folder, arrived,
+                                                      (index, folder))
+                                watcher.start()
+                                watchers[index, folder] = watcher
+                timings.extend(imap_filter.timings)
+                imap.logout()
+            finally:
+                options.revert_to_restore_point()
+
+        def process_all():
+            if workers <= 1:
+                for index in range(len(imaps)):
+                    process(index, doTrain, doClassify)
+                return
+            # Accounts with their own configuration files change the
+            # options for everything else while they are being dealt
+            # with, so those are still done one at a time, afterwards.
+            shared = []
+            alone = []
+            for index in range(len(imaps)):
+                if options_files(imaps[index][0][0]):
+                    alone.append(index)
                 else:
-                    # Failed to connect.  This may be a temporary problem,
-                    # so just continue on and try again.  If we are only
-                    # running once we will end, otherwise we'll try again
-                    # in sleepTime seconds.
-                    # XXX Maybe we should log this error message?
-                    pass
-
-            if sleepTime:
-                time.sleep(sleepTime)
-            else:
+                    shared.append(index)
+            for jobs in parallel_jobs(shared, doTrain, doClassify):
+                run_in_parallel([lambda args=args: process(*args)
+                                 for args in jobs], workers)
+            for index in alone:
+                process(index, doTrain, doClassify)
+
+        # (server, folder, action, number of messages, seconds) for each
+        # folder dealt with in a run.
+        timings = []
+        while True:
+            start = time.time()
+            del timings[:]
+            process_all()
+            if options["globals", "verbose"] and timings:
+                print "Took %.4f seconds:" % (time.time() - start,)
+                for server, folder, action, count, seconds in timings:
+                    print "    %-20s %-20s %-6s %6d %9.4fs" % \
+                          (server, folder, action, count, seconds)
+
+            if not sleepTime:
                 break
+            # Until the next run is due, filter each folder that a
+            # watcher says has new messages.
+            next_run = time.time() + sleepTime
+            while True:
+                try:
+                    index, folder = arrived.get(True,
+                                                max(0, next_run - time.time()))
+                except Queue.Empty:
+                    break
+                process(index, False, True, filter_folders=[folder])
 
 if __name__ == '__main__':
     run()
@@ -87,7 +87,8 @@ Gimmicks:
  o NNTP proxy.
 """
 
-import sys, re, getopt, time, socket, email
+import sys, re, getopt, time, socket, email, tempfile
+import email.FeedParser
 from thread import start_new_thread
 
 import spambayes.message
@@ -95,8 +96,11 @@ from spambayes import i18n
 from spambayes import Stats
 from spambayes import Dibbler
 from spambayes import storage
+from spambayes import classifier
 from spambayes.FileCorpus import ExpiryFileCorpus
 from spambayes.FileCorpus import FileMessageFactory, GzipFileMessageFactory
+from spambayes.FileCorpus import CacheWriter
+from spambayes.reviewindex import ReviewIndex
 from spambayes.Options import options, get_pathname_option, _
 from spambayes.UserInterface import UserInterfaceServer
 from spambayes.ProxyUI import ProxyUserInterface
@@ -121,6 +125,10 @@ class AlreadyRunningException(Exception):
 # number to add to STAT length for each msg to fudge for spambayes headers
 HEADER_SIZE_FUDGE_FACTOR = 512
 
+# How often, in seconds, old messages are expired from the caches while
+# the proxy is running.
+CACHE_EXPIRY_INTERVAL = 60 * 60
+
 class ServerLineReader(Dibbler.BrighterAsyncChat):
     """An async socket that reads lines from a remote server and
     simply calls a callback with the data.  The BayesProxy object
@@ -236,22 +244,36 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
     POP3ProxyBase class, but BayesProxy doesn't need it and it would
     mean re-stuffing them afterwards).  self.onTransaction() should
     return the response to pass back to the email client - the response
-    can be the verbatim response or a processed version of it.  The
-    special command 'KILL' kills it (passing a 'QUIT' command to the
-    server).
+    can be the verbatim response or a processed version of it, or None
+    if it will be passed later, by calling self.resumeResponse(); until
+    then, nothing more is read from the email client.  The special
+    command 'KILL' kills it (passing a 'QUIT' command to the server).
+
+    Rather than have a (possibly huge) response collected into a string,
+    a subclass can have it passed along a line at a time: if
+    self.onStreamStart(command, args) returns an object, each line of the
+    response is passed to that object's feed() method as it arrives, and
+    self.onStreamEnd(command, args, stream) is called at the end instead
+    of self.onTransaction().  onStreamEnd() returns what onTransaction()
+    would, except that the response may also be an asynchat producer.
     """
 
     def __init__(self, clientSocket, serverName, serverPort,
                  ssl=False, map=Dibbler._defaultContext._map):
         Dibbler.BrighterAsyncChat.__init__(self, clientSocket)
         self.request = ''
-        self.response = ''
+        self.response = []          # The lines of the response so far
+        self.stream = None          # ...or what they're being fed to
+        self.gotResponse = False    # Any of the response yet?
         self.set_terminator('\r\n')
         self.command = ''           # The POP3 command being processed...
         self.args = []              # ...and its arguments
         self.isClosing = False      # Has the server closed the socket?
         self.seenAllHeaders = False # For the current RETR or TOP
         self.startTime = 0          # (ditto)
+        self.waiting = False        # For onTransaction to finish?
+        self.held = []              # Server data to send after that
+        self.closeWhenResumed = False
 
         if not self.onIncomingConnection(clientSocket):
             # We must refuse this connection, so pass an error back
@@ -287,10 +309,23 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
         """
         raise NotImplementedError
 
+    def onStreamStart(self, command, args):
+        """Overide this to stream the response to a command; see the class
+        documentation."""
+        return None
+
+    def onStreamEnd(self, command, args, stream):
+        """Overide this if you override onStreamStart()."""
+        raise NotImplementedError
+
     def onServerLine(self, line):
         """A line of response has been received from the POP3 server."""
-        isFirstLine = not self.response
-        self.response = self.response + line
+        isFirstLine = not self.gotResponse
+        self.gotResponse = True
+        if self.stream is not None:
+            self.stream.feed(line)
+        else:
+            self.response.append(line)
 
         # Is this the line that terminates a set of headers?
         self.seenAllHeaders = self.seenAllHeaders or line in ['\r\n', '\n']
@@ -299,10 +334,15 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
         if not line:
             self.isClosing = True
 
-        # If we're not processing a command, just echo the response.
+        # If we're not processing a command, just echo the response
+        # (once the response to the last command has been sent).
         if not self.command:
-            self.push(self.response)
-            self.response = ''
+            if self.waiting:
+                self.held.append(line)
+            else:
+                self.push(line)
+            self.response = []
+            self.gotResponse = False
 
         # Time out after some seconds (30 by default) for message-retrieval
         # commands if all the headers are down.  The rest of the message
@@ -312,12 +352,10 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
            self.seenAllHeaders and time.time() > \
            self.startTime + options["pop3proxy", "retrieval_timeout"]:
             self.onResponse()
-            self.response = ''
         # If that's a complete response, handle it.
         elif not self.isMultiline() or line == '.\r\n' or \
            (isFirstLine and line.startswith('-ERR')):
             self.onResponse()
-            self.response = ''
 
     def isMultiline(self):
         """Returns True if the request should get a multiline
@@ -338,6 +376,12 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
             # rest will be proxied straight through.
             return False
 
+    def readable(self):
+        """Asynchat override.  Don't read the next command until the
+        response to the last one has been sent."""
+        return not self.waiting and \
+               Dibbler.BrighterAsyncChat.readable(self)
+
     def collect_incoming_data(self, data):
         """Asynchat override."""
         self.request = self.request + data
@@ -364,34 +408,225 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
             self.command = splitCommand[0].upper()
             self.args = splitCommand[1:]
             self.startTime = time.time()
+            self.stream = self.onStreamStart(self.command, self.args)
 
         self.request = ''
 
     def onResponse(self):
-        # There are some features, tested by clients using CAPA,
-        # that we don't support.  We strip them from the CAPA
-        # response here, so that the client won't use them.
-        for unsupported in ['PIPELINING', 'STLS', ]:
-            unsupportedLine = r'(?im)^%s[^\n]*\n' % (unsupported,)
-            self.response = re.sub(unsupportedLine, '', self.response)
-
-        # Pass the request and the raw response to the subclass and
-        # send back the cooked response.
-        if self.response:
-            cooked = self.onTransaction(self.command, self.args, self.response)
-            self.push(cooked)
+        if self.stream is not None:
+            stream = self.stream
+            self.stream = None
+            cooked = self.onStreamEnd(self.command, self.args, stream)
+        else:
+            response = ''.join(self.response)
+
+            # There are some features, tested by clients using CAPA,
+            # that we don't support.  We strip them from the CAPA
+            # response here, so that the client won't use them.
+            for unsupported in ['PIPELINING', 'STLS', ]:
+                unsupportedLine = r'(?im)^%s[^\n]*\n' % (unsupported,)
+                response = re.sub(unsupportedLine, '', response)
+
+            # Pass the request and the raw response to the subclass and
+            # send back the cooked response.
+            cooked = ''
+            if response:
+                cooked = self.onTransaction(self.command, self.args,
+                                            response)
+        if cooked is None:
+            self.waiting = True
+        else:
+            self.pushResponse(cooked)
 
         # If onServerLine() decided that the server has closed its
         # socket, close this one when the response has been sent.
         if self.isClosing:
-            self.close_when_done()
+            if self.waiting:
+                self.closeWhenResumed = True
+            else:
+                self.close_when_done()
 
         # Reset.
         self.command = ''
         self.args = []
+        self.response = []
+        self.gotResponse = False
         self.isClosing = False
         self.seenAllHeaders = False
 
+    def pushResponse(self, cooked):
+        """Sends a response, which is a string or an asynchat producer."""
+        if isinstance(cooked, str):
+            if cooked:
+                self.push(cooked)
+        else:
+            self.push_with_producer(cooked)
+
+    def resumeResponse(self, cooked):
+        """Sends the response that onTransaction() returned None for,
+        followed by anything the server has sent since."""
+        self.waiting = False
+        self.pushResponse(cooked)
+        if self.held:
+            self.push(''.join(self.held))
+            self.held = []
+        if self.closeWhenResumed:
+            self.closeWhenResumed = False
+            self.close_when_done()
+
+
+class Spool:
+    """Keeps what's written to it in memory, up to maxMemory bytes, and in
+    a temporary file after that."""
+
+    def __init__(self, maxMemory=256*1024):
+        self.maxMemory = maxMemory
+        self.data = []
+        self.size = 0
+        self.file = None
+
+    def write(self, data):
+        if self.file is None and self.size + len(data) > self.maxMemory:
+            self.file = tempfile.TemporaryFile()
+            self.file.write(''.join(self.data))
+            self.data = []
+        if self.file is None:
+            self.data.append(data)
+        else:
+            self.file.write(data)
+        self.size += len(data)
+
+    def chunks(self, size=16384):
+        """Generates what was written, in pieces of the given size, and
+        then discards it."""
+        if self.file is None:
+            data = ''.join(self.data)
+            self.data = []
+            for i in xrange(0, len(data), size):
+                yield data[i:i+size]
+        else:
+            self.file.seek(0)
+            while True:
+                data = self.file.read(size)
+                if not data:
+                    break
+                yield data
+            self.file.close()
+            self.file = None
+
+
+class IterProducer:
+    """An asynchat producer for the strings an iterator generates.  They
+    are joined into pieces of at least minSize bytes where possible, so
+    that a short response goes out in one send (and one packet) rather
+    than being held up by Nagle's algorithm."""
+
+    def __init__(self, iterable, minSize=16384):
+        self.iterator = iter(iterable)
+        self.minSize = minSize
+
+    def more(self):
+        pieces = []
+        size = 0
+        for data in self.iterator:
+            pieces.append(data)
+            size += len(data)
+            if size >= self.minSize:
+                break
+        return ''.join(pieces)
+
+
+class MessageStream:
+    """Collects the response to a RETR or TOP as it arrives.
+
+    The message is parsed as it arrives, and everything after the headers
+    is also copied to a Spool, so that it can be passed on to the email
+    client exactly as it arrived, with only the headers rebuilt.  If
+    maxParse is more than zero, only that many bytes of the body are
+    parsed (and so classified); the rest is only spooled.  So a huge
+    message doesn't take a huge amount of memory, or several copies of
+    it, as it used to.
+    """
+
+    def __init__(self, maxParse=0):
+        self.maxParse = maxParse
+        self.status = None          # The '+OK' line
+        self.headers = []           # The header lines, as they arrived
+        self.separator = None       # The blank line after them
+        self.body = Spool()         # Everything after that
+        self.size = 0               # The size of the message
+        self.parsed = 0             # How much of the body was parsed
+        self.truncated = False      # Was some of the body not parsed?
+        self.terminated = False     # Has the '.\r\n' arrived?
+        self.parser = email.FeedParser.FeedParser(
+                          _factory=spambayes.message.SBHeaderMessage)
+
+    def feed(self, line):
+        if not line:
+            # The server has closed the connection.
+            return
+        if self.status is None:
+            self.status = line
+            return
+        if line == '.\r\n':
+            # This is always the last line (see POP3ProxyBase).  It's
+            # not passed to the email parser.  (Thanks to Scott
+            # Schlesier for this fix.)
+            self.terminated = True
+            return
+        self.size += len(line)
+        if self.separator is None:
+            if line in ['\r\n', '\n']:
+                self.separator = line
+            else:
+                self.headers.append(line)
+            self.parser.feed(line)
+            return
+        self.body.write(line)
+        if self.maxParse > 0 and self.parsed + len(line) > self.maxParse:
+            self.truncated = True
+        if not self.truncated:
+            self.parser.feed(line)
+            self.parsed += len(line)
+
+    def isOK(self):
+        """Returns True unless the server sent an error response."""
+        statusData = (self.status or '').split()
+        return bool(statusData) and statusData[0].upper() == "+OK"
+
+    def message(self):
+        """Returns the message, as a SBHeaderMessage."""
+        return self.parser.close()
+
+    def rawHeaders(self):
+        """Returns the headers of the message as they arrived."""
+        return ''.join(self.headers) + (self.separator or '')
+
+    def response(self, headers):
+        """Returns a producer for the response, with the given headers
+        (which should end with a blank line) in place of the original
+        ones."""
+        # Restore the +OK and the POP3 .\r\n terminator if there was one.
+        return self._producer("+OK\r\n" + headers)
+
+    def rawResponse(self):
+        """Returns a producer for the response as it arrived (which, for
+        an error response, is just the status line)."""
+        return self._producer((self.status or '') + self.rawHeaders())
+
+    def _producer(self, head):
+        if self.terminated:
+            tail = '.\r\n'
+        else:
+            tail = ''
+        return IterProducer(self._pieces(head, tail))
+
+    def _pieces(self, head, tail):
+        yield head
+        for data in self.body.chunks():
+            yield data
+        yield tail
+
 
 class BayesProxyListener(Dibbler.Listener):
     """Listens for incoming email client connections and spins off
@@ -441,7 +676,6 @@ class BayesProxy(POP3ProxyBase):
         POP3ProxyBase.__init__(self, clientSocket, serverName, serverPort,
                                ssl)
         self.handlers = {'STAT': self.onStat, 'LIST': self.onList,
-                         'RETR': self.onRetr, 'TOP': self.onTop,
                          'USER': self.onUser}
         state.totalSessions += 1
         state.activeSessions += 1
@@ -519,40 +753,76 @@ class BayesProxy(POP3ProxyBase):
             else:
                 return response
 
-    def onRetr(self, command, args, response):
+    def onStreamStart(self, command, args):
+        """Has the responses to RETR and TOP passed to a MessageStream
+        as they arrive."""
+        if command in ['RETR', 'TOP']:
+            return MessageStream(options["pop3proxy", "x-max_classify_size"])
+        return None
+
+    def onStreamEnd(self, command, args, stream):
         """Adds the judgement header based on the raw headers and body
-        of the message."""
-        # Previously, we used '\n\r?\n' to detect the end of the headers in
-        # case of broken emails that don't use the proper line separators,
-        # and if we couldn't find it, then we assumed that the response was
-        # and error response and passed it unfiltered.  However, if the
-        # message doesn't contain the separator (malformed mail), then this
-        # would mean the message was passed straight through the proxy.
-        # Since all the content is then in the headers, this probably
-        # doesn't do a spammer much good, but, just in case, we now just
-        # check for "+OK" and assume no error response will be given if
-        # that is (which seems reasonable).
-        # Remove the trailing .\r\n before passing to the email parser.
-        # Thanks to Scott Schlesier for this fix.
-        terminatingDotPresent = (response[-4:] == '\n.\r\n')
-        if terminatingDotPresent:
-            response = response[:-3]
-
-        # Break off the first line, which will be '+OK'.
-        statusLine, messageText = response.split('\n', 1)
-        statusData = statusLine.split()
-        ok = statusData[0]
-        if ok.strip().upper() != "+OK":
+        of the message (or as much of the body as TOP retrieved)."""
+        # We just check for "+OK" and assume no error response will be
+        # given if that is (which seems reasonable); a message without
+        # a separator between the headers and the body (a malformed
+        # message) still gets the judgement header.
+        if not stream.isOK():
             # Must be an error response.  Return unproxied.
-            return response
+            return stream.rawResponse()
+
+        retrieval = (command, args, stream)
+        if state.tokenizerPool is not None:
+            # Parsing and tokenizing the message can take a while (with
+            # the DNS, OCR and URL options, much more than a while), so
+            # do that in a worker thread, and carry on serving other
+            # clients and the web interface meanwhile.  The response is
+            # sent by onTokenized().
+            def onTokenized(result, excInfo):
+                self.onTokenized(retrieval, result, excInfo)
+            state.tokenizerPool.submit(self.tokenize, (stream,),
+                                       onTokenized)
+            return None
+
+        try:
+            result, excInfo = self.tokenize(stream), None
+        except:
+            result, excInfo = None, sys.exc_info()
+        return self.classify(retrieval, result, excInfo)
+
+    def tokenize(self, stream):
+        """Finishes parsing the message and tokenizes it, returning
+        (msg, tokens, slurpURLs), where slurpURLs are the URLs for the
+        classifier to retrieve if x-slurp_urls is on.  This may be run in
+        a worker thread, so it mustn't touch the classifier or any of the
+        other state."""
+        msg = stream.message()
+        tokens = msg.tokenize()
+        return msg, tokens, classifier.get_slurp_urls()
+
+    def onTokenized(self, retrieval, result, excInfo):
+        """Sends the response to a RETR or TOP whose message was
+        tokenized in a worker thread."""
+        response = self.classify(retrieval, result, excInfo)
+        if not self.isClosed:
+            self.resumeResponse(response)
 
+    def classify(self, retrieval, result, excInfo):
+        """Scores a message tokenized by tokenize(), adds the judgement
+        headers, caches the message, and returns the response for the
+        email client."""
+        command, args, stream = retrieval
         try:
-            msg = email.message_from_string(messageText,
-                      _class=spambayes.message.SBHeaderMessage)
+            if excInfo is not None:
+                raise excInfo[0], excInfo[1], excInfo[2]
+            msg, tokens, slurpURLs = result
             msg.setId(state.getNewMessageName())
             # Now find the spam disposition and add the header.
-            (prob, clues) = state.bayes.spamprob(msg.tokenize(),
-                                                 evidence=True)
+            if options["URLRetriever", "x-slurp_urls"]:
+                (prob, clues) = state.bayes.spamprob(tokens, evidence=True,
+                                                     slurp_urls=slurpURLs)
+            else:
+                (prob, clues) = state.bayes.spamprob(tokens, evidence=True)
 
             msg.addSBHeaders(prob, clues)
 
@@ -571,11 +841,12 @@ class BayesProxy(POP3ProxyBase):
                      options["Storage", "no_cache_bulk_ham"] and
                      msg.get('precedence') in ['bulk', 'list'])
 
-                # Suppress large messages if the options say so.
+                # Suppress large messages if the options say so (and
+                # those that were too large to parse in full).
                 size_limit = options["Storage",
                                      "no_cache_large_messages"]
-                isTooBig = size_limit > 0 and \
-                           len(messageText) > size_limit
+                isTooBig = (size_limit > 0 and stream.size > size_limit) \
+                           or stream.truncated
 
                 # Cache the message.  Don't pollute the cache with test
                 # messages or suppressed bulk ham.
@@ -593,49 +864,33 @@ class BayesProxy(POP3ProxyBase):
             # SBHeaderMessage might have "fixed" a partial message by
             # appending a closing boundary separator.  Remember we can
             # be dealing with partial message here because of the timeout
-            # code in onServerLine.
+            # code in onServerLine.  If there was no separator, then
+            # there's no body - a bad message, but proxy it through
+            # anyway (adding the missing separator).
             headers = []
             for name, value in msg.items():
                 header = "%s: %s" % (name, value)
                 headers.append(re.sub(r'\r?\n', '\r\n', header))
-            try:
-                body = re.split(r'\n\r?\n', messageText, 1)[1]
-            except IndexError:
-                # No separator, so no body.  Bad message, but proxy it
-                # through anyway (adding the missing separator).
-                messageText = "\r\n".join(headers) + "\r\n\r\n"
-            else:
-                messageText = "\r\n".join(headers) + "\r\n\r\n" + body
+            headers = "\r\n".join(headers) + "\r\n\r\n"
         except:
             # Something nasty happened while parsing or classifying -
             # report the exception in a hand-appended header and recover.
             # This is one case where an unqualified 'except' is OK, 'cos
             # anything's better than destroying people's email...
-            messageText, details = spambayes.message.\
-                                   insert_exception_header(messageText)
+            headers, details = spambayes.message.\
+                               insert_exception_header(stream.rawHeaders())
 
             # Print the exception and a traceback.
             print >> sys.stderr, details
 
-        # Restore the +OK and the POP3 .\r\n terminator if there was one.
-        retval = ok + "\n" + messageText
-        if terminatingDotPresent:
-            retval += '.\r\n'
-        return retval
-
-    def onTop(self, command, args, response):
-        """Adds the judgement header based on the raw headers and as
-        much of the body as the TOP command retrieves."""
-        # Easy (but see the caveat in BayesProxy.__doc__).
-        return self.onRetr(command, args, response)
+        return stream.response(headers)
 
     def onUser(self, command, args, response):
         """Spins off three separate threads that expires any old messages
-        in the three caches, but does not do any processing of the USER
-        command itself."""
-        start_new_thread(state.spamCorpus.removeExpiredMessages, ())
-        start_new_thread(state.hamCorpus.removeExpiredMessages, ())
-        start_new_thread(state.unknownCorpus.removeExpiredMessages, ())
+        in the three caches, unless that is done by a timer, but does not
+        do any processing of the USER command itself."""
+        if expiryTimer is None:
+            _expireCaches()
         return response
 
     def onUnknown(self, command, args, response):
@@ -696,6 +951,9 @@ class State:
         __main__ code below."""
         self.logFile = None
         self.bayes = None
+        self.tokenizerPool = None
+        self.cacheWriter = None
+        self.reviewIndex = None
         self.platform_mutex = None
         self.prepared = False
         self.can_stop = True
@@ -783,8 +1041,17 @@ class State:
             self.mdb = None
             spambayes.message.Message().message_info_db = None
 
+        if self.cacheWriter is not None:
+            self.cacheWriter.close()
+            self.cacheWriter = None
+        if self.reviewIndex is not None:
+            self.reviewIndex.close()
+            self.reviewIndex = None
         self.spamCorpus = self.hamCorpus = self.unknownCorpus = None
         self.spamTrainer = self.hamTrainer = None
+        if self.tokenizerPool is not None:
+            self.tokenizerPool.close()
+            self.tokenizerPool = None
 
         self.prepared = False
         close_platform_mutex(self.platform_mutex)
@@ -867,6 +1134,17 @@ class State:
         self.bayes = storage.open_storage(self.DBName, self.useDB)
         self.mdb = spambayes.message.Message().message_info_db
 
+        # Threads for tokenizing retrieved messages, if the options say so.
+        # The pages x-slurp_urls retrieves are tokenized with some of the
+        # tokenizer options changed for the duration, which would affect
+        # messages being tokenized by the threads at the same time.
+        threads = options["pop3proxy", "x-tokenizer_threads"]
+        if threads > 0 and options["URLRetriever", "x-slurp_urls"]:
+            print >> sys.stderr, "x-tokenizer_threads can't be used with " \
+                  "x-slurp_urls; messages will be tokenized as they arrive"
+        elif threads > 0:
+            self.tokenizerPool = Dibbler.WorkerPool(threads)
+
         # Load stats manager.
         self.stats = Stats.Stats(options, self.mdb)
 
@@ -896,6 +1174,21 @@ class State:
                                                   '[0123456789\-]*',
                                                   cacheSize=20)
 
+            # Have the messages written to the caches in the background,
+            # if the options say so.
+            if options["Storage", "x-background_cache_writes"]:
+                self.cacheWriter = CacheWriter()
+                for corpus in (self.spamCorpus, self.hamCorpus,
+                               self.unknownCorpus):
+                    corpus.writer = self.cacheWriter
+
+            # Keep summaries of the unknown messages for the review page,
+            # if the options say so.
+            if options["Storage", "x-review_index_file"]:
+                self.reviewIndex = ReviewIndex(get_pathname_option(
+                    "Storage", "x-review_index_file"))
+                self.unknownCorpus.addObserver(self.reviewIndex)
+
             # Given that (hopefully) users will get to the stage
             # where they do not need to do any more regular training to
             # be satisfied with spambayes' performance, we expire old
@@ -960,6 +1253,14 @@ def _addressPortStr((addr, port)):
 
 state = State()
 proxyListeners = []
+expiryTimer = None
+def _expireCaches():
+    """Spins off three separate threads that expire any old messages in
+    the three caches."""
+    start_new_thread(state.spamCorpus.removeExpiredMessages, ())
+    start_new_thread(state.hamCorpus.removeExpiredMessages, ())
+    start_new_thread(state.unknownCorpus.removeExpiredMessages, ())
+
 def _createProxies(servers, proxyPorts):
     """Create BayesProxyListeners for all the given servers."""
     for (server, serverPort), proxyPort in zip(servers, proxyPorts):
@@ -996,7 +1297,18 @@ def main(servers, proxyPorts, uiPort, launchUI):
     httpServer = UserInterfaceServer(uiPort)
     proxyUI = ProxyUserInterface(state, _recreateState)
     httpServer.register(proxyUI)
-    Dibbler.run(launchBrowser=launchUI)
+    # Rather than expiring old messages every time someone logs in, which
+    # with many users means many threads doing the same work, do it every
+    # so often.  (The caches were expired when the state was prepared.)
+    global expiryTimer
+    expiryTimer = Dibbler.Timer(CACHE_EXPIRY_INTERVAL, _expireCaches,
+                                interval=CACHE_EXPIRY_INTERVAL)
+    try:
+        Dibbler.run(launchBrowser=launchUI,
+                    eventLoop=options["globals", "x-event_loop"])
+    finally:
+        expiryTimer.cancel()
+        expiryTimer = None
 
 def prepare(can_stop=True):
     state.init()
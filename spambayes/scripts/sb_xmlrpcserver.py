@@ -15,24 +15,39 @@ Where:
         use DBM store FILE as the persistent store.
     -o section:option:value
         set [section, option] in the options database to value
+    -t
+        handle each request in a thread of its own, so that one client
+        doesn't have to wait for another's messages to be scored
 
     IP
         IP address to bind (use 0.0.0.0 to listen on all IPs of this machine)
     PORT
         Port number to listen to.
+
+As well as the Hammie methods (score, filter, train and so on), the
+server has score_many and filter_many methods, which take a list of
+messages (and the same extra arguments as score and filter) and return
+a list of the results, in the same order, and it supports
+system.multicall.
 """
 
 import getopt
 import sys
 import xmlrpclib
+import SocketServer
 import SimpleXMLRPCServer
 
 from spambayes import hammie, Options
 from spambayes import storage
+from spambayes.rwlock import RWLock, LockedClassifier
 
 class ReusableSimpleXMLRPCServer(SimpleXMLRPCServer.SimpleXMLRPCServer):
     allow_reuse_address = True
 
+class ThreadedXMLRPCServer(SocketServer.ThreadingMixIn,
+                           ReusableSimpleXMLRPCServer):
+    daemon_threads = True
+
 
 program = sys.argv[0] # For usage(); referenced by docstring above
 
@@ -51,6 +66,12 @@ class XMLHammie(hammie.Hammie):
             pass
         return xmlrpclib.Binary(hammie.Hammie.filter(self, msg, *extra))
 
+    def score_many(self, msgs, *extra):
+        return [self.score(msg, *extra) for msg in msgs]
+
+    def filter_many(self, msgs, *extra):
+        return [self.filter(msg, *extra) for msg in msgs]
+
 
 def usage(code, msg=''):
     """Print usage message and sys.exit(code)."""
@@ -64,17 +85,20 @@ def usage(code, msg=''):
 def main():
     """Main program; parse options and go."""
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hd:p:o:')
+        opts, args = getopt.getopt(sys.argv[1:], 'hd:p:o:t')
     except getopt.error, msg:
         usage(2, msg)
 
     options = Options.options
+    threaded = False
 
     for opt, arg in opts:
         if opt == '-h':
             usage(0)
         elif opt == '-o':
             options.set_from_cmdline(arg, sys.stderr)
+        elif opt == '-t':
+            threaded = True
     dbname, usedb = storage.database_type(opts)
 
     if len(args) != 1:
@@ -84,12 +108,20 @@ def main():
     port = int(port)
 
     bayes = storage.open_storage(dbname, usedb)
-    h = XMLHammie(bayes)
-
-    server = ReusableSimpleXMLRPCServer(
+    if threaded:
+        # Only the pickle is all in memory, where any number of threads
+        # can read it at once.
+        bayes = LockedClassifier(bayes, RWLock(usedb == "pickle"))
+        server_class = ThreadedXMLRPCServer
+    else:
+        server_class = ReusableSimpleXMLRPCServer
+    h = XMLHammie(bayes, 'c')
+
+    server = server_class(
         (ip, port),
         SimpleXMLRPCServer.SimpleXMLRPCRequestHandler)
     server.register_instance(h)
+    server.register_multicall_functions()
     server.serve_forever()
 
 if __name__ == "__main__":
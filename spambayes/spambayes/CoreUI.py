@@ -169,9 +169,10 @@ class CoreUserInterface(UserInterface.UserInterface):
         self._writePostamble(help_topic="home_proxy")
 
     def onUpload(self, filename):
-        """Save a message for later training - used by Skip's proxytee.py."""
+        """Save a message for later training - used by Skip's proxytee.py.
+        The uploaded file is read into memory, to be split into messages."""
         # Convert platform-specific line endings into unix-style.
-        filename = filename.replace('\r\n', '\n').replace('\r', '\n')
+        filename = filename.read().replace('\r\n', '\n').replace('\r', '\n')
 
         # Get a message list from the upload and write it into the cache.
         messages = self._convertUploadToMessageList(filename)
@@ -45,7 +45,10 @@ Abstract:
     As messages pass their "expiration date," they are eligible for
     removal from the corpus. To remove them properly,
     removeExpiredMessages() should be called.  As messages are removed,
-    observers are notified.
+    observers are notified.  The timestamp of each message is only looked
+    up the first time removeExpiredMessages() sees it (which a subclass
+    can do without loading the message, by overriding messageTimestamp),
+    and kept in an index after that.
 
     ExpiryCorpus function is included into a concrete Corpus through
     multiple inheritance. It must be inherited before any inheritance
@@ -83,6 +86,7 @@ __credits__ = "Richie Hindle, Tim Peters, all the spambayes contributors."
 
 import sys           # for output of docstring
 import time
+import threading
 
 from spambayes.Options import options
 
@@ -236,6 +240,10 @@ class ExpiryCorpus:
         self.expireBefore = expireBefore
         # Only check for expiry after this time.
         self.expiry_due = time.time()
+        # key -> the message's create timestamp, so that expiry doesn't
+        # need to look at every message every time.
+        self.timestamps = {}
+        self.expiry_lock = threading.Lock()
 
     def removeExpiredMessages(self):
         '''Kill expired messages'''
@@ -247,17 +255,46 @@ class ExpiryCorpus:
         if time.time() < self.expiry_due:
             return
 
-        self.expiry_due = time.time() + self.expireBefore
-        for key in self.keys()[:]:
-            msg = self[key]
-            timestamp = msg.createTimestamp()
-            if timestamp < time.time() - self.expireBefore:
-                if options["globals", "verbose"]:
-                    print 'message %s has expired' % (msg.key(),)
-                from spambayes.storage import NO_TRAINING_FLAG
-                self.removeMessage(msg, observer_flags=NO_TRAINING_FLAG)
-            elif timestamp + self.expireBefore < self.expiry_due:
-                self.expiry_due = timestamp + self.expireBefore
+        # This is often run in a thread of its own; if another thread is
+        # already expiring messages, there's nothing more to do.
+        if not self.expiry_lock.acquire(False):
+            return
+        try:
+            self.updateTimestamps()
+            now = time.time()
+            self.expiry_due = now + self.expireBefore
+            from spambayes.storage import NO_TRAINING_FLAG
+            for key, timestamp in self.timestamps.items():
+                if timestamp < now - self.expireBefore:
+                    del self.timestamps[key]
+                    msg = self.get(key)
+                    if msg is None:
+                        continue
+                    if options["globals", "verbose"]:
+                        print 'message %s has expired' % (msg.key(),)
+                    self.removeMessage(msg, observer_flags=NO_TRAINING_FLAG)
+                elif timestamp + self.expireBefore < self.expiry_due:
+                    self.expiry_due = timestamp + self.expireBefore
+        finally:
+            self.expiry_lock.release()
+
+    def updateTimestamps(self):
+        '''Bring the timestamp index up to date with the corpus'''
+        # Only messages that have been added since the last time need to
+        # be looked at.
+        keys = self.keys()
+        for key in keys:
+            if key not in self.timestamps:
+                self.timestamps[key] = self.messageTimestamp(key)
+        if len(self.timestamps) > len(keys):
+            for key in self.timestamps.keys():
+                if key not in self.msgs:
+                    del self.timestamps[key]
+
+    def messageTimestamp(self, key):
+        '''Return the create timestamp for the message with this key'''
+        # Subclasses may be able to do this without loading the message.
+        return self[key].createTimestamp()
 
 
 class MessageFactory(object):
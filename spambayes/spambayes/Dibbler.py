@@ -110,6 +110,28 @@ the `localhost`-only idea:
 >>>     return clientSocket.getpeername()[0] == clientSocket.getsockname()[0]
 
 
+*Keep-alive, compression and caching*
+
+HTTP/1.1 connections are kept open for more requests, so a page and its
+images don't each need a new connection; responses written with
+`writeOKHeaders` and `write` are sent in chunks, so the browser can tell
+where each one ends.  Text is gzipped for browsers that can take it.  Either
+can be turned off by overriding `HTTPServer.useKeepAlive` or
+`HTTPServer.useCompression` to return False.
+
+Content that doesn't change while the server is running, like an image,
+can be written with `self.writeResource('image/gif', content)` in place of
+`writeOKHeaders` and `write`.  The browser is given an ETag and a
+Last-Modified date for it, and a "304 Not Modified" when it asks again for
+a version that it already has.
+
+Big POSTed bodies (file uploads, for instance) are kept in a temporary file
+while they are read, rather than in memory.  An uploaded file is passed to
+the methlet as a file object, open for reading, rather than as a string, so
+a big one needn't be read into memory unless the methlet needs it all at
+once.
+
+
 *Advanced usage: Dibbler Contexts*
 
 If you want to run several independent Dibbler environments (in different
@@ -130,6 +152,23 @@ but that's only safe to do from one thread.  Instead, you can say:
 in as many threads as you like.
 
 
+*Advanced usage: work that takes a while*
+
+Everything runs in a single thread, so a methlet (or any other asyncore
+component) that takes a long time holds up every other connection.  A
+`WorkerPool` runs functions in a fixed number of threads, and calls you
+back, in the asyncore thread, with the result:
+
+>>> pool = Dibbler.WorkerPool(4)
+>>> def onResult(result, excInfo):
+>>>     # excInfo is None, or sys.exc_info() if the function raised.
+>>>     ...
+>>> pool.submit(slowFunction, (arg1, arg2), onResult)
+
+The callback is made through a `Trigger`, which other threads can use
+directly to have any function called in the asyncore thread.
+
+
 *Dibbler and asyncore*
 
 If this section means nothing to you, you can safely ignore it.
@@ -149,7 +188,20 @@ you want Dibbler to use its own map: `context = Dibbler.Context({})`.
 
 You can either call `Dibbler.run(context)` to run the async loop, or call
 `asyncore.loop()` directly - the only difference is that the former has a
-few more options, like launching the web browser automatically.
+few more options, like launching the web browser automatically, and calls
+any `Timer`s.  A `Timer` calls a function in the asyncore thread after a
+delay, and optionally every so often after that:
+
+>>> expiryTimer = Dibbler.Timer(60, expireOldMessages, interval=3600)
+>>> expiryTimer.cancel()
+
+By default the loop waits for its sockets with `select()`, which looks at
+every socket each time round and can't handle more than FD_SETSIZE
+(often 1024) file descriptors.  With many connections, use `poll()` or
+(on Linux) `epoll`, which doesn't have to be told about every socket
+each time: `Dibbler.run(eventLoop="epoll")`, or "best" for the best
+that's available.  `Dibbler.Context(myMap, eventLoop="poll")` and
+`context.setEventLoop("epoll")` do the same for other contexts.
 
 
 *Self-test*
@@ -171,6 +223,9 @@ except ImportError:
 
 import sys, re, time, traceback, base64
 import socket, cgi, urlparse, webbrowser
+import threading, Queue, heapq
+import zlib, tempfile
+from email.Utils import formatdate, parsedate_tz, mktime_tz
 
 try:
     "".rstrip("abc")
@@ -185,6 +240,17 @@ else:
 from spambayes.port import md5
 from spambayes import asyncore, asynchat
 
+# Request bodies bigger than this are kept in a temporary file while they
+# are read, rather than in memory.
+BODY_SPOOL_SIZE = 256 * 1024
+
+# Responses of these content types are compressed, if the browser can
+# take it.
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/xml')
+
+# Splits a header line into its name and value.
+_headersRegex = re.compile(r'([^:]*):\s*(.*)')
+
 class BrighterAsyncChat(asynchat.async_chat):
     """An asynchat.async_chat that doesn't give spurious warnings on
     receiving an incoming connection, lets SystemExit cause an exit, can
@@ -227,9 +293,12 @@ class BrighterAsyncChat(asynchat.async_chat):
 
 class Context:
     """See the main documentation for details of `Dibbler.Context`."""
-    def __init__(self, asyncMap=asyncore.socket_map):
+    def __init__(self, asyncMap=asyncore.socket_map, eventLoop='select'):
         self._HTTPPort = None  # Stores the port for `run(launchBrowser=True)`
         self._map = asyncMap
+        self._timers = []      # A heap of (when, sequence, timer).
+        self._timerSequence = 0
+        self.setEventLoop(eventLoop)
     def pop(self, key):
         return self._map.pop(key)
     def keys(self):
@@ -237,9 +306,201 @@ class Context:
     def __len__(self):
         return len(self._map)
 
+    def setEventLoop(self, eventLoop):
+        """Sets how the loop waits for its sockets: 'select', 'poll',
+        'epoll', or 'best' for the best of those that are available.
+        Raises ValueError if the one asked for isn't available."""
+        self._poll = asyncore.get_poll_function(eventLoop)
+
+    def poll(self, timeout=0.0):
+        """Waits up to `timeout` seconds for something to happen on the
+        sockets, and deals with it."""
+        self._poll(timeout, self._map)
+
+    def loop(self, timeout=30.0):
+        """Runs the loop until there are no sockets left, calling any
+        `Timer`s that are due along the way."""
+        while self._map:
+            self.poll(self._timeUntilNextTimer(timeout))
+            self._runTimers()
+
+    def _addTimer(self, timer):
+        self._timerSequence += 1
+        heapq.heappush(self._timers, (timer.when, self._timerSequence, timer))
+
+    def _timeUntilNextTimer(self, timeout):
+        if self._timers:
+            timeout = max(0.0, min(timeout, self._timers[0][0] - time.time()))
+        return timeout
+
+    def _runTimers(self):
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            when, unused, timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                timer._fire(now)
+
 _defaultContext = Context()
 
 
+class Timer:
+    """Calls `function(*args)` in the asyncore thread `delay` seconds from
+    now, and then every `interval` seconds if that is given, until
+    `cancel()` is called.  This lets an asyncore application do periodic
+    work without a thread or a polling loop of its own.  Timers should be
+    created in the asyncore thread; other threads can do that with
+    `Trigger.pull`."""
+
+    def __init__(self, delay, function, args=(), interval=None,
+                 context=_defaultContext):
+        self.function = function
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+        self._context = context
+        self.when = time.time() + delay
+        context._addTimer(self)
+
+    def cancel(self):
+        """Stops the timer.  It's fine to call this more than once."""
+        self.cancelled = True
+
+    def _fire(self, now):
+        try:
+            self.function(*self.args)
+        except SystemExit:
+            raise
+        except:
+            # As for a failing asyncore dispatcher, report it and carry on.
+            print >> sys.stderr, "Timer %r failed:" % (self.function,)
+            traceback.print_exc()
+        if self.interval is not None and not self.cancelled:
+            # If we've fallen behind, skip the calls that were missed.
+            self.when = max(self.when + self.interval, now)
+            self._context._addTimer(self)
+
+
+class Trigger(asyncore.dispatcher):
+    """Lets other threads have functions called in the asyncore thread.
+    `pull(function, *args)` queues the call and wakes the asyncore loop
+    by writing a byte to a socket that the trigger is reading.  (A
+    connected pair of TCP sockets is used rather than a pipe so that
+    this works on Windows too.)"""
+
+    def __init__(self, context=_defaultContext):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        self.writer = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.writer.connect(listener.getsockname())
+        # Any local process can connect to the listener, so make sure
+        # that the connection accepted is our own.
+        while True:
+            reader, address = listener.accept()
+            if address == self.writer.getsockname():
+                break
+            reader.close()
+        listener.close()
+        # pull() mustn't wait if the loop has fallen behind.
+        self.writer.setblocking(False)
+        asyncore.dispatcher.__init__(self, reader, map=context._map)
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def pull(self, function, *args):
+        """Call `function(*args)` in the asyncore thread, as soon as it
+        gets round to it.  Safe to call from any thread."""
+        self.lock.acquire()
+        try:
+            self.calls.append((function, args))
+        finally:
+            self.lock.release()
+        try:
+            self.writer.send('x')
+        except socket.error:
+            # Closed, or the buffer is full - in which case the loop
+            # will wake up anyway.
+            pass
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def handle_connect(self):
+        pass
+
+    def handle_read(self):
+        try:
+            self.recv(8192)
+        except socket.error:
+            pass
+        self.lock.acquire()
+        try:
+            calls = self.calls
+            self.calls = []
+        finally:
+            self.lock.release()
+        for function, args in calls:
+            try:
+                function(*args)
+            except SystemExit:
+                raise
+            except:
+                # Report it, but don't let it close the trigger.
+                traceback.print_exc()
+
+    def close(self):
+        self.writer.close()
+        asyncore.dispatcher.close(self)
+
+
+class WorkerPool:
+    """Runs functions in a fixed number of worker threads, and calls back
+    in the asyncore thread when each is done.  See the main documentation
+    for details."""
+
+    def __init__(self, size, context=_defaultContext):
+        self.size = size
+        self.trigger = Trigger(context)
+        self.jobs = Queue.Queue()
+        self.threads = []
+        for i in range(size):
+            thread = threading.Thread(target=self._work)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, function, args, callback):
+        """Run `function(*args)` in a worker thread, then call
+        `callback(result, excInfo)` in the asyncore thread.  excInfo is
+        None, or sys.exc_info() if the function raised an exception (in
+        which case result is None)."""
+        self.jobs.put((function, args, callback))
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            function, args, callback = job
+            try:
+                result, excInfo = function(*args), None
+            except:
+                result, excInfo = None, sys.exc_info()
+            self.trigger.pull(callback, result, excInfo)
+            # Don't keep the traceback (and its frames) alive.
+            job = function = args = callback = result = excInfo = None
+
+    def close(self):
+        """Stop the threads once they've finished the jobs already
+        submitted.  Callbacks for those jobs are not made."""
+        for thread in self.threads:
+            self.jobs.put(None)
+        self.trigger.close()
+
+
 class Listener(asyncore.dispatcher):
     """Generic listener class used by all the different types of server.
     Listens for incoming socket connections and calls a factory function
@@ -285,7 +546,9 @@ class Listener(asyncore.dispatcher):
         except socket.error:
             print >> sys.stderr, "port", port, "in use"
             raise
-        self.listen(5)
+        # A small backlog makes clients wait (for seconds, while their
+        # connection attempts are retried) when many connect at once.
+        self.listen(socket.SOMAXCONN)
 
     def handle_accept(self):
         """Asyncore override."""
@@ -319,6 +582,7 @@ class HTTPServer(Listener):
         Listener.__init__(self, port, _HTTPHandler,
                           (self, context), context._map)
         self._plugins = []
+        self._resources = {}
         try:
             context._HTTPPort = port[1]
         except TypeError:
@@ -354,16 +618,58 @@ class HTTPServer(Listener):
         """Override: Specify the cancel message for an HTTP Authentication."""
         return "You must log in."
 
+    def useKeepAlive(self):
+        """Override: Return False to close every connection after one
+        response, rather than keeping HTTP/1.1 connections open for more
+        requests."""
+        return True
+
+    def useCompression(self):
+        """Override: Return False to never gzip responses."""
+        return True
+
+    def _getResource(self, contentType, content):
+        """Returns the `_Resource` for some unchanging content, which is
+        made the first time it is asked for."""
+        resource = self._resources.get(id(content))
+        if resource is None or resource.content is not content:
+            resource = _Resource(contentType, content)
+            self._resources[id(content)] = resource
+        return resource
+
+
+class _Resource:
+    """Something that `HTTPPlugin.writeResource` writes: some content that
+    doesn't change while the server is running, with what the browser needs
+    to cache it."""
+
+    def __init__(self, contentType, content):
+        # Holding on to the content means that its id isn't reused.
+        self.content = content
+        self.etag = '"%s"' % (md5(content).hexdigest(),)
+        self.modified = time.time()
+        self.compressed = None
+        for prefix in COMPRESSIBLE_TYPES:
+            if contentType.startswith(prefix):
+                compressor = zlib.compressobj(9, zlib.DEFLATED,
+                                              16 + zlib.MAX_WBITS)
+                self.compressed = compressor.compress(content) + \
+                                  compressor.flush()
+                break
+
 
 class _HTTPHandler(BrighterAsyncChat):
     """This is a helper for the HTTP server class - one of these is created
-    for each incoming request, and does the job of decoding the HTTP traffic
-    and driving the plugins."""
+    for each incoming connection, and does the job of decoding the HTTP
+    traffic and driving the plugins."""
 
     # RE to extract option="value" fields from
     # digest auth login field
     _login_splitter = re.compile('([a-zA-Z]+)=(".*?"|.*?),?')
 
+    # Read big request bodies in big pieces.
+    ac_in_buffer_size = 65536
+
     def __init__(self, clientSocket, server, context):
         # Grumble: asynchat.__init__ doesn't take a 'map' argument,
         # hence the two-stage construction.
@@ -371,29 +677,65 @@ class _HTTPHandler(BrighterAsyncChat):
         BrighterAsyncChat.set_socket(self, clientSocket, context._map)
         self._context = context
         self._server = server
-        self._request = ''
+        self._request = []
+        self._body = None
         self.set_terminator('\r\n\r\n')
+        self._startResponse()
 
+        # Tell the plugins about the connection, letting them veto it.
+        for plugin in self._server._plugins:
+            if not plugin.onIncomingConnection(clientSocket):
+                self.close()
+
+    def _startResponse(self, keepAlive=False, compress=False):
+        """Get ready to send the response to a request."""
         # Because a methlet is likely to call `writeOKHeaders` before doing
         # anything else, an unexpected exception won't send back a 500, which
         # is poor.  So we buffer any sent headers until either a plain `write`
         # happens or the methlet returns.
         self._bufferedHeaders = []
         self._headersWritten = False
-
-        # Tell the plugins about the connection, letting them veto it.
-        for plugin in self._server._plugins:
-            if not plugin.onIncomingConnection(clientSocket):
-                self.close()
+        # Whether the connection is kept open for another request, and
+        # whether the browser can take gzipped content.
+        self._keepAlive = keepAlive
+        self._compress = compress
+        # Set by `writeOKHeaders` if the body is sent in chunks (which
+        # is how the browser knows where it ends, on a connection that is
+        # kept open), and if it is compressed.
+        self._chunked = False
+        self._compressor = None
 
     def collect_incoming_data(self, data):
         """Asynchat override."""
-        self._request = self._request + data
+        if self._body is not None:
+            self._body.write(data)
+        else:
+            self._request.append(data)
 
     def found_terminator(self):
         """Asynchat override."""
+        if self._body is not None:
+            # We've just read the body of a POSTed request.
+            self.set_terminator('\r\n\r\n')
+            body = self._body
+            self._body = None
+            body.seek(0)
+            try:
+                self._readBody(body)
+            finally:
+                body.close()
+            self._handleRequest()
+            return
+
+        # Some browsers send an extra CRLF after the body of a POSTed
+        # request, which we see before the next request on the connection.
+        request = ''.join(self._request).lstrip('\r\n')
+        self._request = []
+        if not request:
+            return
+
         # Parse the HTTP request.
-        requestLine, headers = (self._request+'\r\n').split('\r\n', 1)
+        requestLine, headers = (request+'\r\n').split('\r\n', 1)
         try:
             method, url, version = requestLine.strip().split()
         except ValueError:
@@ -401,53 +743,94 @@ class _HTTPHandler(BrighterAsyncChat):
             self.close_when_done()
             return
 
+        # Parse the headers.  Header names are case-insensitive.
+        self._headersDict = {}
+        for line in headers.split('\r\n'):
+            match = _headersRegex.match(line)
+            if match:
+                name, value = match.groups()
+                self._headersDict[name.lower()] = value
+
+        # Only an HTTP/1.1 browser knows how to tell where a chunked
+        # response ends, which a kept-alive connection needs.
+        connection = self._headersDict.get('connection', '').lower()
+        keepAlive = (version.upper() == 'HTTP/1.1' and
+                     connection != 'close' and self._server.useKeepAlive())
+        compress = (self._server.useCompression() and
+                    'gzip' in self._headersDict.get('accept-encoding', ''))
+        self._startResponse(keepAlive, compress)
+
         # Parse the URL, and deal with POST vs. GET requests.
-        method = method.upper()
-        unused, unused, path, unused, query, unused = urlparse.urlparse(url)
-        cgiParams = cgi.parse_qs(query, keep_blank_values=True)
-        if self.get_terminator() == '\r\n\r\n' and method == 'POST':
+        self._method = method.upper()
+        unused, unused, self._path, unused, query, unused = \
+                urlparse.urlparse(url)
+        self._cgiParams = cgi.parse_qs(query, keep_blank_values=True)
+        if self._method == 'POST':
             # We need to read the body - set a numeric async_chat terminator
-            # equal to the Content-Length.
-            match = re.search(r'(?i)content-length:\s*(\d+)', headers)
-            contentLength = int(match.group(1))
+            # equal to the Content-Length.  A big body is kept in a file
+            # until it has all arrived.
+            try:
+                contentLength = int(self._headersDict['content-length'])
+            except (KeyError, ValueError):
+                contentLength = 0
             if contentLength > 0:
+                if contentLength > BODY_SPOOL_SIZE:
+                    self._body = tempfile.TemporaryFile()
+                else:
+                    self._body = StringIO.StringIO()
+                self._contentLength = contentLength
                 self.set_terminator(contentLength)
-                self._request = self._request + '\r\n\r\n'
                 return
+        self._handleRequest()
+
+    def _readBody(self, body):
+        """Decode the body of a POSTed request, which will contain
+        parameters and possibly uploaded files."""
+        contentTypeHeader = self._headersDict.get('content-type', '')
+        contentType, pdict = cgi.parse_header(contentTypeHeader)
+        if contentType == 'multipart/form-data':
+            # multipart/form-data - probably a file upload.  FieldStorage
+            # reads the parts a line at a time, and keeps big ones in
+            # temporary files, so the body needn't be in memory at once;
+            # uploaded files are passed on as they are kept.
+            form = cgi.FieldStorage(fp=body,
+                        headers={'content-type' : contentTypeHeader,
+                                 'content-length' : str(self._contentLength)},
+                        environ={'REQUEST_METHOD' : 'POST'},
+                        keep_blank_values=True)
+            for name in form.keys():
+                fields = form[name]
+                if not isinstance(fields, list):
+                    fields = [fields]
+                values = []
+                for field in fields:
+                    if field.filename:
+                        field.file.seek(0)
+                        values.append(field.file)
+                    else:
+                        values.append(field.value)
+                self._cgiParams[name] = values
+        else:
+            # A normal x-www-form-urlencoded.
+            self._cgiParams.update(cgi.parse_qs(body.read(),
+                                                keep_blank_values=True))
 
-        # Have we just read the body of a POSTed request?  Decode the body,
-        # which will contain parameters and possibly uploaded files.
-        if type(self.get_terminator()) is type(1):
-            self.set_terminator('\r\n\r\n')
-            body = self._request.split('\r\n\r\n', 1)[1]
-            match = re.search(r'(?i)content-type:\s*([^\r\n]+)', headers)
-            contentTypeHeader = match.group(1)
-            contentType, pdict = cgi.parse_header(contentTypeHeader)
-            if contentType == 'multipart/form-data':
-                # multipart/form-data - probably a file upload.
-                bodyFile = StringIO.StringIO(body)
-                cgiParams.update(cgi.parse_multipart(bodyFile, pdict))
-            else:
-                # A normal x-www-form-urlencoded.
-                cgiParams.update(cgi.parse_qs(body, keep_blank_values=True))
+    def _handleRequest(self):
+        """Authenticate the request, and call the methlet for it."""
+        method, path = self._method, self._path
 
         # Convert the cgi params into a simple dictionary.
         params = {}
-        for name, value in cgiParams.iteritems():
+        for name, value in self._cgiParams.iteritems():
             params[name] = value[0]
-
-        # Parse the headers.
-        headersRegex = re.compile('([^:]*):\s*(.*)')
-        headersDict = dict([headersRegex.match(line).groups(2)
-                           for line in headers.split('\r\n')
-                           if headersRegex.match(line)])
+        self._cgiParams = None
 
         # HTTP Basic/Digest Authentication support.
         serverAuthMode = self._server.requestAuthenticationMode()
         if serverAuthMode != HTTPServer.NO_AUTHENTICATION:
             # The server wants us to authenticate the user.
             authResult = False
-            authHeader = headersDict.get('Authorization')
+            authHeader = self._headersDict.get('authorization')
             if authHeader:
                 authMatch = re.search('(\w+)\s+(.*)', authHeader)
                 authenticationMode, login = authMatch.groups()
@@ -461,6 +844,7 @@ class _HTTPHandler(BrighterAsyncChat):
 
             if not authResult:
                 self.writeUnauthorizedAccess(serverAuthMode)
+                return
 
         # Find and call the methlet.  '/eggs.gif' becomes 'onEggsGif'.
         if path == '/':
@@ -503,7 +887,7 @@ class _HTTPHandler(BrighterAsyncChat):
                             return not isinstance(dispatcher, _HTTPHandler)
 
                         while len(filter(isProtected, contextMap.values())) > 0:
-                            asyncore.poll(timeout=1, map=contextMap)
+                            self._context.poll(timeout=1)
 
                         raise SystemExit
 
@@ -516,26 +900,62 @@ class _HTTPHandler(BrighterAsyncChat):
         else:
             self.onUnknown(path, params)
 
-        # `close_when_done` and `Connection: close` ensure that we don't
-        # support keep-alives or pipelining.  There are problems with some
-        # browsers, for instance with extra characters being appended after
-        # the body of a POSTed request.
-        self.close_when_done()
+        # Finish the response, and either wait for the next request or
+        # close the connection.
+        if self._closed:
+            # The methlet closed the connection itself.
+            return
+        self._finishBody()
+        if self._keepAlive:
+            self._startResponse()
+        else:
+            self.close_when_done()
 
     def onUnknown(self, path, params):
         """Handler for unknown URLs.  Returns a 404 page."""
         self.writeError(404, "Not found: '%s'" % path)
 
+    def _httpDate(self, timestamp=None):
+        """Returns the time, or now, as an HTTP date."""
+        return formatdate(timestamp, usegmt=True)
+
+    def _connectionHeader(self):
+        """Returns the Connection header for the response, if it needs
+        one."""
+        if self._keepAlive:
+            return []
+        return ["Connection: close"]
+
+    def _isCompressible(self, contentType):
+        if not self._compress:
+            return False
+        for prefix in COMPRESSIBLE_TYPES:
+            if contentType.startswith(prefix):
+                return True
+        return False
+
     def writeOKHeaders(self, contentType, extraHeaders={}):
         """Reflected from `HTTPPlugin`s."""
         # Buffer the headers until there's a `write`, in case an error occurs.
-        timeNow = time.gmtime(time.time())
-        httpNow = time.strftime('%a, %d %b %Y %H:%M:%S GMT', timeNow)
         headers = []
         headers.append("HTTP/1.1 200 OK")
-        headers.append("Connection: close")
+        headers.extend(self._connectionHeader())
         headers.append('Content-Type: %s; charset="utf-8"' % contentType)
-        headers.append("Date: %s" % httpNow)
+        headers.append("Date: %s" % self._httpDate())
+        # The methlet may write its content in pieces, flushing as it goes,
+        # so we don't know how long it will be.  On a connection that is
+        # kept open, it is sent in chunks, so the browser can tell where it
+        # ends; otherwise closing the connection does that.
+        self._chunked = self._keepAlive
+        if self._chunked:
+            headers.append("Transfer-Encoding: chunked")
+        if self._isCompressible(contentType):
+            headers.append("Content-Encoding: gzip")
+            headers.append("Vary: Accept-Encoding")
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                                16 + zlib.MAX_WBITS)
+        else:
+            self._compressor = None
         for name, value in extraHeaders.items():
             headers.append("%s: %s" % (name, value))
         headers.append("")
@@ -544,31 +964,127 @@ class _HTTPHandler(BrighterAsyncChat):
 
     def writeError(self, code, message):
         """Reflected from `HTTPPlugin`s."""
-        # Writing an error overrides any buffered headers, but obviously
-        # doesn't want to write any headers if some have already gone.
+        content = "<html><body>%s</body></html>" % (message,)
+        if self._headersWritten:
+            # Obviously we can't write any headers if some have already
+            # gone, so the error becomes part of the page.
+            self._writeBody(content)
+            return
+        # Writing an error overrides any buffered headers.  The methlet
+        # might carry on writing after the error, so we can't say how long
+        # the response is; the connection is closed after it.
+        self._keepAlive = False
+        self._bufferedHeaders = []
+        self._chunked = False
+        self._compressor = None
+        self._headersWritten = True
         headers = []
-        if not self._headersWritten:
-            headers.append("HTTP/1.0 %d Error" % code)
-            headers.append("Connection: close")
-            headers.append('Content-Type: text/html; charset="utf-8"')
-            headers.append("")
-            headers.append("")
-        self.push("%s<html><body>%s</body></html>" % \
-                  ('\r\n'.join(headers), message))
+        headers.append("HTTP/1.1 %d Error" % code)
+        headers.append("Connection: close")
+        headers.append('Content-Type: text/html; charset="utf-8"')
+        headers.append("Content-Length: %d" % len(content))
+        headers.append("")
+        headers.append("")
+        self.push('\r\n'.join(headers) + content)
+
+    def writeResource(self, contentType, content):
+        """Reflected from `HTTPPlugin`s."""
+        resource = self._server._getResource(contentType, content)
+        self._bufferedHeaders = []
+        self._chunked = False
+        self._compressor = None
+        self._headersWritten = True
+        headers = []
+
+        # The browser may already have this version of the resource.
+        etags = self._headersDict.get('if-none-match')
+        since = self._headersDict.get('if-modified-since')
+        if etags is not None:
+            notModified = (resource.etag in etags or etags.strip() == '*')
+        elif since is not None:
+            since = parsedate_tz(since.split(';')[0])
+            notModified = (since is not None and
+                           mktime_tz(since) >= int(resource.modified))
+        else:
+            notModified = False
+        if notModified:
+            headers.append("HTTP/1.1 304 Not Modified")
+            content = ''
+        else:
+            headers.append("HTTP/1.1 200 OK")
+            if contentType.startswith('text/'):
+                contentType = '%s; charset="utf-8"' % (contentType,)
+            headers.append("Content-Type: %s" % (contentType,))
+            if resource.compressed is not None and \
+               self._isCompressible(contentType):
+                headers.append("Content-Encoding: gzip")
+                content = resource.compressed
+            headers.append("Content-Length: %d" % len(content))
+        if resource.compressed is not None:
+            headers.append("Vary: Accept-Encoding")
+        headers.extend(self._connectionHeader())
+        headers.append("Date: %s" % self._httpDate())
+        headers.append("ETag: %s" % (resource.etag,))
+        headers.append("Last-Modified: %s" %
+                       self._httpDate(resource.modified))
+        headers.append("")
+        headers.append("")
+        self.push('\r\n'.join(headers) + content)
 
     def write(self, content):
         """Reflected from `HTTPPlugin`s."""
+        # `write(None)` just flushes buffered headers.
+        if content is None:
+            content = ''
+        else:
+            content = str(content)
+
         # The methlet is writing, so write any buffered headers first.
-        headers = []
         if self._bufferedHeaders:
             headers = self._bufferedHeaders
             self._bufferedHeaders = None
             self._headersWritten = True
+            self.push('\r\n'.join(headers))
+        elif not self._headersWritten:
+            # The methlet is writing its own headers, so we can't tell
+            # where the response ends, except by closing the connection.
+            self._keepAlive = False
+            self._headersWritten = True
+            self.push(content)
+            return
+        self._writeBody(content)
+
+    def _writeBody(self, content):
+        """Writes some of the body of the response, compressing it and
+        making it a chunk if need be."""
+        if self._compressor is not None:
+            content = self._compressor.compress(content)
+        self._pushChunk(content)
+
+    def _pushChunk(self, content):
+        if not content:
+            # An empty chunk would mark the end of the body.
+            return
+        if self._chunked:
+            self.push("%x\r\n%s\r\n" % (len(content), content))
+        else:
+            self.push(content)
 
-        # `write(None)` just flushes buffered headers.
-        if content is None:
-            content = ''
-        self.push('\r\n'.join(headers) + str(content))
+    def _finishBody(self):
+        """Writes whatever is left of the response."""
+        if self._compressor is not None:
+            self._pushChunk(self._compressor.flush())
+            self._compressor = None
+        if self._chunked:
+            self.push("0\r\n\r\n")
+            self._chunked = False
+
+    def flush(self):
+        """Flush everything in the output buffer, including anything that
+        the compressor is holding on to."""
+        if self._compressor is not None and self._headersWritten:
+            self._pushChunk(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        BrighterAsyncChat.flush(self)
 
     def writeUnauthorizedAccess(self, authenticationMode):
         """Access is protected by HTTP authentication."""
@@ -705,6 +1221,13 @@ class HTTPPlugin:
         page's content."""
         return self._handler.write(content)
 
+    def writeResource(self, contentType, content):
+        """A methlet can call this instead of `writeOKHeaders()` / `write()`
+        to write content that doesn't change while the server is running,
+        like an image.  The browser is told that it can cache it, and is
+        sent a "304 Not Modified" when it already has it."""
+        return self._handler.writeResource(contentType, content)
+
     def flush(self):
         """A methlet can call this after calling `write`, to ensure that
         the content is written immediately to the browser.  This isn't
@@ -721,10 +1244,11 @@ class HTTPPlugin:
         return self._handler.close()
 
 
-def run(launchBrowser=False, context=_defaultContext):
+def run(launchBrowser=False, context=_defaultContext, eventLoop=None):
     """Runs a `Dibbler` application.  Servers listen for incoming connections
     and route requests through to plugins until a plugin calls `sys.exit()`
-    or raises a `SystemExit` exception."""
+    or raises a `SystemExit` exception.  `eventLoop`, if given, is passed
+    to `context.setEventLoop`."""
 
     if launchBrowser:
         try:
@@ -732,7 +1256,9 @@ def run(launchBrowser=False, context=_defaultContext):
             webbrowser.open_new(url)
         except webbrowser.Error, e:
             print "\n%s.\nPlease point your web browser at %s." % (e, url)
-    asyncore.loop(map=context._map)
+    if eventLoop is not None:
+        context.setEventLoop(eventLoop)
+    context.loop()
 
 
 def runTestServer(readyEvent=None):
@@ -9,6 +9,7 @@ Classes:
     FileMessageFactory - a factory to create FileMessage objects
     GzipFileMessage - A FileMessage zipped for less storage
     GzipFileMessageFactory - factory to create GzipFileMessage objects
+    CacheWriter - stores FileMessages in a background thread
 
 Abstract:
     These classes are concrete implementations of the Corpus framework.
@@ -29,6 +30,11 @@ Abstract:
     relatively small size of the average textual message.  Still, for a large
     corpus, this could amount to a significant space savings.
 
+    If a FileCorpus is given a CacheWriter (as its writer attribute), the
+    messages added to it are stored by the CacheWriter's thread rather
+    than by addMessage() itself.  Until a message has been stored, the
+    corpus hands out the same message object for its key.
+
     See Corpus.__doc__ for more information.
 
 To Do:
@@ -48,7 +54,8 @@ import email
 
 from spambayes import Corpus
 from spambayes import message
-import os, gzip, fnmatch, time, stat
+import os, sys, gzip, fnmatch, time, stat, traceback
+import threading, Queue
 from spambayes.Options import options
 
 class FileCorpus(Corpus.Corpus):
@@ -61,6 +68,7 @@ filter'''
 
         self.directory = directory
         self.filter = filter
+        self.writer = None
 
         # This assumes that the directory exists.  A horrible death occurs
         # otherwise. We *could* simply create it, but that will likely only
@@ -83,6 +91,12 @@ filter'''
 
     def makeMessage(self, key, content=None):
         '''Ask our factory to make a Message'''
+        if content is None and self.writer is not None:
+            # If the message is still waiting to be stored, its file
+            # might not be there (or be complete) yet.
+            msg = self.writer.get(os.path.join(self.directory, key))
+            if msg is not None:
+                return msg
         msg = self.factory.create(key, self.directory, content)
         return msg
 
@@ -95,7 +109,10 @@ filter'''
             print 'adding', message.key(), 'to corpus'
 
         message.directory = self.directory
-        message.store()
+        if self.writer is None:
+            message.store()
+        else:
+            self.writer.store(message)
         # superclass processing *MUST* be done
         # perform superclass processing *LAST!*
         Corpus.Corpus.addMessage(self, message, observer_flags)
@@ -105,6 +122,9 @@ filter'''
         if options["globals", "verbose"]:
             print 'removing', message.key(), 'from corpus'
 
+        if self.writer is not None:
+            # Don't let the file be written after it has been removed.
+            self.writer.flush(message.pathname())
         message.remove()
 
         # superclass processing *MUST* be done
@@ -142,6 +162,12 @@ filter'''
         Corpus.ExpiryCorpus.__init__(self, expireBefore)
         FileCorpus.__init__(self, factory, directory, filter, cacheSize)
 
+    def messageTimestamp(self, key):
+        '''Return the create timestamp for the message with this key'''
+        # This only needs the file, not the message, so there's no need
+        # to load it (or have it take up room in the cache).
+        return self.makeMessage(key).createTimestamp()
+
 
 class FileMessage(object):
     '''Message that persists as a file system artifact.'''
@@ -227,8 +253,9 @@ class FileMessage(object):
             fp.close()
         self.loaded = True
 
-    def store(self):
-        '''Write the Message substance to the file'''
+    def store(self, sync=False):
+        '''Write the Message substance to the file, and if sync is True,
+        make sure that it is on the disk'''
 
         assert self.file_name is not None, \
                "Must set filename before using FileMessage instances."
@@ -238,6 +265,9 @@ class FileMessage(object):
 
         fp = open(self.pathname(), 'wb')
         fp.write(self.as_string())
+        if sync:
+            fp.flush()
+            os.fsync(fp.fileno())
         fp.close()
 
     def remove(self):
@@ -320,8 +350,9 @@ class FileMessageFactory(MessageFactory):
 
 class GzipFileMessage(FileMessage):
     '''Message that persists as a zipped file system artifact.'''
-    def store(self):
-        '''Write the Message substance to the file'''
+    def store(self, sync=False):
+        '''Write the Message substance to the file, and if sync is True,
+        make sure that it is on the disk'''
         assert self.file_name is not None, \
                "Must set filename before using FileMessage instances."
 
@@ -329,12 +360,153 @@ class GzipFileMessage(FileMessage):
             print 'storing', self.file_name
 
         pn = self.pathname()
-        gz = gzip.open(pn, 'wb')
+        fp = open(pn, 'wb')
+        gz = gzip.GzipFile(pn, 'wb', fileobj=fp)
         gz.write(self.as_string())
         gz.flush()
         gz.close()
+        if sync:
+            fp.flush()
+            os.fsync(fp.fileno())
+        fp.close()
 
 
 class GzipFileMessageFactory(MessageFactory):
     '''MessageFactory for FileMessage objects'''
     klass = GzipFileMessage
+
+
+class CacheWriter:
+    '''Stores FileMessages in a background thread.
+
+    Whatever has been queued by the time the thread gets to it is stored
+    as one batch.  Every file in the batch is written before any of them
+    is flushed to the disk, and then each directory the batch was stored
+    in is flushed, so that the disk can write a busy proxy's messages
+    together, rather than having to finish with each before the next is
+    even written.
+    '''
+
+    def __init__(self, sync=True, batchSize=50):
+        self.sync = sync
+        self.batchSize = batchSize
+        self.queue = Queue.Queue()
+        self.pending = {}       # pathname -> message not yet stored
+        self.condition = threading.Condition()
+        self.batches = 0
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def store(self, message):
+        '''Queue the message to be stored'''
+        pathname = message.pathname()
+        self.condition.acquire()
+        try:
+            self.pending[pathname] = message
+        finally:
+            self.condition.release()
+        self.queue.put((pathname, message))
+
+    def get(self, pathname):
+        '''Return the message waiting to be stored as pathname, or None'''
+        self.condition.acquire()
+        try:
+            return self.pending.get(pathname)
+        finally:
+            self.condition.release()
+
+    def flush(self, pathname=None):
+        '''Wait until the message to be stored as pathname (or, if that's
+        None, every message queued so far) has been stored'''
+        self.condition.acquire()
+        try:
+            while self.pending and (pathname is None or
+                                    pathname in self.pending):
+                self.condition.wait()
+        finally:
+            self.condition.release()
+
+    def close(self):
+        '''Store everything that is queued, and stop the thread'''
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            if batch[-1] is None:
+                self._write(batch[:-1])
+                break
+            self._write(batch)
+
+    def _write(self, batch):
+        stored = []
+        directories = {}
+        try:
+            for pathname, message in batch:
+                try:
+                    message.store()
+                except:
+                    # Whatever went wrong, the thread must carry on with
+                    # the rest of the queue.
+                    print >> sys.stderr, "Can't store", pathname
+                    traceback.print_exc()
+                else:
+                    stored.append(pathname)
+                    directories[os.path.dirname(pathname)] = True
+            if self.sync:
+                for pathname in stored:
+                    _sync_file(pathname)
+                for directory in directories.keys():
+                    _sync_directory(directory)
+            self.batches += 1
+        finally:
+            self._done(batch)
+
+    def _done(self, batch):
+        self.condition.acquire()
+        try:
+            for pathname, message in batch:
+                # It might have been queued again since.
+                if self.pending.get(pathname) is message:
+                    del self.pending[pathname]
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+
+def _sync_file(pathname):
+    """Make sure that the contents of a file that has been written (and
+    closed) are on the disk."""
+    try:
+        # Windows can only flush a file that is open for writing.
+        fp = open(pathname, 'r+b')
+    except IOError:
+        # It has been removed since.
+        return
+    try:
+        os.fsync(fp.fileno())
+    finally:
+        fp.close()
+
+def _sync_directory(directory):
+    """Make sure that the names of new files in the directory are on the
+    disk.  Not every platform can do this (Windows can't open a
+    directory), and there it's not needed."""
+    try:
+        fd = os.open(directory or os.curdir, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+    finally:
+        os.close(fd)
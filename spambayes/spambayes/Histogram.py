@@ -127,11 +127,11 @@ class Hist:
                 i = 0
             buckets[i] += 1
 
-    # Print a histogram to stdout.
+    # Print a histogram to stream (stdout if None).
     # Also sets instance var nbuckets to the # of buckets, and
     # buckts to a list of nbuckets counts, but only if at least one
     # data point is in the collection.
-    def display(self, nbuckets=None, WIDTH=61):
+    def display(self, nbuckets=None, WIDTH=61, stream=None):
         if nbuckets is None:
             nbuckets = self.nbuckets
         if nbuckets <= 0:
@@ -140,15 +140,18 @@ class Hist:
         n = self.n
         if n == 0:
             return
-        print "%d items; mean %.2f; sdev %.2f" % (n, self.mean, self.sdev)
-        print "-> <stat> min %g; median %g; max %g" % (self.min,
-                                                       self.median,
-                                                       self.max)
+        print >> stream, "%d items; mean %.2f; sdev %.2f" % (n, self.mean,
+                                                             self.sdev)
+        print >> stream, "-> <stat> min %g; median %g; max %g" % (self.min,
+                                                                  self.median,
+                                                                  self.max)
         pcts = ['%g%% %g' % x for x in self.pct]
-        print "-> <stat> percentiles:", '; '.join(pcts)
+        print >> stream, "-> <stat> percentiles:", '; '.join(pcts)
 
         lo, hi = self.get_lo_hi()
-        if lo > hi:
+        if lo >= hi:
+            # Nothing to spread across the buckets (e.g. every data
+            # point is the same, with lo and hi left to auto-adjust).
             return
 
         # hunit is how many items a * represents.  A * is printed for
@@ -158,7 +161,7 @@ class Hist:
         hunit, r = divmod(biggest, WIDTH)
         if r:
             hunit += 1
-        print "* =", hunit, "items"
+        print >> stream, "* =", hunit, "items"
 
         # We need ndigits decimal digits to display the largest bucket count.
         ndigits = len(str(biggest))
@@ -179,5 +182,5 @@ class Hist:
         bucketwidth = self.get_bucketwidth()
         for i in range(nbuckets):
             n = self.buckets[i]
-            print format % (lo + i * bucketwidth, n),
-            print '*' * ((n + hunit - 1) // hunit)
+            print >> stream, format % (lo + i * bucketwidth, n),
+            print >> stream, '*' * ((n + hunit - 1) // hunit)
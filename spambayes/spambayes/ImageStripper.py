@@ -8,7 +8,11 @@ import sys
 import os
 import tempfile
 import math
+import time
 import atexit
+import threading
+import subprocess
+import Queue
 try:
     import cStringIO as StringIO
 except ImportError:
@@ -96,10 +100,21 @@ def imconcattb(upper, lower):
     result.paste(lower, (0, h1))
     return result
 
-def PIL_decode_parts(parts):
-    """Decode and assemble a bunch of images using PIL."""
+def PIL_decode_parts(parts, get_payload=None, separate=False):
+    """Decode and assemble a bunch of images using PIL.
+
+    get_payload(part), if given, is used to get the decoded image rather
+    than part.get_payload(decode=True); the tokenizer passes one that
+    reuses payloads it has already decoded.
+
+    Normally all the images are pasted together into a single file, to
+    be OCRed in one go.  If separate is true, each image is saved to a
+    file of its own (and identical images are only saved once), so that
+    they can be OCRed at the same time."""
     tokens = set()
     rows = []
+    pnmfiles = []
+    seen = set()
     max_image_size = options["Tokenizer", "max_image_size"]
     for part in parts:
         # See 'image_large_size_attribute' above - the provider may have seen
@@ -108,7 +123,10 @@ def PIL_decode_parts(parts):
         nbytes = getattr(part, image_large_size_attribute, None)
         if nbytes is None: # no optimization - process normally...
             try:
-                bytes = part.get_payload(decode=True)
+                if get_payload is None:
+                    bytes = part.get_payload(decode=True)
+                else:
+                    bytes = get_payload(part)
                 nbytes = len(bytes)
             except:
                 tokens.add("invalid-image:%s" % part.get_content_type())
@@ -162,6 +180,13 @@ def PIL_decode_parts(parts):
                     pass
             image = image.convert("RGB")
 
+        if separate:
+            digest = md5(bytes).hexdigest()
+            if digest not in seen:
+                seen.add(digest)
+                pnmfiles.append(save_pnm(image))
+            continue
+
         if not rows:
             # first image
             rows.append(image)
@@ -173,18 +198,20 @@ def PIL_decode_parts(parts):
             rows[-1] = imconcatlr(rows[-1], image)
 
     if not rows:
-        return [], tokens
+        return pnmfiles, tokens
 
     # now concatenate the resulting row images top-to-bottom
     full_image, rows = rows[0], rows[1:]
     for image in rows:
         full_image = imconcattb(full_image, image)
 
+    return [save_pnm(full_image)], tokens
+
+def save_pnm(image):
     fd, pnmfile = tempfile.mkstemp('-spambayes-image')
     os.close(fd)
-    full_image.save(open(pnmfile, "wb"), "PPM")
-
-    return [pnmfile], tokens
+    image.save(open(pnmfile, "wb"), "PPM")
+    return pnmfile
 
 class OCREngine(object):
     """Base class for an OCR "engine" that extracts text.  Ideally would
@@ -204,12 +231,20 @@ class OCREngine(object):
         """
         raise NotImplementedError
 
-    def extract_text(self, pnmfiles):
+    def extract_text(self, pnmfile, timeout=None):
         """Extract the text as an unprocessed stream (but as a string).
            Typically this will be the raw output from the OCR engine.
+           If timeout is given, give up (raising OCRTimeout) after that
+           many seconds.
         """
         raise NotImplementedError
 
+class OCRTimeout(SystemError):
+    pass
+
+# The token for an image the OCR program took too long over.
+TIMEOUT_TOKEN = "image-text:ocr timeout"
+
 class OCRExecutableEngine(OCREngine):
     """Uses a simple executable that writes to stdout to extract the text"""
     engine_name = None
@@ -232,9 +267,15 @@ class OCRExecutableEngine(OCREngine):
     def get_command_line(self, pnmfile):
         raise NotImplementedError, "base classes must override"
 
-    def extract_text(self, pnmfile):
+    def get_args(self, pnmfile):
+        """Return the command line as a list, for subprocess."""
+        raise NotImplementedError, "base classes must override"
+
+    def extract_text(self, pnmfile, timeout=None):
         # Generically reads output from stdout.
         assert self.is_enabled(), "I'm not working!"
+        if timeout:
+            return self.extract_text_with_timeout(pnmfile, timeout)
         cmdline = self.get_command_line(pnmfile)
         ocr = os.popen(cmdline)
         ret = ocr.read()
@@ -244,6 +285,37 @@ class OCRExecutableEngine(OCREngine):
                                 (self.engine_name, exit_code))
         return ret
 
+    def extract_text_with_timeout(self, pnmfile, timeout):
+        # Run the program directly, rather than through the shell, so
+        # that it's the program that gets killed if it takes too long.
+        devnull = open(os.devnull, "w")
+        try:
+            ocr = subprocess.Popen(self.get_args(pnmfile),
+                                   stdout=subprocess.PIPE, stderr=devnull)
+        finally:
+            devnull.close()
+        timer = threading.Timer(timeout, self.kill, (ocr,))
+        timer.start()
+        try:
+            ret = ocr.communicate()[0]
+        finally:
+            timer.cancel()
+        if ocr.returncode and getattr(ocr, "spambayes_killed", False):
+            raise OCRTimeout, ("%s took more than %s seconds" %
+                               (self.engine_name, timeout))
+        if ocr.returncode:
+            raise SystemError, ("%s failed with exit code %s" %
+                                (self.engine_name, ocr.returncode))
+        return ret
+
+    def kill(self, process):
+        process.spambayes_killed = True
+        try:
+            process.kill()
+        except OSError:
+            # It finished after all.
+            pass
+
 class OCREngineOCRAD(OCRExecutableEngine):
     engine_name = "ocrad"
 
@@ -253,12 +325,20 @@ class OCREngineOCRAD(OCRExecutableEngine):
         return '%s -s %s -c %s -f "%s" 2>%s' % \
                 (self.program, scale, charset, pnmfile, os.path.devnull)
 
+    def get_args(self, pnmfile):
+        scale = options["Tokenizer", "ocrad_scale"] or 1
+        charset = options["Tokenizer", "ocrad_charset"]
+        return [self.program, "-s", str(scale), "-c", charset, "-f", pnmfile]
+
 class OCREngineGOCR(OCRExecutableEngine):
     engine_name = "gocr"
 
     def get_command_line(self, pnmfile):
         return '%s "%s" 2>%s' % (self.program, pnmfile, os.path.devnull)
 
+    def get_args(self, pnmfile):
+        return [self.program, pnmfile]
+
 # This lists all engines, with the first listed that is enabled winning.
 # Matched with the engine name, as specified in Options.py, via the
 # 'engine_name' attribute on the class.
@@ -283,57 +363,258 @@ def get_engine(engine_name):
             return engine
     return None
 
+class OCRJob:
+    """OCR of a single image file, run by an OCRPool."""
+    def __init__(self, fhash, pnmfile):
+        self.fhash = fhash
+        self.pnmfile = pnmfile
+        self.result = None
+        self.done = threading.Event()
+
+class OCRPool:
+    """Runs the OCR program on up to `size` images at once.
+
+    Each job gets a thread, which waits for one of the slots before
+    starting the program; finished jobs are put on the `finished` queue.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.slots = threading.Semaphore(size)
+        self.finished = Queue.Queue()
+
+    def submit(self, ocr_file, job, timeout):
+        thread = threading.Thread(target=self.run,
+                                  args=(ocr_file, job, timeout))
+        thread.setDaemon(True)
+        thread.start()
+
+    def run(self, ocr_file, job, timeout):
+        self.slots.acquire()
+        try:
+            try:
+                job.result = ocr_file(job.pnmfile, timeout)
+            except:
+                job.result = ("", set(["image-text:no text found"]), True)
+        finally:
+            self.slots.release()
+            self.finished.put(job)
+            job.done.set()
+
+class OCRCache:
+    """OCR results, by image md5, kept in an SQLite database.
+
+    The cache used to be a dictionary, read from a pickle at start up and
+    written back at exit, so it grew without limit, was lost if the
+    process died, and processes sharing the file overwrote each other's
+    results.  Here each result is written (and committed) as soon as it
+    is known, so several processes can share the file, and prune() keeps
+    it to at most max_entries results, none more than max_days old.  An
+    old pickled cache is imported the first time the file is opened.
+    """
+    def __init__(self, filename, max_entries=10000, max_days=30):
+        import sqlite3
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_days = max_days
+
+        # How many results prune() removes at once, at most
+        self.prune_batch = 100
+        # prune() is called after this many new results
+        self.prune_every = 20
+        # last_used is only updated when it is this much out of date,
+        # which saves a write for most hits
+        self.touch_interval = 10*60
+
+        self.writes = self.expired = self.evicted = 0
+        old = None
+        # An empty file is a new database.
+        if os.path.exists(filename) and os.path.getsize(filename) and \
+           open(filename, "rb").read(16) != "SQLite format 3\0":
+            old = pickle_read(filename)
+            os.rename(filename, filename + ".old")
+        # The pool's threads don't touch the cache, but the stripper may
+        # be used from more than one thread.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, timeout=20,
+                                  check_same_thread=False)
+        self.db.text_factory = str
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS ocr (
+                hash TEXT PRIMARY KEY, text BLOB, tokens TEXT,
+                created INTEGER, last_used INTEGER);
+            CREATE INDEX IF NOT EXISTS ocr_created ON ocr (created);
+            CREATE INDEX IF NOT EXISTS ocr_last_used ON ocr (last_used);
+            """)
+        self.db.commit()
+        if old:
+            for fhash, value in old.items():
+                self.put(fhash, value, commit=False)
+            self.db.commit()
+
+    def execute(self, sql, args=(), commit=False):
+        self.lock.acquire()
+        try:
+            rows = self.db.execute(sql, args).fetchall()
+            if commit:
+                self.db.commit()
+            return rows
+        finally:
+            self.lock.release()
+
+    def get(self, fhash, default=None):
+        rows = self.execute("SELECT text, tokens, last_used FROM ocr"
+                            " WHERE hash = ?", (fhash,))
+        if not rows:
+            return default
+        text, tokens, last_used = rows[0]
+        now = int(time.time())
+        if last_used < now - self.touch_interval:
+            self.execute("UPDATE ocr SET last_used = ? WHERE hash = ?",
+                         (now, fhash), commit=True)
+        return str(text), set(tokens.split("\n"))
+
+    def __contains__(self, fhash):
+        return self.get(fhash) is not None
+
+    def __getitem__(self, fhash):
+        value = self.get(fhash)
+        if value is None:
+            raise KeyError(fhash)
+        return value
+
+    def __setitem__(self, fhash, value):
+        self.put(fhash, value)
+        self.writes += 1
+        if self.writes % self.prune_every == 0:
+            self.prune()
+
+    def put(self, fhash, value, commit=True):
+        import sqlite3
+        text, tokens = value
+        now = int(time.time())
+        self.execute("INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?)",
+                     (fhash, sqlite3.Binary(text), "\n".join(tokens), now,
+                      now), commit)
+
+    def __len__(self):
+        return self.execute("SELECT COUNT(*) FROM ocr")[0][0]
+
+    def prune(self, now=None):
+        """Remove up to prune_batch results older than max_days, and then,
+        if there are still more than max_entries, up to prune_batch of
+        the least recently used."""
+        if now is None:
+            now = int(time.time())
+        self.lock.acquire()
+        try:
+            cursor = self.db.execute(
+                "DELETE FROM ocr WHERE rowid IN (SELECT rowid FROM ocr"
+                " WHERE created < ? ORDER BY created LIMIT ?)",
+                (now - self.max_days * 24 * 60 * 60, self.prune_batch))
+            self.expired += cursor.rowcount
+            total = self.db.execute("SELECT COUNT(*) FROM ocr").fetchone()[0]
+            if total > self.max_entries:
+                cursor = self.db.execute(
+                    "DELETE FROM ocr WHERE rowid IN (SELECT rowid FROM ocr"
+                    " ORDER BY last_used LIMIT ?)",
+                    (min(total - self.max_entries, self.prune_batch),))
+                self.evicted += cursor.rowcount
+            self.db.commit()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.db.close()
+        finally:
+            self.lock.release()
+
 class ImageStripper:
     def __init__(self, cachefile=""):
         self.cachefile = os.path.expanduser(cachefile)
-        if os.path.exists(self.cachefile):
-            self.cache = pickle_read(self.cachefile)
-        else:
+        self.cache = None
+        if self.cachefile:
+            try:
+                self.cache = OCRCache(self.cachefile,
+                            options["Tokenizer", "x-crack_image_cache_size"],
+                            options["Tokenizer", "x-crack_image_cache_days"])
+            except ImportError:
+                # No sqlite3; fall back to a pickled dictionary.
+                if os.path.exists(self.cachefile):
+                    self.cache = pickle_read(self.cachefile)
+        if self.cache is None:
             self.cache = {}
         self.misses = self.hits = 0
         if self.cachefile:
             atexit.register(self.close)
         self.engine = None
-    
+        # The pool and the jobs it is running, by image hash, for
+        # extract_ocr_info_parallel.  The lock is for these, as several
+        # threads may be tokenizing messages at once.
+        self.pool = None
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def ocr_file(self, pnmfile, timeout=None):
+        """OCR a single image file.  Returns the text, the set of tokens
+        describing it, and whether the file should be kept (because the
+        OCR program failed on it)."""
+        preserve = False
+        if self.engine.program:
+            try:
+                ctext = self.engine.extract_text(pnmfile, timeout).lower()
+            except OCRTimeout, msg:
+                print >> sys.stderr, msg
+                return "", set([TIMEOUT_TOKEN]), False
+            except SystemError, msg:
+                print >> sys.stderr, msg
+                preserve = True
+                ctext = ""
+        else:
+            # We should not get here if no OCR is enabled.  If it
+            # is enabled and we have no program, its OK to spew lots
+            # of warnings - they should either disable OCR (it is by
+            # default), or fix their config.
+            print >> sys.stderr, \
+                  "No OCR program '%s' available - can't get text!" \
+                  % (self.engine.engine_name,)
+            ctext = ""
+        ctokens = set()
+        if not ctext.strip():
+            # Lots of spam now contains images in which it is
+            # difficult or impossible (using ocrad) to find any
+            # text.  Make a note of that.
+            ctokens.add("image-text:no text found")
+        else:
+            nlines = len(ctext.strip().split("\n"))
+            if nlines:
+                ctokens.add("image-text-lines:%d" % int(log2(nlines)))
+        return ctext, ctokens, preserve
+
     def extract_ocr_info(self, pnmfiles):
         assert self.engine, "must have an engine!"
+        workers = options["Tokenizer", "x-ocr_workers"]
+        image_timeout = options["Tokenizer", "x-ocr_image_timeout"]
+        message_timeout = options["Tokenizer", "x-ocr_message_timeout"]
+        if workers > 1 or image_timeout or message_timeout:
+            return self.extract_ocr_info_parallel(pnmfiles, workers,
+                                                  image_timeout,
+                                                  message_timeout)
         textbits = []
         tokens = set()
         for pnmfile in pnmfiles:
             preserve = False
             fhash = md5(open(pnmfile).read()).hexdigest()
-            if fhash in self.cache:
+            cached = self.cache.get(fhash)
+            if cached is not None:
                 self.hits += 1
-                ctext, ctokens = self.cache[fhash]
+                ctext, ctokens = cached
             else:
                 self.misses += 1
-                if self.engine.program:
-                    try:
-                        ctext = self.engine.extract_text(pnmfile).lower()
-                    except SystemError, msg:
-                        print >> sys.stderr, msg
-                        preserve = True
-                        ctext = ""
-                else:
-                    # We should not get here if no OCR is enabled.  If it
-                    # is enabled and we have no program, its OK to spew lots
-                    # of warnings - they should either disable OCR (it is by
-                    # default), or fix their config.
-                    print >> sys.stderr, \
-                          "No OCR program '%s' available - can't get text!" \
-                          % (self.engine.engine_name,)
-                    ctext = ""
-                ctokens = set()
-                if not ctext.strip():
-                    # Lots of spam now contains images in which it is
-                    # difficult or impossible (using ocrad) to find any
-                    # text.  Make a note of that.
-                    ctokens.add("image-text:no text found")
-                else:
-                    nlines = len(ctext.strip().split("\n"))
-                    if nlines:
-                        ctokens.add("image-text-lines:%d" % int(log2(nlines)))
-                self.cache[fhash] = (ctext, ctokens)
+                result = self.ocr_file(pnmfile)
+                self.remember(fhash, result)
+                ctext, ctokens, preserve = result
             textbits.append(ctext)
             tokens |= ctokens
             if not preserve:
@@ -341,7 +622,106 @@ class ImageStripper:
 
         return "\n".join(textbits), tokens
 
-    def analyze(self, engine_name, parts):
+    def extract_ocr_info_parallel(self, pnmfiles, workers, image_timeout,
+                                  message_timeout):
+        """Like extract_ocr_info, but OCR the images at the same time.
+
+        Each distinct image is OCRed once, even if it is in several
+        files, or is already being OCRed for an earlier message.  The
+        OCR program is killed if it takes more than image_timeout seconds
+        on an image (giving an "image-text:ocr timeout" token), and
+        images that haven't been done after message_timeout seconds are
+        left to finish in the background (their results are cached for
+        next time), also giving an "image-text:ocr timeout" token.  Zero
+        means no limit.
+        """
+        if message_timeout:
+            deadline = time.time() + message_timeout
+        hashes = [md5(open(pnmfile).read()).hexdigest()
+                  for pnmfile in pnmfiles]
+        results = {}
+        jobs = {}
+        self.lock.acquire()
+        try:
+            if self.pool is None or self.pool.size != max(1, workers):
+                self.pool = OCRPool(max(1, workers))
+            self._collect()
+            for fhash, pnmfile in zip(hashes, pnmfiles):
+                if fhash in results or fhash in jobs:
+                    # A repeat within this message.
+                    self.hits += 1
+                    continue
+                if fhash in self.inflight:
+                    # Already being OCRed for an earlier message.
+                    jobs[fhash] = self.inflight[fhash]
+                    self.hits += 1
+                    continue
+                cached = self.cache.get(fhash)
+                if cached is not None:
+                    self.hits += 1
+                    results[fhash] = cached
+                else:
+                    self.misses += 1
+                    job = OCRJob(fhash, pnmfile)
+                    jobs[fhash] = self.inflight[fhash] = job
+                    self.pool.submit(self.ocr_file, job, image_timeout)
+        finally:
+            self.lock.release()
+
+        for job in jobs.values():
+            if message_timeout:
+                job.done.wait(max(0.0, deadline - time.time()))
+            else:
+                job.done.wait()
+        self.collect()
+
+        textbits = []
+        tokens = set()
+        for fhash, pnmfile in zip(hashes, pnmfiles):
+            job = jobs.get(fhash)
+            if fhash in results:
+                ctext, ctokens = results[fhash]
+            elif job.done.isSet():
+                ctext, ctokens = job.result[:2]
+            else:
+                ctext, ctokens = "", set([TIMEOUT_TOKEN])
+            textbits.append(ctext)
+            tokens |= ctokens
+            if job is None or job.pnmfile != pnmfile:
+                # Not being OCRed; the job removes its own file.
+                os.unlink(pnmfile)
+
+        return "\n".join(textbits), tokens
+
+    def collect(self):
+        """Cache the results of the finished OCR jobs."""
+        self.lock.acquire()
+        try:
+            self._collect()
+        finally:
+            self.lock.release()
+
+    def _collect(self):
+        # Called with the lock held.
+        while True:
+            try:
+                job = self.pool.finished.get(False)
+            except Queue.Empty:
+                break
+            del self.inflight[job.fhash]
+            self.remember(job.fhash, job.result)
+            if not job.result[2]:
+                os.unlink(job.pnmfile)
+
+    def remember(self, fhash, result):
+        """Cache the result of OCRing an image, unless the OCR program
+        failed, or was stopped because it took too long; it may do better
+        next time."""
+        ctext, ctokens, preserve = result
+        if not preserve and TIMEOUT_TOKEN not in ctokens:
+            self.cache[fhash] = (ctext, ctokens)
+
+    def analyze(self, engine_name, parts, get_payload=None):
         # check engine hasn't changed...
         if self.engine is not None and self.engine.engine_name != engine_name:
             self.engine = None
@@ -358,7 +738,8 @@ class ImageStripper:
             return "", set()
 
         if Image is not None:
-            pnmfiles, tokens = PIL_decode_parts(parts)
+            pnmfiles, tokens = PIL_decode_parts(parts, get_payload,
+                                    options["Tokenizer", "x-ocr_each_image"])
         else:
             return "", set()
 
@@ -369,15 +750,26 @@ class ImageStripper:
         return "", tokens
 
 
+    def printStats(self, stream=None):
+        print >> stream, len(self.cache), "items in the OCR cache,",
+        print >> stream, self.hits, "hits,", self.misses, "misses",
+        if self.hits + self.misses:
+            print >> stream, "(%.2f%% hit rate)" % \
+                  (100 * self.hits / (self.hits + self.misses)),
+        print >> stream
+        if isinstance(self.cache, OCRCache) and \
+           (self.cache.expired or self.cache.evicted):
+            print >> stream, self.cache.expired, "expired and",
+            print >> stream, self.cache.evicted, "least recently used",
+            print >> stream, "results pruned"
+
     def close(self):
         if options["globals", "verbose"]:
-            print >> sys.stderr, "saving", len(self.cache),
-            print >> sys.stderr, "items to", self.cachefile,
-            if self.hits + self.misses:
-                print >> sys.stderr, "%.2f%% hit rate" % \
-                      (100 * self.hits / (self.hits + self.misses)),
-            print >> sys.stderr
-        pickle_write(self.cachefile, self.cache)
+            self.printStats(sys.stderr)
+        if isinstance(self.cache, OCRCache):
+            self.cache.close()
+        else:
+            pickle_write(self.cachefile, self.cache)
 
 _cachefile = options["Tokenizer", "crack_image_cache"]
 crack_images = ImageStripper(_cachefile).analyze
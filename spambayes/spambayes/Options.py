@@ -113,6 +113,33 @@ defaults = {
      dbm is untested, hence the default)."""),
      PATH, RESTORE),
 
+    ("x-lookup_ip_cache_type", _("x-lookup_ip cache file type"), "pickle",
+     _("""(EXPERIMENTAL) How the lookup_ip_cache file is stored.  A pickle
+     is read in full when SpamBayes starts, and written in full when it
+     stops, which is slow once the cache has grown large.  An sqlite
+     database is read and updated a record at a time, expired and least
+     recently used answers are removed a few at a time, and several
+     SpamBayes processes can share the same file."""),
+     ("pickle", "sqlite"), RESTORE),
+
+    ("x-lookup_ip_cache_size", _("Number of x-lookup_ip answers to keep"),
+     5000,
+     _("""(EXPERIMENTAL) When the lookup_ip_cache is an sqlite database,
+     the least recently used answers are removed once it holds more than
+     this many."""),
+     INTEGER, RESTORE),
+
+    ("x-lookup_ip_timeout", _("Seconds to wait for x-lookup_ip answers"), 0.0,
+     _("""(EXPERIMENTAL) Normally the address lookups done for
+     x-lookup_ip (and for NNTP-Posting-Host headers) are made one at a
+     time, as the hosts are found, and each can take up to ten seconds
+     when the DNS server is slow.  If this is greater than zero, all of a
+     message's lookups are made at the same time, and the tokenizer waits
+     at most this many seconds for the answers.  Hosts that aren't
+     answered in time generate "lookup pending" tokens; their answers are
+     cached when they arrive."""),
+     REAL, RESTORE),
+
     ("image_size", _("Generate image size tokens"), False,
      _("""If true, generate tokens based on the sizes of
      embedded images."""),
@@ -136,10 +163,23 @@ defaults = {
      HEADER_VALUE, RESTORE),
 
     ("crack_image_cache", _("Cache to speed up ocr."), "",
-     _("""If non-empty, names a file from which to read cached ocr info
-     at start and to which to save that info at exit."""),
+     _("""If non-empty, names a file in which to keep the text found in
+     each image, so that the same image doesn't need to be OCRed again.
+     The file is an SQLite database, which several SpamBayes processes
+     can share (an older pickled cache is converted when first opened)."""),
      PATH, RESTORE),
 
+    ("x-crack_image_cache_size", _("Number of images to keep OCR text for"),
+     10000,
+     _("""(EXPERIMENTAL) Once the crack_image_cache holds the text of more
+     than this many images, the least recently used are removed."""),
+     INTEGER, RESTORE),
+
+    ("x-crack_image_cache_days", _("Days to keep OCR text for"), 30,
+     _("""(EXPERIMENTAL) The text found in an image is removed from the
+     crack_image_cache this many days after the image was OCRed."""),
+     INTEGER, RESTORE),
+
     ("ocrad_scale", _("Scale factor to use with ocrad."), 2,
      _("""Specifies the scale factor to apply when running ocrad.  While
      you can specify a negative scale it probably won't help.  Scaling up
@@ -157,6 +197,34 @@ defaults = {
      image to try OCR on."""),
      INTEGER, RESTORE),
 
+    ("x-ocr_workers", _("Number of OCR programs to run at once"), 1,
+     _("""(EXPERIMENTAL) When crack_images is enabled and a message has
+     several images to OCR (see x-ocr_each_image), up to this many copies
+     of the OCR program are run at the same time."""),
+     INTEGER, RESTORE),
+
+    ("x-ocr_each_image", _("OCR each image separately"), False,
+     _("""(EXPERIMENTAL) Normally all of a message's images are pasted
+     together and OCRed in one go.  If this is set, each different image
+     is OCRed on its own, which lets several be done at once (see
+     x-ocr_workers)."""),
+     BOOLEAN, RESTORE),
+
+    ("x-ocr_image_timeout", _("Seconds to allow for OCR of an image"), 0.0,
+     _("""(EXPERIMENTAL) If greater than zero, the OCR program is stopped
+     if it takes longer than this on an image, and an "ocr timeout" token
+     is generated instead of the image's text."""),
+     REAL, RESTORE),
+
+    ("x-ocr_message_timeout", _("Seconds to allow for OCR of a message"),
+     0.0,
+     _("""(EXPERIMENTAL) If greater than zero, classification waits at most
+     this long for a message's images to be OCRed.  Images that aren't
+     done by then give "ocr timeout" tokens; they are finished in the
+     background, and the text is remembered for the next message
+     containing the same image."""),
+     REAL, RESTORE),
+
     ("count_all_header_lines", _("Count all header lines"), False,
      _("""Generate tokens just counting the number of instances of each kind
      of header line, in a case-sensitive way.
@@ -264,6 +332,39 @@ defaults = {
      the ability to reduce the nine tokens to one. (This option has no
      effect if 'Search for Habeas Headers' is False)"""),
      BOOLEAN, RESTORE),
+
+    ("x-profile_stages", _("Profile tokenizer stages"), False,
+     _("""(EXPERIMENTAL) If true, record the time taken and the number of
+     tokens generated by each stage of the tokenizer (header mining, each
+     of the crackers, tag stripping and so on) for every message.  The
+     results are collected into histograms which are shown on the
+     statistics page of the web interface, and can be printed with
+     utilities/tokprofile.py.  This slows tokenizing a little, and the
+     collected data grows with every message, so only enable it when
+     looking for a performance problem."""),
+     BOOLEAN, RESTORE),
+
+    ("x-max_part_bytes", _("Maximum bytes tokenized per part"), 0,
+     _("""(EXPERIMENTAL) If greater than zero, only this many (decoded)
+     bytes of each text part of the message body are tokenized.  When a
+     part is cut short a token recording its (approximate) size is
+     generated instead.  Very large parts (pasted logs, huge HTML spam)
+     otherwise make tokenizing, and so classifying, a message very slow;
+     the start of a part is nearly always enough to tell what it is."""),
+     INTEGER, RESTORE),
+
+    ("x-max_message_bytes", _("Maximum bytes tokenized per message"), 0,
+     _("""(EXPERIMENTAL) If greater than zero, at most this many (decoded)
+     bytes of text are tokenized from the body of a message, across all
+     of its text parts.  Parts beyond the budget are skipped, and a token
+     recording that is generated."""),
+     INTEGER, RESTORE),
+
+    ("x-max_body_tokens", _("Maximum tokens generated per message body"), 0,
+     _("""(EXPERIMENTAL) If greater than zero, stop generating tokens from
+     the body of a message after this many, and generate a token
+     recording that instead."""),
+     INTEGER, RESTORE),
   ),
 
   # These options are all experimental; it seemed better to put them into
@@ -323,6 +424,22 @@ defaults = {
      example), and effectively create an independent (sub)database for
      tokens derived from parsing web pages."""),
      r"[\S]+", RESTORE),
+
+    ("x-slurp_max_urls", _("Maximum number of URLs to retrieve"), 1,
+     _("""(EXPERIMENTAL) The number of distinct http URLs in a message whose
+     text is retrieved and tokenized (the last ones in the message are
+     used).  When more than one needs to be retrieved, they are retrieved
+     at the same time."""),
+     INTEGER, RESTORE),
+
+    ("x-slurp_timeout", _("Maximum time to spend retrieving URLs"), 0.0,
+     _("""(EXPERIMENTAL) If greater than zero, the most time, in seconds,
+     spent waiting for the text at a message's URLs.  URLs that haven't
+     been retrieved by then contribute no tokens to the message; their
+     text is still cached when it arrives, so later messages with the
+     same URLs get it.  If zero, each URL is waited for (for up to five
+     seconds)."""),
+     REAL, RESTORE),
   ),
 
   # These options control how a message is categorized
@@ -694,6 +811,46 @@ defaults = {
      (and are correctly classified), you may not wish to cache these.
      If you set this to zero (0), then this option will have no effect."""),
      INTEGER, RESTORE),
+
+    ("x-background_cache_writes", _("Write cached messages in the background"), False,
+     _("""(EXPERIMENTAL) Where message caching is enabled, each message is
+     normally written to the cache before it is passed on to the mail
+     client.  If this option is enabled, messages are instead written by
+     a separate thread, in batches, and each batch is flushed to the disk
+     (with fsync) before the next is started, so a slow disk doesn't
+     hold up retrieving mail."""),
+     BOOLEAN, RESTORE),
+
+    ("x-review_index_file", _("Review index file"), "",
+     _("""(EXPERIMENTAL) If non-empty, a summary of each message in the
+     unknown cache (its subject and other headers, score, classification
+     and the start of its body) is kept in a file with this name, updated
+     as messages are cached, trained and expired.  The review page is
+     then built from the summaries, rather than by reading every message
+     file of the day.  If you don't give a full pathname, the name will
+     be taken to be relative to the location of the most recent
+     configuration file loaded."""),
+     PATH, DO_NOT_RESTORE),
+
+    ("x-token_cache_size", _("Number of token lists to keep in memory"), 0,
+     _("""(EXPERIMENTAL) Tokenizing a message is the most expensive part
+     of classifying or training on it, and the same message is often
+     tokenized more than once (for example, when it is classified as it
+     arrives, and then trained on from the review page).  If this is
+     greater than zero, the tokens generated for this many messages are
+     kept in memory, and reused when the same message (ignoring any
+     headers that SpamBayes has added) is seen again.  When running
+     cross-validation tests, set this to at least the number of messages
+     in the test corpus."""),
+     INTEGER, RESTORE),
+
+    ("x-token_cache_file", _("Token cache file"), "",
+     _("""(EXPERIMENTAL) If non-empty, the tokens generated for each
+     message are also stored in a database with this name, so that they
+     can be reused after a restart.  The cache is emptied whenever any of
+     the tokenizer options change.  The file is not trimmed, so delete it
+     from time to time if it grows too large."""),
+     PATH, RESTORE),
   ),
 
   # These options control the various headers that some Spambayes
@@ -889,6 +1046,26 @@ defaults = {
      used for classifications (i.e. results may be effected)."""),
      REAL, RESTORE),
 
+    ("x-tokenizer_threads", _("Tokenizer threads"), 0,
+     _("""(EXPERIMENTAL) If greater than zero, retrieved messages are
+     parsed and tokenized by this many background threads, rather than by
+     the thread that serves all the email clients and the web interface,
+     so one large message (or slow DNS or OCR lookups) doesn't hold up
+     everything else.  The response to the client is sent when the
+     message has been classified.  This can't be used together with
+     x-slurp_urls (the URLs are retrieved when the message is classified,
+     which is done by the thread that serves everything else), and is
+     ignored if that is set."""),
+     INTEGER, RESTORE),
+
+    ("x-max_classify_size", _("Maximum size of message to classify"), 0,
+     _("""(EXPERIMENTAL) If greater than zero, only this many bytes of the
+     body of a retrieved message are used to classify it (the whole
+     message is still passed on to the email client), so that a huge
+     message doesn't take a huge amount of memory.  Messages larger than
+     this are not cached."""),
+     INTEGER, RESTORE),
+
     ("use_ssl", "Connect via a secure socket layer", False,
      """Use SSL to connect to the server. This allows spambayes to connect
      without sending data in plain text.
@@ -1125,6 +1302,27 @@ defaults = {
     ("rows_per_section", _("Rows per section"), 10000,
      _("""Number of rows to display per ham/spam/unsure section."""),
      INTEGER, RESTORE),
+
+    ("x-rows_per_page", _("Messages per review page"), 0,
+     _("""(EXPERIMENTAL) If this is greater than zero, a day with more than
+     this many untrained messages is split into several review pages,
+     with buttons to move between them.  Otherwise each day is shown on
+     one page."""),
+     INTEGER, RESTORE),
+
+    ("x-http_keep_alive", _("Keep connections open"), False,
+     _("""(EXPERIMENTAL) If this is True, the web interface keeps a
+     browser's connection open after a page has been sent, so that the
+     images on the page, and the next page, don't each need a new one.
+     Otherwise the connection is closed after every request."""),
+     BOOLEAN, RESTORE),
+
+    ("x-http_compression", _("Compress pages"), False,
+     _("""(EXPERIMENTAL) If this is True, the pages of the web interface
+     are gzipped for browsers that can take it, which makes big pages,
+     like the review page, quicker to send to a browser on another
+     machine."""),
+     BOOLEAN, RESTORE),
   ),
 
   "imap" : (
@@ -1220,6 +1418,78 @@ defaults = {
      was originally in - *all* messages will be moved to the same
      folder."""),
      IMAP_FOLDER, DO_NOT_RESTORE),
+
+    ("x-fetch_batch_size", _("Number of message headers to fetch at once"),
+     1,
+     _("""(EXPERIMENTAL) Normally the headers of each message in a folder
+     are fetched from the server with a separate command.  If this is more
+     than one, the headers of up to this many messages are fetched with a
+     single command, which saves a round trip to the server for each
+     message."""),
+     INTEGER, RESTORE),
+
+    ("x-body_batch_size", _("Number of message bodies to fetch at once"), 1,
+     _("""(EXPERIMENTAL) Normally each message that is to be trained on or
+     classified is fetched from the server with a separate command.  If
+     this is more than one, up to this many are fetched with a single
+     command.  Larger numbers save more round trips, but all of the
+     messages fetched at once must be held in memory together."""),
+     INTEGER, RESTORE),
+
+    ("x-save_batch_size", _("Number of messages to move at once"), 1,
+     _("""(EXPERIMENTAL) Normally each message that is filtered (or
+     trained on and then moved) is saved with several commands: its flags
+     are fetched, a new copy is uploaded to the destination folder, and
+     the original is marked as deleted.  If this is more than one, up to
+     this many messages are saved together, with a few commands for each
+     destination folder.  Messages that haven't been changed are copied
+     (or moved, if the server supports MOVE) on the server rather than
+     uploaded again, and the rest are uploaded without waiting for each
+     one to be stored before sending the next."""),
+     INTEGER, RESTORE),
+
+    ("x-parallel_connections", _("Number of connections to use at once"), 1,
+     _("""(EXPERIMENTAL) Normally each account is dealt with in turn, over
+     a single connection.  If this is more than one, up to this many
+     accounts are dealt with at once, each over its own connection (the
+     classifier is shared between them, with training done by one at a
+     time).  Accounts that have their own configuration file are still
+     dealt with one at a time, after the others, as that configuration
+     changes the options for everything else.  This can't be used with
+     the [URLRetriever] x-slurp_urls option."""),
+     INTEGER, RESTORE),
+
+    ("x-connection_per_folder", _("Use a connection for each folder"), False,
+     _("""(EXPERIMENTAL) If this is set, and x-parallel_connections is
+     more than one, each folder that is trained on or filtered gets a
+     connection of its own, so that the folders in an account are also
+     dealt with at once.  All the training folders are done before any
+     of the folders are filtered."""),
+     BOOLEAN, RESTORE),
+
+    ("x-use_checkpoints", _("Only look at new messages"), False,
+     _("""(EXPERIMENTAL) Normally every message in the folders being
+     filtered or trained on is looked at each time, to see whether it has
+     already been dealt with.  If this is set, the filter remembers how far
+     it got in each folder (using the folder's UIDVALIDITY and UIDNEXT
+     values), and only looks at messages that have arrived since; checking
+     a folder with nothing new in it takes a single command.  If the
+     server renumbers a folder's messages, the whole folder is looked at
+     again.  Messages that were already in a folder when it was last
+     looked at are not reconsidered, even if (for example) their
+     classification has been forgotten."""),
+     BOOLEAN, RESTORE),
+
+    ("x-use_idle", _("Filter new messages as soon as they arrive"), False,
+     _("""(EXPERIMENTAL) When the filter is run continuously (with the -l
+     option), the filter folders are normally only looked at every -l
+     minutes.  If this is set, and the server supports the IDLE command,
+     a separate connection to the server watches each filter folder, and
+     a folder is filtered as soon as the server says that messages have
+     arrived in it.  This works best with x-use_checkpoints, so that only
+     the new messages are looked at.  Training, and filtering on servers
+     that don't support IDLE, still happen every -l minutes."""),
+     BOOLEAN, RESTORE),
   ),
 
   "ZODB" : (
@@ -1278,6 +1548,15 @@ defaults = {
      platform."""),
      ("best", "db3hash", "dbhash", "gdbm"), RESTORE),
 
+    ("x-event_loop", _("Event loop"), "select",
+     _("""(EXPERIMENTAL) How the proxies and the web interface wait for
+     their connections.  "select" works everywhere, but gets slower as
+     the number of connections grows, and can't handle more than about a
+     thousand of them.  "poll" (not on Windows) has no such limit, and
+     "epoll" (Linux only) also stays quick with many idle connections.
+     "best" picks the best of these that is available."""),
+     ("best", "select", "poll", "epoll"), DO_NOT_RESTORE),
+
     ("proxy_username", _("HTTP Proxy Username"), "",
      _("""The username to give to the HTTP proxy when required.  If a
      username is not necessary, simply leave blank."""),
@@ -184,9 +184,10 @@ class ProxyUserInterface(UserInterface.UserInterface):
         self._writePostamble(help_topic="home_proxy")
 
     def onUpload(self, file):
-        """Save a message for later training - used by Skip's proxytee.py."""
+        """Save a message for later training - used by Skip's proxytee.py.
+        The uploaded file is read into memory, to be split into messages."""
         # Convert platform-specific line endings into unix-style.
-        file = file.replace('\r\n', '\n').replace('\r', '\n')
+        file = file.read().replace('\r\n', '\n').replace('\r', '\n')
 
         # Get a message list from the upload and write it into the cache.
         messages = self._convertUploadToMessageList(file)
@@ -205,11 +206,16 @@ class ProxyUserInterface(UserInterface.UserInterface):
         page or zero if there isn't one, likewise the start of the given page,
         and likewise the start of the next page."""
         # Fetch all the message keys
-        allKeys = state.unknownCorpus.keys()
-        # We have to sort here to split into days.
-        # Later on, we also sort the messages that will be on the page
-        # (by whatever column we wish).
-        allKeys.sort()
+        if state.reviewIndex is not None:
+            # The index keeps them in order.
+            state.reviewIndex.update(state.unknownCorpus)
+            allKeys = state.reviewIndex.keys()
+        else:
+            allKeys = state.unknownCorpus.keys()
+            # We have to sort here to split into days.
+            # Later on, we also sort the messages that will be on the page
+            # (by whatever column we wish).
+            allKeys.sort()
 
         # The default start timestamp is derived from the most recent message,
         # or the system time if there are no messages (not that it gets used).
@@ -238,6 +244,33 @@ class ProxyUserInterface(UserInterface.UserInterface):
         # Return the keys and their date.
         return keys, date, prior, start, end
 
+    def _pageReviewKeys(self, keys, page):
+        """Given the keys of a day's messages, returns a 3-tuple: the keys
+        on the given page of the day (counting from zero), the number of
+        that page (which is moved into range if need be), and the number
+        of pages.  Unless [html_ui] x-rows_per_page is set, the whole day
+        is one page."""
+        rows = options["html_ui", "x-rows_per_page"]
+        if rows <= 0:
+            return keys, 0, 1
+        pages = max(1, (len(keys) + rows - 1) // rows)
+        page = max(0, min(page, pages - 1))
+        return keys[page * rows:(page + 1) * rows], page, pages
+
+    def _messageSummary(self, key):
+        """Returns the review index's summary of the message in the unknown
+        corpus with this key, or None if there isn't a usable one."""
+        if state.reviewIndex is None:
+            return None
+        summary = state.reviewIndex.get(key)
+        if summary is not None:
+            for header in options["html_ui", "display_headers"]:
+                if header.lower() not in summary["headers"]:
+                    # The option has changed since the message was
+                    # summarized.
+                    return None
+        return summary
+
     def onReview(self, **params):
         """Present a list of message for (re)training."""
         # Train/discard sumbitted messages.
@@ -296,11 +329,14 @@ class ProxyUserInterface(UserInterface.UserInterface):
             else:
                 response = "Trained on %d messages. " % (numTrained,)
             self._doSave()
+            if state.reviewIndex is not None:
+                state.reviewIndex.store()
             self.write(response)
             self.write("<br>&nbsp;")
 
         title = ""
         keys = []
+        page_number = 0
         sourceCorpus = state.unknownCorpus
         # If any messages were deferred, show the same page again.
         if numDeferred > 0:
@@ -311,8 +347,13 @@ class ProxyUserInterface(UserInterface.UserInterface):
         # last processed message.
         elif id:
             start = self._keyToTimestamp(id)
-            unused, unused, prior, unused, next = self._buildReviewKeys(start)
-            if prior:
+            day_keys, unused, prior, unused, next = \
+                      self._buildReviewKeys(start)
+            if day_keys and options["html_ui", "x-rows_per_page"] > 0:
+                # Only one page of the day was submitted, so show what
+                # is left of it.
+                pass
+            elif prior:
                 start = prior
             else:
                 start = next
@@ -322,6 +363,13 @@ class ProxyUserInterface(UserInterface.UserInterface):
             start = self._keyToTimestamp(params['next'])
         elif params.get('go') == _('Previous day'):
             start = self._keyToTimestamp(params['prior'])
+        elif params.get('go') in (_('Next page'), _('Previous page')):
+            start = self._keyToTimestamp(params['day'])
+            page_number = int(params['page'])
+            if params['go'] == _('Next page'):
+                page_number += 1
+            else:
+                page_number -= 1
 
         # Else if an id has been specified, just show that message
         # Else if search criteria have been specified, show the messages
@@ -408,8 +456,11 @@ class ProxyUserInterface(UserInterface.UserInterface):
             start = 0
 
         # Build the lists of messages: spams, hams and unsure.
+        pages = 1
         if len(keys) == 0:
             keys, date, prior, this, next = self._buildReviewKeys(start)
+            keys, page_number, pages = self._pageReviewKeys(keys,
+                                                            page_number)
         keyedMessageInfo = {options["Headers", "header_unsure_string"]: [],
                             options["Headers", "header_ham_string"]: [],
                             options["Headers", "header_spam_string"]: [],
@@ -420,6 +471,14 @@ class ProxyUserInterface(UserInterface.UserInterface):
                 key, sourceCorpus = key
             else:
                 sourceCorpus = state.unknownCorpus
+                # If the message is in the review index, everything we
+                # need is there, and the message needn't be loaded.
+                summary = self._messageSummary(key)
+                if summary is not None:
+                    messageInfo = self._makeMessageInfoFromSummary(summary)
+                    keyedMessageInfo[summary["classification"]].append(
+                        (key, messageInfo))
+                    continue
             # Parse the message, get the judgement header and build a message
             # info object for each message.
             message = sourceCorpus[key]
@@ -452,6 +511,16 @@ class ProxyUserInterface(UserInterface.UserInterface):
             if next:
                 page.next.value = next
                 del page.nextButton.disabled
+            if pages > 1:
+                page.day.value = "%d" % (this,)
+                page.page.value = page_number
+                if page_number > 0:
+                    del page.priorPageButton.disabled
+                if page_number < pages - 1:
+                    del page.nextPageButton.disabled
+            else:
+                del page.priorPage
+                del page.nextPage
             templateRow = page.reviewRow.clone()
 
             # The decision about whether to reverse the sort
@@ -497,6 +566,9 @@ class ProxyUserInterface(UserInterface.UserInterface):
             page.table += self.html.trainRow
             if title == "":
                 title = _("Untrained messages received on %s") % date
+                if pages > 1:
+                    title += _(" (page %d of %d)") % (page_number + 1,
+                                                      pages)
             box = self._buildBox(title, None, page)  # No icon, to save space.
         else:
             page = _("<p>There are no untrained messages to display. " \
@@ -36,6 +36,7 @@ __credits__ = "Kenny Pitt, Mark Hammond, all the spambayes folk."
 import time
 
 from spambayes.message import STATS_START_KEY, STATS_STORAGE_KEY
+from spambayes.message import FOLDER_CHECKPOINTS_KEY
 from spambayes.message import Message
 
 try:
@@ -149,11 +150,13 @@ class Stats(object):
         self.ResetTotal()
         totals = self.totals
         for msg_id in self.messageinfo_db.keys():
-            # Skip the date and persistent statistics keys.
+            # Skip the date, persistent statistics and checkpoint keys.
             if msg_id == STATS_START_KEY:
                 continue
             if msg_id == STATS_STORAGE_KEY:
                 continue
+            if msg_id == FOLDER_CHECKPOINTS_KEY:
+                continue
 
             m = Message(msg_id)
             self.messageinfo_db.load_msg(m)
@@ -73,7 +73,6 @@ import cgi
 import mailbox
 import types
 import StringIO
-from email.Iterators import typed_subpart_iterator
 from textwrap import wrap
 
 from spambayes import oe_mailbox
@@ -81,6 +80,9 @@ from spambayes import oe_mailbox
 from spambayes import PyMeldLite
 from spambayes import Dibbler
 from spambayes import tokenizer
+from spambayes import tokenprofile
+from spambayes import tokenindex
+from spambayes import reviewindex
 from spambayes import Version
 from spambayes import storage
 from spambayes import FileCorpus
@@ -127,6 +129,12 @@ class UserInterfaceServer(Dibbler.HTTPServer):
     def getCancelMessage(self):
         return _("You must login to use SpamBayes.")
 
+    def useKeepAlive(self):
+        return options["html_ui", "x-http_keep_alive"]
+
+    def useCompression(self):
+        return options["html_ui", "x-http_compression"]
+
 
 class BaseUserInterface(Dibbler.HTTPPlugin):
     def __init__(self, lang_manager=None):
@@ -227,8 +235,7 @@ class BaseUserInterface(Dibbler.HTTPPlugin):
         raise NotImplementedError
 
     def _writeImage(self, image):
-        self.writeOKHeaders('image/gif')
-        self.write(self._images[image])
+        self.writeResource('image/gif', self._images[image])
 
     # If you are easily offended, look away now...
     for imageName in IMAGES:
@@ -421,25 +428,28 @@ class UserInterface(BaseUserInterface):
                 flags = re.IGNORECASE
             r = re.compile(word, flags)
 
+            # We ask for one more than we show, so that we know whether
+            # there are more, without looking through all the rest.
             reached_limit = False
-            for w in self.classifier._wordinfokeys():
-                if not reached_limit and len(stats) >= max_results:
+            for w in tokenindex.find_words(self.classifier, r,
+                                           max_results + 1):
+                if len(stats) >= max_results:
                     reached_limit = True
-                    over_limit = 0
-                if r.match(w):
-                    if reached_limit:
-                        over_limit += 1
-                    else:
-                        wordinfo = self.classifier._wordinfoget(w)
-                        stat = (w, wordinfo.spamcount, wordinfo.hamcount,
-                                self.classifier.probability(wordinfo))
-                        stats.append(stat)
+                    break
+                wordinfo = self.classifier._wordinfoget(w)
+                if wordinfo is None:
+                    # Removed from the database by another process.
+                    continue
+                stat = (w, wordinfo.spamcount, wordinfo.hamcount,
+                        self.classifier.probability(wordinfo))
+                stats.append(stat)
             if len(stats) == 0 and max_results > 0:
                 stat = _("There are no words that begin with '%s' " \
                          "in the database.") % (word,)
                 stats.append(stat)
             elif reached_limit:
-                stat = _("Additional tokens not shown: %d") % (over_limit,)
+                stat = _("Only the first %d matching tokens are shown.") % \
+                       (max_results,)
                 stats.append(stat)
 
         self._writePreamble(_("Word query"))
@@ -480,7 +490,8 @@ class UserInterface(BaseUserInterface):
         self._writePostamble()
 
     def onTrain(self, file, text, which):
-        """Train on an uploaded or pasted message."""
+        """Train on an uploaded or pasted message.  An uploaded file is
+        read into memory, to be converted and split into messages."""
         self._writePreamble(_("Train"))
 
         # Upload or paste?  Spam or ham?
@@ -489,7 +500,7 @@ class UserInterface(BaseUserInterface):
 
         # Attempt to convert the content from a DBX file to a standard mbox
         if file:
-            content = self._convertToMbox(content)
+            content = self._convertToMbox(file.read())
 
         # Convert platform-specific line endings into unix-style.
         content = content.replace('\r\n', '\n').replace('\r', '\n')
@@ -1023,6 +1034,11 @@ class UserInterface(BaseUserInterface):
             stats = self._buildBox(_("Statistics"), None,
                                    _("Statistics not available"))
         self.write(stats)
+        profiler = tokenprofile.profiler
+        if profiler.enabled and profiler.num_messages:
+            profile = "<pre>%s</pre>" % (cgi.escape(profiler.as_text()),)
+            self.write(self._buildBox(_("Tokenizer profile"), None,
+                                      profile))
         self._writePostamble(help_topic="stats")
 
     def onBugreport(self):
@@ -1105,6 +1121,9 @@ class UserInterface(BaseUserInterface):
 
     def onSubmitreport(self, from_addr, message, subject, attach):
         """Send the help message/bug report to the specified address."""
+        if hasattr(attach, "read"):
+            attach = attach.read()
+
         # For guessing MIME type based on file name extension
         import mimetypes
 
@@ -1273,10 +1292,15 @@ class UserInterface(BaseUserInterface):
         keyedMessageInfo = self._sortMessages(keyedMessageInfo, sort_order,
                                               reverse)
         nrows = options["html_ui", "rows_per_section"]
+        # Finding an element means searching the whole page, so only
+        # find the templates once, rather than once per row.
+        rowTemplate = self.html.reviewRow
+        linkedHeaderTemplate = rowTemplate.linkedHeaderValue
+        headerTemplate = rowTemplate.headerValue
         for key, messageInfo in keyedMessageInfo[:nrows]:
             unused, unused, messageInfo.received = \
                     self._getTimeRange(self._keyToTimestamp(key))
-            row = self.html.reviewRow.clone()
+            row = rowTemplate.clone()
             try:
                 score = messageInfo.score
             except ValueError:
@@ -1308,11 +1332,11 @@ class UserInterface(BaseUserInterface):
                     # Subject is special, because it links to the body.
                     # If the user doesn't display the subject, then there
                     # is no link to the body.
-                    h = self.html.reviewRow.linkedHeaderValue.clone()
+                    h = linkedHeaderTemplate.clone()
                     h.text.title = messageInfo.bodySummary
                     h.text.href = "view?key=%s&corpus=%s" % (key, label)
                 else:
-                    h = self.html.reviewRow.headerValue.clone()
+                    h = headerTemplate.clone()
                 h.text = text
                 row.optionalHeadersValues += h
 
@@ -1366,57 +1390,20 @@ class UserInterface(BaseUserInterface):
         # Remove notations before displaying - see:
         # [ 848365 ] Remove subject annotations from message review page
         message.delNotations()
-        subjectHeader = message["Subject"] or "(none)"
-        headers = {"subject" : subjectHeader}
-        for header in options["html_ui", "display_headers"]:
-            headers[header.lower()] = (message[header] or "(none)")
-        score = message[options["Headers", "score_header_name"]]
-        if score:
-            # the score might have the log info at the end
-            op = score.find('(')
-            if op >= 0:
-                score = score[:op]
-            try:
-                score = float(score) * 100
-            except ValueError:
-                # Hmm.  The score header should only contain a floating
-                # point number.  What's going on here, then?
-                score = "Err"  # Let the user know something is wrong.
-        else:
-            # If the lookup fails, this means that the "include_score"
-            # option isn't activated. We have the choice here to either
-            # calculate it now, which is pretty inefficient, since we have
-            # already done so, or to admit that we don't know what it is.
-            # We'll go with the latter.
-            score = "?"
-        try:
-            part = typed_subpart_iterator(message, 'text', 'plain').next()
-            text = part.get_payload()
-        except StopIteration:
-            try:
-                part = typed_subpart_iterator(message, 'text', 'html').next()
-                text = part.get_payload()
-                text, unused = tokenizer.crack_html_style(text)
-                text, unused = tokenizer.crack_html_comment(text)
-                text = tokenizer.html_re.sub(' ', text)
-                text = _('(this message only has an HTML body)\n') + text
-            except StopIteration:
-                text = _('(this message has no text body)')
-        if type(text) == type([]):  # gotta be a 'right' way to do this
-            text = _("(this message is a digest of %s messages)") % (len(text))
-        elif text is None:
-            text = _("(this message has no body)")
-        else:
-            text = text.replace('&nbsp;', ' ')      # Else they'll be quoted
-            text = re.sub(r'(\s)\s+', r'\1', text)  # Eg. multiple blank lines
-            text = text.strip()
+        return self._makeMessageInfoFromSummary(reviewindex.summarize(message))
 
+    def _makeMessageInfoFromSummary(self, summary):
+        """Like _makeMessageInfo, but given the summary of a message (see
+        reviewindex.summarize), which is all that it needs."""
         class _MessageInfo:
             pass
         messageInfo = _MessageInfo()
+        headers = {"subject" : summary["headers"]["subject"]}
+        for header in options["html_ui", "display_headers"]:
+            headers[header.lower()] = summary["headers"][header.lower()]
         for headerName, headerValue in headers.items():
             headerValue = self._trimHeader(headerValue, 45, True)
             setattr(messageInfo, "%sHeader" % (headerName,), headerValue)
-        messageInfo.score = score
-        messageInfo.bodySummary = self._trimHeader(text, 200)
+        messageInfo.score = summary["score"]
+        messageInfo.bodySummary = self._trimHeader(summary["text"], 200)
         return messageInfo
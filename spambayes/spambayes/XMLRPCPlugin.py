@@ -28,6 +28,13 @@ The XML-RPC server exposes the following methods:
         Scores a MIME message (a string encoded using encoding).
         The return value is as for the score method.
 
+    score_mime_many(msgs, encoding) -> [score, ...]
+        Scores a list of MIME messages, as score_mime does, and returns
+        a list of the results in the same order, so that a batch of
+        messages needs only one request.
+
+    system.multicall is also supported.
+
 The following options are available in the Plugin section of the options.
 
     xmlrpc_host - host to listen to (default: localhost)
@@ -74,12 +81,14 @@ class XMLRPCPlugin(Plugin):
         # Path is only enforced in Python 2.5 and later but we set it anyway.
         self.server.RequestHandlerClass.rpc_paths = (path,)
         self.server.register_instance(self)
+        self.server.register_multicall_functions()
         self.thread = threading.Thread(target=self.server.serve_forever)
         self.thread.setDaemon(True)
         self.thread.start()
 
     def _dispatch(self, method, params):
-        if method in ("score", "score_mime", "train", "train_mime"):
+        if method in ("score", "score_mime", "score_mime_many", "train",
+                      "train_mime"):
             return getattr(self, method)(*params)
         else:
             raise xmlrpclib.Fault(404, '"%s" is not supported' % method)
@@ -209,6 +218,11 @@ class XMLRPCPlugin(Plugin):
             self.state.unknownCorpus.addMessage(message)
         return prob
 
+    def score_mime_many(self, msg_texts, encoding):
+        """Score a list of messages representing MIME documents."""
+        return [self.score_mime(msg_text, encoding)
+                for msg_text in msg_texts]
+
 def form_to_mime(form, extra_tokens, attachments):
     """Encode submission form bits as a MIME message.
 
@@ -177,11 +177,120 @@ def poll2(timeout=0.0, map=None):
 
 poll3 = poll2                           # Alias for backward compatibility
 
+class epoll_poller:
+    # Use epoll (Linux 2.6 and later, Python 2.6 and later).  Unlike select
+    # and poll, the set of sockets is kept by the kernel between calls, so
+    # a socket is only re-registered when its readable/writable flags
+    # change, the kernel's work is proportional to the number of sockets
+    # that are ready rather than the number there are, and there is no
+    # FD_SETSIZE limit.  There's one poller per socket map.
+
+    def __init__(self):
+        self.epoll = select.epoll()
+        self.registered = {}            # fd -> (obj, flags)
+
+    def close(self):
+        self.epoll.close()
+        self.registered.clear()
+
+    def _unregister(self, fd):
+        del self.registered[fd]
+        try:
+            self.epoll.unregister(fd)
+        except (IOError, OSError, ValueError):
+            # The socket has already been closed, which removes it.
+            pass
+
+    def poll(self, timeout=0.0, map=None):
+        if map is None:
+            map = socket_map
+        registered = self.registered
+        for fd in registered.keys():
+            if fd not in map:
+                self._unregister(fd)
+        for fd, obj in map.items():
+            flags = 0
+            if obj.readable():
+                flags |= select.EPOLLIN | select.EPOLLPRI
+            if obj.writable():
+                flags |= select.EPOLLOUT
+            old = registered.get(fd)
+            if old is not None and old[0] is not obj:
+                # The fd has been reused by a new socket.
+                self._unregister(fd)
+                old = None
+            if old is None:
+                if flags:
+                    try:
+                        self.epoll.register(fd, flags)
+                    except (IOError, OSError):
+                        # Probably a file descriptor that epoll can't
+                        # watch (like a regular file); try it next time.
+                        continue
+                    registered[fd] = (obj, flags)
+            elif old[1] != flags:
+                if flags:
+                    self.epoll.modify(fd, flags)
+                    registered[fd] = (obj, flags)
+                else:
+                    self._unregister(fd)
+        if timeout is None:
+            timeout = -1
+        if not registered:
+            if timeout > 0:
+                time.sleep(timeout)
+            return
+        try:
+            r = self.epoll.poll(timeout)
+        except (IOError, select.error), err:
+            if err[0] != EINTR:
+                raise
+            r = []
+        for fd, flags in r:
+            obj = map.get(fd)
+            if obj is None:
+                continue
+            # EPOLLERR and EPOLLHUP have the same values as POLLERR and
+            # POLLHUP, so readwrite() can deal with them.
+            readwrite(obj, flags)
+
+_epoll_pollers = {}
+
+def poll_epoll(timeout=0.0, map=None):
+    if map is None:
+        map = socket_map
+    poller = _epoll_pollers.get(id(map))
+    if poller is None or poller[0] is not map:
+        poller = _epoll_pollers[id(map)] = (map, epoll_poller())
+    poller[1].poll(timeout, map)
+
+# The ways of waiting for sockets that are available here, best first.
+poll_functions = {'select' : poll}
+if hasattr(select, 'poll'):
+    poll_functions['poll'] = poll2
+if hasattr(select, 'epoll'):
+    poll_functions['epoll'] = poll_epoll
+
+def get_poll_function(name):
+    """Return the poll function for 'select', 'poll' or 'epoll', or for
+    the best one that is available if the name is 'best'.  A ValueError
+    is raised if the named one isn't available on this platform."""
+    if name == 'best':
+        for name in ('epoll', 'poll', 'select'):
+            if name in poll_functions:
+                break
+    try:
+        return poll_functions[name]
+    except KeyError:
+        raise ValueError("%s is not available" % (name,))
+
 def loop(timeout=30.0, use_poll=False, map=None, count=None):
     if map is None:
         map = socket_map
 
-    if use_poll and hasattr(select, 'poll'):
+    if use_poll == 'epoll' and hasattr(select, 'epoll'):
+        poll_fun = poll_epoll
+    elif use_poll and hasattr(select, 'poll'):
         poll_fun = poll2
     else:
         poll_fun = poll
@@ -46,22 +46,34 @@ import math
 import re
 import os
 import sys
-import socket
+import time
+import Queue
+import threading
 import urllib2
 from email import message_from_string
 
-DOMAIN_AND_PORT_RE = re.compile(r"([^:/\\]+)(:([\d]+))?")
-HTTP_ERROR_RE = re.compile(r"HTTP Error ([\d]+)")
 URL_KEY_RE = re.compile(r"[\W]")
 # XXX ---- ends ----
 
 from spambayes.Options import options
 from spambayes.chi2 import chi2Q
-from spambayes.safepickle import pickle_read, pickle_write
+from spambayes.urlslurp import BadURLCache, fetch
+from spambayes.tokenindex import TokenIndex
 
 LN2 = math.log(2)       # used frequently by chi-combining
 
-slurp_wordstream = None
+# The http URLs the tokenizer found in the message each thread tokenized
+# most recently; see get_slurp_urls().
+_slurp = threading.local()
+
+def get_slurp_urls():
+    """Return the http URLs in the message this thread tokenized most
+    recently, as a list of (proto, url) pairs, in the order they were
+    last seen."""
+    return getattr(_slurp, "urls", [])
+
+def set_slurp_urls(urls):
+    _slurp.urls = urls
 
 PICKLE_VERSION = 5
 
@@ -105,6 +117,10 @@ class Classifier:
     # allow a subclass to use a different class for WordInfo
     WordInfoClass = WordInfo
 
+    # A TokenIndex of the words in the database, made the first time it
+    # is needed (see _wordinfokeys_prefix) and then kept up to date.
+    _token_index = None
+
     def __init__(self):
         self.wordinfo = {}
         self.probcache = {}
@@ -207,22 +223,28 @@ class Classifier:
         else:
             return prob
 
-    def slurping_spamprob(self, wordstream, evidence=False):
+    def slurping_spamprob(self, wordstream, evidence=False, slurp_urls=None):
         """Do the standard chi-squared spamprob, but if the evidence
         leaves the score in the unsure range, and we have fewer tokens
         than max_discriminators, also generate tokens from the text
-        obtained by following http URLs in the message."""
+        obtained by following http URLs in the message.
+
+        slurp_urls is the list of the message's URLs, as returned by
+        get_slurp_urls() when it was tokenized; the default is those of
+        the message this thread tokenized most recently."""
         h_cut = options["Categorization", "ham_cutoff"]
         s_cut = options["Categorization", "spam_cutoff"]
 
         # Get the raw score.
         prob, clues = self.chi2_spamprob(wordstream, True)
+        if slurp_urls is None:
+            slurp_urls = get_slurp_urls()
 
         # If necessary, enhance it with the tokens from whatever is
         # at the URL's destination.
         if len(clues) < options["Classifier", "max_discriminators"] and \
-           prob > h_cut and prob < s_cut and slurp_wordstream:
-            slurp_tokens = list(self._generate_slurp())
+           prob > h_cut and prob < s_cut and slurp_urls:
+            slurp_tokens = list(self._generate_slurp(slurp_urls))
             slurp_tokens.extend([w for (w, _p) in clues])
             sprob, sclues = self.chi2_spamprob(slurp_tokens, True)
             if sprob < h_cut or sprob > s_cut:
@@ -354,6 +376,8 @@ class Classifier:
             record = self._wordinfoget(word)
             if record is None:
                 record = self.WordInfoClass()
+                if self._token_index is not None:
+                    self._token_index.add(word)
 
             if is_spam:
                 record.spamcount += 1
@@ -386,6 +410,8 @@ class Classifier:
                         record.hamcount -= 1
                 if record.hamcount == 0 == record.spamcount:
                     self._wordinfodel(word)
+                    if self._token_index is not None:
+                        self._token_index.remove(word)
                 else:
                     self._wordinfoset(word, record)
 
@@ -525,19 +551,17 @@ class Classifier:
                 yield "bi:%s %s" % (last, token)
             last = token
 
-    def _generate_slurp(self):
+    def _generate_slurp(self, urls):
         # We don't want to do this recursively and check URLs
         # on webpages, so we have this little cheat.
-        if not hasattr(self, "setup_done"):
-            self.setup()
-            self.setup_done = True
         if not hasattr(self, "do_slurp") or self.do_slurp:
-            if slurp_wordstream:
+            if urls:
                 self.do_slurp = False
 
-                tokens = self.slurp(*slurp_wordstream)
+                max_urls = options["URLRetriever", "x-slurp_max_urls"]
+                tokens = self.slurp_many(urls[-max_urls:],
+                             options["URLRetriever", "x-slurp_timeout"])
                 self.do_slurp = True
-                self._save_caches()
                 return tokens
         return []
 
@@ -583,47 +607,32 @@ class Classifier:
         # Kill any old information in the cache
         self.urlCorpus.removeExpiredMessages()
 
-        # Setup caches for unretrievable urls
-        self.bad_url_cache_name = os.path.join(dir, "bad_urls.pck")
-        self.http_error_cache_name = os.path.join(dir, "http_error_urls.pck")
-        if os.path.exists(self.bad_url_cache_name):
-            try:
-                self.bad_urls = pickle_read(self.bad_url_cache_name)
-            except (IOError, ValueError):
-                # Something went wrong loading it (bad pickle,
-                # probably).  Start afresh.
-                if options["globals", "verbose"]:
-                    print >> sys.stderr, "Bad URL pickle, using new."
-                self.bad_urls = {"url:non_resolving": (),
-                                 "url:non_html": (),
-                                 "url:unknown_error": ()}
-        else:
-            if options["globals", "verbose"]:
-                print "URL caches don't exist: creating"
-            self.bad_urls = {"url:non_resolving": (),
-                        "url:non_html": (),
-                        "url:unknown_error": ()}
-        if os.path.exists(self.http_error_cache_name):
-            try:
-                self.http_error_urls = pickle_read(self.http_error_cache_name)
-            except (IOError, ValueError):
-                # Something went wrong loading it (bad pickle,
-                # probably).  Start afresh.
-                if options["globals", "verbose"]:
-                    print >> sys.stderr, "Bad HHTP error pickle, using new."
-                self.http_error_urls = {}
-        else:
-            self.http_error_urls = {}
+        # Setup the cache for unretrievable urls.  These are kept for
+        # as long as the pages are, so that a URL that was bad (or
+        # non-existent) gets another chance from time to time.
+        self.bad_urls = BadURLCache(os.path.join(dir, "bad_urls.txt"), age)
+        self.bad_urls.import_pickles(os.path.join(dir, "bad_urls.pck"),
+                                     os.path.join(dir, "http_error_urls.pck"))
 
-    def _save_caches(self):
-        # XXX Note that these caches are never refreshed, which might not
-        # XXX be a good thing long-term (if a previously invalid URL
-        # XXX becomes valid, for example).
-        for name, data in [(self.bad_url_cache_name, self.bad_urls),
-                           (self.http_error_cache_name, self.http_error_urls),]:
-            pickle_write(name, data)
+        # (proto, url) -> True, for the pages being retrieved; the
+        # fetching threads put (proto, url, token, page) on the queue.
+        self.slurping = {}
+        self.slurped = Queue.Queue()
+        self.max_slurping = 20
+        self.slurp_pending = 0
 
     def slurp(self, proto, url):
+        """Return the tokens for the page at proto://url."""
+        return self.slurp_many([(proto, url)])
+
+    def slurp_many(self, urls, timeout=0.0):
+        """Return the tokens for the pages at a list of (proto, url) pairs.
+
+        The pages that aren't cached are retrieved concurrently.  If
+        timeout is more than zero, the pages that haven't arrived within
+        timeout seconds contribute no tokens; they are cached when they
+        do arrive, ready for the next message that has them.
+        """
         # We generate these tokens:
         #  url:non_resolving
         #  url:non_html
@@ -637,102 +646,122 @@ class Classifier:
         # doesn't cost us anything apart from another entry in the db, and
         # it's only two entries, plus one for each type of http error
         # encountered, so it's pretty neglible.
-        # If there is no content in the URL, then just return immediately.
-        # "http://)" will trigger this.
+        if not hasattr(self, "setup_done"):
+            self.setup()
+            self.setup_done = True
+        deadline = time.time() + timeout
+        self.collect_slurped()
+        order = []
+        results = {}
+        waiting = {}
+        for proto, url in urls:
+            # If there is no content in the URL, then just return
+            # immediately.  "http://)" will trigger this.
+            if url and options["URLRetriever", "x-only_slurp_base"]:
+                url = self._base_url(url)
+            key = (proto, url)
+            if key in results or key in waiting:
+                continue
+            order.append(key)
+            tokens = self._slurp_cached(proto, url)
+            if tokens is not None:
+                results[key] = tokens
+                continue
+            if key not in self.slurping:
+                if len(self.slurping) >= self.max_slurping:
+                    results[key] = []
+                    continue
+                self.slurping[key] = True
+                if options["globals", "verbose"]:
+                    print >> sys.stderr, "Slurping", url
+                thread = threading.Thread(target=self._slurp_thread,
+                                          args=(proto, url))
+                thread.setDaemon(True)
+                thread.start()
+            waiting[key] = True
+
+        while waiting:
+            if timeout > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+            else:
+                remaining = None
+            try:
+                if remaining is None:
+                    slurped = self.slurped.get(True)
+                else:
+                    slurped = self.slurped.get(True, remaining)
+            except Queue.Empty:
+                break
+            key, tokens = self._store_slurped(slurped)
+            if key in waiting:
+                del waiting[key]
+                results[key] = tokens
+
+        for key in waiting:
+            self.slurp_pending += 1
+            results[key] = []
+        tokens = []
+        for key in order:
+            tokens.extend(results[key])
+        return tokens
+
+    def _slurp_cached(self, proto, url):
+        # Return the tokens for the url if we already know them, or
+        # None if the page needs to be retrieved.
         if not url:
             return ["url:non_resolving"]
-        
-        from spambayes.tokenizer import Tokenizer
 
-        if options["URLRetriever", "x-only_slurp_base"]:
-            url = self._base_url(url)
-
-        # Check the unretrievable caches
-        for err in self.bad_urls.keys():
-            if url in self.bad_urls[err]:
-                return [err]
-        if self.http_error_urls.has_key(url):
-            return self.http_error_urls[url]
-
-        # We check if the url will resolve first
-        mo = DOMAIN_AND_PORT_RE.match(url)
-        domain = mo.group(1)
-        if mo.group(3) is None:
-            port = 80
-        else:
-            port = mo.group(3)
-        try:
-            _unused = socket.getaddrinfo(domain, port)
-        except socket.error:
-            self.bad_urls["url:non_resolving"] += (url,)
-            return ["url:non_resolving"]
+        # Check the unretrievable cache
+        token = self.bad_urls.get(url)
+        if token is not None:
+            return [token]
 
         # If the message is in our cache, then we can just skip over
         # retrieving it from the network, and get it from there, instead.
         url_key = URL_KEY_RE.sub('_', url)
         cached_message = self.urlCorpus.get(url_key)
-
         if cached_message is None:
-            # We're going to ignore everything that isn't text/html,
-            # so we might as well not bother retrieving anything with
-            # these extensions.
-            parts = url.split('.')
-            if parts[-1] in ('jpg', 'gif', 'png', 'css', 'js'):
-                self.bad_urls["url:non_html"] += (url,)
-                return ["url:non_html"]
-
-            # Waiting for the default timeout period slows everything
-            # down far too much, so try and reduce it for just this
-            # call (this will only work with Python 2.3 and above).
-            try:
-                timeout = socket.getdefaulttimeout()
-                socket.setdefaulttimeout(5)
-            except AttributeError:
-                # Probably Python 2.2.
-                pass
-            try:
-                if options["globals", "verbose"]:
-                    print >> sys.stderr, "Slurping", url
-                f = urllib2.urlopen("%s://%s" % (proto, url))
-            except (urllib2.URLError, socket.error), details:
-                mo = HTTP_ERROR_RE.match(str(details))
-                if mo:
-                    self.http_error_urls[url] = "url:http_" + mo.group(1)
-                    return ["url:http_" + mo.group(1)]
-                self.bad_urls["url:unknown_error"] += (url,)
-                return ["url:unknown_error"]
-            # Restore the timeout
-            try:
-                socket.setdefaulttimeout(timeout)
-            except AttributeError:
-                # Probably Python 2.2.
-                pass
+            return None
+        return self._tokenize_page(cached_message.as_string())
 
+    def _slurp_thread(self, proto, url):
+        try:
+            token, page = fetch(proto, url)
+        except:
+            # Don't leave the url being slurped forever.
+            token = page = None
+        self.slurped.put((proto, url, token, page))
+
+    def _store_slurped(self, slurped):
+        proto, url, token, page = slurped
+        key = (proto, url)
+        self.slurping.pop(key, None)
+        if token is not None:
+            self.bad_urls.add(url, token)
+            return key, [token]
+        if page is None:
+            return key, []
+        # Retrieving the same messages over and over again will tire
+        # us out, so we store them in our own wee cache.
+        url_key = URL_KEY_RE.sub('_', url)
+        message = self.urlCorpus.makeMessage(url_key, page)
+        self.urlCorpus.addMessage(message)
+        return key, self._tokenize_page(page)
+
+    def collect_slurped(self):
+        """Cache the pages that slurp_many()'s threads have retrieved
+        since it returned."""
+        while True:
             try:
-                # Anything that isn't text/html is ignored
-                content_type = f.info().get('content-type')
-                if content_type is None or \
-                   not content_type.startswith("text/html"):
-                    self.bad_urls["url:non_html"] += (url,)
-                    return ["url:non_html"]
-
-                page = f.read()
-                headers = str(f.info())
-                f.close()
-            except socket.error:
-                # This is probably a temporary error, like a timeout.
-                # For now, just bail out.
-                return []
-            
-            fake_message_string = headers + "\r\n" + page
-
-            # Retrieving the same messages over and over again will tire
-            # us out, so we store them in our own wee cache.
-            message = self.urlCorpus.makeMessage(url_key,
-                                                 fake_message_string)
-            self.urlCorpus.addMessage(message)
-        else:
-            fake_message_string = cached_message.as_string()
+                slurped = self.slurped.get(False)
+            except Queue.Empty:
+                break
+            self._store_slurped(slurped)
+
+    def _tokenize_page(self, fake_message_string):
+        from spambayes.tokenizer import Tokenizer
 
         msg = message_from_string(fake_message_string)
 
@@ -776,12 +805,28 @@ class Classifier:
         to the wordstream."""
         for token in wordstream:
             yield token
-        slurped_tokens = self._generate_slurp()
+        slurped_tokens = self._generate_slurp(get_slurp_urls())
         for token in slurped_tokens:
             yield token
 
     def _wordinfokeys(self):
         return self.wordinfo.keys()
 
+    def _wordinfokeys_prefix(self, prefix=""):
+        """Iterate, in order, through the words in the database that start
+        with prefix.
+
+        The first call reads all of the words (with _wordinfokeys), and
+        keeps them in a TokenIndex, which is kept up to date as the
+        classifier is trained, and made again when it is next wanted
+        after the database is loaded again.  Training done by another
+        process sharing the database (a dbm file trained by sb_filter
+        while sb_server has it open, say) isn't seen until then, so a
+        word this gives may no longer be there (_wordinfoget returns
+        None for it)."""
+        if self._token_index is None:
+            self._token_index = TokenIndex(self._wordinfokeys())
+        return self._token_index.prefix(prefix)
+
 
 Bayes = Classifier
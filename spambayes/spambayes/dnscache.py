@@ -7,7 +7,16 @@
 # Version 0.11 2004 07 06 Fixed zero division error in __del__
 
 # From http://sourceforge.net/projects/pydns/
-import DNS
+try:
+    import DNS
+except ImportError:
+    # A cache can still be used with another requestFactory (the tests
+    # use a stub resolver), but the default needs PyDNS.
+    DNS = None
+    class DNSError(Exception):
+        pass
+else:
+    DNSError = DNS.Base.DNSError
 
 import sys
 import os
@@ -15,6 +24,9 @@ import operator
 import time
 import types
 import socket
+import threading
+import collections
+import Queue
 
 from spambayes.Options import options
 from spambayes.safepickle import pickle_read, pickle_write
@@ -27,6 +39,9 @@ kMinTTL = 24 * 60 * 60 * 1                # one day
 kPruneThreshold = 5000 # May go over slightly; numbers chosen at random
 kPruneDownTo = 2500
 
+# lookup_many() gives this for questions that weren't answered in time.
+PENDING = "pending"
+
 
 class lookupResult(object):
     #__slots__=("qType","answer","question","expiresAt","lastUsed")
@@ -65,33 +80,11 @@ def sort_by_attr(seq, attr):
     return map(operator.getitem, intermed, (-1,) * len(intermed))
 
 
-class cache:
-    def __init__(self, dnsServer=None, cachefile=""):
-    # These attributes intended for user setting
-        self.printStatsAtEnd = False
-
-        # As far as I can tell from the standards,
-        # it's legal to have more than one PTR record
-        # for an address. That is, it's legal to get
-        # more than one name back when you do a
-        # reverse lookup on an IP address. I don't
-        # know of a use for that and I've never seen
-        # it done. And I don't think that most
-        # people would expect it. So forward ("A")
-        # lookups always return a list. Reverse
-        # ("PTR") lookups return a single name unless
-        # this attribute is set to False.
-        self.returnSinglePTR = True
-
-        # How long to cache an error as no data
-        self.cacheErrorSecs=5*60
-
-        # How long to wait for the server
-        self.dnsTimeout=10
-
-        # end of user-settable attributes
-
-        self.cachefile = os.path.expanduser(cachefile)
+class PickleStore:
+    """The answers, kept in a dictionary in memory, and pickled to
+    cachefile (if there is one) when the cache is closed."""
+    def __init__(self, cachefile=""):
+        self.cachefile = cachefile
         self.caches = None
 
         if self.cachefile and os.path.exists(self.cachefile):
@@ -112,36 +105,53 @@ class cache:
             else:
                 print >> sys.stderr, "opened new cache"
 
-        self.hits=0 # These two for statistics
-        self.misses=0
-        self.pruneTicker=0
-
-        if dnsServer == None:
-            DNS.DiscoverNameServers()
-            self.queryObj = DNS.DnsRequest()
-        else:
-            self.queryObj = DNS.DnsRequest(server=dnsServer)
-        return None
-
     def close(self):
-        if self.printStatsAtEnd:
-            self.printStats()
         if self.cachefile:
             pickle_write(self.cachefile, self.caches)
 
-    def printStats(self):
+    def counts(self):
+        """Return a list of (qType, questions, answers) tuples."""
+        counts = []
         for key,val in self.caches.items():
             totAnswers=0
             for item in val.values():
                 totAnswers+=len(item)
-            print >> sys.stderr, "cache", key, "has", len(self.caches[key]),
-            print >> sys.stderr, "question(s) and", totAnswers, "answer(s)"
-        if self.hits+self.misses == 0:
-            print >> sys.stderr, "No queries"
+            counts.append((key, len(val), totAnswers))
+        return counts
+
+    def get(self, question, qType, now):
+        """Return the unexpired cached answers to question, or None."""
+        cacheToLookIn = self.caches[qType]
+
+        try:
+            answers = cacheToLookIn[question]
+        except KeyError:
+            return None
+
+        if answers:
+            ind = 0
+            # No guarantee that expire has already been done
+            while ind<len(answers):
+                thisAnswer = answers[ind]
+                if thisAnswer.expiresAt<now:
+                    del answers[ind]
+                else:
+                    thisAnswer.lastUsed = now
+                    ind += 1
         else:
-            print >> sys.stderr, self.hits, "hits,", self.misses, "misses",
-            print >> sys.stderr, "(%.1f%% hits)" % \
-                  (self.hits/float(self.hits+self.misses)*100)
+            print >> sys.stderr, "lookup failure:", question
+
+        if not answers:
+            del cacheToLookIn[question]
+            return None
+        return answers
+
+    def put(self, question, qType, objs):
+        self.caches[qType][question] = objs
+
+    def checkPrune(self, now):
+        if len(self.caches["A"])+len(self.caches["PTR"])>kPruneThreshold:
+            self.prune(now)
 
     def prune(self, now):
         # I want this to be as fast as reasonably possible.
@@ -155,7 +165,7 @@ class cache:
         allAnswers = sort_by_attr(allAnswers,"expiresAt")
         allAnswers.reverse()
 
-        while True:
+        while allAnswers:
             if allAnswers[-1].expiresAt > now:
                 break
             answer = allAnswers.pop()
@@ -164,9 +174,6 @@ class cache:
             if  not c[answer.question]:
                 del c[answer.question]
 
-        if options["globals", "verbose"]:
-            self.printStats()
-
         if len(allAnswers)<=kPruneDownTo:
             return None
 
@@ -187,6 +194,271 @@ class cache:
         return None
 
 
+class SQLiteStore:
+    """The answers, kept in an SQLite database.
+
+    The pickle is read in full when the cache is opened and written in
+    full when it is closed, and prune() sorts every answer, which gets
+    slow once the cache is large.  Here each answer is a row, indexed by
+    question, by expiry time and by when it was last used, so opening and
+    closing cost nothing, expired answers can be removed a few at a time,
+    and the least recently used answers can be found without looking at
+    the rest.  Every change is committed straight away, so several
+    processes can share the file; SQLite does the locking.  If cachefile
+    is a pickled cache (from before the cache type was changed), its
+    unexpired answers are imported, and it is kept as cachefile + ".old".
+    """
+    def __init__(self, cachefile, maxAnswers=kPruneThreshold):
+        import sqlite3
+        self.cachefile = cachefile
+        self.maxAnswers = maxAnswers
+
+        # How many rows prune() removes at once, at most
+        self.pruneBatch = 100
+        # lastUsed is only updated when it is this much out of date,
+        # which saves a write for most hits
+        self.touchInterval = 10*60
+
+        self.expired = self.evicted = 0
+        old = None
+        # An empty file is a new database.
+        if os.path.exists(cachefile) and os.path.getsize(cachefile) and \
+           open(cachefile, "rb").read(16) != "SQLite format 3\0":
+            try:
+                old = pickle_read(cachefile)
+            except:
+                # Not a pickle either; there's nothing to keep.
+                pass
+            if os.path.exists(cachefile + ".old"):
+                os.remove(cachefile + ".old")
+            os.rename(cachefile, cachefile + ".old")
+        # The cache may be used by lookup_many()'s caller and by
+        # lookup() in other threads.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(cachefile, timeout=20,
+                                  check_same_thread=False)
+        # Answers are plain strings, like PyDNS gives.
+        self.db.text_factory = str
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                qtype TEXT, question TEXT, answer TEXT,
+                expires INTEGER, last_used INTEGER);
+            CREATE INDEX IF NOT EXISTS answers_question
+                ON answers (question, qtype);
+            CREATE INDEX IF NOT EXISTS answers_expires
+                ON answers (expires);
+            CREATE INDEX IF NOT EXISTS answers_last_used
+                ON answers (last_used);
+            """)
+        self.db.commit()
+        if old:
+            self.importPickle(old)
+
+    def importPickle(self, caches):
+        """Add the unexpired answers from a PickleStore's dictionary."""
+        now = int(time.time())
+        rows = []
+        for qType, questions in caches.items():
+            for question, objs in questions.items():
+                rows.extend([(qType, question, obj.answer, obj.expiresAt,
+                              obj.lastUsed) for obj in objs
+                             if obj.expiresAt >= now])
+        self.db.executemany("INSERT INTO answers VALUES (?, ?, ?, ?, ?)",
+                            rows)
+        self.db.commit()
+
+    def execute(self, sql, args=(), commit=False):
+        self.lock.acquire()
+        try:
+            rows = self.db.execute(sql, args).fetchall()
+            if commit:
+                self.db.commit()
+            return rows
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.db.close()
+        finally:
+            self.lock.release()
+
+    def counts(self):
+        return [(qType, questions, answers) for qType, questions, answers in
+                self.execute("SELECT qtype, COUNT(DISTINCT question),"
+                             " COUNT(*) FROM answers GROUP BY qtype")]
+
+    def get(self, question, qType, now):
+        rows = self.execute("SELECT answer, expires, last_used FROM answers"
+                            " WHERE question = ? AND qtype = ?"
+                            " AND expires >= ?", (question, qType, now))
+        if not rows:
+            return None
+        if rows[0][2] < now - self.touchInterval:
+            self.execute("UPDATE answers SET last_used = ?"
+                         " WHERE question = ? AND qtype = ?",
+                         (now, question, qType), commit=True)
+        return [lookupResult(qType, answer, question, expires, now)
+                for answer, expires, lastUsed in rows]
+
+    def put(self, question, qType, objs):
+        self.lock.acquire()
+        try:
+            self.db.execute("DELETE FROM answers"
+                            " WHERE question = ? AND qtype = ?",
+                            (question, qType))
+            self.db.executemany("INSERT INTO answers VALUES (?, ?, ?, ?, ?)",
+                                [(qType, question, obj.answer, obj.expiresAt,
+                                  obj.lastUsed) for obj in objs])
+            self.db.commit()
+        finally:
+            self.lock.release()
+
+    def checkPrune(self, now):
+        self.prune(now)
+
+    def prune(self, now):
+        """Remove up to pruneBatch expired answers, and then, if there
+        are still too many, up to pruneBatch of the least recently used
+        ones."""
+        self.lock.acquire()
+        try:
+            cursor = self.db.execute(
+                "DELETE FROM answers WHERE rowid IN (SELECT rowid"
+                " FROM answers WHERE expires < ? ORDER BY expires LIMIT ?)",
+                (now, self.pruneBatch))
+            self.expired += cursor.rowcount
+            total = self.db.execute("SELECT COUNT(*) FROM answers"
+                                    ).fetchone()[0]
+            if total > self.maxAnswers:
+                cursor = self.db.execute(
+                    "DELETE FROM answers WHERE rowid IN (SELECT rowid"
+                    " FROM answers ORDER BY last_used LIMIT ?)",
+                    (min(total - self.maxAnswers, self.pruneBatch),))
+                self.evicted += cursor.rowcount
+            self.db.commit()
+        finally:
+            self.lock.release()
+
+
+class cache:
+    def __init__(self, dnsServer=None, cachefile="", requestFactory=None,
+                 cachetype="pickle", maxAnswers=kPruneThreshold):
+    # These attributes intended for user setting
+        self.printStatsAtEnd = False
+
+        # As far as I can tell from the standards,
+        # it's legal to have more than one PTR record
+        # for an address. That is, it's legal to get
+        # more than one name back when you do a
+        # reverse lookup on an IP address. I don't
+        # know of a use for that and I've never seen
+        # it done. And I don't think that most
+        # people would expect it. So forward ("A")
+        # lookups always return a list. Reverse
+        # ("PTR") lookups return a single name unless
+        # this attribute is set to False.
+        self.returnSinglePTR = True
+
+        # How long to cache an error as no data
+        self.cacheErrorSecs=5*60
+
+        # How long to wait for the server
+        self.dnsTimeout=10
+
+        # The most queries lookup_many() will have outstanding at once
+        self.maxConcurrent=20
+
+        # end of user-settable attributes
+
+        self.cachefile = os.path.expanduser(cachefile)
+        self.store = None
+        if cachetype == "sqlite" and self.cachefile:
+            try:
+                import sqlite3
+            except ImportError:
+                print >> sys.stderr, "sqlite3 not available,",
+                print >> sys.stderr, "using a pickled DNS cache"
+            else:
+                try:
+                    self.store = SQLiteStore(self.cachefile, maxAnswers)
+                except sqlite3.DatabaseError, e:
+                    # Don't let a damaged file stop the tokenizer loading
+                    # (or a PickleStore remove it).
+                    print >> sys.stderr, "Can't use DNS cache", \
+                          self.cachefile, "(%s)," % (e,),
+                    print >> sys.stderr, "answers will not be kept"
+                    self.store = PickleStore()
+        if self.store is None:
+            self.store = PickleStore(self.cachefile)
+
+        self.hits=0 # These three for statistics
+        self.misses=0
+        self.pending=0
+        self.pruneTicker=0
+
+        # Queries being made by lookup_many()'s threads: (question,
+        # qType) -> the queues of the lookup_many() calls waiting for the
+        # answer.  Questions that couldn't be asked yet, because
+        # maxConcurrent threads were busy, are in backlog; the threads ask
+        # them when they're done.  The lock is for these, the counts and
+        # the store, which the threads add their answers to.
+        self.inFlight = {}
+        self.backlog = collections.deque()
+        self.running = 0
+        self.lock = threading.Lock()
+
+        if requestFactory is None:
+            if DNS is None:
+                raise ImportError("PyDNS is not installed")
+            if dnsServer == None:
+                DNS.DiscoverNameServers()
+                requestFactory = DNS.DnsRequest
+            else:
+                requestFactory = lambda: DNS.DnsRequest(server=dnsServer)
+        # Request objects aren't safe to share between threads, so each
+        # of lookup_many()'s threads makes its own, and lookup() uses one
+        # per calling thread.
+        self.requestFactory = requestFactory
+        self.requests = threading.local()
+        return None
+
+    def getQueryObj(self):
+        """Return the request object for lookups made by this thread."""
+        queryObj = getattr(self.requests, "queryObj", None)
+        if queryObj is None:
+            queryObj = self.requests.queryObj = self.requestFactory()
+        return queryObj
+
+    def close(self):
+        if self.printStatsAtEnd:
+            self.printStats()
+        self.store.close()
+
+    def printStats(self):
+        for key, questions, answers in self.store.counts():
+            print >> sys.stderr, "cache", key, "has", questions,
+            print >> sys.stderr, "question(s) and", answers, "answer(s)"
+        if self.hits+self.misses == 0:
+            print >> sys.stderr, "No queries"
+        else:
+            print >> sys.stderr, self.hits, "hits,", self.misses, "misses",
+            print >> sys.stderr, "(%.1f%% hits)" % \
+                  (self.hits/float(self.hits+self.misses)*100)
+        if self.pending:
+            print >> sys.stderr, self.pending, "answers not in time"
+        if getattr(self.store, "expired", 0) or \
+           getattr(self.store, "evicted", 0):
+            print >> sys.stderr, self.store.expired, "expired and",
+            print >> sys.stderr, self.store.evicted, "least recently used",
+            print >> sys.stderr, "answers pruned"
+
+    def prune(self, now):
+        self.store.prune(now)
+        if options["globals", "verbose"]:
+            self.printStats()
+
     def formatForReturn(self, listOfObjs):
         if len(listOfObjs) == 1 and listOfObjs[0].answer == None:
             return []
@@ -197,50 +469,44 @@ class cache:
         return [ obj.answer for obj in listOfObjs ]
 
 
-    def lookup(self,question,qType="A"):
+    def checkType(self, qType):
         qType = qType.upper()
         if qType not in ("A","PTR"):
             raise ValueError,"Query type must be one of A, PTR"
+        return qType
 
-        now = int(time.time())
-
-        # Finding the len() of a dictionary isn't an expensive operation
-        # but doing it twice for every lookup isn't necessary.
+    def checkPrune(self, now):
+        # Called with the lock held.
         self.pruneTicker += 1
         if self.pruneTicker == kCheckForPruneEvery:
             self.pruneTicker = 0
-            if len(self.caches["A"])+len(self.caches["PTR"])>kPruneThreshold:
-                self.prune(now)
-
-        cacheToLookIn = self.caches[qType]
+            self.store.checkPrune(now)
 
+    def lookup(self,question,qType="A"):
+        qType = self.checkType(qType)
+        now = int(time.time())
+        self.lock.acquire()
         try:
-            answers = cacheToLookIn[question]
-        except KeyError:
-            pass
-        else:
-            if answers:
-                ind = 0
-                # No guarantee that expire has already been done
-                while ind<len(answers):
-                    thisAnswer = answers[ind]
-                    if thisAnswer.expiresAt<now:
-                        del answers[ind]
-                    else:
-                        thisAnswer.lastUsed = now
-                        ind += 1
-            else:
-                print >> sys.stderr, "lookup failure:", question
-
-            if not answers:
-                del cacheToLookIn[question]
-            else:
+            self.checkPrune(now)
+            answers = self.store.get(question, qType, now)
+            if answers is not None:
                 self.hits += 1
                 return self.formatForReturn(answers)
+            # Not in cache or we just expired it
+            self.misses += 1
+        finally:
+            self.lock.release()
 
-        # Not in cache or we just expired it
-        self.misses += 1
+        objs = self.query(self.getQueryObj(), question, qType, now)
+        self.lock.acquire()
+        try:
+            self.store.put(question, qType, objs)
+        finally:
+            self.lock.release()
+        return self.formatForReturn(objs)
 
+    def query(self, queryObj, question, qType, now):
+        """Ask the server, and return a list of lookupResults to cache."""
         if qType == "PTR":
             qList = question.split(".")
             qList.reverse()
@@ -250,22 +516,23 @@ class cache:
 
         # where do we get NXDOMAIN?
         try:
-            reply = self.queryObj.req(queryQuestion, qtype=qType,
-                                      timeout=self.dnsTimeout)
-        except DNS.Base.DNSError,detail:
+            reply = queryObj.req(queryQuestion, qtype=qType,
+                                 timeout=self.dnsTimeout)
+        except DNSError,detail:
             if detail.args[0] not in ("Timeout", "nothing to lookup"):
                 print >> sys.stderr, detail.args[0]
                 print >> sys.stderr, "Error, fixme", detail
                 print >> sys.stderr, "Question was", queryQuestion
                 print >> sys.stderr, "Original question was", question
                 print >> sys.stderr, "Type was", qType
-            objs = [lookupResult(qType, None, question,
+            return [lookupResult(qType, None, question,
                                  self.cacheErrorSecs+now, now)]
-            cacheToLookIn[question] = objs # Add to format for return?
-            return self.formatForReturn(objs)
         except socket.gaierror,detail:
-            print >> sys.stderr, "DNS connection failure:", self.queryObj.ns, detail
-            print >> sys.stderr, "Defaults:", DNS.defaults
+            print >> sys.stderr, "DNS connection failure:", queryObj.ns, detail
+            if DNS is not None:
+                print >> sys.stderr, "Defaults:", DNS.defaults
+            return [lookupResult(qType, None, question,
+                                 self.cacheErrorSecs+now, now)]
 
         objs = []
         for answer in reply.answers:
@@ -287,15 +554,12 @@ class cache:
                     objs.append(item)
 
         if objs:
-            cacheToLookIn[question] = objs
-            return self.formatForReturn(objs)
+            return objs
 
         # Probably SERVFAIL or the like
         if not reply.authority:
-            objs = [lookupResult(qType, None, question,
+            return [lookupResult(qType, None, question,
                                  self.cacheErrorSecs+now, now)]
-            cacheToLookIn[question] = objs
-            return self.formatForReturn(objs)
 
 
         # No such host
@@ -314,10 +578,110 @@ class cache:
                 break
         else:
             cacheNeg = auTTL
-        objs = [lookupResult(qType, None, question, cacheNeg+now, now)]
+        return [lookupResult(qType, None, question, cacheNeg+now, now)]
+
+    # Concurrent lookups.  lookup() makes one query at a time, and waits
+    # up to dnsTimeout seconds for each, which is far too long to hold up
+    # a message (and, in sb_server, every other connection).
+    # lookup_many() starts a thread for each question that isn't cached
+    # (up to maxConcurrent of them; the rest wait for a thread to become
+    # free), waits until a deadline for the answers, and reports PENDING
+    # for the ones that haven't arrived.  Those threads carry on, and
+    # their answers are added to the cache when they come in, so later
+    # messages mentioning the same hosts get them.  Any number of threads
+    # can call lookup_many() at once; a question already being asked for
+    # one of them isn't asked again.
+
+    def lookup_many(self, requests, timeout):
+        """Look up a list of (question, qType) pairs concurrently.
+
+        Returns a dictionary mapping each (question, qType.upper()) pair
+        to what lookup() would return, or to PENDING if the answer didn't
+        arrive within timeout seconds.
+        """
+        deadline = time.time() + timeout
+        now = int(time.time())
+        # The answers to this call's questions.
+        answered = Queue.Queue()
+        results = {}
+        waiting = {}
+        self.lock.acquire()
+        try:
+            for question, qType in requests:
+                qType = self.checkType(qType)
+                key = (question, qType)
+                if key in results or key in waiting:
+                    continue
+                self.checkPrune(now)
+                answers = self.store.get(question, qType, now)
+                if answers is not None:
+                    self.hits += 1
+                    results[key] = self.formatForReturn(answers)
+                    continue
+                waiting[key] = True
+                if key in self.inFlight:
+                    self.inFlight[key].append(answered)
+                    continue
+                self.misses += 1
+                self.inFlight[key] = [answered]
+                if self.running < self.maxConcurrent:
+                    self.running += 1
+                    thread = threading.Thread(target=self.queryThread,
+                                              args=(key,))
+                    thread.setDaemon(True)
+                    thread.start()
+                else:
+                    self.backlog.append(key)
+        finally:
+            self.lock.release()
+
+        while waiting:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                key, objs = answered.get(True, remaining)
+            except Queue.Empty:
+                break
+            del waiting[key]
+            results[key] = self.formatForReturn(objs)
 
-        cacheToLookIn[question] = objs
-        return self.formatForReturn(objs)
+        self.lock.acquire()
+        try:
+            for key in waiting:
+                self.pending += 1
+                results[key] = PENDING
+                # Nobody is waiting for this answer now.
+                queues = self.inFlight.get(key)
+                if queues is not None and answered in queues:
+                    queues.remove(answered)
+        finally:
+            self.lock.release()
+        return results
+
+    def queryThread(self, key):
+        # Ask the question, and then any that are waiting for a thread.
+        while True:
+            question, qType = key
+            now = int(time.time())
+            try:
+                objs = self.query(self.requestFactory(), question, qType,
+                                  now)
+            except:
+                # Don't leave the question in flight forever.
+                objs = [lookupResult(qType, None, question,
+                                     self.cacheErrorSecs+now, now)]
+            self.lock.acquire()
+            try:
+                self.store.put(question, qType, objs)
+                for answered in self.inFlight.pop(key, []):
+                    answered.put((key, objs))
+                if not self.backlog:
+                    self.running -= 1
+                    return
+                key = self.backlog.popleft()
+            finally:
+                self.lock.release()
 
 
 def main():
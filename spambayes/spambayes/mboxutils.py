@@ -134,9 +134,9 @@ def getmbox(name):
         mboxes = [IMAPFolder(n, session, stats) for n in names]
         
         if len(mboxes) == 1:
-            return full_messages(mboxes[0])
+            return full_messages(mboxes[0].full_messages())
         else:
-            return _cat([full_messages(x) for x in mboxes])
+            return _cat([full_messages(x.full_messages()) for x in mboxes])
         
     if os.path.isdir(name):
         # XXX Bogus: use a Maildir if /cur is a subdirectory, else a MHMailbox
@@ -91,7 +91,7 @@ import email.Generator
 
 from spambayes import storage
 from spambayes import dbmstorage
-from spambayes.tokenizer import tokenize
+from spambayes import tokencache
 from spambayes.Options import options
 from spambayes.safepickle import pickle_read, pickle_write
 
@@ -104,6 +104,7 @@ CRLF_RE = re.compile(r'\r\n|\r|\n')
 
 STATS_START_KEY = "Statistics start date"
 STATS_STORAGE_KEY = "Persistent statistics"
+FOLDER_CHECKPOINTS_KEY = "Folder checkpoints"
 PERSISTENT_HAM_STRING = 'h'
 PERSISTENT_SPAM_STRING = 's'
 PERSISTENT_UNSURE_STRING = 'u'
@@ -135,6 +136,21 @@ class MessageInfoBase(object):
         self.db[STATS_STORAGE_KEY] = stats
         self.store()
 
+    def get_folder_checkpoints(self):
+        if self.db.has_key(FOLDER_CHECKPOINTS_KEY):
+            return self.db[FOLDER_CHECKPOINTS_KEY]
+        else:
+            return {}
+
+    def set_folder_checkpoints(self, checkpoints):
+        self.db[FOLDER_CHECKPOINTS_KEY] = checkpoints
+        self.store()
+
+    def set_folder_checkpoint(self, key, checkpoint):
+        checkpoints = self.get_folder_checkpoints()
+        checkpoints[key] = checkpoint
+        self.set_folder_checkpoints(checkpoints)
+
     def __getstate__(self):
         return self.db
 
@@ -402,6 +418,9 @@ class Message(object, email.Message.Message):
         if id == STATS_STORAGE_KEY:
             raise ValueError, "MsgId must not be " + STATS_STORAGE_KEY
 
+        if id == FOLDER_CHECKPOINTS_KEY:
+            raise ValueError, "MsgId must not be " + FOLDER_CHECKPOINTS_KEY
+
         self.id = id
         self.message_info_db.load_msg(self)
 
@@ -409,7 +428,7 @@ class Message(object, email.Message.Message):
         return self.id
 
     def tokenize(self):
-        return tokenize(self)
+        return tokencache.tokenize(self)
 
     def _force_CRLF(self, data):
         """Make sure data uses CRLF for line termination."""
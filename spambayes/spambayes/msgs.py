@@ -3,7 +3,7 @@ from __future__ import generators
 import os
 import random
 
-from spambayes.tokenizer import tokenize
+from spambayes.tokencache import tokenize
 
 HAMTEST  = None
 SPAMTEST = None
@@ -22,7 +22,7 @@ class Msg(object):
         f.close()
 
     def __iter__(self):
-        return tokenize(self.guts)
+        return iter(tokenize(self.guts))
 
     # Compare msgs by their paths; this is appropriate for sets of msgs.
     def __hash__(self):
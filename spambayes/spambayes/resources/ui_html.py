@@ -5,153 +5,154 @@ source = 'ui.html'
 package = 'spambayes.resources'
 
 import zlib
-data = zlib.decompress("x=ksFS0\015\")v\022=kN=;ʦRj\010\014I@\000C\024713\030<HQ\
-vv꜔D\002~O\017tw\027W?%.޾\021|\016F/FW/ƓP\\2)\
-2J\023\031F~&_~q(1V2eTJDGL._ȵ*ďTL\006lD\017*\
-Xev~sB\006\013 K҃/zuE*\021Wj \000D\034~X'\
-&04\005ӸgXVEy[\031G,\002*47\025HZ.f\000D|;~$d\036x UT\
-\024\003P*@Qr\"__~Q)0oq,͗l\003_ȓ8Jnzi~\"4\001ݔ'\
-\021\0127]@g'\014\0155+\035T4_\0004\016Hh#\011)cn8IBLep\
-3*\011a``S0S V3q/7MP\007eN\024)\000iZ\
-(rK\010\021EO\005\035\037?j]s)XsU\"C[\000hl\002!֌ܟ\
-\031b\025\002#w b\014`<fRO{\020q9r/g}W^E^O\017 ٝ^tP\030\016t!z\
-%tL2y_`õm<\015\030QQӄ\027\\\025,0@~,\022)`g\022e\035\
-\037Z<!<N\031|62Vl,|$v\017\036]%:\013[\021Ĳ(}5\024\031B\034\001V\004L79s\
-QWh\0130mܗb\031aq2-S\003 4xDɲ<\015A.\033'5u]\001\
-A>qK4]*\\<O,r5?g#?\035heBs=蠚7\000Ø9\004Qri\
-\012=m\010g'#0|X'\002dETY\024{8\013PM,\026m B5\022`BP\"Nӛ\003\0073\
-b\006N22<2Wk\026~T9\020Wp\026\034EZ\025\014 @Z\013\034AΛ\013{\012\034\022e\000\023iK\
-%}/\031B^%e\004Ӗp\015\004\023k\010\021\002].dD3n_2q\000Oi\010\032t\033\007c\021\
-T\006S\036\033,M\005\014|~\015h案{K\007-0\001F\010N \003l\024\020eh8c\
-31Ky\003\001m^\026E\004fy0^gfZ^ҨD@LU{\013$*r@xFA\001{@T_\
-\013!\032;><\033e\035y\\641\012}\004ѳ,.EI\012sa\003PbP\007\020D\017F$\012\
-\016\017%H@\0001c0V&ۈ>',ԝ\\f1l\030UP\0023FT\030\016|\\`\000p4\0004\
-L\030oi[q\026%YU֏x\\g\012\002Ps\0174#\015\003{\0356\001p\011BYZA\\\
-.epҠ\036\007i]lYS\001\033}>t?M8ȇ]\011;\033\035P\016Pt\
-\010q\034\032)q.L%{6Z@xyk4\000@5\002C4`WU@w\005 k\010lXY\
-<_~\004a\016l\024Mv'bHЀFb!\012C\014\012mF g\035?ucJm\020\024\031*\
-|\005s-Ȅ$v\024h\012qLB#)ɢD3T2G;\0112h@9Ow\011~m\031,O\010rY\
-\030-p\002ϓ+ю\004ŀ\003(\002\0175]\033\017\0014Cn@\004'\034\025\013Am\004\036j?X\
-H\025\022\016T\021,wV_h1\011{BYl\023{źm<_\030%>\023\000̂'R\003M'\
->\030.3`ȒS~ƍL\011\005p\013\016NNo{F8y៛\"Pq\014#\003f\014\
-e\003\016zڃSG\020Ԃ\014\031\026\001\016D?\002Ay}\010\012_!5[1P9\002c7\\eh\
-\0009..JYV\005z\017n\014#tlc'\026E<h\025T6rFG')\034ƃ\026M?6,L\007\
-S\001/`:\012F&uX\001mn>.'w ;7E\023 oSpua\037)AӰ\004\021BQ\005\
-\001\011blP֤Hx\037(e[:/vh#\003 Ȧ\031)\000\033/pQ#\
-KI\037 \"OW<.B4D\026E\036\001.\037<_Hpt((2\025D(u\
-2i\025f\0165a/\"-5\"\003\"\027ɮ\020>rwj+\014\")$\020_(s\0159-\
-\004\037(<\000C\015\022@.\022kp1)\030a\0020\020\006@\003{A\0267}\031$7\\(\002\034\005\
-L\0024\017?sZN\034C\003\0268\030SKcH]\024>D@W`~T(Mr\012 C*1\000m%\
-\016i\014\004c\022\005\017ҧ\033G%W\013thsLÍ_jHH>b\005\011\016\021\034#OF\014o9N-\
-i>)\033\024@\014lt\011\030p\010\001$qLrjhT\000\005\0020Q\010\033~v\015\
-P\002\034\035\016\0218PTKu\014p\013H\034w\011( Ba\0000\"%X\001ض\034r\025Hcr \003\
-X0`\000+\0364\007`Fy4+4\022\0214s\002\012A\024ƚb1j2E\022\
-ZwEZ,8&\001F)0\030+\0344\022r1Xjj%-\0060*Wvk`\
-$\0036w\0328\005\026T!O\002HJW'|\021\\-(ph>XiA\"P\"\021KЪ\027,`\014\
-\022*ib\017n\034X\033aXĽwhXWQXC\030Yв\015\006\\l%84B\014CH6\033\027\
-;E^\"\000\"\015Hu|\033\021/5W\007-\020FPv\000b\014OZAbr\
-`;:Ȑcq(ZU\004_7\032Y!VbXiauS{\015\024\020Ca\
-R\025\034R#\031\0201fJ:å\011\034LD\0304鰋pX\017S\020\030U6h\002\
-j\012_(sP\012#@\0114!\014\"Uť7,5T\002ҵd>\001\006$!\023\012\
-l\005n\"\004r\035\014فE(*\024cPe*\011eB12*X\000mR\032hчgb\
-N^%\004<_p[3\002G\032QSCU-LOҫ\006X٬*AF\034ϓז\037F!AP2Y<\
-M\006!}Gێ\0127ס\\\027/Fˌy\015y\0249\002\016\025\016\005\023^G=)`B\004Cc\"\025|z\
-I¨\010d\036K\027(42#R\017\032CL@.\026XϘ|QqC3f+\007v\
-\\\011\006F\016\\$ \037U\017ue\024\0005\001\003\010B\016Ws?\000wp\001<\010\013\020WTDl\
-.Xf^e.\024˧2`7cb4\027\003\013*ug\035隩\002`pd\020\015\027RX\001D\000\
-\020\026D3&L\\LY;0~ɡW\010xAY]\022HKn\003\0304\004Yvz\\U\012\002`\037\
-b!\\h\000\024p\021\021-\011\007+\030\\YRFF d\005^AӚ\010ó1Qv׎\027\
-Б\023/fѐ\003Ǵ3\026e|BTd\020Z\0308k~+\021|U*q8߰\006?\"ÆbcO\001\
-laKʂ\0300\020H\"\037ok\007a\032r\022o(jpX\013C\010\\&2kGb\032Ty\
-\032\001GE3#\010+t\020\020\0368Q^mS/MB^\010rE\000Xf\020\027\0028@\007\033\003B\020|Ψ\
-;1ʄuh\021\017`D!3c\025BOLPp\033\010\014M\"WW\020\006䩡\
-pY\\q:@5In\001 `Y\0230W1N\"8Zq\020\007\037k\023i\0304xֵ6i)\
-\004\006iM89F6C~­h\015\024\025kZ\036W2\013׀c;vFJ9Aơ:!=H\
-/8\0002\001핹0Xd \001q\022W};BOq\001Q\025\037rn\031!\
-\027udڗB#2[Q(\005ˉ\005֠?<9\014+sfi\017\012bgZd\017YrV߉ڱ\
-Z:/@%\012\035\002w=\023D(\025\033#*:\\Łu\003SI\"w\003^2*d\003\025ie4\027\013\014\
-\015򛀓_˙]Yhb1t3U-b%NK\026K*, \023G\003\006\006\024\033!B\0140E\
-`K4,VleI\013RN\012N(0\004\006\001Dc3\\\020V(7&bw\"\
-\005@Ntoߪ<5v\012YW\011[رv.X4N\011!i\010\031\033$W%@\
-@8A;\032\002˻GM-;(;Ds\011wLR-符=[ƞh\034KG\0011N7GPt\
-\031vƸ;\005G!d\\q-\032i!8Y4r._@\027QH\025Kr7R,\000N\
-JLū;\013\036n1bb5Z7>(\017\006\020L\000[\"ryY܆L\020\027h\026\
-\027XW٘=3,\022\0245#p\02024K;/Dջ\007\015jLA(<uo \
-Ŋ0K\031uDf\023\006p\003\030Z?\"ja\021i\025\015B4.fQ܍`u4Ϣ\
-؅\021&F2=\\r3H,\"ȣ醚\013\031Pl( \0000;\010c1>cj\
-ӵ_8\036\"/[n\005=̾\0006BJkQ\005\021\004Pk\\'\015fn£\005\005\031\023tRw+\
-`L\0257p^B\025\027(\012oqǁP\"x\015뢰@!\006r5P蘊mH\
-Qo/ղ\013%\027ZOS$,Qlya\013y#u$htE\021\001\0357Z\
-5\033~d8Ѯ&r\007ƀ\031Oe-i8\036KǅȺXӞaF\012lm'\022\027\
-mg\024$,Nؙj=?\0247ԫ'g%׳6kqKRJ:@\005H\030\001βǍop?Gb\016\
- *<\000jh7կ\006Z\033ή\037ʗp~_\\r _];Gg_\035\034\0157Ȟ\025\
-\031L܌]%yw6\037p\007<i\021SG\022v՞{K>(Sӑt<]H<X\032-\
-9d䟞rt'ѳ\031)lνg^c34\010zf$2\010(ynY\
-=֓\005\017\002Q}69u\014H7r.\037\0344\037xG.aio\031\036op\
-\007\032w6<ѻn\027\033/\0115䩹#΍ϐqS$\036JG6@)SM홦^֔mL\035\
-O7?\021M0%m<\0357><H<h\\R\0202\003E[\013QUֆ\
-_\001Ē9\0367;C\023\0173~\006\022o9Œ,8P*\011f{\035R\031A\
-M864\017iJ'\001:F\011aC3݋_9\013\033^C|''\026D6D4ݼ>DJ\
-ZA\034#ͮ##\014tznR]6޿{LQ\032\017͞t\032\036waX\
-wA\023$=O\031F\004vBѝXv\015[Y6\011sH\021$\036I;s4\016\
-Kðg\014 7]2mi\036:U­Cm1kR-1mM(p\013q}ewA?Rm5\
-\013fm\"\0379RĠE\011b~Қ\0031oo\016YGm6OtmYp8lj\036;Hp\023\
-\020ڸ?Swn#rƸm4(\033ב\023nx@\037}\030\006\0179uq4I\001{ol\
-. \027̶\007pujS\\dY\015o\007PkQ\0327s샠\020V2OF5/\
-(\001\006\031\011_(5_q{jj~+\032Si\014\013\032t\011m'Z\032\0307A%\002]@@`t\023W\
-חqz4q?itH٩P}6\024D\0124.U)\020!GijV\
-ja|deOc6~v\0022d\001?@\\\032+ڸ\025A'\0253U\022[JkAK5\026JD\
-\015]f\030\002>\005M%էJ)v\012/\027ԿRkCQf\007\024m`\032d5Ǻ\007=l\
-1\022\004\035~1(\004B]%HI}G=Ij\032u<홗$\014v\002OY6붶qy\
-\013y\011\025\031\004ktVp\033\024ţ\017\034]q\030\012b?_]9\015[E\024\012\
-Bp|j7\0379Ǯ\002 \001\025w8Ǩ:${\020|MMT#o<uA\035\
-\032;\035J\004¨@\000ġs\021\0121\0057@#|݈=\007\022Ӷ3t\017ܦv\
-m\013(3d\031CJOF~x/[\011[=\034Io(UJ^\023Ͱ\011/\
-x7MǏE0Vɼ\\ɹ8گ\"iyk/v\036\023{\021<8>\0258az\002?7\037\
-Tԡ\000\000 8!n'~\013'P;Pt~.^{\003ŋ\027q9sa\
-IW*\000G\035vdyzhWUԿF_\0171h\015߿xOo\\\
-\034pWEjc55n}á\030\010\001'\003W\014l\011LxsTx\026l\0206\036\
-nN*;ŝA\030\0154y\020\005\026\007\011\026);Eߖ}ienxM׋\006Ң/\0154\017\027\
-WENj#j}`o\021p^F6u>ʅ?\020!0\003^\007AӠQF\007!APF\
-ph3`PG`x+\017tu\015(|\004\002Eb\021?$\003<+znQHW98>\035\037X\026\
-\002\022\026v\023@@}͘\016AZh>9=ӻ\037d\021zMfC\024\
-,\"%.#:\021\007sW\024\031H.ԨA$_]G^\032DczQ'NB\
-y5Aip\003\0317\0074YC\007:\"ˁ8<\024\037U&cq甩p=KD\
-\014\004g儜?D)\010S\016w\033_v;@[!/}ϢA7Y\004 \
-ޣl;!ڣyۛh1\032\005߹<t^b-1\017\\nQ@,\017\
-zMhڅDՉ\035 d=5-Eo\033Vɹ\026,Ne-/ GgkPC\
-\032aP\021}*.#<_KX\035`g\014ٍA;sʯ_ћ\014ܾEM\022o@6n3uO\011\
-tVijN~W'\033\024-D.7dcW<MFξ;~{\015K5klPP[Q\
-S(L{\031.B5~e\006g$\026.\027dl/S\021DOS<eNp\\}\
-G[!r\015Bma;c\031:L\012f\015x:4C<{bN\026fCo<}Qc\
-\000y\026hx<n\032֮T1ߔbm{Nݘxde\021\005\032b5b7\
-.\0271\017z:6\001șMƮp)ۺe>^\005ʐGc9U7y_P\
-tU\015}kR#Mft)8h4\0322?\\\0262F\020AwþݰL*8|\
-\002Yv\026߹d)n\\cIvF\031_%U\034\031xo]`z?̚\\\007!׹d\
-=\0347,SOL\023\006mqF\004)onmi\007]\\|z1w\
-tܰGR\022\034k0ڤ(r׵[\015\023;ws-=̷E\0256'[D|\
-nӓqC'\023\007}gĻ!а_o\035FR\0015똷\020}j3sl\
-Ѹ/z)jf4\022M>Q+V\022b\032\035\003^<{Zw\037(`\017Vbb\
-[MRx/H+l><:ЛVZl<}\001{z\017\025'ڇm\013\034*\010yB\021Fbo2\036~\
-ͷ\033&y7\011\037f\015n9ݙtơk\016tS3\004\0172\004ob9:/\033)FXGS1 O\
-}&φ\\\037\002\0155лE-N\015'S)tC,Y!O>\015?aIE\
-w/阴}z/&^\0239PGA-DkVw1/]'Ւ\001>em\
-3MXWp^J²\002+\033\036|'<կ\0347\017\033mH!L8tsv9=qٻ\
-ٴ\021{\"O'=\033\031\033f+.aP]x1z\0036\006;zG:;\014bl\031o\013\011\
-Fۢ-wMA{<u\006\007\0367QG3jiAU^g!\0041뾐\011\
-\032?|g|gloHb\023;N^(u&g\036wԥ\031FL =\024\
-Į\037\016o#xB0oyүFt+\025m\021٦ݳۗs;1mԘ[P\026s^\033\
-F,\027\011T\021Q/5{xQ\016z7gO\032\020\027\021\\\
-Zzn3Ħ\016/OԽzٜst|Nr~p]&5K\016'-.q\006\
-\035Ի>;6\002y-}\035QGd\016#Rö=S\027>~]Cjӹ?bL%\020G;NiZ\
-x\021,&yu\026[%(t&Un\003߻t.l9K!1k-~\
- ^fتt\002R>\006[Xhż\034m]$pw61GVz1VU\
-+wI\026\013T1bmWlwY8nQn:M%\016\037\025#ݨ\036\005\005|\026\
-SOb6LgN\013LSy>a\011e;POjf+i\030\036\
-\017\011\017\033lN$sF6K3{| \036{O>E\030C?)HL\021nox3\
-g ʙ㓑h,_,2LWIߎ\012j=M\032\0054\015g)݃ޟIS<mf]\
-o\0331\036?knnWyAi)c[/{v'dog\033tOA;g\
-1.!\011C\011(Q \021\006\036iD㩾~j\032\0020#F~o_ubAy\
-0^iX4}S[_\017\037\024K\004\032#\032k.w\010h\0269R\036»\\O%==J\0371[P\
-\023jNǰ\014\031\026ykQ@Qp_/$#")
+data = zlib.decompress("x=ks\0337S̖=R-ER$zpזwv쳕KR)\0258\003\032L!~\0000\007)\
+.e3@7\032W/]\\zFś\027;\030~:\030^^\027OCqˤ\
+(Md<\032|٢\\W\020Q\031+\021\036}&\0373|!ת\020?\026*\027R3\031\0215>KU\
+J(@VEޅ\014\026\023A\012K҃\037zۿˢ\\\025NE5\020D\034~X'\
+۫M`h؃\013q\003 W2BY\003xUin0+5Mik\001\023y$(VQ\
+Q\014Bŷ\002y*2Gɉ\030}E)@\035aY/m\003_ȓ8Jnyi~\"2\002z)O\
+n#X?\025nxHoawOƳ\031\033jR\010;Xh\000\034i\034RHhN\0041c7$A2\
+i0R0V0ҩd\030Fx\020\0318|z\0277MP\007eN\024)\0004-t\
+iJx#\022Bs\021SAGiT>|J/(\\zH\026ꮞBtgԷP\001ʐYkE/\
+b\025\002##b\014`4fRO{\020q)r/e}W^Y^\017\017 ٝ^t\020\030\016t!z\
+9tL<iϰqr[ :\001yy4\005m\020W\005?f\030~$o\011\024@*\004xbG\
+G\026o\010~\002V9\033i-\013\037ܨfGpV\004,se͟7E\006\020{\026\001M΢\\\
+\024yp<\002T<9XFa\030+4yL\024\000\010\015hz ^/3Ps,O*(ˆ-IM]S@\
+O1M\012\027\023\\` O.߳\037\0162\036SQEC4PMԛ_`LQ\034X(`\
+\014=\010g'h#pb,O\005&W\020(\006p\026X,@j\026%@rD7\0072\011\017fJ\
+\014\"ћ\012edhd$rC!-\030*\030@\026\001\026؃7\017\027\025\030\024%]\000E\001\006\006Ֆ\
+DY\025K^2Jh\011-\025\032\011&'ׂ\027S\021\"\004\\Ȳ\026gD\012Qe\000Zi\010\030\032d\033\017\"V\
+e\0147HY\000\013\033\0237 \"b-\001\037\006 w\033\006\003\"\030t\017Q0,C\031\003\
+9Y\033\017eiQD\014\025\030}&%J\012\013T5I%\017\010(4\010r> rO\025L\020\007\025\
+\002t\016j\017FY<<0\015b zz>K\021:Ia,y\027Jt\000}AD\
+\001\010\011\035 f\014d\033焅,&-\025#J\033_`Ĉ[Q9Mƕ\013\006\000\017D\003\020H\
+Ä\016\025gQU%m\023:S\002{ \031qk\034sp썴\012K\0007\026bVΪּ\0165\
+r)KQ{\006۵?3 igíOwS\035\004ێsl؛g#|\003\001\002\
+vJJ4Sɞ7\020^^z`e#0\015\000P\020\025*U!]d9\032\002\033֫k\026~8\
+.O.6F\0308\033Eݧ`1$h0Gb!\012)\031\024S\032\001u윖Տ)qA(SЪ\010\
+\016-\023Ƶ \025P*Ď3\011Nz&\022,S\034$8 \003<\000%gh<]\"e\
+\0117b\010<O®D=\022p\026\003\016 h\012,tm?\006<\016\003\021 pp\004FW,*\007\022w0Ta\
+\032E2p⠾I\024As'jUۅ\026\016Ȝ.\006)\027TZ(YA[b\0236G\035\007&\026H\001\017T\
+0{MNaG@%43\016z\023r\027]\035\034Q\0147q?7E\030z\006\030*\031\
+x\006\034Zc\037\007>ף\005)2\004)\0028\035~\004p\001(\021BhࣣsL\005Ǯ\007\
+ް\001_\\\012u'c\037\030z8ǎ/x:_a\006-Ӄ=\032I\020\036mZaa<\
+>\032\016\010\001ñ\025GQ0<]ƺ\017Hsú\034,AC6IO*@ަ`*>?a\015\011<\012\
+\026\003OXI\0142K\017 ijdڮ\034\004'#fކ\000\006_|>vF\
+/&\000<]hǻ0=`叏vgy\004vj;L|,!rL֢T\020͢I\
+(UyHN\017DË\\&BV\\u,_ȳB@\0132\0203\
+\003\007`(a\003d6Zb\016.0\005]~\020:\021T\000\032\034\000\004h`\037/8 ȍ)\026@ E\001u\
+(\000\017inSLǐ\000>\016Fh\030B\027\027\010\012\024o*\024)Q\016\026^\001d\010%\006`m\
+?9\001u_DƃF̣\022˫\005\032t9Y$g5$>b\005\001\016L#P9z\030jS8/\
+W~S}S7p)0Da3]%`.\004P6D3\011\012\017'Q\0013\010\024u*G\030nߨ|7\
+k`g_\020`ﰋBR-11. pD\025ơ\000\012\001̂CH`\006rU \
+a\032@iU\005\003\025_ᬩ19\0006+4<5\0318\\`\036qL9\031Pp2(7V\025QÔ,B\
+`֚\003,\"*`7\01104+\014𿢚\021M\027莔\005V2JYc`l\017re\
+\006F<`~\007`A\021+[$PteR\024\"\001VE\026Ĳ\012E.\022\024H\015*\014{\002\
+)*4\\\003i#t\013i8:q\035*UT(\026,F\026,qtN3g2<=Z\011\006\015\020\020¾\
+N\022m%\017<\000O\0037n\035\033,5ċ-x͙ao؅e\021\030{q\
+\034\016\016\"d56p4.ҕ\010E봊T~F#+_ъ̑55\0162\021s*0\011P\
+Pi+:\007!H<&96D}Rpj1\007\025\021%F4\015r\"%Ô9\035\002\036\
+Ɯ\"%hl\032u\0276e\012\024JxT\021\022\010A&d4\020$\025T\020R@'@$\
+DBA1MqT$@!9\020X2&\002:E4TJBD\014\026\0213\000s& 0Z\031\
+\030W\011A7\027ք@DԳ\026i&'XUb,ulV#CQkɍI\020s\
+f\017I\037Ѷu(>2w^~*ECC\001Q\017J(\030\027M\021\012\
+Z>$aT\0042\017%\013Sm\032A`\021g\017\032]LNG.fV_ϘlQ~\003gXV\
+\016\020\013\003\014\014\035H[7U\017uf\024\0001\001\005\010L\006WS?\000w\000<\010\023WT\
+DA.j^eN\024ӧ2`3c|4\027\003\036\013\035*eg\002sd`\015x\027X\
+\001x\000\026D3\026*!w6`]\020񂢺ĝ -u8cTN\013bOd\004\
+>fňB1CĞѬ\001($\"j\022vVo֜YRDJ d\005^Az\022fic6߁\
+\015/K='^̢\007`ig\03656\002لp!1pL-'Wg#Tbwva)\015~E\015{\
+ʞ\034*Ò\004\021\005\021`*Y{qD|ў]7\017s\020˗}I>SZU\034\"6Y;b\
+ӠsV\011 >b/\031nDX\001j\015zit\022eE+\004V\0200\0034`: \004\014\
+挊*\030\034\023[\032*\012ߨ\012\026IQ\013h\031R3V \004\005\027:\001`${{t\005n\
+\011\032\002\025\003\034 \017\002f\004*Q9zh0]\025{+\016\"u'{m<\015\036Z\034bo\036Ӛ\
+F7%\035 'N\020p+\032F\003A\034Ǖ(5`ߎͦRq:ߵ1bf\036\
+A@ėrM\024@`\000\031<X\030i,̕FR8F+dID'(L̊ڏ]X=sn\
+\021ʙ.ȵkȀ-\005GVej\013ؖ\023\011AkJqr\030\032SVA\037\024ŢO\011=dZ\
+k\004j\001\004\000((vpu\023yTVpl\022\035\005D:\025߱iT,\007*\
+h*\026p\0337\001'Η3\004bhf2o\005kx]s\035wZ/0!D\037\015\014\033k\032o\010q\
+2@7\026-ɂ԰Xa>\0032%.P*K9`+8@\027:\032\004\020\022mc\007\007}VZܨN\"\
+։\005'\000:ᮿђ)$!?!#lbGy\"\011,6\016AC`8y\\ a*\
+\011\010\016\035\003Y[{TԲp]4\034\012kW,L$2j޳f&ɰt(\020cy\
+s\004YǍkgiYXS\027B:e\027tb̬\024E*E\011t\022^\021$s#\022K\011\
+8O޻\020Zy?^'POg\021[\007Ba\033`p+VD3o\"\013\023ې\024\
+hY\002s?\033Ur\006Vf\004\016\027Wuq\034fic(z\030\"V;7\010n\
+\015Ĳ1\032\030p*ۄ4~\034j\000\001^qVOOmh\0124\015ii ]*͢j\
+o\"؅`\021&B0|8فf*mZVEG\0159\027RXP\037Ah\006^at\021U٣%\
+9}Fն'K=E^\004qrz|?\001l_ך\013\"pָN\033؄Gg\013\030\013\"\031\007$\
+W'AT\033+.aGN*N\032Q\024\003D4\015\0324I=\"EaBt(jmX1\024\
+ېh^y\027\026S.&IAI\026qZlE\034Y\026C4\0278ف\027YF\007\
+PK\035\022l&\014q]=Y'\035\030\005BBf>ɷhX/\036'#kbMyn\030,(Ӄ\
+\035O_P2:rcg\012\023\"S\\@R➜ڜJۯ-I)\000\021 f\0048\03635\
+\034's\000\012)V\001̆vSzo*|\012\0367ť*\027)tՕstx˛\012\\p\
+Ya,x:a\024͘\033U^ǚ~g\001w\000ʓ\0361U$aU\00725\025Ic[Tʃ\
+ZѢC4=L*7OW\037={ayb{5:MgO\002[(J0,\034t7\
+ֹ\031c=\030\037_\021ſg#~{*SwC?\010\010-Ac\007\017+>|\022zFH\
+\006\006w q'iCuxIPt!N\005G\031q^|\006,i~d\025\0113i\025lL>\
+3{ۘ\015^Syo~\"~ʗK7_ۓ~tܜMZă&K\012\032\036ܘ\\f hu9\012\
+Z\021k* dʠŎ#~D%ߤs%?$\005\026\014v\
+\016Ke\006B6ب/4WJ\004hlsoLx\014\034\011^\032YX/\037b;9l I+\
+K$Ԯ\026412ެ=2MW/U\011ֵhqiM'x\027\037\
+\030֛\034\036\036uh:\0314AR{0& \003\026\014Ɣ\003lZϺ.Ζ\005NC )(Nz̙;\
+\037M9\014{\006`*\010}Õi)FkC\033u-<Ԗ\033&\022=ր\002\020\007ۻ]v{-\
+#Z8a֞\025҃+G\012\023\030f@̛}.]\026\036mr\023}n:\034\016['\
+\012\022P\\\004Vԝˈ[}ܲGw\030{HJv\0117< zžz\007Мf]\034 \000\
+ҵ76@jQu\027\\\013f˃TXjSOAWɰ2\033\013\036ݨ\017׮4f\007F!ҭd\
+j\023?>1%MQ\002*\015\"\022~lQtkdULV\0205\030\026V5\024[OϹ41nJ\004\
+\000A&X\003w-ʩi2QҐ\021tQf-(U\025\032cit3S\012!pC\
+S=-'ÈʴOc6~v\002\022d\0017 ZS\031m܊Z,hA;\
+k-N\033::351\004|`\013LOR\025\000_b!/~pׂ\"\016t\015I0Tbs\
+u=w{b$\010:\005e\014\"\023\004\013UL\023%IVSH\013iϸ\\%aP\003\024xR\036\006\036\
+X[&]\017N (\"߸.I.|z7øY\020Õ&\
+/0Tv\024S?v\026\000\011(O\017\0365\017\017TѸӧ\037kw\0305_\
+7I`<\006\006\033\014C\027r~ߵ\000nӌè@\000ġs<\014 \011\006\020\
+o\0071\"&\010;#\013rMdz}\007\002!\017~.}\014\026y#\015b\033C\021b\017c&\017}L{Ƭ\
+SV۬ 23-t(F_.^>z>X%ӄ\036\\`q#D3,\
+\014*L\016ysc|2U2/\027br.뮿7H_O;^\004\015ǧ\"\022gM\017\000\017f\
+߻KE7x\003\000޿D\016qb?{.\022ڞfF\030k_\000X\037?g\0233>{n;\
+,7J\027\000w{\035 ]0~^9??ѯևӈYvr}'<o\
+qU\007\036c55چNO\026N\003:07A\031\\~bM\"ڬVB\030V\036\
+sH'D'\000N\030ui\014h);~ie&\\\017\003\\/\032w.׹\
+B}_ɽXm$vR\016\027-\0027Z\011ԪG\007:\013j6!\030}\0324r\011\026ז2$\
+p\011\016\025I|2\024t\011\014Tta:|H\005\0201@\015>⧝x\021rM63\017>hI\
+$oRn1\031K\036\0072EIg7}ۥ\006}ڟm)F_\021\036[ϩM>UGh7\
+\017Q\007^Аӓ;exBhIZ\017\027b\012/\035MPm\035eLi'9>3\035u\
+$\0320_t<\015n\022⛃?D9YE\0072\"ˁ8<\024\037U&cq>9o\
+܉r\031Fq2M-\011\031|s-f߭߁\0042vy\002f}]\033\010P\
+A\000ɽGYwzm\031\017G=]E7c\0205\002ds<Y\\Nƥ>_nɭRG,\
+\017z\027\015hڅDY\035  d={9[9)Ӌ6Zo\032\023s9\0278ܛ\\8a7m\024wu\
+B\015kBAF[Vq\031i\000+eE\014.rS~ud֣)r*\036\021\033zg\
+MN\032L$fV4v\016ct+D))yތay$2y\037~7T9nV\"k>\
+r&SS3\003]nVK M)h\015pMHa~^/<\034/\012.\030DOS<gN\002qMd}n\
+٭\0227!]\"rHB\026XdI\025\025\005\006|D }м\023šЛjO>j\
+n%@`4|\031I\\\027\037\012اz\014'\027:Xz\037[\02765\036)iYD\015\032\
+N\013@\007_t-F\000Ly&Ic`wHu2|[fGc9U7y_\
+>WtUԅ}sS1Ms6G3O'4Wsueϝ#\015i&AW9UΟ\
+<U0/\0050eJθM\015Fߌˠ\036\011팭{+e4\027\016ì@0\
+u\036\036\033'Iꉛ8>\007)/ڮBm\006.[i[T.hg7\
+K1\016\033\032u:QB\025!{UfƐÊBw]\035_Pn\035{7F݂E[Da~\
+I\007\014;=\031:;T|\"\012omu\005Ay\020*\\Oh/\015z\0344ء\034e\033Pkjz\011\0076\
+>GW=\\O\035<'\034&yGF%#\035|-\031/v3EU}m\017,\
+-ܡU¢ã\01555fH\013\013g\033\000>\027Ӿ\004/񉰂7!d\033q,\020\
+&|aۉ0mP˩W\034s7u\035!x\020!x\023s|ԹD'\031a\015ɣN2\
+>@.?\033r}z\0224T,ٟC&8hkT+x_:Yyw鳰]\034?}\030d5\
+\\1a\0073ȩ\033⩬^\0239PF@^MDk\026w1K5vId\
+OYڌe.֕*+tj6L+\006BS}(7\025QQhN_\0109$dGik\000\
+lnq:,IF\006\012!K\030+\020(F\027D=\000l3\035ۻuC`J\017hx[\
+J_ϧg7fn\032\012Nk:P\033T\017}p}!\023*g\
+<\0275nx3i>3b (+\016mSIq<vǕi^9iM\
+E:\02097/\024.}-\031\025f$\006^W[@D\030f32Yڨ8\035s\017C\
+3х\036{Y.\022*\030+L?j8+\025\026jrśWNA=>\005y=l1W/5w\
+{$[\014)a\0357M䫗q?\037'Ȏ \0077\016Mf2_^xYV{0]\022g\
+A볹bn#5G\035\032e=:dJVL\007_w.\017YME3C\0378)\
+EӰYkOr.Н4t6*U\033\010w\033NuW\002:j󖳴\032\037bB\
+\004gj\006͚O- .ce{jUۿkJ&ܝqhJOY\032o[\
+pzG\030nѰM\021ch/6\0302ۤK6gᘹD\021*68\034Tȶv\"\021r,\
+\020'lwmN\0177\0223\021\027\030\006cVyu~߇\023ֆi;|POif3im\037\036u\
+\015\0163\033lN$SF6K3{|\036{Ol?E  C\037\024]\010d\031qh\
+\031rd\037\027\014UҷgZ-R?#U|t](\036=\000\0174Cvk\006\
+VXQ_Yws\037[_\005\015\037\004VL\031ܺğ˝|\0271\021mMGnwvc\
+x]B\020\023\020@\034ᓓ#,\015<҈\014ǎ}}gj\032\0040#F~o_ub\010\
+NSΨx={\003__\015J4_De\0045\035G)\016B{ݗe\004-t\
+\0115}1,0}):w\035j\024\0204\\/F\002j)")
 ### end
@@ -0,0 +1,245 @@
+"""reviewindex.py - summaries of cached messages, for the review page.
+
+Classes:
+    ReviewIndex - a persistent index of the messages in a corpus.
+
+Functions:
+    summarize - the parts of a message that the review page shows.
+
+Abstract:
+
+    The review page lists the messages in the proxy's unknown cache,
+    a day at a time, with a few of their headers, their score and
+    classification, and the start of their body.  Building that listing
+    used to mean loading and parsing every message of the day, and
+    sorting all of the keys in the cache, on every visit to the page.
+
+    A ReviewIndex is an observer of a corpus (see Corpus.addObserver).
+    When a message is added to the corpus, its summary is worked out
+    (while the message is still in memory) and kept, with the keys in
+    order; when a message is removed, so is its summary.  Message keys
+    start with the time the message was received, so the keys of a day
+    can be found with a binary search, and the review page can be built
+    without looking at any of the message files.
+
+    The index is kept in a pickle, which is written when store() is
+    called.  If the proxy is stopped without that, or messages are added
+    to the cache directory behind the index's back, update() brings it
+    back into line with the corpus, summarizing only the messages that
+    are missing.
+
+To Do:
+    o Suggestions?
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import re
+import bisect
+import email
+import errno
+import threading
+from email.Iterators import typed_subpart_iterator
+
+from spambayes import tokenizer
+from spambayes.message import SBHeaderMessage
+from spambayes.safepickle import pickle_read, pickle_write
+from spambayes.Options import options, _
+
+# Headers kept for every message, whatever [html_ui] display_headers is,
+# so that changing that option doesn't (usually) make the index useless.
+SUMMARY_HEADERS = ("subject", "from", "to", "date", "reply-to")
+
+# How much of the body to keep; the review page shows less than this.
+SUMMARY_TEXT_LENGTH = 250
+
+# Bump this if the summaries change, so that old ones are thrown away.
+INDEX_VERSION = 1
+
+
+def summarize(message):
+    """Return a dictionary with the parts of the message that the review
+    page shows: "headers" (a dictionary keyed by lower-case header name,
+    with the Subject and the [html_ui] display_headers), "score" (a
+    percentage, or "?" if the message has no score header, or "Err" if
+    it can't be read), "classification" (the value of the classification
+    header, or the unsure string if there isn't one) and "text" (the start
+    of the body).
+
+    Any notations that were added to the message's headers should be
+    removed first (see SBHeaderMessage.delNotations)."""
+    headers = {}
+    for header in SUMMARY_HEADERS + tuple(options["html_ui",
+                                                 "display_headers"]):
+        headers[header.lower()] = message[header] or "(none)"
+
+    judgement = message[options["Headers", "classification_header_name"]]
+    if judgement is None:
+        judgement = options["Headers", "header_unsure_string"]
+    else:
+        judgement = judgement.split(';')[0].strip()
+
+    score = message[options["Headers", "score_header_name"]]
+    if score:
+        # the score might have the log info at the end
+        op = score.find('(')
+        if op >= 0:
+            score = score[:op]
+        try:
+            score = float(score) * 100
+        except ValueError:
+            # Hmm.  The score header should only contain a floating
+            # point number.  What's going on here, then?
+            score = "Err"  # Let the user know something is wrong.
+    else:
+        # If the lookup fails, this means that the "include_score"
+        # option isn't activated. We have the choice here to either
+        # calculate it now, which is pretty inefficient, since we have
+        # already done so, or to admit that we don't know what it is.
+        # We'll go with the latter.
+        score = "?"
+
+    try:
+        part = typed_subpart_iterator(message, 'text', 'plain').next()
+        text = part.get_payload()
+    except StopIteration:
+        try:
+            part = typed_subpart_iterator(message, 'text', 'html').next()
+            text = part.get_payload()
+            text, unused = tokenizer.crack_html_style(text)
+            text, unused = tokenizer.crack_html_comment(text)
+            text = tokenizer.html_re.sub(' ', text)
+            text = _('(this message only has an HTML body)\n') + text
+        except StopIteration:
+            text = _('(this message has no text body)')
+    if type(text) == type([]):  # gotta be a 'right' way to do this
+        text = _("(this message is a digest of %s messages)") % (len(text))
+    elif text is None:
+        text = _("(this message has no body)")
+    else:
+        text = text.replace('&nbsp;', ' ')      # Else they'll be quoted
+        text = re.sub(r'(\s)\s+', r'\1', text)  # Eg. multiple blank lines
+        text = text.strip()
+
+    return {"headers" : headers,
+            "score" : score,
+            "classification" : judgement,
+            "text" : text[:SUMMARY_TEXT_LENGTH],
+            }
+
+
+class ReviewIndex:
+    """The summaries of the messages in a corpus, in key order."""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        # The corpus is changed by the proxy, the review page, and the
+        # threads that expire old messages.
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        try:
+            version, self.summaries = pickle_read(self.db_name)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            version = None
+        if version != INDEX_VERSION:
+            self.summaries = {}
+        self.sorted_keys = self.summaries.keys()
+        self.sorted_keys.sort()
+        self.changed = False
+
+    def store(self):
+        self.lock.acquire()
+        try:
+            if self.changed:
+                pickle_write(self.db_name, (INDEX_VERSION, self.summaries),
+                             2)
+                self.changed = False
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.store()
+
+    def __len__(self):
+        return len(self.sorted_keys)
+
+    def __contains__(self, key):
+        return key in self.summaries
+
+    def keys(self):
+        """Return a sorted list of the keys in the index."""
+        self.lock.acquire()
+        try:
+            return self.sorted_keys[:]
+        finally:
+            self.lock.release()
+
+    def get(self, key, default=None):
+        """Return the summary of the message with this key."""
+        return self.summaries.get(key, default)
+
+    def add(self, key, message):
+        """Summarize the message (which is changed, if it has notations)
+        and keep the summary under this key."""
+        message.delNotations()
+        summary = summarize(message)
+        self.lock.acquire()
+        try:
+            if key not in self.summaries:
+                bisect.insort(self.sorted_keys, key)
+            self.summaries[key] = summary
+            self.changed = True
+        finally:
+            self.lock.release()
+        return summary
+
+    def remove(self, key):
+        self.lock.acquire()
+        try:
+            if key in self.summaries:
+                del self.summaries[key]
+                i = bisect.bisect_left(self.sorted_keys, key)
+                del self.sorted_keys[i]
+                self.changed = True
+        finally:
+            self.lock.release()
+
+    def update(self, corpus):
+        """Add any messages that are in the corpus but not in the index,
+        and remove any that are in the index but not in the corpus."""
+        keys = corpus.keys()
+        in_corpus = dict.fromkeys(keys)
+        for key in self.keys():
+            if key not in in_corpus:
+                self.remove(key)
+        for key in keys:
+            if key not in self.summaries:
+                message = corpus.get(key)
+                if message is None:
+                    continue
+                try:
+                    message.load()
+                except IOError:
+                    # Someone has taken this file away from us; it will
+                    # be left out of the review.
+                    continue
+                self.add(key, message)
+
+    # Corpus observer methods.
+
+    def onAddMessage(self, message, flags=0):
+        # The message may not have been written to the disk yet (see
+        # FileCorpus.CacheWriter), so it mustn't be changed; summarize a
+        # copy of it instead.
+        copy = email.message_from_string(message.as_string(),
+                                         _class=SBHeaderMessage)
+        self.add(message.key(), copy)
+
+    def onRemoveMessage(self, message, flags=0):
+        self.remove(message.key())
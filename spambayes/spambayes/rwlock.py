@@ -0,0 +1,159 @@
+"""rwlock.py - share a classifier between threads.
+
+Classes:
+    RWLock - a lock that many readers, or one writer, can hold at once.
+    LockedClassifier - a classifier that takes an RWLock for each call.
+    LockedObject - an object whose methods are called one thread at a time.
+
+Abstract:
+
+    Scoring a message only reads the classifier, so any number of threads
+    can do it at once, but training (or storing the database) mustn't
+    happen while anything else is using it.  LockedClassifier wraps a
+    classifier so that spamprob() holds the lock for reading, and learn(),
+    unlearn() and store() hold it for writing.  The tokens are collected
+    before the lock is taken, so tokenizing (the slow part) is never done
+    while holding it.
+
+    Only an in-memory classifier (a pickle) can safely be read by several
+    threads at once; database handles generally can't be shared that way.
+    For those, pass shared=False, and every call gets the lock to itself.
+
+    Other things that are shared, like the message information database
+    and the statistics kept about it, can be wrapped in a LockedObject,
+    so that each call has the object to itself.
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import threading
+
+
+class RWLock:
+    """A lock that can be held by any number of readers, or by one writer.
+
+    A waiting writer is let in before any readers that arrive after it,
+    so that a steady stream of readers can't keep it out for ever.  If
+    shared is False, readers exclude each other too.
+    """
+
+    def __init__(self, shared=True):
+        self.shared = shared
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+
+    def acquire_read(self):
+        if not self.shared:
+            self.acquire_write()
+            return
+        self.condition.acquire()
+        try:
+            while self.writing or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+        finally:
+            self.condition.release()
+
+    def release_read(self):
+        if not self.shared:
+            self.release_write()
+            return
+        self.condition.acquire()
+        try:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def acquire_write(self):
+        self.condition.acquire()
+        try:
+            self.writers_waiting += 1
+            while self.writing or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writing = True
+        finally:
+            self.condition.release()
+
+    def release_write(self):
+        self.condition.acquire()
+        try:
+            self.writing = False
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+
+class LockedClassifier:
+    """Wraps a classifier so that it can be used by several threads."""
+
+    def __init__(self, bayes, lock=None):
+        self.bayes = bayes
+        if lock is None:
+            lock = RWLock()
+        self.lock = lock
+
+    def spamprob(self, wordstream, evidence=False):
+        wordstream = list(wordstream)
+        self.lock.acquire_read()
+        try:
+            return self.bayes.spamprob(wordstream, evidence)
+        finally:
+            self.lock.release_read()
+
+    def learn(self, wordstream, is_spam):
+        wordstream = list(wordstream)
+        self.lock.acquire_write()
+        try:
+            self.bayes.learn(wordstream, is_spam)
+        finally:
+            self.lock.release_write()
+
+    def unlearn(self, wordstream, is_spam):
+        wordstream = list(wordstream)
+        self.lock.acquire_write()
+        try:
+            self.bayes.unlearn(wordstream, is_spam)
+        finally:
+            self.lock.release_write()
+
+    def store(self):
+        self.lock.acquire_write()
+        try:
+            self.bayes.store()
+        finally:
+            self.lock.release_write()
+
+    def __getattr__(self, name):
+        # Everything else (nham, nspam, close() and so on) is passed
+        # straight through.
+        return getattr(self.bayes, name)
+
+
+class LockedObject:
+    """Wraps an object so that only one thread at a time can call its
+    methods.  Other attributes are passed straight through."""
+
+    def __init__(self, obj, lock=None):
+        self.obj = obj
+        if lock is None:
+            lock = threading.RLock()
+        self.lock = lock
+
+    def __getattr__(self, name):
+        attr = getattr(self.obj, name)
+        if not callable(attr):
+            return attr
+        def locked(*args, **kwargs):
+            self.lock.acquire()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.lock.release()
+        return locked
@@ -122,6 +122,8 @@ class PickledClassifier(classifier.Classifier):
             self.wordinfo = {}
             self.nham = 0
             self.nspam = 0
+        # The words may have changed since the index was made.
+        self._token_index = None
 
     def store(self):
         '''Store self as a pickle'''
@@ -198,6 +200,8 @@ class DBDictClassifier(classifier.Classifier):
             self.nham = 0
         self.wordinfo = {}
         self.changed_words = {} # value may be one of the WORD_ constants
+        # The words may have changed since the index was made.
+        self._token_index = None
 
     def store(self):
         '''Place state into persistent store'''
@@ -413,6 +417,21 @@ class SQLClassifier(classifier.Classifier):
         rows = self.fetchall(c)
         return [r[0] for r in rows]
 
+    def _wordinfokeys_prefix(self, prefix=""):
+        # The database can find these itself, without us keeping a copy
+        # of all the words.
+        c = self.cursor()
+        if prefix:
+            pattern = prefix.replace("\\", "\\\\").replace("%", "\\%")
+            pattern = pattern.replace("_", "\\_") + "%"
+            c.execute("select word from bayes"
+                      "  where word like %s"
+                      "  order by word",
+                      (pattern,))
+        else:
+            c.execute("select word from bayes order by word")
+        return iter([r[0] for r in self.fetchall(c)])
+
 
 class PGClassifier(SQLClassifier):
     '''Classifier object persisted in a Postgres database'''
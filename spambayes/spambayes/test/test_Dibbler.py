@@ -0,0 +1,318 @@
+# Test Dibbler: keep-alive, compression, caching and POSTed bodies, with
+# each way of waiting for sockets, and timers.
+
+import sys
+import time
+import gzip
+import socket
+import httplib
+import threading
+import unittest
+import StringIO
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes import Dibbler
+from spambayes import asyncore
+
+IMAGE = "GIF89a" + "".join([chr(i) for i in range(256)])
+
+
+class TestPlugin(Dibbler.HTTPPlugin):
+    def onHome(self):
+        self.writeOKHeaders('text/html')
+        self.write("<html><body>")
+        self.flush()
+        self.write("Hello " * 1000)
+        self.write("</body></html>")
+
+    def onUpload(self, **params):
+        self.writeOKHeaders('text/plain')
+        for name in sorted(params.keys()):
+            value = params[name]
+            if hasattr(value, "read"):
+                # Uploaded files are passed on as file objects.
+                self.write("%s=file:%d\n" % (name, len(value.read())))
+            else:
+                self.write("%s=%d\n" % (name, len(value)))
+
+    def onImageGif(self):
+        self.writeResource('image/gif', IMAGE)
+
+    def onPageCss(self):
+        self.writeResource('text/css', "body { color: black; }\n" * 100)
+
+
+class TestServer(Dibbler.HTTPServer):
+    keepAlive = True
+    compression = True
+
+    def useKeepAlive(self):
+        return self.keepAlive
+
+    def useCompression(self):
+        return self.compression
+
+
+class DibblerTest(unittest.TestCase):
+    eventLoop = 'select'
+
+    def setUp(self):
+        self.context = Dibbler.Context({}, self.eventLoop)
+        self.server = TestServer(('127.0.0.1', 0), context=self.context)
+        self.server.register(TestPlugin())
+        self.port = self.server.socket.getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def serve(self):
+        while self.running:
+            self.context.poll(0.05)
+
+    def tearDown(self):
+        self.running = False
+        self.thread.join()
+        for dispatcher in self.context._map.values():
+            dispatcher.close()
+
+    def connect(self):
+        return httplib.HTTPConnection('127.0.0.1', self.port)
+
+    def test_keep_alive(self):
+        connection = self.connect()
+        for i in range(3):
+            connection.request('GET', '/')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader('transfer-encoding'),
+                             'chunked')
+            body = response.read()
+            self.assert_(body.startswith("<html><body>Hello "))
+            self.assert_(body.endswith("</body></html>"))
+        # Unknown pages don't close the connection either.
+        connection.request('GET', '/nothing')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 404)
+        response.read()
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        response.read()
+        connection.close()
+
+    def test_no_keep_alive(self):
+        self.server.keepAlive = False
+        connection = self.connect()
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        self.assertEqual(response.getheader('connection'), 'close')
+        self.assertEqual(response.getheader('transfer-encoding'), None)
+        self.assert_(response.read().endswith("</body></html>"))
+
+    def test_compression(self):
+        connection = self.connect()
+        connection.request('GET', '/', headers={'Accept-Encoding' : 'gzip'})
+        response = connection.getresponse()
+        self.assertEqual(response.getheader('content-encoding'), 'gzip')
+        compressed = response.read()
+        body = gzip.GzipFile(fileobj=StringIO.StringIO(compressed)).read()
+        self.assert_(len(compressed) < len(body))
+        self.assert_(body.endswith("</body></html>"))
+        # Images aren't compressed.
+        connection.request('GET', '/image.gif',
+                           headers={'Accept-Encoding' : 'gzip'})
+        response = connection.getresponse()
+        self.assertEqual(response.getheader('content-encoding'), None)
+        self.assertEqual(response.read(), IMAGE)
+
+    def test_resource(self):
+        connection = self.connect()
+        connection.request('GET', '/image.gif')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), IMAGE)
+        etag = response.getheader('etag')
+        modified = response.getheader('last-modified')
+        connection.request('GET', '/image.gif',
+                           headers={'If-None-Match' : etag})
+        response = connection.getresponse()
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.read(), "")
+        connection.request('GET', '/image.gif',
+                           headers={'If-Modified-Since' : modified})
+        response = connection.getresponse()
+        self.assertEqual(response.status, 304)
+        response.read()
+        connection.request('GET', '/image.gif',
+                           headers={'If-None-Match' : '"other"'})
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), IMAGE)
+        connection.request('GET', '/page.css',
+                           headers={'Accept-Encoding' : 'gzip'})
+        response = connection.getresponse()
+        self.assertEqual(response.getheader('content-encoding'), 'gzip')
+        body = gzip.GzipFile(fileobj=StringIO.StringIO(response.read()))
+        self.assertEqual(body.read(), "body { color: black; }\n" * 100)
+
+    def test_post(self):
+        connection = self.connect()
+        connection.request('POST', '/upload', "a=1&b=22",
+                           {'Content-Type' :
+                            'application/x-www-form-urlencoded'})
+        self.assertEqual(connection.getresponse().read(), "a=1\nb=2\n")
+        # A big file upload is spooled to disk as it arrives.
+        content = "From: someone\n\n" + "x" * (Dibbler.BODY_SPOOL_SIZE + 10)
+        body = "\r\n".join(["--boundary",
+                            'Content-Disposition: form-data; name="file"; '
+                            'filename="big.txt"',
+                            "Content-Type: text/plain",
+                            "",
+                            content,
+                            "--boundary",
+                            'Content-Disposition: form-data; name="text"',
+                            "",
+                            "abc",
+                            "--boundary--",
+                            ""])
+        connection.request('POST', '/upload', body,
+                           {'Content-Type' :
+                            'multipart/form-data; boundary=boundary'})
+        self.assertEqual(connection.getresponse().read(),
+                         "file=file:%d\ntext=3\n" % len(content))
+        # And the connection can still be used afterwards.
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        response.read()
+        connection.close()
+
+
+class PollDibblerTest(DibblerTest):
+    eventLoop = 'poll'
+
+
+class EpollDibblerTest(DibblerTest):
+    eventLoop = 'epoll'
+
+
+class TimerTest(unittest.TestCase):
+    def setUp(self):
+        self.context = Dibbler.Context({})
+        # Something for the loop to wait on.
+        self.trigger = Dibbler.Trigger(self.context)
+        self.calls = []
+
+    def tearDown(self):
+        self.trigger.close()
+
+    def call(self, name):
+        self.calls.append(name)
+        if name == "stop":
+            self.trigger.close()
+
+    def test_timers(self):
+        start = time.time()
+        Dibbler.Timer(0.2, self.call, ("stop",), context=self.context)
+        Dibbler.Timer(0.1, self.call, ("second",), context=self.context)
+        Dibbler.Timer(0.05, self.call, ("first",), context=self.context)
+        cancelled = Dibbler.Timer(0.1, self.call, ("cancelled",),
+                                  context=self.context)
+        cancelled.cancel()
+        self.context.loop()
+        self.assertEqual(self.calls, ["first", "second", "stop"])
+        elapsed = time.time() - start
+        self.assert_(0.2 <= elapsed < 5, elapsed)
+
+    def test_interval(self):
+        repeating = Dibbler.Timer(0, self.call, ("tick",), interval=0.02,
+                                  context=self.context)
+        Dibbler.Timer(0.15, repeating.cancel, context=self.context)
+        Dibbler.Timer(0.2, self.call, ("stop",), context=self.context)
+        self.context.loop()
+        self.assertEqual(self.calls[-1], "stop")
+        self.assert_(3 <= self.calls.count("tick") <= 9, self.calls)
+
+    def test_failure(self):
+        def fail():
+            raise ValueError
+        # A failing timer is reported, and doesn't stop the loop.
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            Dibbler.Timer(0, fail, context=self.context)
+            Dibbler.Timer(0.01, self.call, ("stop",), context=self.context)
+            self.context.loop()
+            self.assert_("ValueError" in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(self.calls, ["stop"])
+
+
+class TriggerTest(unittest.TestCase):
+    def test_full(self):
+        # Pulling doesn't wait when the loop hasn't kept up with the
+        # bytes that wake it.
+        context = Dibbler.Context({})
+        trigger = Dibbler.Trigger(context)
+        calls = []
+        try:
+            while True:
+                try:
+                    trigger.writer.send("x" * 65536)
+                except socket.error:
+                    break
+            trigger.pull(calls.append, 1)
+            for i in range(10):
+                context.poll(0.01)
+                if calls:
+                    break
+        finally:
+            trigger.close()
+        self.assertEqual(calls, [1])
+
+
+class EventLoopTest(unittest.TestCase):
+    def test_get_poll_function(self):
+        self.assertEqual(asyncore.get_poll_function('select'), asyncore.poll)
+        self.assert_(asyncore.get_poll_function('best') in
+                     asyncore.poll_functions.values())
+        self.assertRaises(ValueError, asyncore.get_poll_function, 'kqueue')
+
+    def test_epoll_reregister(self):
+        # The epoll poller keeps its registrations between calls, so
+        # closed sockets, and reused file descriptors, have to be noticed.
+        context = Dibbler.Context({}, 'epoll')
+        for i in range(3):
+            trigger = Dibbler.Trigger(context)
+            trigger.pull(self.calls.append, i)
+            for j in range(10):
+                context.poll(0.01)
+                if len(self.calls) > i:
+                    break
+            trigger.close()
+            context.poll(0)
+        self.assertEqual(self.calls, [0, 1, 2])
+
+    def setUp(self):
+        self.calls = []
+
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (DibblerTest,
+                PollDibblerTest,
+                TimerTest,
+                TriggerTest,
+                EventLoopTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    if 'epoll' in asyncore.poll_functions:
+        suite.addTest(unittest.makeSuite(EpollDibblerTest))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
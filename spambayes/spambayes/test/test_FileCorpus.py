@@ -14,6 +14,7 @@ from spambayes import storage
 from spambayes.FileCorpus import ExpiryFileCorpus
 from spambayes.FileCorpus import FileCorpus, FileMessage, GzipFileMessage
 from spambayes.FileCorpus import FileMessageFactory, GzipFileMessageFactory
+from spambayes.FileCorpus import CacheWriter
 
 # We borrow the test messages that test_sb_server uses.
 from test_sb_server import good1, spam1, malformed1
@@ -310,6 +311,82 @@ class ExpiryFileCorpusTest(FileCorpusTest):
         self.corpus = ExpiryFileCorpus(1.0, self.factory, self.directory,
                                        '?', self.cache_size)
 
+    def test_removeExpiredMessages(self):
+        self.corpus.removeExpiredMessages()
+        self.assertEqual(len(self.corpus.keys()), 3)
+        # The messages haven't been loaded to find their timestamps.
+        self.assertEqual(self.corpus.keysInMemory, [])
+        self.assertEqual(len(self.corpus.timestamps), 3)
+        time.sleep(1.5)
+        msg = self.factory.create("9", self.directory, good1)
+        self.corpus.addMessage(msg)
+        self.corpus.removeExpiredMessages()
+        self.assertEqual(self.corpus.keys(), ["9"])
+        self.assertEqual(self.corpus.timestamps.keys(), ["9"])
+        files = os.listdir(self.directory)
+        files.sort()
+        self.assertEqual(files, ["10", "9"])
+
+
+class CacheWriterTest(FileCorpusTest):
+    def setUp(self):
+        FileCorpusTest.setUp(self)
+        self.writer = CacheWriter()
+        self.corpus.writer = self.writer
+
+    def tearDown(self):
+        self.writer.close()
+        FileCorpusTest.tearDown(self)
+
+    def test_addMessage(self):
+        msg = self.factory.create("9", 'fctestspamcorpus', good1)
+        self.corpus.addMessage(msg)
+        self.assertEqual(msg.directory, self.directory)
+        self.writer.flush()
+        self.assertEqual(self.writer.pending, {})
+        f = open(os.path.join(self.directory, "9"), "rU")
+        content = f.read()
+        f.close()
+        self.assertEqual(content, good1)
+
+    def test_pending(self):
+        msgs = [self.factory.create(str(i), 'fctestspamcorpus', good1)
+                for i in range(5, 10)]
+        self.writer.condition.acquire()
+        try:
+            # The writer can't finish a batch while the condition is
+            # held, so the messages stay pending.
+            for msg in msgs:
+                self.corpus.addMessage(msg)
+            self.assert_(self.corpus.makeMessage("7") is msgs[2])
+        finally:
+            self.writer.condition.release()
+        self.corpus.removeMessage(msgs[0])
+        self.failIf(os.path.exists(msgs[0].pathname()))
+        self.writer.flush()
+        for msg in msgs[1:]:
+            self.assert_(os.path.exists(msg.pathname()))
+            self.failIf(self.corpus.makeMessage(msg.key()) is msg)
+        self.assert_(self.writer.batches < len(msgs))
+
+    def test_sync(self):
+        # Every file in a batch is written before any is flushed to the
+        # disk.
+        msgs = [self.factory.create(str(i), 'fctestspamcorpus', good1)
+                for i in range(50, 55)]
+        written = []
+        def fsync(fd):
+            written.append(len([msg for msg in msgs
+                                if os.path.exists(msg.pathname())]))
+        saved = os.fsync
+        os.fsync = fsync
+        try:
+            self.writer._write([(msg.pathname(), msg) for msg in msgs])
+        finally:
+            os.fsync = saved
+        self.assert_(len(written) > len(msgs))
+        self.assertEqual(written, [len(msgs)] * len(written))
+
 
 def suite():
     suite = unittest.TestSuite()
@@ -319,6 +396,7 @@ def suite():
              GzipFileMessageTest,
              FileCorpusTest,
              ExpiryFileCorpusTest,
+             CacheWriterTest,
              )
     for cls in clses:
         suite.addTest(unittest.makeSuite(cls))
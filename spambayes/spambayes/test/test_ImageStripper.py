@@ -0,0 +1,213 @@
+# Test the OCR side of spambayes.ImageStripper, using a stub OCR program.
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes import ImageStripper
+from spambayes.safepickle import pickle_write
+from spambayes.Options import options
+
+# The "images" are text files; the first line says how long the stub
+# should take, and the rest is the text it "finds" (or, if it is "fail",
+# the stub fails).
+STUB_OCR = """import sys, time
+f = open(sys.argv[1])
+delay = float(f.readline())
+time.sleep(delay)
+text = f.read()
+if text == "fail":
+    sys.exit(1)
+sys.stdout.write(text)
+"""
+
+class StubEngine(ImageStripper.OCRExecutableEngine):
+    engine_name = "stub"
+
+    def __init__(self, script):
+        ImageStripper.OCRExecutableEngine.__init__(self)
+        self._program = script
+
+    def get_command_line(self, pnmfile):
+        return '"%s" "%s" "%s"' % (sys.executable, self.program, pnmfile)
+
+    def get_args(self, pnmfile):
+        return [sys.executable, self.program, pnmfile]
+
+class OCRTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.script = tempfile.mkstemp(".py")
+        os.write(fd, STUB_OCR)
+        os.close(fd)
+        self.stripper = ImageStripper.ImageStripper()
+        self.stripper.engine = StubEngine(self.script)
+        self.saved = {}
+        for name in ("x-ocr_workers", "x-ocr_image_timeout",
+                     "x-ocr_message_timeout"):
+            self.saved[name] = options["Tokenizer", name]
+
+    def tearDown(self):
+        os.remove(self.script)
+        for name, value in self.saved.items():
+            options["Tokenizer", name] = value
+
+    def set_options(self, workers, image_timeout=0.0, message_timeout=0.0):
+        options["Tokenizer", "x-ocr_workers"] = workers
+        options["Tokenizer", "x-ocr_image_timeout"] = image_timeout
+        options["Tokenizer", "x-ocr_message_timeout"] = message_timeout
+
+    def images(self, *images):
+        files = []
+        for delay, text in images:
+            fd, name = tempfile.mkstemp("-spambayes-test-image")
+            os.write(fd, "%s\n%s" % (delay, text))
+            os.close(fd)
+            files.append(name)
+        return files
+
+    def test_same_as_serial(self):
+        images = [(0.0, "buy now\ncheap"), (0.0, ""), (0.0, "one line")]
+        self.set_options(1)
+        expected = self.stripper.extract_ocr_info(self.images(*images))
+        self.stripper.cache = {}
+        self.set_options(4)
+        files = self.images(*images)
+        self.assertEqual(self.stripper.extract_ocr_info(files), expected)
+        for name in files:
+            self.failIf(os.path.exists(name))
+
+    def test_concurrent_and_deduplicated(self):
+        self.set_options(4)
+        images = [(0.3, "text %d" % (i,)) for i in range(4)]
+        start = time.time()
+        text, tokens = self.stripper.extract_ocr_info(
+            self.images(*(images + images)))
+        self.assert_(time.time() - start < 1.0)
+        self.assertEqual(text.split("\n"), [t for d, t in images] * 2)
+        self.assertEqual(self.stripper.misses, 4)
+
+    def test_image_timeout(self):
+        self.set_options(2, image_timeout=0.3)
+        start = time.time()
+        text, tokens = self.stripper.extract_ocr_info(
+            self.images((5.0, "slow"), (0.0, "fast")))
+        self.assert_(time.time() - start < 2.0)
+        self.assertEqual(text, "\nfast")
+        self.assert_("image-text:ocr timeout" in tokens)
+        # The timeout isn't cached; the image gets another try.
+        self.stripper.collect()
+        self.assertEqual(len(self.stripper.cache), 1)
+
+    def test_failure_not_cached(self):
+        self.set_options(2)
+        stderr = sys.stderr
+        sys.stderr = open(os.devnull, "w")
+        try:
+            files = self.images((0.0, "fail"))
+            text, tokens = self.stripper.extract_ocr_info(files)
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(tokens, set(["image-text:no text found"]))
+        self.assertEqual(len(self.stripper.cache), 0)
+        # The file is kept, so the failure can be looked into.
+        self.assert_(os.path.exists(files[0]))
+        os.remove(files[0])
+
+    def test_message_timeout(self):
+        self.set_options(2, message_timeout=0.2)
+        text, tokens = self.stripper.extract_ocr_info(
+            self.images((1.0, "slow")))
+        self.assertEqual(tokens, set(["image-text:ocr timeout"]))
+        # The OCR carries on, and the result is used next time.
+        time.sleep(1.5)
+        text, tokens = self.stripper.extract_ocr_info(
+            self.images((1.0, "slow")))
+        self.assertEqual(text, "slow")
+        self.assertEqual(self.stripper.misses, 1)
+
+
+class OCRCacheTest(unittest.TestCase):
+    filename = "__test_ocr_cache"
+
+    def tearDown(self):
+        for name in (self.filename, self.filename + ".old"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def test_shared(self):
+        first = ImageStripper.OCRCache(self.filename)
+        second = ImageStripper.OCRCache(self.filename)
+        try:
+            first["abc"] = ("some text\xff", set(["image-text-lines:0"]))
+            self.assertEqual(second.get("abc"),
+                             ("some text\xff", set(["image-text-lines:0"])))
+            self.failIf("def" in second)
+            self.assertEqual(len(second), 1)
+        finally:
+            first.close()
+            second.close()
+
+    def test_prune(self):
+        cache = ImageStripper.OCRCache(self.filename, max_entries=50,
+                                       max_days=1)
+        try:
+            cache.prune_batch = 10
+            for i in range(60):
+                cache.put(str(i), ("text", set(["a"])))
+            now = int(time.time())
+            cache.execute("UPDATE ocr SET created = ? WHERE hash = '59'",
+                          (now - 2 * 24 * 60 * 60,), commit=True)
+            cache.execute("UPDATE ocr SET last_used = 0"
+                          " WHERE hash IN ('0', '1', '2')",
+                          commit=True)
+            cache.prune(now)
+            self.assertEqual((cache.expired, cache.evicted), (1, 9))
+            self.failIf("59" in cache)
+            self.failIf("0" in cache)
+            self.assertEqual(len(cache), 50)
+        finally:
+            cache.close()
+
+    def test_import_pickle(self):
+        pickle_write(self.filename, {"abc" : ("text", set(["a", "b"]))})
+        cache = ImageStripper.OCRCache(self.filename)
+        try:
+            self.assertEqual(cache["abc"], ("text", set(["a", "b"])))
+        finally:
+            cache.close()
+        self.assert_(os.path.exists(self.filename + ".old"))
+
+    def test_empty_file(self):
+        # An empty file (say, one just created with mkstemp) is a new
+        # database, not an old pickle.
+        open(self.filename, "wb").close()
+        cache = ImageStripper.OCRCache(self.filename)
+        try:
+            cache["abc"] = ("text", set(["a"]))
+            self.assertEqual(len(cache), 1)
+        finally:
+            cache.close()
+        self.failIf(os.path.exists(self.filename + ".old"))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (OCRTest,
+             )
+    try:
+        import sqlite3
+    except ImportError:
+        print "Skipping OCR cache tests, sqlite3 not available"
+    else:
+        clses += (OCRCacheTest,)
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,292 @@
+# Test the spambayes.dnscache module, against a stub resolver.
+
+import os
+import sys
+import time
+import threading
+import unittest
+import StringIO
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from email.MIMEText import MIMEText
+
+from spambayes import dnscache
+from spambayes import tokenizer
+from spambayes.Options import options
+
+# host -> (seconds to take, answer); hosts not listed don't exist.
+HOSTS = {
+    "www.example.com" : (0.0, "10.1.2.3"),
+    "slow.example.com" : (0.5, "10.4.5.6"),
+    "news.example.org" : (0.0, "10.7.8.9"),
+    "10.7.8.9" : (0.0, "news.example.org"),
+    }
+for i in range(10):
+    HOSTS["host%d.example.net" % (i,)] = (0.1, "10.0.0.%d" % (i,))
+
+class StubReply:
+    def __init__(self, answers):
+        self.answers = answers
+        self.authority = []
+
+class StubRequest:
+    """Stands in for DNS.DnsRequest."""
+    ns = "stub"
+    def req(self, name, qtype, timeout):
+        if qtype == "PTR":
+            name = ".".join(name.split(".")[3::-1])
+        if name not in HOSTS:
+            return StubReply([])
+        delay, answer = HOSTS[name]
+        time.sleep(delay)
+        return StubReply([{"typename" : qtype, "ttl" : 3600,
+                           "data" : answer}])
+
+class LookupManyTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = dnscache.cache(requestFactory=StubRequest)
+
+    def test_same_as_lookup(self):
+        questions = [("www.example.com", "A"), ("nosuch.example.com", "A"),
+                     ("10.7.8.9", "PTR")]
+        answers = self.cache.lookup_many(questions, 5.0)
+        other = dnscache.cache(requestFactory=StubRequest)
+        for question, qType in questions:
+            self.assertEqual(answers[question, qType],
+                             other.lookup(question, qType))
+
+    def test_concurrent(self):
+        questions = [("host%d.example.net" % (i,), "A") for i in range(10)]
+        start = time.time()
+        answers = self.cache.lookup_many(questions, 5.0)
+        self.assert_(time.time() - start < 0.5)
+        for i in range(10):
+            self.assertEqual(answers["host%d.example.net" % (i,), "A"],
+                             ["10.0.0.%d" % (i,)])
+
+    def test_deadline(self):
+        start = time.time()
+        answers = self.cache.lookup_many([("slow.example.com", "A"),
+                                          ("www.example.com", "A")], 0.1)
+        self.assert_(time.time() - start < 0.4)
+        self.assertEqual(answers["slow.example.com", "A"], dnscache.PENDING)
+        self.assertEqual(answers["www.example.com", "A"], ["10.1.2.3"])
+        self.assertEqual(self.cache.pending, 1)
+        # The answer is cached when it arrives.
+        time.sleep(0.6)
+        self.assertEqual(self.cache.lookup_many([("slow.example.com", "A")],
+                                                0.0),
+                         {("slow.example.com", "A") : ["10.4.5.6"]})
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_backlog(self):
+        # Questions beyond maxConcurrent are asked as threads come free.
+        self.cache.maxConcurrent = 2
+        questions = [("host%d.example.net" % (i,), "A") for i in range(6)]
+        start = time.time()
+        answers = self.cache.lookup_many(questions, 5.0)
+        self.assert_(0.3 <= time.time() - start < 2.0)
+        for i in range(6):
+            self.assertEqual(answers["host%d.example.net" % (i,), "A"],
+                             ["10.0.0.%d" % (i,)])
+        self.assertEqual(self.cache.running, 0)
+
+    def test_threads(self):
+        # Each call gets its own answers, even for a question another
+        # call is already waiting for.
+        results = {}
+        def lookup(name, questions):
+            results[name] = self.cache.lookup_many(questions, 5.0)
+        slow = [("slow.example.com", "A")]
+        mixed = [("www.example.com", "A"), ("slow.example.com", "A")]
+        threads = [threading.Thread(target=lookup, args=("slow", slow)),
+                   threading.Thread(target=lookup, args=("mixed", mixed))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results["slow"],
+                         {("slow.example.com", "A") : ["10.4.5.6"]})
+        self.assertEqual(results["mixed"],
+                         {("www.example.com", "A") : ["10.1.2.3"],
+                          ("slow.example.com", "A") : ["10.4.5.6"]})
+        self.assertEqual(self.cache.misses, 2)
+
+
+class SQLiteStoreTest(unittest.TestCase):
+    filename = "__test_dnscache.sqlite"
+
+    def setUp(self):
+        self.cache = self.open()
+
+    def tearDown(self):
+        self.cache.close()
+        for name in (self.filename, self.filename + ".old"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def open(self, maxAnswers=100):
+        return dnscache.cache(requestFactory=StubRequest,
+                              cachefile=self.filename, cachetype="sqlite",
+                              maxAnswers=maxAnswers)
+
+    def test_shared(self):
+        self.assertEqual(self.cache.lookup("www.example.com"), ["10.1.2.3"])
+        self.assertEqual(self.cache.lookup("10.7.8.9", "PTR"),
+                         "news.example.org")
+        self.assertEqual(self.cache.lookup("nosuch.example.com"), [])
+        other = self.open()
+        try:
+            self.assertEqual(other.lookup("www.example.com"), ["10.1.2.3"])
+            self.assertEqual(other.lookup("10.7.8.9", "PTR"),
+                             "news.example.org")
+            self.assertEqual(other.lookup("nosuch.example.com"), [])
+            self.assertEqual((other.hits, other.misses), (3, 0))
+        finally:
+            other.close()
+
+    def test_upgrade(self):
+        # A pickled cache, from before the cache type was changed, is
+        # imported.
+        self.cache.close()
+        os.remove(self.filename)
+        old = dnscache.cache(requestFactory=StubRequest,
+                             cachefile=self.filename)
+        self.assertEqual(old.lookup("www.example.com"), ["10.1.2.3"])
+        self.assertEqual(old.lookup("10.7.8.9", "PTR"), "news.example.org")
+        old.close()
+        self.cache = self.open()
+        self.assert_(isinstance(self.cache.store, dnscache.SQLiteStore))
+        self.assert_(os.path.exists(self.filename + ".old"))
+        self.assertEqual(self.cache.lookup("www.example.com"), ["10.1.2.3"])
+        self.assertEqual(self.cache.lookup("10.7.8.9", "PTR"),
+                         "news.example.org")
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 0))
+
+    def test_empty_file(self):
+        self.cache.close()
+        open(self.filename, "wb").close()
+        self.cache = self.open()
+        self.assert_(isinstance(self.cache.store, dnscache.SQLiteStore))
+        self.assert_(not os.path.exists(self.filename + ".old"))
+        self.assertEqual(self.cache.lookup("www.example.com"), ["10.1.2.3"])
+
+    def test_damaged(self):
+        # A file that can't be used doesn't stop the cache working.
+        self.cache.close()
+        f = open(self.filename, "wb")
+        f.write("SQLite format 3\0" + "x" * 1000)
+        f.close()
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            self.cache = self.open()
+            self.assert_("Can't use DNS cache" in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(self.cache.lookup("www.example.com"), ["10.1.2.3"])
+        self.cache.close()
+        self.assertEqual(open(self.filename, "rb").read(16),
+                         "SQLite format 3\0")
+
+    def test_prune(self):
+        store = self.cache.store
+        now = int(time.time())
+        for i in range(150):
+            obj = dnscache.lookupResult("A", "10.0.0.1", "h%d" % (i,),
+                                        now + 3600, now + i)
+            store.put("h%d" % (i,), "A", [obj])
+        old = dnscache.lookupResult("A", "10.0.0.2", "old", now - 1, now)
+        store.put("old", "A", [old])
+        store.pruneBatch = 20
+        store.prune(now)
+        self.assertEqual((store.expired, store.evicted), (1, 20))
+        self.assertEqual(store.get("h0", "A", now), None)
+        self.assertNotEqual(store.get("h149", "A", now), None)
+        for i in range(5):
+            store.prune(now)
+        self.assertEqual(store.counts(), [("A", 100, 100)])
+
+
+class DeferredLookupsTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_cache = tokenizer.cache
+        tokenizer.cache = dnscache.cache(requestFactory=StubRequest)
+        self.saved = {}
+        for name in ("x-lookup_ip", "x-pick_apart_urls", "x-lookup_ip_timeout",
+                     "x-mine_nntp_headers"):
+            self.saved[name] = options["Tokenizer", name]
+        options["Tokenizer", "x-lookup_ip"] = True
+        options["Tokenizer", "x-pick_apart_urls"] = True
+        options["Tokenizer", "x-mine_nntp_headers"] = True
+
+    def tearDown(self):
+        tokenizer.cache = self.saved_cache
+        for name, value in self.saved.items():
+            options["Tokenizer", name] = value
+
+    def tokens(self, timeout, *hosts):
+        options["Tokenizer", "x-lookup_ip_timeout"] = timeout
+        msg = MIMEText(" ".join(["see http://%s/page" % (host,)
+                                 for host in hosts]))
+        msg["NNTP-Posting-Host"] = "news.example.org"
+        tokens = list(tokenizer.tokenize(msg.as_string()))
+        tokens.sort()
+        return tokens
+
+    def test_same_tokens(self):
+        hosts = ("www.example.com", "nosuch.example.com")
+        tokens = self.tokens(0.0, *hosts)
+        self.assert_("url-ip:10.1.2.3/32" in tokens)
+        self.assert_("nntp-host-ip:has-reverse" in tokens)
+        tokenizer.cache = dnscache.cache(requestFactory=StubRequest)
+        self.assertEqual(self.tokens(5.0, *hosts), tokens)
+
+    def test_interleaved(self):
+        # Each message gets the answers to its own lookups, however its
+        # tokens are interleaved with another's.
+        options["Tokenizer", "x-lookup_ip_timeout"] = 5.0
+        messages = []
+        for host in ("www.example.com", "host3.example.net"):
+            msg = MIMEText("see http://%s/page" % (host,))
+            messages.append(tokenizer.tokenize(msg.as_string()))
+        tokens = [[], []]
+        while messages[0] or messages[1]:
+            for i in range(2):
+                if messages[i]:
+                    try:
+                        tokens[i].append(messages[i].next())
+                    except StopIteration:
+                        messages[i] = None
+        self.assert_("url-ip:10.1.2.3/32" in tokens[0])
+        self.assert_("url-ip:10.0.0.3/32" not in tokens[0])
+        self.assert_("url-ip:10.0.0.3/32" in tokens[1])
+        self.assert_("url-ip:10.1.2.3/32" not in tokens[1])
+
+    def test_pending(self):
+        start = time.time()
+        tokens = self.tokens(0.2, "host1.example.net", "slow.example.com")
+        self.assert_(time.time() - start < 0.45)
+        self.assert_("url-ip:10.0.0.1/32" in tokens)
+        self.assert_("url-ip:lookup pending" in tokens)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (LookupManyTest,
+             DeferredLookupsTest,
+             )
+    try:
+        import sqlite3
+    except ImportError:
+        print "Skipping sqlite tests, sqlite3 not available"
+    else:
+        clses += (SQLiteStoreTest,)
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,114 @@
+# Test the reviewindex module.
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes.Options import options
+from spambayes.FileCorpus import FileCorpus, FileMessageFactory
+from spambayes.reviewindex import ReviewIndex, summarize
+
+# We borrow the test messages that test_sb_server uses.
+from test_sb_server import good1, spam1
+
+notated = """From: friend@public.com
+Subject: %s,Make money fast
+%s: %s
+%s: 0.999
+
+Buy now.
+""" % (options["Headers", "header_spam_string"],
+       options["Headers", "classification_header_name"],
+       options["Headers", "header_spam_string"],
+       options["Headers", "score_header_name"])
+
+
+class ReviewIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_name = os.path.join(self.directory, "review.pickle")
+        self.cache = os.path.join(self.directory, "cache")
+        os.mkdir(self.cache)
+        self.factory = FileMessageFactory()
+        self.corpus = FileCorpus(self.factory, self.cache, '[0-9]*')
+        self.index = ReviewIndex(self.db_name)
+        self.corpus.addObserver(self.index)
+        self.notate_subject = options["Headers", "notate_subject"]
+        options["Headers", "notate_subject"] = (
+            options["Headers", "header_spam_string"],)
+
+    def tearDown(self):
+        options["Headers", "notate_subject"] = self.notate_subject
+        shutil.rmtree(self.directory)
+
+    def add(self, key, content):
+        msg = self.corpus.makeMessage(key, content)
+        self.corpus.addMessage(msg)
+        return msg
+
+    def test_summarize(self):
+        msg = self.corpus.makeMessage("1", good1)
+        summary = summarize(msg)
+        self.assertEqual(summary["headers"]["subject"], "ZPT and DTML")
+        self.assertEqual(summary["headers"]["from"], "chris@example.com")
+        self.assertEqual(summary["score"], "?")
+        self.assertEqual(summary["classification"],
+                         options["Headers", "header_unsure_string"])
+        self.assert_(summary["text"].startswith("Jean Jordaan wrote:"))
+
+    def test_add_and_remove(self):
+        self.add("1200000002", good1)
+        msg = self.add("1200000001", spam1)
+        self.add("1100000000", notated)
+        self.assertEqual(self.index.keys(),
+                         ["1100000000", "1200000001", "1200000002"])
+        summary = self.index.get("1100000000")
+        self.assertEqual(summary["headers"]["subject"], "Make money fast")
+        self.assertEqual(summary["classification"],
+                         options["Headers", "header_spam_string"])
+        self.assertAlmostEqual(summary["score"], 99.9)
+        # The message itself keeps its notation.
+        self.assert_(self.corpus["1100000000"]["Subject"].startswith(
+            options["Headers", "header_spam_string"]))
+        self.corpus.removeMessage(msg)
+        self.assertEqual(self.index.keys(), ["1100000000", "1200000002"])
+        self.assertEqual(self.index.get("1200000001"), None)
+
+    def test_store(self):
+        self.add("1200000001", spam1)
+        self.index.store()
+        index = ReviewIndex(self.db_name)
+        self.assertEqual(index.keys(), ["1200000001"])
+        self.assertEqual(index.get("1200000001"),
+                         self.index.get("1200000001"))
+
+    def test_update(self):
+        self.add("1200000001", spam1)
+        self.index.store()
+        # Messages that appear in the cache, and disappear from it,
+        # without the index being told.
+        msg = self.factory.create("1200000002", self.cache, good1)
+        msg.store()
+        os.remove(os.path.join(self.cache, "1200000001"))
+        corpus = FileCorpus(self.factory, self.cache, '[0-9]*')
+        index = ReviewIndex(self.db_name)
+        index.update(corpus)
+        self.assertEqual(index.keys(), ["1200000002"])
+        self.assertEqual(index.get("1200000002")["headers"]["subject"],
+                         "ZPT and DTML")
+
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (ReviewIndexTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
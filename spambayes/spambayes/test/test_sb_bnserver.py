@@ -0,0 +1,96 @@
+# Test sb_bnserver script.
+
+import os
+import sys
+import time
+import errno
+import shutil
+import socket
+import tempfile
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+import sb_bnserver
+
+# We borrow the test messages that test_sb_server uses.
+from test_sb_server import good1, spam1
+
+class WorkersTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.socket_name = os.path.join(self.dir, "socket")
+        script = sb_bnserver.__file__
+        if script.endswith(".pyc") or script.endswith(".pyo"):
+            script = script[:-1]
+        args = [sys.executable, script, "-w", "2", "-a", "2",
+                "-p", os.path.join(self.dir, "hammie.db"), self.socket_name]
+        self.pid = os.spawnv(os.P_NOWAIT, args[0], args)
+
+    def tearDown(self):
+        os.waitpid(self.pid, 0)
+        shutil.rmtree(self.dir)
+
+    def request(self, switches, body):
+        for i in range(40):
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                s.connect(self.socket_name)
+                break
+            except socket.error, e:
+                if e[0] not in (errno.ENOENT, errno.ECONNREFUSED):
+                    raise
+                s.close()
+                time.sleep(0.25)
+        else:
+            self.fail("sb_bnserver appeared to not start")
+        s.sendall("%s\n%s" % (switches, body))
+        s.shutdown(socket.SHUT_WR)
+        response = []
+        while True:
+            data = s.recv(8192)
+            if not data:
+                break
+            response.append(data)
+        s.close()
+        status, size, body = "".join(response).split("\n", 2)
+        self.assertEqual(status, "0", body)
+        self.assertEqual(int(size), len(body))
+        return body
+
+    def classification(self, body):
+        for line in body.split("\n"):
+            if line.startswith("X-Spambayes-Classification:"):
+                return line.split(":", 1)[1].split(";")[0].strip()
+            if not line.strip():
+                break
+        self.fail("no classification header")
+
+    def test_train(self):
+        # The workers load the (empty) pickle before the training is done
+        # in the original process, and see what was learnt afterwards.
+        self.assertEqual(self.classification(self.request("-f", spam1)),
+                         "unsure")
+        self.request("-s", spam1)
+        for i in range(4):
+            self.assertEqual(self.classification(self.request("-f",
+                                                              spam1)),
+                             "spam")
+        self.request("-g", good1)
+        for i in range(4):
+            self.assertEqual(self.classification(self.request("-f",
+                                                              good1)),
+                             "ham")
+
+
+def suite():
+    suite = unittest.TestSuite()
+    if hasattr(socket, "AF_UNIX") and hasattr(os, "fork"):
+        suite.addTest(unittest.makeSuite(WorkersTest))
+    else:
+        print "Skipping sb_bnserver tests, no unix sockets or fork"
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -7,6 +7,7 @@ import email
 import types
 import socket
 import threading
+import Queue
 import imaplib
 import unittest
 import StringIO
@@ -19,6 +20,7 @@ except AttributeError:
 import sb_test_support
 sb_test_support.fix_sys_path()
 
+from spambayes import Stats
 from spambayes import message
 from spambayes import Dibbler
 from spambayes import asyncore
@@ -26,6 +28,8 @@ from spambayes.Options import options
 from spambayes.classifier import Classifier
 from sb_imapfilter import run, BadIMAPResponseError, LoginFailure
 from sb_imapfilter import IMAPSession, IMAPMessage, IMAPFolder, IMAPFilter
+from sb_imapfilter import message_set, IMAPWatcher, run_in_parallel, \
+     parallel_jobs
 
 IMAP_PORT = 8143
 IMAP_USERNAME = "testu"
@@ -95,6 +99,40 @@ IMAP_UIDS = {1 : 101, 2: 102, 3:103, 4:104}
 # Messages that are UNDELETED
 UNDELETED_IDS = (1,2)
 
+# What STATUS says.
+UIDVALIDITY = 1091599302
+UIDNEXT = 23
+
+# Whether the server supports IDLE, and whether it says that a message
+# has arrived as soon as IDLE is started.
+IDLE_SUPPORTED = True
+IDLE_EXISTS = False
+
+# Other capabilities that the server claims to have (like MOVE).
+EXTRA_CAPABILITIES = []
+
+# Each command the server is sent is added to this (as "UID FETCH", for
+# example), so that tests can check how many commands things take.
+COMMANDS = []
+
+def expand_message_set(message_set, numbers):
+    """Return those of the given numbers that are in the IMAP message
+    set (like "3:5,9"), in order."""
+    wanted = []
+    for part in message_set.split(','):
+        if ':' in part:
+            start, end = part.split(':')
+            if end == '*':
+                end = max(numbers)
+            wanted.extend([n for n in numbers
+                           if int(start) <= n <= int(end)])
+        else:
+            wanted.append(int(part))
+    wanted = [n for n in numbers if n in wanted]
+    wanted.sort()
+    return wanted
+
+
 class TestListener(Dibbler.Listener):
     """Listener for TestIMAP4Server."""
     def __init__(self, socketMap=asyncore.socket_map):
@@ -120,38 +158,55 @@ class TestIMAP4Server(Dibbler.BrighterAsyncChat):
         self.handlers = {'LIST' : self.onList,
                          'LOGIN' : self.onLogin,
                          'SELECT' : self.onSelect,
+                         'EXAMINE' : self.onSelect,
                          'FETCH' : self.onFetch,
                          'SEARCH' : self.onSearch,
                          'UID' : self.onUID,
                          'APPEND' : self.onAppend,
                          'STORE' : self.onStore,
+                         'COPY' : self.onCopy,
+                         'MOVE' : self.onMove,
+                         'STATUS' : self.onStatus,
+                         'IDLE' : self.onIdle,
                          }
-        self.push("* OK [CAPABILITY IMAP4REV1 AUTH=LOGIN] " \
-                  "localhost IMAP4rev1\r\n")
+        if IDLE_SUPPORTED:
+            capabilities = "IMAP4REV1 AUTH=LOGIN IDLE"
+        else:
+            capabilities = "IMAP4REV1 AUTH=LOGIN"
+        capabilities = " ".join([capabilities] + EXTRA_CAPABILITIES)
+        self.push("* OK [CAPABILITY %s] localhost IMAP4rev1\r\n" %
+                  (capabilities,))
         self.request = ''
         self.next_id = 0
         self.in_literal = (0, None)
+        self.idle_id = None
 
     def collect_incoming_data(self, data):
         """Asynchat override."""
-        if self.in_literal[0] > 0:
-            # Also add the line breaks.
-            self.request = "%s\r\n%s" % (self.request, data)
-        else:
-            self.request = self.request + data
+        self.request = self.request + data
 
     def found_terminator(self):
         """Asynchat override."""
         global FAIL_NEXT
 
         if self.in_literal[0] > 0:
-            if len(self.request) >= self.in_literal[0]:
-                self.push(self.in_literal[1](self.request,
-                                             *self.in_literal[2]))
-                self.in_literal = (0, None)
-                self.request = ''
+            # The terminator was the size of the literal, so we have all
+            # of it.
+            self.push(self.in_literal[1](self.request, *self.in_literal[2]))
+            self.in_literal = (0, None)
+            self.set_terminator('\r\n')
+            self.request = ''
             return
-        
+        if not self.request:
+            # The end of a command that had a literal.
+            return
+
+        if self.idle_id is not None and self.request.upper() == "DONE":
+            self.push("%s OK IDLE terminated\r\n" % (self.idle_id,))
+            self.idle_id = None
+            self.request = ''
+            return
+
         id, command = self.request.split(None, 1)
 
         if FAIL_NEXT:
@@ -163,6 +218,10 @@ class TestIMAP4Server(Dibbler.BrighterAsyncChat):
         else:
             args = ''
         command = command.upper()
+        if command == 'UID':
+            COMMANDS.append("UID " + args.split(None, 1)[0].upper())
+        else:
+            COMMANDS.append(command)
         if command in self.okCommands:
             self.push("%s OK (we hope)\r\n" % (id,))
             if command == 'LOGOUT':
@@ -202,11 +261,32 @@ class TestIMAP4Server(Dibbler.BrighterAsyncChat):
         # We ignore flags.
         return "%s OK STORE completed\r\n" % (id,)
 
+    def onCopy(self, id, command, args, uid=False):
+        # We ignore the folder, and don't actually copy anything.
+        return "%s OK COPY completed\r\n" % (id,)
+
+    def onMove(self, id, command, args, uid=False):
+        if "MOVE" not in EXTRA_CAPABILITIES:
+            return self.onUnknown(id, command, args, uid)
+        return "%s OK MOVE completed\r\n" % (id,)
+
+    def onIdle(self, id, command, args, uid=False):
+        self.idle_id = id
+        if IDLE_EXISTS:
+            return "+ idling\r\n* 5 EXISTS\r\n"
+        return "+ idling\r\n"
+
+    def onStatus(self, id, command, args, uid=False):
+        folder, args = args.split(None, 1)
+        return "* STATUS %s (UIDVALIDITY %d UIDNEXT %d)\r\n" \
+               "%s OK STATUS completed\r\n" % (folder, UIDVALIDITY, UIDNEXT,
+                                                id)
+
     def onSelect(self, id, command, args, uid=False):
         exists = "* %d EXISTS" % (len(IMAP_MESSAGES),)
         recent = "* 0 RECENT"
-        uidv = "* OK [UIDVALIDITY 1091599302] UID validity status"
-        next_uid = "* OK [UIDNEXT 23] Predicted next UID"
+        uidv = "* OK [UIDVALIDITY %d] UID validity status" % (UIDVALIDITY,)
+        next_uid = "* OK [UIDNEXT %d] Predicted next UID" % (UIDNEXT,)
         flags = "* FLAGS (\Answered \Flagged \Deleted \Draft \Seen)"
         perm_flags = "* OK [PERMANENTFLAGS (\* \Answered \Flagged " \
                      "\Deleted \Draft \Seen)] Permanent flags"
@@ -226,8 +306,14 @@ class TestIMAP4Server(Dibbler.BrighterAsyncChat):
         # We ignore the date.
         if '{' in args:
             # A literal.
-            size = int(args[2:-1])
-            self.in_literal = (size, self.appendLiteral, (id,))
+            size = args.strip()[1:-1]
+            self.in_literal = (int(size.rstrip('+')), self.appendLiteral,
+                               (id,))
+            self.set_terminator(self.in_literal[0])
+            if size.endswith('+'):
+                # LITERAL+, so the client doesn't wait to be told to go
+                # ahead.
+                return ""
             return "+ Ready for argument\r\n"
         # Strip off the space at the front.
         return self.appendLiteral(args[1:], id)
@@ -251,6 +337,14 @@ class TestIMAP4Server(Dibbler.BrighterAsyncChat):
                     results += (IMAP_UIDS[msg_id],)
                 else:
                     results += (msg_id,)
+        if args.startswith("UID "):
+            # Only those in the given message set.
+            wanted = expand_message_set(args.split()[1],
+                                        IMAP_MESSAGES.keys())
+            # As real servers do, "n:*" includes the last message.
+            if args.split()[1].endswith("*"):
+                wanted.append(max(IMAP_UIDS.values()))
+            results = tuple([r for r in results if r in wanted])
         if uid:
             command_string = "UID " + command
         else:
@@ -261,57 +355,41 @@ class TestIMAP4Server(Dibbler.BrighterAsyncChat):
 
     def onFetch(self, id, command, args, uid=False):
         msg_nums, msg_parts = args.split(None, 1)
-        msg_nums = msg_nums.split()
-        response = {}
+        if uid:
+            msg_nums = expand_message_set(msg_nums, IMAP_MESSAGES.keys())
+        else:
+            msg_nums = expand_message_set(msg_nums, IMAP_UIDS.keys())
+        ids = {}
+        for msg_id, msg_uid in IMAP_UIDS.items():
+            ids[msg_uid] = msg_id
+        response = []
         for msg in msg_nums:
-            response[msg] = []
-        if msg_parts.find("UID") != -1:
             if uid:
-                for msg in msg_nums:
-                    response[msg].append("FETCH (UID %s)" % (msg,))
+                msg_uid = msg
+                # Appended messages don't have a message number, so we
+                # just use the UID.
+                msg_id = ids.get(msg, msg)
             else:
-                for msg in msg_nums:
-                    response[msg].append("FETCH (UID %s)" %
-                                         (IMAP_UIDS[int(msg)]))
-        if msg_parts.find("BODY.PEEK[]") != -1:
-            for msg in msg_nums:
-                if uid:
-                    msg_uid = int(msg)
-                else:
-                    msg_uid = IMAP_UIDS[int(msg)]
-                response[msg].append(("FETCH (BODY[] {%s}" %
-                                     (len(IMAP_MESSAGES[msg_uid])),
-                                     IMAP_MESSAGES[msg_uid]))
-        if msg_parts.find("RFC822.HEADER") != -1:
-            for msg in msg_nums:
-                if uid:
-                    msg_uid = int(msg)
-                else:
-                    msg_uid = IMAP_UIDS[int(msg)]
-                msg_text = IMAP_MESSAGES[msg_uid]
-                headers, unused = msg_text.split('\r\n\r\n', 1)
-                response[msg].append(("FETCH (RFC822.HEADER {%s}" %
-                                      (len(headers),), headers))
-        if msg_parts.find("FLAGS INTERNALDATE") != -1:
-            # We make up flags & dates.
-            for msg in msg_nums:
-                response[msg].append('FETCH (FLAGS (\Seen \Deleted) '
-                                     'INTERNALDATE "27-Jul-2004 13:1'
-                                     '1:56 +1200')
-        for msg in msg_nums:
-            try:
-                simple = " ".join(response[msg])
-            except TypeError:
-                simple = []
-                for part in response[msg]:
-                    if isinstance(part, types.StringTypes):
-                        simple.append(part)
-                    else:
-                        simple.append('%s\r\n%s)' % (part[0], part[1]))
-                simple = " ".join(simple)
-            response[msg] = "* %s %s" % (msg, simple)
-        response_text = "\r\n".join(response.values())
-        return "%s\r\n%s OK FETCH completed\r\n" % (response_text, id)
+                msg_uid = IMAP_UIDS[msg]
+                msg_id = msg
+            parts = []
+            if uid or msg_parts.find("UID") != -1:
+                parts.append("UID %s" % (msg_uid,))
+            if msg_parts.find("FLAGS INTERNALDATE") != -1:
+                # We make up flags & dates.
+                parts.append('FLAGS (\Seen \Deleted) INTERNALDATE '
+                             '"27-Jul-2004 13:11:56 +1200"')
+            if msg_parts.find("RFC822.HEADER") != -1:
+                headers, unused = IMAP_MESSAGES[msg_uid].split('\r\n\r\n', 1)
+                parts.append("RFC822.HEADER {%s}\r\n%s" % (len(headers),
+                                                           headers))
+            if msg_parts.find("BODY.PEEK[]") != -1:
+                parts.append("BODY[] {%s}\r\n%s" %
+                             (len(IMAP_MESSAGES[msg_uid]),
+                              IMAP_MESSAGES[msg_uid]))
+            response.append("* %s FETCH (%s)\r\n" % (msg_id,
+                                                     " ".join(parts)))
+        return "%s%s OK FETCH completed\r\n" % ("".join(response), id)
 
     def onUID(self, id, command, args, uid=False):
         actual_command, args = args.split(None, 1)
@@ -536,6 +614,40 @@ class IMAPSessionTest(BaseIMAPFilterTest):
         self.assertEqual(data['5']["UID"], uid)
         self.assertEqual(data['5']["RFC822.HEADER"], headers)
 
+        # Several messages at once, where (as some servers do) the UID
+        # comes after the literal.
+        response = [('1 (BODY[] {%d}' % (len(rfc),), rfc), ' UID 101)',
+                    ('2 (BODY[] {%d}' % (len(peek),), peek),
+                    ' UID 102 FLAGS (\\Seen))']
+        data = self.imap.extract_fetch_data(response)
+        self.assertEqual(data['1']["UID"], '101')
+        self.assertEqual(data['1']["BODY[]"], rfc)
+        self.assertEqual(data['2']["UID"], '102')
+        self.assertEqual(data['2']["BODY[]"], peek)
+        self.assertEqual(data['2']["FLAGS"], '(\\Seen)')
+
+    def test_message_set(self):
+        self.assertEqual(message_set([5]), "5")
+        self.assertEqual(message_set(["3", "5", "4", "9", "11", "10"]),
+                         "3:5,9:11")
+        self.assertEqual(message_set([1, 3, 5]), "1,3,5")
+
+    def test_idle(self):
+        global IDLE_EXISTS
+        self.imap.login(IMAP_USERNAME, IMAP_PASSWORD)
+        self.assert_(self.imap.supports_idle())
+        self.imap.SelectFolder("INBOX")
+        IDLE_EXISTS = True
+        try:
+            self.assert_(self.imap.idle(5))
+        finally:
+            IDLE_EXISTS = False
+        start = time.time()
+        self.assert_(not self.imap.idle(0.5))
+        self.assert_(time.time() - start >= 0.5)
+        # The connection can still be used.
+        self.assertEqual(self.imap.noop()[0], "OK")
+
     def _counter(self, size):
         self._count += 1
         return self._imap_file_read(size)
@@ -686,6 +798,123 @@ class IMAPFolderTest(BaseIMAPFilterTest):
             self.assertEqual(msg.as_string(), msg_correct.as_string())
             keys = keys[1:]
 
+    def test_get_messages(self):
+        # 103 isn't there any more, so should be left out.
+        msgs = self.folder.get_messages(["101", "102", "999"])
+        self.assertEqual([msg.uid for msg in msgs], ["101", "102"])
+        self.assertEqual([msg.id for msg in msgs], [SB_ID_1, SB_ID_2])
+
+    def test_full_messages_batched(self):
+        commands = []
+        def uid(command, *args):
+            commands.append(command)
+            return IMAPSession.uid(self.imap, command, *args)
+        self.imap.uid = uid
+        expected = [msg.as_string() for msg in self.folder.full_messages()]
+        self.assertEqual(len(commands), 5)
+        saved = (options["imap", "x-fetch_batch_size"],
+                 options["imap", "x-body_batch_size"])
+        options["imap", "x-fetch_batch_size"] = 10
+        options["imap", "x-body_batch_size"] = 10
+        try:
+            del commands[:]
+            msgs = list(self.folder.full_messages())
+            self.assertEqual([msg.as_string() for msg in msgs], expected)
+            # One search, one fetch for the headers, one for the bodies.
+            self.assertEqual(commands, ["SEARCH", "FETCH", "FETCH"])
+            # Only the bodies that are wanted are fetched.
+            del commands[:]
+            msgs = list(self.folder.full_messages(
+                lambda msg: msg.uid == "102"))
+            self.assertEqual([msg.got_substance for msg in msgs],
+                             [False, True])
+            self.assertEqual(msgs[1].as_string(), expected[1])
+        finally:
+            (options["imap", "x-fetch_batch_size"],
+             options["imap", "x-body_batch_size"]) = saved
+
+    def check_save_messages(self, expected):
+        msgs = [msg.get_full_message() for msg in
+                self.folder.get_messages(["101", "102", "104"])]
+        # 101 and 104 don't have our id header until it is added, so have
+        # changed; 102 hasn't.
+        self.assertEqual([msg.content_changed() for msg in msgs],
+                         [True, False, True])
+        msgs[0].MoveTo(IMAPFolder("unsure", self.imap, None))
+        msgs[1].MoveTo(IMAPFolder("spam", self.imap, None))
+        msgs[2].MoveTo(IMAPFolder("unsure", self.imap, None))
+        saved_messages = IMAP_MESSAGES.copy()
+        del COMMANDS[:]
+        try:
+            self.folder.save_messages(msgs)
+            self.assertEqual([c for c in COMMANDS if c != "CAPABILITY"],
+                             expected)
+            appended = [text for key, text in IMAP_MESSAGES.items()
+                        if key not in saved_messages]
+            self.assertEqual(len(appended), 2)
+            for text in appended:
+                self.assert_(options["Headers", "mailid_header_name"]
+                             in text)
+            self.assertEqual([msg.uid for msg in msgs], [None] * 3)
+        finally:
+            IMAP_MESSAGES.clear()
+            IMAP_MESSAGES.update(saved_messages)
+
+    def test_save_messages(self):
+        self.check_save_messages(["UID FETCH", "UID COPY", "APPEND",
+                                  "APPEND", "UID STORE"])
+
+    def test_save_messages_move(self):
+        # With MOVE, the copied message doesn't need deleting, but the
+        # appended ones still do; with LITERAL+, the appends don't wait
+        # to be told to go ahead.
+        EXTRA_CAPABILITIES[:] = ["MOVE", "LITERAL+"]
+        try:
+            self.imap.logout()
+            self.imap = IMAPSession("localhost:%d" % IMAP_PORT)
+            self.imap.login(IMAP_USERNAME, IMAP_PASSWORD)
+            self.folder = IMAPFolder("testfolder", self.imap, None)
+            self.check_save_messages(["UID FETCH", "UID MOVE", "APPEND",
+                                      "APPEND", "UID STORE"])
+        finally:
+            EXTRA_CAPABILITIES[:] = []
+
+    def test_checkpoints(self):
+        global UIDVALIDITY, UIDNEXT
+        saved = UIDVALIDITY, UIDNEXT
+        db = IMAPMessage().message_info_db
+        saved_checkpoints = db.get_folder_checkpoints()
+        db.set_folder_checkpoints({})
+        try:
+            self.assertEqual(self.imap.folder_status("testfolder"),
+                             (UIDVALIDITY, UIDNEXT))
+            # Never checkpointed, so everything is looked at.
+            self.assert_(self.folder.changed_since_checkpoint())
+            self.assertEqual(self.folder.first_uid, None)
+            self.folder.checkpoint()
+            folder = IMAPFolder("testfolder", self.imap, None)
+            self.assert_(not folder.changed_since_checkpoint())
+            # Something new arrives: only look at it.
+            UIDNEXT = 103
+            self.assert_(self.folder.changed_since_checkpoint())
+            self.folder.checkpoint()
+            UIDNEXT = 105
+            folder = IMAPFolder("testfolder", self.imap, None)
+            self.assert_(folder.changed_since_checkpoint())
+            self.assertEqual(folder.first_uid, 103)
+            self.assertEqual(folder.keys(), [])
+            folder.first_uid = 102
+            self.assertEqual(folder.keys(), ["102"])
+            # The folder is renumbered: look at everything again.
+            UIDVALIDITY += 1
+            folder = IMAPFolder("testfolder", self.imap, None)
+            self.assert_(folder.changed_since_checkpoint())
+            self.assertEqual(folder.first_uid, None)
+            self.assertEqual(len(folder.keys()), len(UNDELETED_IDS))
+        finally:
+            UIDVALIDITY, UIDNEXT = saved
+            db.set_folder_checkpoints(saved_checkpoints)
+
     def test_keys(self):
         keys = self.folder.keys()
         # We get back UIDs, not IDs, so convert to check.
@@ -748,6 +977,46 @@ class IMAPFolderTest(BaseIMAPFilterTest):
         pass
 
 
+class IMAPWatcherTest(unittest.TestCase):
+    def make_watcher(self):
+        self.queue = Queue.Queue()
+        watcher = IMAPWatcher("localhost:%d" % IMAP_PORT, 0, IMAP_USERNAME,
+                              IMAP_PASSWORD, "INBOX", self.queue, "key")
+        watcher.idle_timeout = 0.5
+        watcher.retry_delay = 0.5
+        return watcher
+
+    def test_watch(self):
+        global IDLE_EXISTS
+        watcher = self.make_watcher()
+        watcher.start()
+        try:
+            # Nothing arrives...
+            self.assertRaises(Queue.Empty, self.queue.get, True, 1)
+            # ...until something does.
+            IDLE_EXISTS = True
+            self.assertEqual(self.queue.get(True, 5), "key")
+        finally:
+            IDLE_EXISTS = False
+            watcher.stop()
+        watcher.thread.join(5)
+        self.assert_(not watcher.thread.isAlive())
+        self.assert_(watcher.supported)
+
+    def test_no_idle(self):
+        global IDLE_SUPPORTED
+        IDLE_SUPPORTED = False
+        try:
+            watcher = self.make_watcher()
+            watcher.start()
+            watcher.thread.join(5)
+        finally:
+            IDLE_SUPPORTED = True
+        self.assert_(not watcher.thread.isAlive())
+        self.assert_(not watcher.supported)
+        self.assert_(self.queue.empty())
+
+
 class IMAPFilterTest(BaseIMAPFilterTest):
     def setUp(self):
         BaseIMAPFilterTest.setUp(self)
@@ -758,13 +1027,88 @@ class IMAPFilterTest(BaseIMAPFilterTest):
         options["imap", "spam_train_folders"] = ("spam_to_train",)
 
     def test_Train(self):
-        # XXX To-do
-        pass
+        self.filter.imap_server = self.imap
+        self.filter.stats = Stats.Stats(options,
+                                        message.Message().message_info_db)
+        self.filter.Train([("ham_to_train", False)])
+        self.assertEqual(len(self.filter.timings), 1)
+        server, folder, action, count, seconds = self.filter.timings[0]
+        self.assertEqual((server, folder, action),
+                         ("localhost", "ham_to_train", "train"))
     def test_Filter(self):
         # XXX To-do
         pass
 
 
+class RunInParallelTest(unittest.TestCase):
+    def test_run_in_parallel(self):
+        lock = threading.Lock()
+        running = [0]
+        most = [0]
+        done = []
+        def job(i):
+            lock.acquire()
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+            lock.release()
+            time.sleep(0.1)
+            lock.acquire()
+            running[0] -= 1
+            done.append(i)
+            lock.release()
+        run_in_parallel([lambda i=i: job(i) for i in range(6)], 3)
+        done.sort()
+        self.assertEqual(done, range(6))
+        self.assertEqual(most[0], 3)
+
+    def test_exception(self):
+        done = []
+        def fail():
+            raise ValueError("job failed")
+        jobs = [lambda: done.append(1), fail, lambda: done.append(2)]
+        self.assertRaises(ValueError, run_in_parallel, jobs, 2)
+        # The other jobs still get done.
+        done.sort()
+        self.assertEqual(done, [1, 2])
+
+
+class ParallelJobsTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = {}
+        for name in ("x-connection_per_folder", "ham_train_folders",
+                     "spam_train_folders", "filter_folders"):
+            self.saved[name] = options["imap", name]
+        options["imap", "ham_train_folders"] = ("ham",)
+        options["imap", "spam_train_folders"] = ("spam",)
+        options["imap", "filter_folders"] = ("INBOX", "other")
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            options["imap", name] = value
+
+    def test_per_account(self):
+        options["imap", "x-connection_per_folder"] = False
+        self.assertEqual(parallel_jobs([0, 2], True, True),
+                         [[(0, True, True, None, None),
+                           (2, True, True, None, None)]])
+
+    def test_per_folder(self):
+        # Every folder is trained on before any is filtered.
+        options["imap", "x-connection_per_folder"] = True
+        self.assertEqual(parallel_jobs([0, 1], True, True),
+                         [[(0, True, False, [("ham", False)], None),
+                           (0, True, False, [("spam", True)], None),
+                           (1, True, False, [("ham", False)], None),
+                           (1, True, False, [("spam", True)], None)],
+                          [(0, False, True, None, ["INBOX"]),
+                           (0, False, True, None, ["other"]),
+                           (1, False, True, None, ["INBOX"]),
+                           (1, False, True, None, ["other"])]])
+        self.assertEqual(parallel_jobs([0], False, True),
+                         [[(0, False, True, None, ["INBOX"]),
+                           (0, False, True, None, ["other"])]])
+
+
 class SFBugsTest(BaseIMAPFilterTest):
     def test_802545(self):
         # Test that the filter selects each folder before expunging,
@@ -833,7 +1177,10 @@ def suite():
     for cls in (IMAPSessionTest,
                 IMAPMessageTest,
                 IMAPFolderTest,
+                IMAPWatcherTest,
                 IMAPFilterTest,
+                RunInParallelTest,
+                ParallelJobsTest,
                 SFBugsTest,
                 InterfaceTest,
                ):
@@ -334,8 +334,26 @@ def helper():
         proxy.send("retr %d\r\n" % i)
         while response.find('\n.\r\n') == -1:
             response = response + proxy.recv(1000)
+        assert response.startswith("+OK\r\n")
         assert response.find(options["Headers", "classification_header_name"]) >= 0
 
+    # Error responses are passed on as they arrived.
+    for command in ("retr 99", "top 99 0"):
+        proxy.send(command + "\r\n")
+        response = proxy.recv(1000)
+        assert response == "-ERR no such message\r\n", response
+
+    # And again, with the messages tokenized in worker threads.
+    state.tokenizerPool = Dibbler.WorkerPool(2)
+    for i in range(1, count+1):
+        response = ""
+        proxy.send("retr %d\r\n" % i)
+        while response.find('\n.\r\n') == -1:
+            response = response + proxy.recv(1000)
+        assert response.find(options["Headers", "classification_header_name"]) >= 0
+    state.tokenizerPool.close()
+    state.tokenizerPool = None
+
     # Check that the proxy times out when it should.  The consequence here
     # is that the first packet we receive from the proxy will contain a
     # partial message, so we assert for that.  At 100 characters per second
@@ -0,0 +1,143 @@
+# Test sb_xmlrpcserver script, and the locking it uses.
+
+import sys
+import time
+import threading
+import unittest
+import xmlrpclib
+import SimpleXMLRPCServer
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes.classifier import Classifier
+from spambayes.tokenizer import tokenize
+from spambayes.rwlock import RWLock, LockedClassifier, LockedObject
+
+import sb_xmlrpcserver
+
+# We borrow the test messages that test_sb_server uses.
+from test_sb_server import good1, spam1
+
+
+class RWLockTest(unittest.TestCase):
+    def hold(self, acquire, release, events, name, delay=0.2):
+        acquire()
+        try:
+            events.append(("start", name))
+            time.sleep(delay)
+            events.append(("end", name))
+        finally:
+            release()
+
+    def run_threads(self, lock, kinds):
+        events = []
+        threads = []
+        for i, kind in enumerate(kinds):
+            if kind == "r":
+                args = (lock.acquire_read, lock.release_read, events, i)
+            else:
+                args = (lock.acquire_write, lock.release_write, events, i)
+            thread = threading.Thread(target=self.hold, args=args)
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+        return events
+
+    def test_readers_share(self):
+        events = self.run_threads(RWLock(), "rrr")
+        self.assertEqual([e for e, n in events[:3]], ["start"] * 3)
+
+    def test_writer_excludes(self):
+        events = self.run_threads(RWLock(), "rwr")
+        # The writer waits for the first reader, and the second reader
+        # (which arrived while the writer was waiting) waits for it.
+        self.assertEqual(events, [("start", 0), ("end", 0),
+                                  ("start", 1), ("end", 1),
+                                  ("start", 2), ("end", 2)])
+
+    def test_not_shared(self):
+        events = self.run_threads(RWLock(False), "rr")
+        self.assertEqual(events, [("start", 0), ("end", 0),
+                                  ("start", 1), ("end", 1)])
+
+
+class LockedObjectTest(unittest.TestCase):
+    def test_one_at_a_time(self):
+        events = []
+        class Slow:
+            name = "slow"
+            def call(self, i):
+                events.append(("start", i))
+                time.sleep(0.1)
+                events.append(("end", i))
+        obj = LockedObject(Slow())
+        self.assertEqual(obj.name, "slow")
+        threads = [threading.Thread(target=obj.call, args=(i,))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(0, 6, 2):
+            self.assertEqual(events[i][0], "start")
+            self.assertEqual(events[i + 1], ("end", events[i][1]))
+
+
+class XMLRPCServerTest(unittest.TestCase):
+    def setUp(self):
+        bayes = LockedClassifier(Classifier())
+        bayes.learn(tokenize(good1), False)
+        bayes.learn(tokenize(spam1), True)
+        self.hammie = sb_xmlrpcserver.XMLHammie(bayes, 'c')
+        self.server = sb_xmlrpcserver.ThreadedXMLRPCServer(
+            ("127.0.0.1", 0), SimpleXMLRPCServer.SimpleXMLRPCRequestHandler,
+            logRequests=False)
+        self.server.register_instance(self.hammie)
+        self.server.register_multicall_functions()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.proxy = xmlrpclib.ServerProxy("http://127.0.0.1:%d/" %
+                                           self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_score_many(self):
+        expected = [self.hammie.score(good1), self.hammie.score(spam1)]
+        self.assertEqual(self.proxy.score_many([good1, spam1]), expected)
+        self.assert_(expected[0] < 0.5 < expected[1])
+
+    def test_filter_many(self):
+        results = self.proxy.filter_many([xmlrpclib.Binary(spam1),
+                                          xmlrpclib.Binary(good1)])
+        self.assertEqual(len(results), 2)
+        self.assert_("spam" in results[0].data)
+        self.assert_("ham" in results[1].data)
+
+    def test_multicall(self):
+        multicall = xmlrpclib.MultiCall(self.proxy)
+        multicall.score(good1)
+        multicall.score(spam1)
+        multicall.filter(xmlrpclib.Binary(spam1))
+        results = list(multicall())
+        self.assertEqual(results[:2], [self.hammie.score(good1),
+                                       self.hammie.score(spam1)])
+        self.assert_("spam" in results[2].data)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (RWLockTest,
+                LockedObjectTest,
+                XMLRPCServerTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
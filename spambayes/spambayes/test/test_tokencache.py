@@ -0,0 +1,195 @@
+# Test the spambayes.tokencache module.
+
+import os
+import sys
+import threading
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+import email
+from email.MIMEText import MIMEText
+
+from spambayes import tokenizer
+from spambayes import tokencache
+from spambayes import classifier
+from spambayes.message import SBHeaderMessage
+from spambayes.Options import options
+
+def make_message(body="Hello there, this is a test message.\n"):
+    msg = MIMEText(body)
+    msg["Subject"] = "A test"
+    msg["From"] = "someone@example.com"
+    msg["To"] = "someone.else@example.org"
+    return msg.as_string()
+
+class StripTest(unittest.TestCase):
+    def test_nothing_to_strip(self):
+        text = make_message()
+        self.assert_(tokencache.strip_sb_headers(text) is text)
+
+    def test_strip(self):
+        text = make_message()
+        head, body = text.split("\n\n", 1)
+        name = options["Headers", "evidence_header_name"]
+        headed = "%s\n%s: 'a': 0.01;\n\t'b': 0.99\nX-Other: yes\n\n%s" % \
+                 (head, name, body)
+        expected = "%s\nX-Other: yes\n\n%s" % (head, body)
+        self.assertEqual(tokencache.strip_sb_headers(headed), expected)
+        crlf = headed.replace("\n", "\r\n")
+        self.assertEqual(tokencache.strip_sb_headers(crlf), expected)
+
+    def test_body_untouched(self):
+        name = options["Headers", "classification_header_name"]
+        text = make_message("%s: spam\n" % (name,))
+        self.assertEqual(tokencache.strip_sb_headers(text), text)
+
+
+class TokenCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = tokencache.TokenCache(4)
+        self.saved = options["Tokenizer", "mine_received_headers"]
+
+    def tearDown(self):
+        options["Tokenizer", "mine_received_headers"] = self.saved
+
+    def test_same_tokens(self):
+        text = make_message()
+        expected = list(tokenizer.tokenize(text))
+        self.assertEqual(self.cache.tokenize(text), expected)
+        self.assertEqual(self.cache.tokenize(text), expected)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_sb_headers_ignored(self):
+        # A message classified by the proxy, and then read back from its
+        # cache, is the same message.
+        text = make_message().replace("\n", "\r\n")
+        msg = email.message_from_string(text, _class=SBHeaderMessage)
+        tokens = self.cache.tokenize(msg)
+        msg.addSBHeaders(0.99, [("*H*", 0.0), ("*S*", 0.98)])
+        cached = email.message_from_string(msg.as_string(),
+                                           _class=SBHeaderMessage)
+        self.assertEqual(self.cache.tokenize(cached), tokens)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # And the tokens are those of the message without the headers.
+        cache = tokencache.TokenCache(4)
+        self.assertEqual(cache.tokenize(cached), tokens)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_lru(self):
+        texts = [make_message("message number %d\n" % (i,))
+                 for i in range(5)]
+        for text in texts[:4]:
+            self.cache.tokenize(text)
+        self.cache.tokenize(texts[0])
+        self.cache.tokenize(texts[4])
+        self.assert_(len(self.cache.entries) <= 4)
+        self.cache.tokenize(texts[0])
+        self.assertEqual(self.cache.hits, 2)
+        self.cache.tokenize(texts[1])
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_options_change(self):
+        text = make_message()
+        self.cache.tokenize(text)
+        options["Tokenizer", "mine_received_headers"] = not self.saved
+        self.cache.tokenize(text)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_returns_copy(self):
+        text = make_message()
+        self.cache.tokenize(text).append("extra")
+        self.assert_("extra" not in self.cache.tokenize(text))
+
+
+class SlurpTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = options["URLRetriever", "x-slurp_urls"]
+        options["URLRetriever", "x-slurp_urls"] = True
+        # The URL stripper is chosen when the tokenizer is imported.
+        self.stripper = tokenizer.crack_all.im_self
+        self.strippers = self.stripper.strippers[:]
+        self.stripper.strippers[1] = tokenizer.SlurpingURLStripper()
+        self.cache = tokencache.TokenCache(4)
+
+    def tearDown(self):
+        options["URLRetriever", "x-slurp_urls"] = self.saved
+        self.stripper.strippers[:] = self.strippers
+        classifier.set_slurp_urls([])
+
+    def test_slurp_urls(self):
+        # A hit gives the classifier the URLs of the message, not those
+        # of the one tokenized before it.
+        a = make_message("See http://a.example.com/page now.\n")
+        b = make_message("See http://b.example.com/page now.\n")
+        for text, url in ((a, "a"), (b, "b"), (a, "a")):
+            self.cache.tokenize(text)
+            urls = [("http", url + ".example.com/page")]
+            self.assertEqual(classifier.get_slurp_urls(), urls)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        self.cache.tokenize(make_message())
+        self.assertEqual(classifier.get_slurp_urls(), [])
+
+    def test_threads(self):
+        # Each thread has the URLs of the message it tokenized.
+        results = {}
+        def tokenize(name):
+            for i in range(20):
+                self.cache.tokenize(make_message(
+                    "See http://%s.example.com/%d now.\n" % (name, i)))
+                urls = classifier.get_slurp_urls()
+                if urls != [("http", "%s.example.com/%d" % (name, i))]:
+                    results[name] = urls
+                    return
+            results[name] = True
+        self.cache.tokenize(make_message("See http://main.example.com/\n"))
+        threads = [threading.Thread(target=tokenize, args=(name,))
+                   for name in ("a", "b", "c")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {"a" : True, "b" : True, "c" : True})
+        self.assertEqual(classifier.get_slurp_urls(),
+                         [("http", "main.example.com")])
+
+
+class DBTokenCacheTest(unittest.TestCase):
+    filename = "__test_tokencache.db"
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def test_persist(self):
+        text = make_message()
+        cache = tokencache.TokenCache(0, self.filename)
+        tokens = cache.tokenize(text)
+        cache.close()
+        cache = tokencache.TokenCache(0, self.filename)
+        self.assertEqual(cache.tokenize(text), tokens)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        cache.close()
+
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (StripTest,
+             TokenCacheTest,
+             SlurpTest,
+             )
+    from spambayes.port import bsddb
+    from spambayes.port import gdbm
+
+    if gdbm or bsddb:
+        clses += (DBTokenCacheTest,)
+    else:
+        print "Skipping dbm tests, no dbm module available"
+
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
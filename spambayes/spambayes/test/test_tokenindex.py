@@ -0,0 +1,115 @@
+# Test the token index used to find words by prefix or pattern.
+
+import os
+import re
+import sys
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes.classifier import Classifier
+from spambayes.storage import PickledClassifier
+from spambayes.tokenindex import TokenIndex, literal_prefix, find_words
+
+
+class TokenIndexTest(unittest.TestCase):
+    def test_prefix(self):
+        index = TokenIndex(["subject:free", "free", "from:addr:example",
+                            "subject:hello", "frees"])
+        self.assertEqual(list(index.prefix("free")), ["free", "frees"])
+        self.assertEqual(list(index.prefix("subject:")),
+                         ["subject:free", "subject:hello"])
+        self.assertEqual(list(index.prefix("nothing")), [])
+        self.assertEqual(len(list(index.prefix())), 5)
+
+    def test_changes(self):
+        index = TokenIndex(["a", "c"])
+        index.add("b")
+        index.add("d")
+        index.remove("c")
+        # Adding a word that is already there doesn't duplicate it.
+        index.add("a")
+        self.assertEqual(list(index.prefix()), ["a", "b", "d"])
+        index.remove("b")
+        index.add("b")
+        index.add("e")
+        index.remove("e")
+        self.assertEqual(list(index.prefix()), ["a", "b", "d"])
+
+
+class LiteralPrefixTest(unittest.TestCase):
+    def test_literal_prefix(self):
+        self.assertEqual(literal_prefix("subject:fr.*"), "subject:fr")
+        self.assertEqual(literal_prefix(re.escape("url:") + ".*"), "url:")
+        self.assertEqual(literal_prefix("ab*"), "a")
+        self.assertEqual(literal_prefix("(ab)c"), "")
+        self.assertEqual(literal_prefix("a|b"), "")
+
+    def test_ignore_case(self):
+        self.assertEqual(literal_prefix("url:x", re.IGNORECASE), "")
+        self.assertEqual(literal_prefix("1:x", re.IGNORECASE), "1:")
+
+    def test_search(self):
+        self.assertEqual(literal_prefix("free", search=True), "")
+        self.assertEqual(literal_prefix("^free", search=True), "free")
+
+
+class FindWordsTest(unittest.TestCase):
+    def setUp(self):
+        self.bayes = Classifier()
+        self.bayes.learn(["free", "freedom", "money", "subject:free"], True)
+        self.bayes.learn(["meeting", "freely", "subject:meeting"], False)
+
+    def test_find_words(self):
+        self.assertEqual(list(find_words(self.bayes, re.compile("free"))),
+                         ["free", "freedom", "freely"])
+        self.assertEqual(list(find_words(self.bayes, re.compile("free"),
+                                         search=True)),
+                         ["free", "freedom", "freely", "subject:free"])
+        self.assertEqual(list(find_words(self.bayes, re.compile(".*ee"),
+                                         2)),
+                         ["free", "freedom"])
+
+    def test_training(self):
+        # The index is made by the first search, and then kept up to date.
+        self.assertEqual(list(find_words(self.bayes, re.compile("m"))),
+                         ["meeting", "money"])
+        self.bayes.learn(["mortgage"], True)
+        self.bayes.unlearn(["meeting", "freely", "subject:meeting"], False)
+        self.assertEqual(list(find_words(self.bayes, re.compile("m"))),
+                         ["money", "mortgage"])
+
+    def test_reload(self):
+        # Words removed by another process are gone from the index once
+        # the database is loaded again.
+        filename = "__test_tokenindex.pik"
+        try:
+            bayes = PickledClassifier(filename)
+            bayes.learn(["free", "freedom", "money"], True)
+            bayes.store()
+            self.assertEqual(list(find_words(bayes, re.compile("free"))),
+                             ["free", "freedom"])
+            other = PickledClassifier(filename)
+            other.unlearn(["free", "freedom", "money"], True)
+            other.store()
+            bayes.load()
+            self.assertEqual(list(find_words(bayes, re.compile("free"))),
+                             [])
+        finally:
+            for name in (filename, filename + ".lock"):
+                if os.path.exists(name):
+                    os.remove(name)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (TokenIndexTest,
+                LiteralPrefixTest,
+                FindWordsTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,207 @@
+# Test the spambayes.tokenizer module.
+
+import sys
+import random
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from email.MIMEText import MIMEText
+from email.MIMEImage import MIMEImage
+from email.MIMEMultipart import MIMEMultipart
+from email.MIMEBase import MIMEBase
+
+from spambayes import tokenizer
+from spambayes.Options import options
+
+class CombinedStripperTest(unittest.TestCase):
+    # The combined stripper must give exactly the same text and tokens as
+    # running the crackers one after the other.
+    def setUp(self):
+        self.stripper = tokenizer.crack_all.im_self
+
+    def check(self, text):
+        self.assertEqual(self.stripper.analyze(text),
+                         self.stripper.sequential(text), repr(text))
+
+    def test_nothing_to_strip(self):
+        text = "just some plain text, nothing special at all\n"
+        self.assertEqual(self.stripper.analyze(text), (text, []))
+
+    def test_each_kind(self):
+        for text in ("see http://www.example.com/a/b.html now",
+                     "or www.example.org, or ftp://ftp.example.net/x",
+                     "<html><style type=text/css>p {}</style>hi</html>",
+                     "a<!-- hidden -->b<comment>also hidden</comment>c",
+                     "x<noframes>no frames here</noframes>y",
+                     "text\nbegin 644 money.txt\nM9F]O\n`\nend\nmore\n"):
+            self.check(text)
+
+    def test_nested(self):
+        # URLs inside later sections still produce tokens.
+        self.check("a<!-- http://example.com/hidden -->b")
+        self.check("<style>@import url(http://example.com/s.css);</style>")
+        # Sections that start inside an earlier stripper's section.
+        self.check("<!--[if mso]><style>p {}</style><![endif]-->text")
+        self.check("<style><!-- p {} --></style>text")
+
+    def test_glued(self):
+        # Removing a URL can create a section start that wasn't there.
+        self.check("<http://a.b/c style<style>a</style> tail")
+        self.check("<http://a.b/c !-- hidden --> tail")
+        self.check("<noframeshttp://a.b/c>q</noframes> end")
+        # Only the style stripper's view has the glued start; by the end
+        # the comment after it has gone too.
+        self.check('"<\n stylehttp://x.y/<!--zftp.x-->y://begin 600 a.b\n'
+                   '</style>')
+
+    def test_unterminated(self):
+        self.check("a<!-- never closed http://example.com/ <style>x")
+        self.check("<style>p {} http://example.com/")
+
+    def test_random(self):
+        fragments = ["<", ">", "sty", "le>", "<style>", "</style>", "<!-",
+                     "-->", "<!-- x ", "<comment>", "</comment>",
+                     "<noframes>", "</noframes>", "http://a.b/c",
+                     "www.x.com", "ftp.y.org/z", "https://", " ", "\n",
+                     "\"", "foo", "begin ", "begin 644 f\n", "M9F]O\n",
+                     "end\n", "<a href=\"http://e.f/g\">"]
+        rand = random.Random(42)
+        for i in range(5000):
+            self.check("".join([rand.choice(fragments)
+                                for j in range(rand.randint(1, 14))]))
+
+
+class PayloadTest(unittest.TestCase):
+    def parts(self, data):
+        for encoding in ("base64", "quoted-printable", "7bit"):
+            part = MIMEText(data)
+            del part["Content-Transfer-Encoding"]
+            part["Content-Transfer-Encoding"] = encoding
+            if encoding == "base64":
+                part.set_payload(data.encode("base64"))
+            elif encoding == "quoted-printable":
+                part.set_payload(data.encode("quopri"))
+            yield part
+
+    def test_size(self):
+        data = "".join([chr(i % 128) for i in range(100000)])
+        for part in self.parts(data):
+            decoded = len(part.get_payload(decode=True))
+            size = tokenizer.payload_size(part)
+            if part["Content-Transfer-Encoding"] == "quoted-printable":
+                self.assert_(decoded <= size)
+            else:
+                self.assertEqual(decoded, size)
+        part = MIMEImage("GIF89a" + "\0" * 5000, "gif")
+        self.assertEqual(tokenizer.payload_size(part), 5006)
+
+    def test_prefix(self):
+        data = "".join([chr(i % 128) for i in range(100000)])
+        for part in self.parts(data):
+            for n in (1, 5, 100, 1000):
+                prefix = tokenizer.payload_prefix(part, n)
+                self.assert_(len(prefix) >= n)
+                self.assert_(data.startswith(prefix))
+        short = MIMEText("short")
+        self.assertEqual(tokenizer.payload_prefix(short, 1000), "short")
+        self.assertEqual(tokenizer.payload_prefix(MIMEMultipart(), 10),
+                         None)
+
+
+class PartIndexTest(unittest.TestCase):
+    def setUp(self):
+        msg = MIMEMultipart()
+        msg.attach(MIMEText("plain text"))
+        msg.attach(MIMEText("<p>html</p>", "html"))
+        msg.attach(MIMEImage("GIF89a" + "\0" * 100, "gif"))
+        octet = MIMEBase("application", "octet-stream")
+        octet.set_payload("MZ" + "\0" * 100)
+        msg.attach(octet)
+        self.msg = tokenizer.get_message(msg.as_string())
+        self.index = tokenizer.PartIndex(self.msg)
+
+    def test_kinds(self):
+        index = self.index
+        self.assertEqual(index.all, list(self.msg.walk()))
+        text = tokenizer.textparts(self.msg)
+        self.assertEqual(index.text, [part for part in self.msg.walk()
+                                      if part in text])
+        self.assertEqual(index.image, tokenizer.imageparts(self.msg))
+        self.assertEqual(set(index.octet), tokenizer.octetparts(self.msg))
+
+    def test_payload_cached(self):
+        part = self.index.image[0]
+        payload = self.index.payload(part)
+        self.assertEqual(payload, part.get_payload(decode=True))
+        self.assert_(self.index.payload(part) is payload)
+        self.assertEqual(self.index.size(part), len(payload))
+        self.assertEqual(self.index.prefix(part, 3), payload)
+
+
+class LimitsTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = [options["Tokenizer", name] for name in
+                      ("x-max_part_bytes", "x-max_message_bytes",
+                       "x-max_body_tokens")]
+        msg = MIMEMultipart()
+        msg.attach(MIMEText("first " * 1000))
+        msg.attach(MIMEText("second " * 1000))
+        self.msg = msg.as_string()
+
+    def tearDown(self):
+        self.set_limits(*self.saved)
+
+    def set_limits(self, part_bytes, message_bytes, body_tokens):
+        options["Tokenizer", "x-max_part_bytes"] = part_bytes
+        options["Tokenizer", "x-max_message_bytes"] = message_bytes
+        options["Tokenizer", "x-max_body_tokens"] = body_tokens
+
+    def body_tokens(self):
+        tokenize_body = tokenizer.global_tokenizer.tokenize_body
+        msg = tokenizer.get_message(self.msg)
+        return list(tokenize_body(msg))
+
+    def test_no_limits(self):
+        self.set_limits(0, 0, 0)
+        tokens = self.body_tokens()
+        self.assertEqual(tokens.count("first"), 1000)
+        self.assertEqual(tokens.count("second"), 1000)
+        self.assertEqual([t for t in tokens if t.startswith("truncated:")],
+                         [])
+
+    def test_part_bytes(self):
+        self.set_limits(600, 0, 0)
+        tokens = self.body_tokens()
+        self.assert_(tokens.count("first") <= 100)
+        self.assert_(tokens.count("second") <= 86)
+        # Both parts are between 2**12.5 and 2**13.5 bytes.
+        self.assertEqual(tokens.count("truncated:part-size:2**13"), 2)
+
+    def test_message_bytes(self):
+        self.set_limits(0, 3000, 0)
+        tokens = self.body_tokens()
+        self.assertEqual(tokens.count("first"), 500)
+        self.assertEqual(tokens.count("second"), 0)
+        self.assertEqual(tokens.count("truncated:message"), 1)
+
+    def test_body_tokens(self):
+        self.set_limits(0, 0, 10)
+        tokens = self.body_tokens()
+        self.assertEqual(len(tokens), 11)
+        self.assertEqual(tokens[-1], "truncated:tokens")
+
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (CombinedStripperTest,
+                PayloadTest,
+                PartIndexTest,
+                LimitsTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,107 @@
+# Test the tokenprofile module.
+
+import sys
+import unittest
+import StringIO
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from email.MIMEText import MIMEText
+
+from spambayes import tokenizer
+from spambayes.tokenprofile import TokenizerProfiler, MessageProfile, \
+     profiler
+
+
+def make_message():
+    msg = MIMEText("""<html><style>p {}</style>
+Visit http://www.example.com/offer now.
+<!-- hidden words -->Cheap stuff.</html>""", "html")
+    msg["Subject"] = "An offer"
+    msg["From"] = "someone@example.com"
+    return msg.as_string()
+
+
+class TokenizerProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.enabled = profiler.enabled
+        profiler.enabled = True
+        profiler.reset()
+
+    def tearDown(self):
+        profiler.enabled = self.enabled
+        profiler.reset()
+
+    def test_stages(self):
+        message = make_message()
+        tokens = list(tokenizer.tokenize(message))
+        list(tokenizer.tokenize(message))
+        self.assertEqual(profiler.num_messages, 2)
+        stages = profiler.stages()
+        for stage in ("get_message", "headers", "decode", "crackers",
+                      "crack_urls", "crack_html_style",
+                      "crack_html_comment", "tokenize_text"):
+            self.assert_(stage in stages, stage)
+        # The stages are in pipeline order.
+        self.assert_(stages.index("crackers") < stages.index("crack_urls")
+                     < stages.index("tokenize_text"))
+        rows = dict([(row[0], row[1:]) for row in profiler.summary()])
+        # Every stage is recorded once per message.
+        self.assertEqual(rows["headers"][0], 2)
+        # Each stripper's tokens are counted separately.
+        url_tokens = [t for t in tokens if t.startswith("url:") or
+                      t.startswith("proto:")]
+        self.assertEqual(rows["crack_urls"][4], 2 * len(url_tokens))
+        self.assertEqual(rows["crack_html_style"][4], 0)
+
+    def test_crackers(self):
+        # Profiling the combined stripper doesn't change what it does,
+        # whether it walks the text or falls back to the strippers.
+        stripper = tokenizer.crack_all.im_self
+        for text in ("a<!-- http://example.com/hidden -->b",
+                     "<http://a.b/c style<style>a</style> tail"):
+            prof = MessageProfile(profiler)
+            self.assertEqual(stripper.analyze(text, prof),
+                             stripper.analyze(text))
+            self.assert_(prof.tokens["crack_urls"] > 0)
+            self.assert_(prof.times["crackers"] >= 0)
+
+    def test_unfinished(self):
+        # A message whose tokens aren't all used is still recorded.
+        tokens = tokenizer.tokenize(make_message())
+        tokens.next()
+        tokens.close()
+        self.assertEqual(profiler.num_messages, 1)
+
+    def test_display(self):
+        list(tokenizer.tokenize(make_message()))
+        stream = StringIO.StringIO()
+        profiler.display(stream=stream)
+        output = stream.getvalue()
+        self.assert_(output.startswith("1 messages profiled\n"))
+        self.assert_("-> <stat> crack_urls: milliseconds per message"
+                     in output)
+        self.assert_("-> <stat> crack_urls: tokens per message" in output)
+        stream = StringIO.StringIO()
+        profiler.display(stream=stream, histograms=False)
+        self.assert_("<stat>" not in stream.getvalue())
+        self.assertEqual(stream.getvalue(),
+                         profiler.as_text(histograms=False))
+
+    def test_disabled(self):
+        profiler.enabled = False
+        list(tokenizer.tokenize(make_message()))
+        self.assertEqual(profiler.num_messages, 0)
+        self.assertEqual(TokenizerProfiler().stages(), [])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (TokenizerProfilerTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,190 @@
+# Test the URL slurping code, against a local HTTP server.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes import urlslurp
+from spambayes import classifier
+from spambayes.classifier import Classifier
+from spambayes.safepickle import pickle_write
+from spambayes.Options import options
+
+# path -> (seconds to take, content type, page); paths not listed are 404s.
+PAGES = {
+    "/page" : (0.0, "text/html", "<html><body>cheap pills</body></html>"),
+    "/slow" : (1.0, "text/html", "<html><body>slow page</body></html>"),
+    "/picture" : (0.0, "image/png", "not really a png"),
+    }
+WORDS = ("alpha", "bravo", "charlie", "delta")
+for i in range(4):
+    PAGES["/page%d" % (i,)] = (0.3, "text/html",
+                               "<html><body>%s</body></html>" % (WORDS[i],))
+
+class PageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path not in PAGES:
+            self.send_error(404)
+            return
+        delay, content_type, page = PAGES[self.path]
+        time.sleep(delay)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, *args):
+        pass
+
+class PageServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                           PageHandler)
+        self.requests = []
+
+
+class BadURLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "bad_urls.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_expiry(self):
+        cache = urlslurp.BadURLCache(self.filename, 60)
+        now = time.time()
+        cache.add("www.example.com/a", "url:http_404", now)
+        self.assertEqual(cache.get("www.example.com/a", now + 30),
+                         "url:http_404")
+        self.assertEqual(cache.get("www.example.com/a", now + 61), None)
+        self.assertEqual(cache.get("www.example.com/b", now), None)
+        cache.close()
+
+    def test_persist(self):
+        cache = urlslurp.BadURLCache(self.filename, 60)
+        cache.add("www.example.com/a", "url:http_404")
+        cache.add("www.example.com/b", "url:non_html", time.time() - 120)
+        cache.add("www.example.com/a", "url:unknown_error")
+        cache.close()
+        cache = urlslurp.BadURLCache(self.filename, 60)
+        self.assertEqual(cache.get("www.example.com/a"), "url:unknown_error")
+        self.failIf("www.example.com/b" in cache)
+        self.assertEqual((len(cache), cache.dead), (1, 2))
+        cache.compact()
+        self.assertEqual(len(open(self.filename).readlines()), 1)
+        cache.close()
+
+    def test_import_pickles(self):
+        bad_name = os.path.join(self.dir, "bad_urls.pck")
+        http_name = os.path.join(self.dir, "http_error_urls.pck")
+        pickle_write(bad_name, {"url:non_resolving" : ("nosuch.example.com",),
+                                "url:non_html" : (),
+                                "url:unknown_error" : ()})
+        pickle_write(http_name, {"www.example.com/a" : "url:http_403"})
+        cache = urlslurp.BadURLCache(self.filename, 60)
+        cache.import_pickles(bad_name, http_name)
+        self.assertEqual(cache.get("nosuch.example.com"), "url:non_resolving")
+        self.assertEqual(cache.get("www.example.com/a"), "url:http_403")
+        self.failIf(os.path.exists(bad_name))
+        self.assert_(os.path.exists(http_name + ".old"))
+        cache.close()
+
+
+class SlurpTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = {}
+        for name in ("x-cache_directory", "x-only_slurp_base"):
+            self.saved[name] = options["URLRetriever", name]
+        options["URLRetriever", "x-cache_directory"] = self.dir
+        options["URLRetriever", "x-only_slurp_base"] = False
+        self.server = PageServer()
+        self.host = "127.0.0.1:%d" % (self.server.server_address[1],)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.classifier = Classifier()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.classifier.bad_urls.close()
+        for name, value in self.saved.items():
+            options["URLRetriever", name] = value
+        shutil.rmtree(self.dir)
+
+    def urls(self, *paths):
+        return [("http", self.host + path) for path in paths]
+
+    def test_slurp(self):
+        tokens = self.classifier.slurp_many(self.urls("/page", "/missing",
+                                                      "/picture"))
+        self.assert_("pills" in tokens)
+        self.assert_("url:http_404" in tokens)
+        self.assert_("url:non_html" in tokens)
+        self.assertEqual(self.classifier.slurp("http", ""),
+                         ["url:non_resolving"])
+        # Everything comes from the caches the second time.
+        requests = len(self.server.requests)
+        self.assertEqual(self.classifier.slurp_many(
+            self.urls("/page", "/missing", "/picture")), tokens)
+        self.assertEqual(len(self.server.requests), requests)
+
+    def test_concurrent(self):
+        start = time.time()
+        tokens = self.classifier.slurp_many(
+            self.urls("/page0", "/page1", "/page2", "/page3"), 5.0)
+        self.assert_(time.time() - start < 0.9)
+        for word in WORDS:
+            self.assert_(word in tokens)
+
+    def test_deadline(self):
+        start = time.time()
+        tokens = self.classifier.slurp_many(self.urls("/slow", "/page"), 0.2)
+        self.assert_(time.time() - start < 0.6)
+        self.assert_("pills" in tokens)
+        self.failIf("slow" in tokens)
+        self.assertEqual(self.classifier.slurp_pending, 1)
+        # The page is cached when it arrives.
+        time.sleep(1.2)
+        tokens = self.classifier.slurp_many(self.urls("/slow"), 0.2)
+        self.assert_("slow" in tokens)
+        self.assertEqual(self.server.requests.count("/slow"), 1)
+
+    def test_spamprob_urls(self):
+        # The URLs given are retrieved, not those of whatever message
+        # this thread tokenized last.
+        classifier.set_slurp_urls(self.urls("/other"))
+        try:
+            self.classifier.slurping_spamprob(["a", "b"], True,
+                                              self.urls("/page"))
+        finally:
+            classifier.set_slurp_urls([])
+        self.assert_("/page" in self.server.requests)
+        self.failIf("/other" in self.server.requests)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (BadURLCacheTest,
+                SlurpTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
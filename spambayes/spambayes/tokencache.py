@@ -0,0 +1,335 @@
+#! /usr/bin/env python
+
+"""tokencache.py - reuse token lists for messages seen before.
+
+Classes:
+    TokenCache - an LRU cache of token lists, with an optional dbm store.
+
+Functions:
+    tokenize - tokenizer.tokenize, but returning a list and using the
+               cache configured in [Storage].
+    strip_sb_headers - remove the headers SpamBayes adds from message text.
+    close - write out and close the global cache.
+
+Abstract:
+
+    Several applications tokenize the same message more than once.
+    sb_server classifies a message when it is retrieved, and tokenizes it
+    again when the user trains on it from the review page; sb_imapfilter
+    tokenizes messages again on every training pass; and the test driver
+    tokenizes every message once per cross-validation fold.  Tokenizing is
+    by far the most expensive part of scoring or training, so this module
+    keeps the token lists around, keyed by an md5 digest of the message
+    text.
+
+    The key is computed from the message with the SpamBayes headers
+    (classification, id, evidence, score, trained and so on) removed and
+    the line endings normalised, so that a message classified by the POP3
+    proxy and later read back from the proxy's cache (with headers added
+    and CRLF line endings) is recognised as the same message.  The tokens
+    stored are always those of the message without the SpamBayes headers,
+    so a hit gives the same result as a miss.  Subject notations are not
+    removed; a notated message is simply a different message.
+
+    The values of all the [Tokenizer] and [URLRetriever] options (and the
+    SpamBayes version) are folded into a signature, which is checked on
+    every lookup.  When any of them change, the cached token lists are
+    thrown away, in memory and on disk.
+
+    When [URLRetriever] x-slurp_urls is on, tokenizing a message also
+    leaves its http URLs for the classifier to retrieve (see
+    classifier.get_slurp_urls).  These are cached with the tokens, and put
+    back on a hit, so that the classifier never retrieves the URLs of a
+    message tokenized earlier.
+
+    The in-memory cache holds [Storage] x-token_cache_size messages; when
+    it is full, the least recently used quarter is discarded.  If
+    [Storage] x-token_cache_file is set, token lists are also kept in a
+    dbm database of that name, so they survive restarts.  Both are off by
+    default.
+
+To Do:
+    o The on-disk store is not bounded; remove the file from time to time
+      if it grows too large.
+    o Suggestions?
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import sys
+import threading
+import cPickle as pickle
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+import spambayes
+from spambayes.Options import options
+from spambayes import tokenizer
+from spambayes import classifier
+
+# Sections whose options change the tokens generated for a message.
+TOKENIZER_SECTIONS = ("Tokenizer", "URLRetriever")
+
+# Key in the dbm store under which the options signature is kept.
+SIGNATURE_KEY = "saved options signature"
+
+# Part of the signature, so that entries stored in an older format are
+# thrown away.
+CACHE_FORMAT = 3
+
+_tokenizer_options = None
+
+def options_signature():
+    """Return a string that changes whenever any option that affects the
+    tokenizer does."""
+    global _tokenizer_options
+    if _tokenizer_options is None:
+        _tokenizer_options = [(sect, opt) for sect in TOKENIZER_SECTIONS
+                              for opt in options.options_in_section(sect)]
+    values = [CACHE_FORMAT, spambayes.__version__]
+    for key in _tokenizer_options:
+        values.append(options[key])
+    return md5(repr(values)).hexdigest()
+
+def _get_slurp():
+    # The URLs the tokenizer left for the classifier to retrieve.
+    if not options["URLRetriever", "x-slurp_urls"]:
+        return None
+    return list(classifier.get_slurp_urls())
+
+def _set_slurp(slurp):
+    if slurp is not None:
+        classifier.set_slurp_urls(list(slurp))
+
+def _sb_header_names():
+    names = [options["Headers", "classification_header_name"],
+             options["Headers", "mailid_header_name"],
+             options["Headers", "classification_header_name"] + "-ID",
+             options["Headers", "thermostat_header_name"],
+             options["Headers", "evidence_header_name"],
+             options["Headers", "score_header_name"],
+             options["Headers", "trained_header_name"]]
+    return [name.lower() for name in names]
+
+def strip_sb_headers(text):
+    """Return text, with '\\n' line endings, and without any of the
+    headers that SpamBayes adds (see message.SBHeaderMessage.delSBHeaders).
+    """
+    return _strip_headers(text.replace("\r\n", "\n"))
+
+def _strip_headers(text):
+    # text must have '\n' line endings; it is returned unchanged (the same
+    # object) if there is nothing to remove.
+    i = text.find("\n\n")
+    if i == -1:
+        head, body = text, ""
+    else:
+        head, body = text[:i+1], text[i+1:]
+    lowered = head.lower()
+    names = [name for name in _sb_header_names()
+             if name + ":" in lowered]
+    if not names:
+        return text
+    lines = []
+    skipping = False
+    for line in head.splitlines(True):
+        if line[:1] in " \t":
+            # A continuation of the previous header.
+            if not skipping:
+                lines.append(line)
+            continue
+        name = line.split(":", 1)[0].strip().lower()
+        skipping = name in names
+        if not skipping:
+            lines.append(line)
+    return "".join(lines) + body
+
+
+class TokenCache(object):
+    def __init__(self, size=500, filename=None):
+        self.size = size
+        self.filename = filename
+        self.signature = options_signature()
+        self.hits = self.misses = 0
+        # The tokenizing is done without holding this, so several threads
+        # can tokenize at once.
+        self.lock = threading.Lock()
+        self._clear_memory()
+        self.db = None
+        if filename:
+            self._open_db(filename)
+
+    def _clear_memory(self):
+        # digest -> [last used tick, token list, slurp URLs]
+        self.entries = {}
+        self.tick = 0
+
+    def _open_db(self, filename):
+        from spambayes import dbmstorage
+        self.db = dbmstorage.open(filename, "c")
+        if self._db_get(SIGNATURE_KEY) != self.signature:
+            self._clear_db()
+
+    def _db_get(self, key):
+        # gdbm objects have no get() method.
+        try:
+            return self.db[key]
+        except KeyError:
+            return None
+
+    def _clear_db(self):
+        for key in self.db.keys():
+            del self.db[key]
+        self.db[SIGNATURE_KEY] = self.signature
+
+    def check_options(self):
+        """Throw away everything if the tokenizer options have changed
+        since the cached token lists were generated."""
+        signature = options_signature()
+        if signature != self.signature:
+            if options["globals", "verbose"]:
+                print >> sys.stderr, "tokenizer options changed, " \
+                      "clearing token cache"
+            self.signature = signature
+            self._clear_memory()
+            if self.db is not None:
+                self._clear_db()
+
+    def tokenize(self, obj):
+        """Return the list of tokens for obj (a string or an
+        email.Message.Message), from the cache if possible."""
+        if isinstance(obj, str):
+            text = obj
+        elif hasattr(obj, "as_string"):
+            text = obj.as_string()
+        else:
+            # A file; tokenizer.get_message will read it.
+            return list(tokenizer.tokenize(obj))
+        text = text.replace("\r\n", "\n")
+        stripped = _strip_headers(text)
+        key = md5(stripped).hexdigest()
+
+        entry = self._lookup(key)
+        if entry is not None:
+            tokens, slurp = entry
+            _set_slurp(slurp)
+            return list(tokens)
+        if stripped is text and not isinstance(obj, str):
+            # Nothing to remove, so there's no need to parse the
+            # message again.
+            tokens = list(tokenizer.tokenize(obj))
+        else:
+            tokens = list(tokenizer.tokenize(stripped))
+        slurp = _get_slurp()
+        self.lock.acquire()
+        try:
+            if self.db is not None:
+                self.db[key] = pickle.dumps((tokens, slurp), 1)
+            self._remember(key, tokens, slurp)
+        finally:
+            self.lock.release()
+        return list(tokens)
+
+    def _lookup(self, key):
+        # Return the cached (tokens, slurp URLs) for key, or None
+        # (counting a miss).
+        self.lock.acquire()
+        try:
+            self.check_options()
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.tick += 1
+                entry[0] = self.tick
+                return entry[1], entry[2]
+            result = None
+            if self.db is not None:
+                data = self._db_get(key)
+                if data is not None:
+                    result = pickle.loads(data)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember(key, *result)
+            return result
+        finally:
+            self.lock.release()
+
+    def _remember(self, key, tokens, slurp):
+        if self.size <= 0:
+            return
+        if len(self.entries) >= self.size:
+            self._prune()
+        self.tick += 1
+        self.entries[key] = [self.tick, tokens, slurp]
+
+    def _prune(self):
+        """Discard the least recently used quarter of the entries."""
+        ticks = [entry[0] for entry in self.entries.values()]
+        ticks.sort()
+        cutoff = ticks[len(ticks) // 4]
+        for key, entry in self.entries.items():
+            if entry[0] <= cutoff:
+                del self.entries[key]
+
+    def clear(self):
+        self._clear_memory()
+        if self.db is not None:
+            self._clear_db()
+
+    def close(self):
+        if self.db is not None:
+            if hasattr(self.db, "sync"):
+                self.db.sync()
+            self.db.close()
+            self.db = None
+
+    def printStats(self, stream=None):
+        total = self.hits + self.misses
+        if total:
+            rate = 100.0 * self.hits / total
+        else:
+            rate = 0.0
+        print >> stream, "token cache: %d messages in memory, %d hits, " \
+              "%d misses (%.1f%% hit rate)" % (len(self.entries), self.hits,
+                                              self.misses, rate)
+
+
+# The cache used by tokenize(), created when first needed, and recreated
+# if the [Storage] options change.
+_cache = None
+
+def get_cache():
+    """Return the global TokenCache, or None if caching is disabled."""
+    global _cache
+    size = options["Storage", "x-token_cache_size"]
+    filename = options["Storage", "x-token_cache_file"] or None
+    if _cache is not None and (_cache.size != size or
+                               _cache.filename != filename):
+        close()
+    if _cache is None and (size > 0 or filename):
+        _cache = TokenCache(size, filename)
+        if filename:
+            import atexit
+            atexit.register(close)
+    return _cache
+
+def tokenize(obj):
+    """Like tokenizer.tokenize, but returns a list of tokens, reusing the
+    list generated for an earlier copy of the message if there is one."""
+    cache = get_cache()
+    if cache is None:
+        return list(tokenizer.tokenize(obj))
+    return cache.tokenize(obj)
+
+def close():
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
@@ -0,0 +1,135 @@
+"""tokenindex.py - find the words in a classifier's database quickly.
+
+Classes:
+    TokenIndex - a sorted list of words, which can be searched by prefix.
+
+Functions:
+    find_words - the words in a database that match a regular expression.
+    literal_prefix - what anything a regular expression matches starts with.
+
+Abstract:
+
+    Finding the words that match a pattern (as the web interface's word
+    query and contrib/spamcounts.py do) used to mean reading every word
+    in the database, every time.  A TokenIndex keeps the words sorted, so
+    that those with a given prefix can be found with a binary search.  A
+    classifier makes one the first time it is asked for words by prefix
+    (see Classifier._wordinfokeys_prefix), and keeps it up to date as it
+    is trained.  Words that are added or removed are only merged into the
+    sorted list when it is next searched, so that training stays cheap.
+    Training by another process that shares the database isn't seen until
+    the database is loaded again, so a word from the index may have gone
+    from the database by the time it is looked up.
+
+    find_words() works out what anything a regular expression matches
+    must start with, only looks at the words that start with that, and
+    stops as soon as it has found as many as are wanted.
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+from __future__ import generators
+
+import re
+import bisect
+import sre_parse
+import sre_constants
+
+
+class TokenIndex:
+    """A sorted list of words."""
+
+    def __init__(self, words=()):
+        self.words = list(words)
+        self.words.sort()
+        # Changes that haven't been merged into self.words yet.
+        self.added = {}
+        self.removed = {}
+
+    def add(self, word):
+        self.removed.pop(word, None)
+        self.added[word] = True
+
+    def remove(self, word):
+        self.added.pop(word, None)
+        self.removed[word] = True
+
+    def _merge(self):
+        if self.removed:
+            removed = self.removed
+            self.words = [w for w in self.words if w not in removed]
+            self.removed = {}
+        if self.added:
+            words = self.words
+            new_words = []
+            for word in self.added:
+                i = bisect.bisect_left(words, word)
+                if i == len(words) or words[i] != word:
+                    new_words.append(word)
+            # The list is mostly sorted already, which sort() is quick
+            # to take advantage of.
+            words.extend(new_words)
+            words.sort()
+            self.added = {}
+
+    def __len__(self):
+        self._merge()
+        return len(self.words)
+
+    def prefix(self, prefix=""):
+        """Iterate, in order, through the words that start with prefix."""
+        self._merge()
+        words = self.words
+        i = bisect.bisect_left(words, prefix)
+        while i < len(words) and words[i].startswith(prefix):
+            yield words[i]
+            i += 1
+
+
+def literal_prefix(pattern, flags=0, search=False):
+    """Return the text that anything the regular expression pattern
+    matches (with re.match, or, if search is true, re.search) must start
+    with, which may be empty."""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (sre_constants.error, OverflowError):
+        return ""
+    items = list(parsed)
+    if search:
+        # re.search can match anywhere, unless the pattern is anchored.
+        if not items or items[0] != (sre_constants.AT,
+                                     sre_constants.AT_BEGINNING) and \
+           items[0] != (sre_constants.AT, sre_constants.AT_BEGINNING_STRING):
+            return ""
+        items = items[1:]
+    prefix = []
+    for op, av in items:
+        if op != sre_constants.LITERAL or av > 255:
+            break
+        c = chr(av)
+        if flags & re.IGNORECASE and c.lower() != c.upper():
+            # The word could have this either way.
+            break
+        prefix.append(c)
+    return "".join(prefix)
+
+
+def find_words(classifier, regex, max_results=None, search=False):
+    """Iterate, in order, through the words in the classifier's database
+    that the compiled regular expression regex matches (from the start,
+    as regex.match does, or, if search is true, anywhere, as regex.search
+    does).  No more than max_results are found, unless that is None."""
+    prefix = literal_prefix(regex.pattern, regex.flags, search)
+    if search:
+        matches = regex.search
+    else:
+        matches = regex.match
+    found = 0
+    for word in classifier._wordinfokeys_prefix(prefix):
+        if max_results is not None and found >= max_results:
+            break
+        if matches(word):
+            yield word
+            found += 1
@@ -11,24 +11,35 @@ import email.Errors
 import re
 import math
 import os
+import bisect
 import binascii
+import quopri
 import urlparse
 import urllib
+import time
+import threading
 
 from spambayes import classifier
+from spambayes import tokenprofile
 from spambayes.Options import options
 
 from spambayes.mboxutils import get_message
 
+from spambayes import dnscache
 try:
-    from spambayes import dnscache
-    cache = dnscache.cache(cachefile=options["Tokenizer", "lookup_ip_cache"])
+    cache = dnscache.cache(cachefile=options["Tokenizer", "lookup_ip_cache"],
+                cachetype=options["Tokenizer", "x-lookup_ip_cache_type"],
+                maxAnswers=options["Tokenizer", "x-lookup_ip_cache_size"])
     cache.printStatsAtEnd = False
 except (IOError, ImportError):
     class cache:
         @staticmethod
         def lookup(*args):
             return []
+        @staticmethod
+        def lookup_many(requests, timeout):
+            return dict([((question, qType.upper()), [])
+                         for question, qType in requests])
 else:
     import atexit
     atexit.register(cache.close)
@@ -627,6 +638,123 @@ def imageparts(msg):
                   part.get_content_type().startswith('image/'),
                   msg.walk())
 
+# Decoding a multi-megabyte attachment just to find out how big it is, or
+# what its first few bytes are, is expensive.  payload_size() and
+# payload_prefix() work from the encoded payload where the transfer
+# encoding allows, and decode only as much as is needed.  Like
+# get_payload(decode=True), both give None for a multipart.  When they do
+# have to decode the whole payload, they use get_payload(part) if given
+# (e.g. PartIndex.payload, which remembers the result).
+
+def _transfer_encoding(part):
+    return part.get('content-transfer-encoding', '').lower()
+
+def payload_size(part, get_payload=None):
+    """Return (an estimate of) the size of part's decoded payload."""
+    if part.is_multipart():
+        return None
+    payload = part.get_payload()
+    if payload is None:
+        return None
+    cte = _transfer_encoding(part)
+    if cte == 'base64':
+        # Four characters of base64 make three bytes, less one for each
+        # '=' of padding.
+        n = len(payload)
+        for ws in " \t\r\n":
+            n -= payload.count(ws)
+        if n % 4 == 0:
+            return n // 4 * 3 - payload[-8:].count('=')
+    elif cte in ('', '7bit', '8bit', 'binary', 'quoted-printable'):
+        # Quoted-printable is (nearly) the size of what it encodes.
+        return len(payload)
+    return len(_decoded_payload(part, get_payload) or "")
+
+def payload_prefix(part, nbytes, get_payload=None):
+    """Return the start of part's decoded payload; at least nbytes bytes
+    of it (or all of it, if it's shorter)."""
+    if part.is_multipart():
+        return None
+    payload = part.get_payload()
+    cte = _transfer_encoding(part)
+    if payload is not None and len(payload) > 3 * nbytes + 1024:
+        if cte == 'base64':
+            need = (nbytes + 2) // 3 * 4
+            end = payload.find('\n', need + need // 16)
+            if end != -1:
+                chunk = ''.join(payload[:end].split())
+                chunk = chunk[:len(chunk) // 4 * 4]
+                if len(chunk) >= need:
+                    try:
+                        return binascii.a2b_base64(chunk)
+                    except binascii.Error:
+                        pass
+        elif cte == 'quoted-printable':
+            # At most three characters per byte, and a whole number of
+            # lines, so no escape or soft line break is cut in two.
+            end = payload.find('\n', 3 * nbytes)
+            if end != -1:
+                return quopri.decodestring(payload[:end + 1])
+        elif cte in ('', '7bit', '8bit', 'binary'):
+            return payload[:nbytes]
+    return _decoded_payload(part, get_payload)
+
+def _decoded_payload(part, get_payload=None):
+    if get_payload is None:
+        return part.get_payload(decode=True)
+    return get_payload(part)
+
+class PartIndex(object):
+    """The parts of a message, found in a single walk of it.
+
+    The tokenizer looks through a message's parts several times (for the
+    MIME headers of every part, and for octet-stream, image and text
+    parts), and images used to be decoded once to size them and again to
+    look inside them.  A PartIndex is built once per message, sorts the
+    parts by kind (each list is in walk order) and remembers decoded
+    payloads, so nothing is decoded twice.
+    """
+    def __init__(self, msg):
+        self.all = []
+        self.text = []
+        self.octet = []
+        self.image = []
+        self._decoded = {}
+        for part in msg.walk():
+            self.all.append(part)
+            ctype = part.get_content_type()
+            if ctype == 'application/octet-stream':
+                self.octet.append(part)
+            elif ctype.startswith('image/'):
+                self.image.append(part)
+            elif ctype.split('/')[0] == 'text':
+                self.text.append(part)
+
+    def payload(self, part):
+        """Return part.get_payload(decode=True), decoding it only once."""
+        # The parts are kept alive by self.all, so their ids are unique.
+        key = id(part)
+        try:
+            return self._decoded[key]
+        except KeyError:
+            payload = self._decoded[key] = part.get_payload(decode=True)
+            return payload
+
+    def size(self, part):
+        """Return (an estimate of) the size of part's decoded payload."""
+        if id(part) in self._decoded:
+            payload = self._decoded[id(part)]
+            if payload is None:
+                return None
+            return len(payload)
+        return payload_size(part, self.payload)
+
+    def prefix(self, part, nbytes):
+        """Return the start (at least nbytes) of part's decoded payload."""
+        if id(part) in self._decoded:
+            return self._decoded[id(part)]
+        return payload_prefix(part, nbytes, self.payload)
+
 has_highbit_char = re.compile(r"[\x80-\xff]").search
 
 # Cheap-ass gimmick to probabilistically find HTML/XML tags.
@@ -927,6 +1055,18 @@ class Stripper(object):
     # Breaking this into "FR" and "EE!" wasn't a real help <wink>.
     separator = ''  # a subclass can override if this isn't appropriate
 
+    # A regexp (source, VERBOSE) matching at least wherever find_start
+    # can match; CombinedStripper uses it to find where sections might
+    # start.  Subclasses that can be combined must set this.
+    anchor = None
+
+    # True if sections are just the start match (find_end matches at
+    # once), so a section can never contain another stripper's section.
+    inline = False
+
+    # The tokenprofile stage this stripper's time is charged to.
+    name = "crackers"
+
     def __init__(self, find_start, find_end):
         # find_start and find_end have signature
         #     string, int -> match_object
@@ -946,7 +1086,12 @@ class Stripper(object):
     # is optimized to return string.  It would actually slow this code down
     # to special-case these "do nothing" special cases at the Python level!
 
+    def prepare(self):
+        # Called before each text is analyzed.
+        pass
+
     def analyze(self, text):
+        self.prepare()
         i = 0
         retained = []
         pushretained = retained.append
@@ -989,6 +1134,9 @@ uuencode_begin_re = re.compile(r"""
 uuencode_end_re = re.compile(r"^end\s*\n", re.MULTILINE)
 
 class UUencodeStripper(Stripper):
+    anchor = r"begin\s"
+    name = "crack_uuencode"
+
     def __init__(self):
         Stripper.__init__(self, uuencode_begin_re.search,
                                 uuencode_end_re.search)
@@ -1032,6 +1180,11 @@ url_re = re.compile(r"""
 urlsep_re = re.compile(r"[;?:@&=+,$.]")
 
 class URLStripper(Stripper):
+    # Covers both url_re and url_fancy_re.
+    anchor = r"https?:// | ftp:// | ftp\. | www\."
+    inline = True
+    name = "crack_urls"
+
     def __init__(self):
         # The empty regexp matches anything at once.
         if options["Tokenizer", "x-fancy_url_recognition"]:
@@ -1075,12 +1228,8 @@ class URLStripper(Stripper):
                 pushclue("url:invalid-url")
             else:
                 if options["Tokenizer", "x-lookup_ip"]:
-                    ips = cache.lookup(netloc)
-                    if not ips:
-                        pushclue("url-ip:lookup error")
-                    else:
-                        for clue in gen_dotted_quad_clues("url-ip", ips):
-                            pushclue(clue)
+                    for clue in lookup_ip(netloc, "A", url_ip_clues):
+                        pushclue(clue)
 
                 # one common technique in bogus "please (re-)authorize yourself"
                 # scams is to make it appear as if you're visiting a valid
@@ -1124,17 +1273,22 @@ class URLStripper(Stripper):
 
 received_complaints_re = re.compile(r'\([a-z]+(?:\s+[a-z]+)+\)')
 
+def url_ip_clues(ips):
+    if ips is dnscache.PENDING:
+        return ["url-ip:lookup pending"]
+    if not ips:
+        return ["url-ip:lookup error"]
+    return list(gen_dotted_quad_clues("url-ip", ips))
+
 class SlurpingURLStripper(URLStripper):
     def __init__(self):
         URLStripper.__init__(self)
 
-    def analyze(self, text):
+    def prepare(self):
         # If there are no URLS, then we need to clear the
-        # wordstream, or whatever was there from the last message
+        # list, or whatever was there from the last message
         # will be used.
-        classifier.slurp_wordstream = None
-        # Continue as normal.
-        return URLStripper.analyze(self, text)
+        classifier.set_slurp_urls([])
 
     def tokenize(self, m):
         # XXX Note that the 'slurped' tokens are *always* trained
@@ -1151,7 +1305,11 @@ class SlurpingURLStripper(URLStripper):
         while guts and guts[-1] in '.:;?!/)':
             guts = guts[:-1]
 
-        classifier.slurp_wordstream = (proto, guts)
+        # Keep the URLs in the order they were last seen.
+        urls = classifier.get_slurp_urls()
+        if (proto, guts) in urls:
+            urls.remove((proto, guts))
+        urls.append((proto, guts))
         return tokens
 
 if options["URLRetriever", "x-slurp_urls"]:
@@ -1165,6 +1323,9 @@ html_style_start_re = re.compile(r"""
 """, re.VERBOSE)
 
 class StyleStripper(Stripper):
+    anchor = r"< \s* style\b"
+    name = "crack_html_style"
+
     def __init__(self):
         Stripper.__init__(self, html_style_start_re.search,
                                 re.compile(r"</style>").search)
@@ -1174,6 +1335,9 @@ crack_html_style = StyleStripper().analyze
 # Nuke HTML comments.
 
 class CommentStripper(Stripper):
+    anchor = r"<!-- | < \s* comment"
+    name = "crack_html_comment"
+
     def __init__(self):
         Stripper.__init__(self,
                           re.compile(r"<!--|<\s*comment\s*[^>]*>").search,
@@ -1183,6 +1347,9 @@ crack_html_comment = CommentStripper().analyze
 
 # Nuke stuff between <noframes> </noframes> tags.
 class NoframesStripper(Stripper):
+    anchor = r"< \s* noframes"
+    name = "crack_noframes"
+
     def __init__(self):
         Stripper.__init__(self,
                           re.compile(r"<\s*noframes\s*>").search,
@@ -1190,6 +1357,324 @@ class NoframesStripper(Stripper):
 
 crack_noframes = NoframesStripper().analyze
 
+# Running the crackers one after another means each one rescans the whole
+# text and (if it finds anything) builds a new copy of it.  For a big HTML
+# spam that adds up.  CombinedStripper walks the text once, taking the
+# sections of all the strippers in the order they appear (each stripper
+# has an "anchor", a cheap pattern matching wherever one of its sections
+# might start), and builds the residual text once.  The results must be
+# exactly what running the strippers in order produces, and that depends
+# on how the sections interact:  an earlier stripper sees sections of
+# later strippers that it should strip (e.g. a URL inside an HTML
+# comment), and removing a section can glue together text that a later
+# stripper then matches (e.g. "<" + URL + " style>").
+# The walk handles the common case of inline (URL) sections inside later
+# sections exactly, and falls back to the sequential strippers whenever
+# it notices anything else that could make a difference:
+#
+#     o the section of a later stripper contains an anchor of an earlier,
+#       non-inline stripper (for the first stripper, only a real start
+#       counts, since it sees the original text);
+#     o a section has no end (the stripper then gives up on the rest of
+#       the text);
+#     o removing the inline sections inside a section changes where that
+#       section starts or ends, or leaves an anchor of an earlier
+#       stripper that runs after an inline one;
+#     o the residual text contains an anchor of a stripper that runs
+#       after one that removed something.  Any start glued together by
+#       a removal leaves its anchor behind, so this catches them all.
+#
+# These are rare in real mail; test_tokenizer.py checks the two ways of
+# doing it against each other.
+
+class CombinedStripper(object):
+    def __init__(self, strippers):
+        # strippers are in the order they would be run in.
+        self.strippers = strippers
+        self.inline = [s.inline for s in strippers]
+        self.find_anchor = [re.compile(s.anchor, re.VERBOSE).search
+                            for s in strippers]
+        # Where the walk looks for the next section of each stripper.
+        # Searching for each stripper's anchor separately is much faster
+        # than searching for the union of them (sre can then skip ahead
+        # to the literal prefix), and an inline stripper's own start
+        # pattern is as cheap as its anchor.
+        self.find_next = []
+        for stripper, find_anchor in zip(strippers, self.find_anchor):
+            if stripper.inline:
+                self.find_next.append(stripper.find_start)
+            else:
+                self.find_next.append(find_anchor)
+        # How often the walk gave up; several threads may be counting.
+        self.fallbacks = 0
+        self.fallbacks_lock = threading.Lock()
+
+    def sequential(self, text, strippers=None):
+        if strippers is None:
+            strippers = self.strippers
+        tokens = []
+        for stripper in strippers:
+            text, new_tokens = stripper.analyze(text)
+            tokens.extend(new_tokens)
+        return text, tokens
+
+    def analyze(self, text, prof=tokenprofile.null_profile):
+        """Return (residual text, tokens).  If prof is profiling, the
+        time each stripper takes is charged to its own stage, and the
+        rest to "crackers"."""
+        for stripper in self.strippers:
+            stripper.prepare()
+        if prof.active:
+            return self._analyze_profiled(text, prof)
+        result = self._walk(text, self.strippers, self.find_next,
+                            self.find_anchor)
+        if result is None:
+            self._count_fallback()
+            return self.sequential(text)
+        return result
+
+    def _count_fallback(self):
+        self.fallbacks_lock.acquire()
+        try:
+            self.fallbacks += 1
+        finally:
+            self.fallbacks_lock.release()
+
+    def _analyze_profiled(self, text, prof):
+        start = prof.clock()
+        timed = [_TimedStripper(s, prof.clock) for s in self.strippers]
+        result = self._walk(text, timed,
+                            [t.timed(f) for t, f in zip(timed,
+                                                        self.find_next)],
+                            [t.timed(f) for t, f in zip(timed,
+                                                        self.find_anchor)])
+        if result is None:
+            self._count_fallback()
+            result = self.sequential(text, timed)
+        others = prof.clock() - start
+        for t in timed:
+            prof.add(t.stripper.name, t.elapsed, t.ntokens)
+            others -= t.elapsed
+        prof.add("crackers", others)
+        return result
+
+    def _walk(self, text, strippers, find_next, find_anchor):
+        """Return (residual text, tokens), or None if the result might
+        differ from running the strippers in order."""
+        inline = self.inline
+        kinds = range(len(strippers))
+        # Per stripper, the last search for a real start done:
+        # (searched from, match).
+        found = {}
+        def next_start(k, i, text=text):
+            # The first real start for stripper k at or after i.
+            if k in found:
+                frm, m = found[k]
+                if frm <= i and (m is None or i <= m.start()):
+                    return m
+            m = strippers[k].find_start(text, i)
+            found[k] = (i, m)
+            return m
+
+        # Per stripper, the next anchor (or, for inline strippers, the
+        # next start) at or after pos, or None.
+        nxt = [find(text) for find in find_next]
+        retained = []
+        matches = [[] for k in kinds]
+        # (start, end, stripper) of each section removed.
+        sections = []
+        pos = 0         # everything before this has been dealt with
+        while True:
+            k = None
+            for j in kinds:
+                if nxt[j] is not None and (k is None or
+                                           nxt[j].start() < p):
+                    k = j
+                    p = nxt[j].start()
+            if k is None:
+                break
+            if inline[k]:
+                # Runs of inline sections (typically URLs) are common, so
+                # deal with all of them up to the next candidate section
+                # of any other kind in one go.
+                q = len(text)
+                for j in kinds:
+                    if j != k and nxt[j] is not None and nxt[j].start() < q:
+                        q = nxt[j].start()
+                find = find_next[k]
+                m = nxt[k]
+                while m is not None and m.end() <= q:
+                    retained.append(text[pos:m.start()])
+                    matches[k].append(m)
+                    sections.append((m.start(), m.end(), k))
+                    pos = m.end()
+                    m = find(text, pos)
+                nxt[k] = m
+                if m is None or m.start() >= q:
+                    continue
+            else:
+                m = next_start(k, p)
+                if m is None or m.start() != p:
+                    # Only an anchor, not a real start.
+                    nxt[k] = find_next[k](text, p + 1)
+                    continue
+            p = m.start()
+            retained.append(text[pos:p])
+            matches[k].append(m)
+            if inline[k]:
+                # The section is just what the start matched.
+                pos = m.end()
+            else:
+                end = strippers[k].find_end(text, m.end())
+                if end is None:
+                    return None
+                pos = end.end()
+                inner = []
+                for j in kinds[:k]:
+                    if inline[j]:
+                        # Inline sections inside this one still
+                        # generate tokens.
+                        im = nxt[j]
+                        while im is not None and im.start() < pos:
+                            if im.end() > pos:
+                                return None
+                            inner.append(im)
+                            matches[j].append(im)
+                            sections.append((im.start(), im.end(), j))
+                            im = find_next[j](text, im.end())
+                        nxt[j] = im
+                if inner and not self._check_view(text, k, m, pos, inner,
+                                                  strippers, find_anchor):
+                    return None
+            sections.append((p, pos, k))
+            for j in kinds:
+                if nxt[j] is None or nxt[j].start() >= pos:
+                    continue
+                if j < k and not inline[j]:
+                    # An earlier stripper might have got here first.
+                    if j:
+                        return None
+                    sm = next_start(j, nxt[j].start())
+                    if sm is not None and sm.start() < pos:
+                        return None
+                nxt[j] = find_next[j](text, pos)
+        retained.append(text[pos:])
+
+        # Stripper k ran on the text with the sections of strippers
+        # before it removed, so if any of those removed anything, k might
+        # have seen starts that the original text doesn't have.
+        sections.sort()
+        removed = False
+        for k in kinds:
+            if removed and not self._check_glue(text, k, sections,
+                                                strippers, find_anchor):
+                return None
+            removed = removed or bool(matches[k])
+        text = ''.join(retained)
+
+        tokens = []
+        for stripper, stripper_matches in zip(strippers, matches):
+            for m in stripper_matches:
+                tokens.extend(stripper.tokenize(m))
+        return text, tokens
+
+    def _check_glue(self, text, k, sections, strippers, find_anchor):
+        """Check that no start of stripper k runs into a place where the
+        sections of the strippers before it were removed, in the text as
+        stripper k would see it."""
+        pieces = []
+        joins = []      # where the removals were, in the view
+        i = length = 0
+        for start, end, j in sections:
+            if j >= k or end <= i:
+                # Not removed yet, or inside a section already removed.
+                continue
+            piece = text[i:max(i, start)]
+            pieces.append(piece)
+            length += len(piece)
+            joins.append(length)
+            i = end
+        if not joins:
+            return True
+        pieces.append(text[i:])
+        view = ''.join(pieces)
+        find_start = strippers[k].find_start
+        find = find_anchor[k]
+        a = find(view)
+        while a is not None:
+            n = bisect.bisect_left(joins, a.start())
+            if n == len(joins):
+                break
+            m = find_start(view, a.start())
+            if m is not None and m.start() == a.start() and \
+               m.end() >= joins[n]:
+                return False
+            a = find(view, a.start() + 1)
+        return True
+
+    def _check_view(self, text, k, m, e, inner, strippers, find_anchor):
+        """Check that the section of stripper k from m.start() to e would
+        be the same once the inline sections inside it are removed."""
+        pieces = []
+        i = m.start()
+        for im in inner:
+            pieces.append(text[i:im.start()])
+            i = im.end()
+        pieces.append(text[i:e])
+        view = ''.join(pieces)
+        stripper = strippers[k]
+        vm = stripper.find_start(view, 0)
+        if vm is None or vm.start() != 0:
+            return False
+        end = stripper.find_end(view, vm.end())
+        if end is None or end.end() != len(view):
+            return False
+        # Strippers that run after an inline one see the view too.
+        for j in range(self.inline.index(True) + 1, k):
+            if not self.inline[j] and find_anchor[j](view):
+                return False
+        return True
+
+
+class _TimedStripper(object):
+    # Stands in for a stripper in CombinedStripper's walk when profiling,
+    # adding up the time its searches and tokenize() take, and the tokens
+    # it generates.
+    def __init__(self, stripper, clock):
+        self.stripper = stripper
+        self.clock = clock
+        self.inline = stripper.inline
+        self.elapsed = 0.0
+        self.ntokens = 0
+        self.find_start = self.timed(stripper.find_start)
+        self.find_end = self.timed(stripper.find_end)
+
+    def timed(self, func):
+        clock = self.clock
+        def timed_func(*args):
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                self.elapsed += clock() - start
+        return timed_func
+
+    def tokenize(self, m):
+        tokens = self.timed(self.stripper.tokenize)(m)
+        self.ntokens += len(tokens)
+        return tokens
+
+    def analyze(self, text):
+        text, tokens = self.timed(self.stripper.analyze)(text)
+        self.ntokens += len(tokens)
+        return text, tokens
+
+# The strippers tokenize_body() runs, in order.  These are the same
+# instances as the crack_* functions are bound to.
+crack_all = CombinedStripper([crack.im_self for crack in
+                              (crack_uuencode, crack_urls, crack_html_style,
+                               crack_html_comment, crack_noframes)]).analyze
+
 # Scan HTML for constructs often seen in viruses and worms.
 # <script  </script
 # <iframe  </iframe
@@ -1224,6 +1709,19 @@ breaking_entity_re = re.compile(r"""
     >
 """, re.VERBOSE)
 
+def strip_html_tags(text):
+    # Remove HTML/XML tags.  Also &nbsp;.  <br> and <p> tags should
+    # create a space too.
+    text = breaking_entity_re.sub(' ', text)
+    # It's important to eliminate HTML tags rather than, e.g.,
+    # replace them with a blank (as this code used to do), else
+    # simple tricks like
+    #    Wr<!$FS|i|R3$s80sA >inkle Reduc<!$FS|i|R3$s80sA >tion
+    # can be used to disguise words.  <br> and <p> were special-
+    # cased just above (because browsers break text on those,
+    # they can't be used to hide words effectively).
+    return html_re.sub('', text)
+
 class Tokenizer:
 
     date_hms_re = re.compile(r' (?P<hour>[0-9][0-9])'
@@ -1252,28 +1750,64 @@ class Tokenizer:
             self.basic_skip = [re.compile(s)
                                for s in options["Tokenizer",
                                                 "basic_header_skip"]]
+        tokenprofile.profiler.enabled = options["Tokenizer",
+                                                "x-profile_stages"]
 
     def get_message(self, obj):
         return get_message(obj)
 
     def tokenize(self, obj):
-        msg = self.get_message(obj)
+        # prof is a do-nothing NullProfile unless x-profile_stages is
+        # enabled; see tokenprofile.py.
+        prof = tokenprofile.profiler.begin()
+        timeout = options["Tokenizer", "x-lookup_ip_timeout"]
+        if timeout > 0:
+            lookups = DeferredLookups(timeout)
+        else:
+            lookups = None
+        msg = prof.call("get_message", self.get_message, obj)
+        index = prof.call("parts", PartIndex, msg)
 
-        for tok in self.tokenize_headers(msg):
+        try:
+            tokens = self._tokenize_message(msg, prof, index)
+            if lookups is not None:
+                tokens = lookups.collect(tokens)
+            for tok in tokens:
+                yield tok
+            if lookups is not None:
+                for tok in prof.wrap("lookups", lookups.tokens()):
+                    yield tok
+        finally:
+            # Record the message even if not all its tokens were wanted.
+            prof.finish()
+
+    def _tokenize_message(self, msg, prof, index):
+        for tok in self.tokenize_headers(msg, prof, index):
             yield tok
-        for tok in self.tokenize_body(msg):
+        for tok in self.tokenize_body(msg, prof, index):
             yield tok
 
-    def tokenize_headers(self, msg):
+    def tokenize_headers(self, msg, prof=tokenprofile.null_profile,
+                         index=None):
         # Special tagging of header lines and MIME metadata.
+        if index is None:
+            index = PartIndex(msg)
 
         # Content-{Type, Disposition} and their params, and charsets.
         # This is done for all MIME sections.
-        for x in msg.walk():
+        for w in prof.wrap("crack_content_xyz", self._crack_mime(index)):
+            yield w
+
+        # The rest is solely tokenization of header lines.
+        for w in prof.wrap("headers", self._tokenize_header_lines(msg)):
+            yield w
+
+    def _crack_mime(self, index):
+        for x in index.all:
             for w in crack_content_xyz(x):
                 yield w
 
-        # The rest is solely tokenization of header lines.
+    def _tokenize_header_lines(self, msg):
         # XXX The headers in my (Tim's) spam and ham corpora are so different
         # XXX (they came from different sources) that including several kinds
         # XXX of header analysis renders the classifier's job trivial.  So
@@ -1580,114 +2114,169 @@ class Tokenizer:
         if short_runs and options["Tokenizer", "x-short_runs"]:
             yield "short:%d" % int(log2(max(short_runs)))
 
-    def tokenize_body(self, msg):
+    def tokenize_body(self, msg, prof=tokenprofile.null_profile,
+                      index=None):
         """Generate a stream of tokens from an email Message.
 
         If options['Tokenizer', 'check_octets'] is True, the first few
         undecoded characters of application/octet-stream parts of the
         message body become tokens.
+
+        prof is the tokenprofile object each stage is routed through, and
+        index the message's PartIndex (one is made if it isn't given).
+
+        The x-max_part_bytes, x-max_message_bytes and x-max_body_tokens
+        options limit how much of a (huge) body is tokenized; tokens
+        starting with "truncated:" record that they cut something short.
         """
+        if index is None:
+            index = PartIndex(msg)
+        max_tokens = options["Tokenizer", "x-max_body_tokens"]
+        if not max_tokens:
+            for t in self._tokenize_body(index, prof):
+                yield t
+            return
+        n = 0
+        for t in self._tokenize_body(index, prof):
+            if n == max_tokens:
+                yield "truncated:tokens"
+                break
+            n += 1
+            yield t
 
+    def _tokenize_body(self, index, prof):
         if options["Tokenizer", "check_octets"]:
             # Find, decode application/octet-stream parts of the body,
             # tokenizing the first few characters of each chunk.
-            for part in octetparts(msg):
-                try:
-                    text = part.get_payload(decode=True)
-                except:
-                    yield "control: couldn't decode octet"
-                    text = part.get_payload(decode=False)
-
-                if text is None:
-                    yield "control: octet payload is None"
-                    continue
-
-                yield "octet:%s" % text[:options["Tokenizer",
-                                                 "octet_prefix_size"]]
+            for t in prof.wrap("octetparts", self._tokenize_octets(index)):
+                yield t
 
-        parts = imageparts(msg)
         if options["Tokenizer", "image_size"]:
             # Find image/* parts of the body, calculating the log(size) of
             # each image.
-
-            total_len = 0
-            for part in parts:
-                try:
-                    text = part.get_payload(decode=True)
-                except:
-                    yield "control: couldn't decode image"
-                    text = part.get_payload(decode=False)
-
-                total_len += len(text or "")
-                if text is None:
-                    yield "control: image payload is None"
-
-            if total_len:
-                yield "image-size:2**%d" % round(log2(total_len))
+            for t in prof.wrap("imageparts",
+                               self._tokenize_image_size(index)):
+                yield t
 
         if options["Tokenizer", "crack_images"]:
             engine_name = options["Tokenizer", 'ocr_engine']
             from spambayes.ImageStripper import crack_images
-            text, tokens = crack_images(engine_name, parts)
+            text, tokens = prof.call("crack_images", crack_images,
+                                     engine_name, index.image,
+                                     index.payload)
             for t in tokens:
                 yield t
-            for t in self.tokenize_text(text):
+            for t in prof.wrap("tokenize_text", self.tokenize_text(text)):
                 yield t
 
         # Find, decode (base64, qp), and tokenize textual parts of the body.
-        for part in textparts(msg):
+        part_limit = options["Tokenizer", "x-max_part_bytes"]
+        budget = options["Tokenizer", "x-max_message_bytes"]
+        used = 0
+        for part in index.text:
+            limit = part_limit
+            if budget:
+                if used >= budget:
+                    yield "truncated:message"
+                    break
+                if not limit or budget - used < limit:
+                    limit = budget - used
             # Decode, or take it as-is if decoding fails.
+            controls = []
+            text = prof.call("decode", self._decode_text_part, index, part,
+                             controls, limit)
+            for t in controls:
+                yield t
+            if text is None:
+                continue
+            used += len(text)
+
+            for t in prof.wrap("virus", find_html_virus_clues(text)):
+                yield "virus:%s" % t
+
+            # Get rid of uuencoded sections, embedded URLs, <style gimmicks,
+            # HTML comments and <noframes> sections, all in one go.
+            text, tokens = crack_all(text, prof)
+            for t in tokens:
+                yield t
+
+            text = prof.call("html_re", strip_html_tags, text)
+
+            for t in prof.wrap("tokenize_text", self.tokenize_text(text)):
+                yield t
+
+    def _tokenize_octets(self, index):
+        prefix_size = options["Tokenizer", "octet_prefix_size"]
+        for part in index.octet:
             try:
-                text = part.get_payload(decode=True)
+                text = index.prefix(part, prefix_size)
             except:
-                yield "control: couldn't decode"
+                yield "control: couldn't decode octet"
                 text = part.get_payload(decode=False)
-                if text is not None:
-                    text = try_to_repair_damaged_base64(text)
 
             if text is None:
-                yield 'control: payload is None'
+                yield "control: octet payload is None"
                 continue
 
-            # Replace numeric character entities (like &#97; for the letter
-            # 'a').
-            text = numeric_entity_re.sub(numeric_entity_replacer, text)
+            yield "octet:%s" % text[:prefix_size]
 
-            # Normalize case.
-            text = text.lower()
+    def _tokenize_image_size(self, index):
+        total_len = 0
+        for part in index.image:
+            try:
+                size = index.size(part)
+            except:
+                yield "control: couldn't decode image"
+                size = len(part.get_payload(decode=False) or "")
 
-            if options["Tokenizer", "replace_nonascii_chars"]:
-                # Replace high-bit chars and control chars with '?'.
-                text = text.translate(non_ascii_translate_tab)
+            if size is None:
+                yield "control: image payload is None"
+            else:
+                total_len += size
 
-            for t in find_html_virus_clues(text):
-                yield "virus:%s" % t
+        if total_len:
+            yield "image-size:2**%d" % round(log2(total_len))
 
-            # Get rid of uuencoded sections, embedded URLs, <style gimmicks,
-            # and HTML comments.
-            for cracker in (crack_uuencode,
-                            crack_urls,
-                            crack_html_style,
-                            crack_html_comment,
-                            crack_noframes):
-                text, tokens = cracker(text)
-                for t in tokens:
-                    yield t
-
-            # Remove HTML/XML tags.  Also &nbsp;.  <br> and <p> tags should
-            # create a space too.
-            text = breaking_entity_re.sub(' ', text)
-            # It's important to eliminate HTML tags rather than, e.g.,
-            # replace them with a blank (as this code used to do), else
-            # simple tricks like
-            #    Wr<!$FS|i|R3$s80sA >inkle Reduc<!$FS|i|R3$s80sA >tion
-            # can be used to disguise words.  <br> and <p> were special-
-            # cased just above (because browsers break text on those,
-            # they can't be used to hide words effectively).
-            text = html_re.sub('', text)
-
-            for t in self.tokenize_text(text):
-                yield t
+    def _decode_text_part(self, index, part, controls, limit=0):
+        """Return the decoded, case-normalized text of a text part, ready
+        for the crackers, or None if there is no payload.  Any control
+        tokens are appended to controls.  If limit is not zero, at most
+        that many bytes of the part are returned."""
+        try:
+            if limit:
+                text = index.prefix(part, limit + 1)
+            else:
+                text = index.payload(part)
+        except:
+            controls.append("control: couldn't decode")
+            text = part.get_payload(decode=False)
+            if text is not None:
+                text = try_to_repair_damaged_base64(text)
+
+        if text is None:
+            controls.append('control: payload is None')
+            return None
+
+        if limit and len(text) > limit:
+            text = text[:limit]
+            try:
+                size = index.size(part)
+            except:
+                size = len(part.get_payload())
+            controls.append("truncated:part-size:2**%d" %
+                            round(log2(max(size, limit + 1))))
+
+        # Replace numeric character entities (like &#97; for the letter
+        # 'a').
+        text = numeric_entity_re.sub(numeric_entity_replacer, text)
+
+        # Normalize case.
+        text = text.lower()
+
+        if options["Tokenizer", "replace_nonascii_chars"]:
+            # Replace high-bit chars and control chars with '?'.
+            text = text.translate(non_ascii_translate_tab)
+        return text
 
 # Mine NNTP-Posting-Host headers.  This is part of an effort to put some
 # SpamBayes smarts into the Mailman gate_news program.  On mail.python.org
@@ -1706,24 +2295,43 @@ def mine_nntp(msg):
         if received_nntp_ip_re.match(address):
             for clue in gen_dotted_quad_clues("nntp-host", [address]):
                 yield clue
-            names = cache.lookup(address)
-            if names:
-                yield 'nntp-host-ip:has-reverse'
-                yield 'nntp-host-name:%s' % names[0]
-                yield ('nntp-host-domain:%s' %
-                       '.'.join(names[0].split('.')[-2:]))
+            for clue in lookup_ip(address, "A", nntp_name_clues):
+                yield clue
         else:
             # assume it's a hostname
             name = address
             yield 'nntp-host-name:%s' % name
             yield ('nntp-host-domain:%s' %
                    '.'.join(name.split('.')[-2:]))
-            addresses = cache.lookup(name)
-            if addresses:
-                for clue in gen_dotted_quad_clues("nntp-host-ip", addresses):
-                    yield clue
-                if cache.lookup(addresses[0], qType="PTR") == name:
-                    yield 'nntp-host-ip:has-reverse'
+            for clue in lookup_ip(name, "A", NNTPAddressClues(name)):
+                yield clue
+
+def nntp_name_clues(names):
+    if names is dnscache.PENDING:
+        return ['nntp-host-ip:lookup pending']
+    if not names:
+        return []
+    return ['nntp-host-ip:has-reverse',
+            'nntp-host-name:%s' % names[0],
+            'nntp-host-domain:%s' % '.'.join(names[0].split('.')[-2:])]
+
+class NNTPAddressClues:
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, addresses):
+        if addresses is dnscache.PENDING:
+            return ['nntp-host-ip:lookup pending']
+        if not addresses:
+            return []
+        clues = list(gen_dotted_quad_clues("nntp-host-ip", addresses))
+        clues.extend(lookup_ip(addresses[0], "PTR", self.reverse_clues))
+        return clues
+
+    def reverse_clues(self, name):
+        if name == self.name:
+            return ['nntp-host-ip:has-reverse']
+        return []
 
 def gen_dotted_quad_clues(pfx, ips):
     for ip in ips:
@@ -1736,5 +2344,75 @@ def gen_dotted_quad_clues(pfx, ips):
                                   dottedQuadList[1],
                                   dottedQuadList[2])
 
+# x-lookup_ip and NNTP-Posting-Host lookups.  Ordinarily each is made
+# when the tokenizer comes across the host, and can hold up the message
+# for up to dnscache's dnsTimeout (ten seconds) per host.  If the
+# [Tokenizer] x-lookup_ip_timeout option is set, tokenize() instead
+# collects the message's lookups in a DeferredLookups object, makes them
+# all at the same time once the rest of the message has been tokenized,
+# and waits at most that long (from the start of the message) for the
+# answers.  Hosts that haven't been answered by then give "lookup
+# pending" tokens; their answers are cached when they arrive, so the
+# next message from the same place gets the real tokens.  The order of
+# the tokens changes, but not the tokens themselves.
+class DeferredLookups:
+    def __init__(self, timeout, clock=time.time):
+        self.clock = clock
+        self.deadline = clock() + timeout
+        self.requests = []
+
+    def add(self, question, qType, clues):
+        self.requests.append((question, qType, clues))
+
+    def collect(self, tokens):
+        """Generate the tokens from the iterator tokens, collecting the
+        lookups made while each is generated.  This is only the thread's
+        current DeferredLookups while tokens is being advanced, so
+        messages whose tokens are interleaved (in one thread or several)
+        each get their own lookups."""
+        tokens = iter(tokens)
+        while True:
+            outer = getattr(_lookups, "current", None)
+            _lookups.current = self
+            try:
+                try:
+                    tok = tokens.next()
+                except StopIteration:
+                    return
+            finally:
+                _lookups.current = outer
+            yield tok
+
+    def tokens(self):
+        # Generating clues can ask for more lookups (the reverse lookup
+        # of an NNTP host's address); those are made in another round,
+        # in whatever time is left.
+        while self.requests:
+            requests = self.requests
+            self.requests = []
+            remaining = max(0.0, self.deadline - self.clock())
+            answers = cache.lookup_many([(question, qType)
+                                         for question, qType, clues
+                                         in requests], remaining)
+            for question, qType, clues in requests:
+                for clue in clues(answers[question, qType.upper()]):
+                    yield clue
+
+# The DeferredLookups for the message being tokenized by this thread, if
+# x-lookup_ip_timeout is set.
+_lookups = threading.local()
+_lookups.current = None
+
+def lookup_ip(question, qType, clues):
+    """Return the clues for the answer to a DNS query, as generated by
+    calling clues(answer).  If lookups are being deferred, the query is
+    saved for later, and the clues are generated at the end of the
+    message instead."""
+    deferred = getattr(_lookups, "current", None)
+    if deferred is None:
+        return clues(cache.lookup(question, qType))
+    deferred.add(question, qType, clues)
+    return []
+
 global_tokenizer = Tokenizer()
 tokenize = global_tokenizer.tokenize
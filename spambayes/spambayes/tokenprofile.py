@@ -0,0 +1,227 @@
+#! /usr/bin/env python
+
+"""tokenprofile.py - per-stage tokenizer instrumentation.
+
+Classes:
+    MessageProfile - wall time and token counts for each stage of one
+                     message's tokenization.
+    NullProfile - a do-nothing stand-in used when profiling is disabled.
+    TokenizerProfiler - aggregates MessageProfiles into histograms.
+
+Abstract:
+
+    tokenizer.Tokenizer.tokenize() is a long chain of generators (MIME
+    header cracking, header mining, the various part extractors, the
+    crackers, tag stripping and finally tokenize_text()), so an ordinary
+    profiler has a hard time telling which stage is responsible for the
+    time spent on a particular message.  The tokenizer asks the global
+    `profiler` for a per-message profile object and routes each stage
+    through it.  When profiling is off (the default, controlled by the
+    [Tokenizer] x-profile_stages option), the profile object is a
+    NullProfile, whose methods simply hand back what they are given, so
+    the cost is a handful of function calls per message.
+
+    When profiling is on, each stage's wall time (in milliseconds) and
+    the number of tokens it generated are recorded for every message, and
+    collected into Histogram.Hist objects, one per stage.  These can be
+    displayed with utilities/tokprofile.py, and are shown on the
+    statistics page of the web interface.
+
+To Do:
+    o The raw data points are kept in memory (that's how Hist works), so
+      a long running proxy with profiling enabled will slowly grow.  Call
+      reset() (or restart) from time to time.
+    o Suggestions?
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import time
+import StringIO
+import threading
+
+from spambayes.Options import options
+from spambayes.Histogram import Hist
+
+# Stages in the order they are run by the tokenizer; anything else is
+# reported after these, alphabetically.
+STAGE_ORDER = ("get_message", "parts", "crack_content_xyz", "headers",
+               "octetparts", "imageparts", "crack_images", "decode",
+               "virus", "crackers", "crack_uuencode", "crack_urls",
+               "crack_html_style", "crack_html_comment", "crack_noframes",
+               "html_re", "tokenize_text", "lookups")
+
+class NullProfile(object):
+    """Stand-in for MessageProfile when profiling is disabled."""
+    active = False
+
+    def wrap(self, stage, iterable):
+        return iterable
+
+    def call(self, stage, func, *args):
+        return func(*args)
+
+    def crack(self, stage, cracker, text):
+        return cracker(text)
+
+    def finish(self):
+        pass
+
+null_profile = NullProfile()
+
+
+class MessageProfile(object):
+    """Time and token counts for each stage of a single message."""
+    active = True
+
+    def __init__(self, profiler, clock=time.time):
+        self.profiler = profiler
+        self.clock = clock
+        self.times = {}
+        self.tokens = {}
+
+    def add(self, stage, elapsed, ntokens=0):
+        self.times[stage] = self.times.get(stage, 0.0) + elapsed
+        self.tokens[stage] = self.tokens.get(stage, 0) + ntokens
+
+    def wrap(self, stage, iterable):
+        """Generate the items from iterable, charging the time spent
+        producing them (but not consuming them) to stage."""
+        clock = self.clock
+        it = iter(iterable)
+        elapsed = 0.0
+        count = 0
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = it.next()
+                except StopIteration:
+                    elapsed += clock() - start
+                    break
+                elapsed += clock() - start
+                count += 1
+                yield item
+        finally:
+            self.add(stage, elapsed, count)
+
+    def call(self, stage, func, *args):
+        start = self.clock()
+        try:
+            return func(*args)
+        finally:
+            self.add(stage, self.clock() - start)
+
+    def crack(self, stage, cracker, text):
+        """Run a (text, tokens) returning cracker, charging it to stage."""
+        start = self.clock()
+        text, tokens = cracker(text)
+        self.add(stage, self.clock() - start, len(tokens))
+        return text, tokens
+
+    def finish(self):
+        self.profiler.record(self)
+
+
+class TokenizerProfiler(object):
+    def __init__(self, enabled=False, nbuckets=20):
+        self.enabled = enabled
+        self.nbuckets = nbuckets
+        # Messages may be tokenized (and recorded) by several threads at
+        # once, and the histograms displayed by another.
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.num_messages = 0
+            self.time_hists = {}
+            self.token_hists = {}
+        finally:
+            self.lock.release()
+
+    def begin(self):
+        """Return the object the tokenizer should route its stages
+        through for the next message."""
+        if self.enabled:
+            return MessageProfile(self)
+        return null_profile
+
+    def record(self, profile):
+        self.lock.acquire()
+        try:
+            self.num_messages += 1
+            for stage, elapsed in profile.times.items():
+                if stage not in self.time_hists:
+                    self.time_hists[stage] = Hist(self.nbuckets, lo=0.0,
+                                                  hi=None)
+                    self.token_hists[stage] = Hist(self.nbuckets, lo=0.0,
+                                                   hi=None)
+                self.time_hists[stage].add(elapsed * 1000.0)
+                self.token_hists[stage].add(profile.tokens[stage])
+        finally:
+            self.lock.release()
+
+    def stages(self):
+        """Return the names of the recorded stages, in pipeline order."""
+        known = [s for s in STAGE_ORDER if s in self.time_hists]
+        others = [s for s in self.time_hists if s not in STAGE_ORDER]
+        others.sort()
+        return known + others
+
+    def summary(self):
+        """Return a list of (stage, messages, total ms, mean ms, max ms,
+        total tokens) tuples, in pipeline order."""
+        self.lock.acquire()
+        try:
+            rows = []
+            for stage in self.stages():
+                times = self.time_hists[stage]
+                times.compute_stats()
+                tokens = self.token_hists[stage]
+                total_tokens = 0
+                for n in tokens.data:
+                    total_tokens += n
+                total = 0.0
+                for ms in times.data:
+                    total += ms
+                rows.append((stage, times.n, total, times.mean, times.max,
+                             total_tokens))
+            return rows
+        finally:
+            self.lock.release()
+
+    def display(self, stream=None, nbuckets=None, histograms=True):
+        """Print a per-stage summary table and (optionally) the time and
+        token count histograms for each stage to stream (stdout if
+        None)."""
+        self.lock.acquire()
+        try:
+            print >> stream, "%d messages profiled" % (self.num_messages,)
+            print >> stream, "%-20s %8s %10s %9s %9s %9s" % \
+                  ("stage", "msgs", "total ms", "mean ms", "max ms",
+                   "tokens")
+            for row in self.summary():
+                print >> stream, "%-20s %8d %10.1f %9.3f %9.3f %9d" % row
+            if not histograms:
+                return
+            for stage in self.stages():
+                print >> stream
+                print >> stream, "-> <stat> %s: milliseconds per message" \
+                      % (stage,)
+                self.time_hists[stage].display(nbuckets, stream=stream)
+                print >> stream, "-> <stat> %s: tokens per message" % \
+                      (stage,)
+                self.token_hists[stage].display(nbuckets, stream=stream)
+        finally:
+            self.lock.release()
+
+    def as_text(self, nbuckets=None, histograms=True):
+        s = StringIO.StringIO()
+        self.display(s, nbuckets, histograms)
+        return s.getvalue()
+
+profiler = TokenizerProfiler(options["Tokenizer", "x-profile_stages"])
@@ -0,0 +1,215 @@
+"""urlslurp.py - support for the experimental [URLRetriever] options.
+
+Classes:
+    BadURLCache - the URLs that couldn't be slurped, and why.
+
+Functions:
+    fetch - retrieve the page at a URL.
+
+Abstract:
+
+    Classifier.slurp() used to keep the URLs that couldn't be retrieved in
+    tuples (one per reason), which were searched from end to end for every
+    URL, copied every time a URL was added, rewritten in full after every
+    message, and never expired.  BadURLCache keeps them in a dictionary,
+    each with an expiry time, and appends each new URL to a journal file as
+    soon as it is known; the file is rewritten (without the expired
+    entries) only when it is mostly dead wood.
+
+    fetch() does the network side of slurping a URL - resolving the name
+    and retrieving the page - and nothing else, so that Classifier can run
+    it in several threads at once.  Everything else (the caches and the
+    tokenizing) is left to the thread that called Classifier.slurp_many().
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import os
+import re
+import sys
+import time
+import socket
+import urllib2
+
+from spambayes.safepickle import pickle_read
+
+DOMAIN_AND_PORT_RE = re.compile(r"([^:/\\]+)(:([\d]+))?")
+HTTP_ERROR_RE = re.compile(r"HTTP Error ([\d]+)")
+
+# We're going to ignore everything that isn't text/html, so we might as
+# well not bother retrieving anything with these extensions.
+NON_HTML_EXTENSIONS = ('jpg', 'gif', 'png', 'css', 'js')
+
+def fetch(proto, url, timeout=5):
+    """Retrieve proto://url.
+
+    Returns a (token, page) pair.  If the page couldn't be retrieved,
+    token is the reason (url:non_resolving, url:non_html, url:http_XXX or
+    url:unknown_error) and page is None.  Otherwise token is None and page
+    is the headers and text of the page, as a string; page is also None
+    if there was a (probably temporary) error reading it.
+    """
+    # We check if the url will resolve first
+    mo = DOMAIN_AND_PORT_RE.match(url)
+    domain = mo.group(1)
+    if mo.group(3) is None:
+        port = 80
+    else:
+        port = mo.group(3)
+    try:
+        _unused = socket.getaddrinfo(domain, port)
+    except socket.error:
+        return "url:non_resolving", None
+
+    parts = url.split('.')
+    if parts[-1] in NON_HTML_EXTENSIONS:
+        return "url:non_html", None
+
+    try:
+        f = _urlopen("%s://%s" % (proto, url), timeout)
+    except (urllib2.URLError, socket.error), details:
+        mo = HTTP_ERROR_RE.match(str(details))
+        if mo:
+            return "url:http_" + mo.group(1), None
+        return "url:unknown_error", None
+
+    try:
+        # Anything that isn't text/html is ignored
+        content_type = f.info().get('content-type')
+        if content_type is None or \
+           not content_type.startswith("text/html"):
+            return "url:non_html", None
+
+        page = f.read()
+        headers = str(f.info())
+        f.close()
+    except socket.error:
+        # This is probably a temporary error, like a timeout.
+        return None, None
+    return None, headers + "\r\n" + page
+
+def _urlopen(url, timeout):
+    if sys.version_info >= (2, 6):
+        return urllib2.urlopen(url, timeout=timeout)
+    # Older versions can only change the timeout for every socket in the
+    # process, which isn't safe with other threads about, so the page
+    # may take as long as it likes (Classifier.slurp_many() won't wait
+    # past its deadline, though).
+    return urllib2.urlopen(url)
+
+
+class BadURLCache:
+    """URL -> the token for why it couldn't be slurped, for max_age
+    seconds.
+
+    The cache is kept in a journal file, one "expires<tab>token<tab>url"
+    line for each URL, appended when the URL is added.
+    """
+    def __init__(self, filename, max_age):
+        self.filename = filename
+        self.max_age = max_age
+        self.entries = {}
+        # Lines in the journal that are expired or superseded.
+        self.dead = 0
+        self.journal = None
+        self.load()
+
+    def load(self):
+        now = time.time()
+        self.entries = {}
+        self.dead = 0
+        if os.path.exists(self.filename):
+            for line in open(self.filename, "rb"):
+                try:
+                    expires, token, url = line.rstrip("\n").split("\t", 2)
+                    expires = float(expires)
+                except ValueError:
+                    # A line cut short by a crash, probably.
+                    self.dead += 1
+                    continue
+                if url in self.entries:
+                    self.dead += 1
+                if expires > now:
+                    self.entries[url] = (token, expires)
+                else:
+                    self.entries.pop(url, None)
+                    self.dead += 1
+        if self.dead > max(100, len(self.entries)):
+            self.compact()
+
+    def import_pickles(self, bad_url_name, http_error_name):
+        """Add the URLs from the pickles earlier versions kept, and rename
+        the pickles so that this only happens once."""
+        for name in (bad_url_name, http_error_name):
+            if not os.path.exists(name):
+                continue
+            try:
+                old = pickle_read(name)
+            except (IOError, ValueError):
+                old = {}
+            if name == bad_url_name:
+                for token, urls in old.items():
+                    for url in urls:
+                        self.add(url, token)
+            else:
+                for url, token in old.items():
+                    self.add(url, token)
+            os.rename(name, name + ".old")
+
+    def get(self, url, now=None):
+        """Return the token for url, or None if it isn't in the cache."""
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        if now is None:
+            now = time.time()
+        token, expires = entry
+        if expires <= now:
+            del self.entries[url]
+            self.dead += 1
+            return None
+        return token
+
+    def __contains__(self, url):
+        return self.get(url) is not None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, url, token, now=None):
+        if now is None:
+            now = time.time()
+        if url in self.entries:
+            self.dead += 1
+        expires = now + self.max_age
+        self.entries[url] = (token, expires)
+        if "\n" in url or "\t" in url:
+            # Can't be written to the journal; it'll have to be
+            # looked up again after a restart.
+            return
+        if self.journal is None:
+            self.journal = open(self.filename, "ab")
+        self.journal.write("%d\t%s\t%s\n" % (expires, token, url))
+        self.journal.flush()
+
+    def compact(self):
+        """Rewrite the journal with only the current entries."""
+        self.close()
+        tmp = self.filename + ".tmp"
+        f = open(tmp, "wb")
+        for url, (token, expires) in self.entries.items():
+            if "\n" not in url and "\t" not in url:
+                f.write("%d\t%s\t%s\n" % (expires, token, url))
+        f.close()
+        if os.path.exists(self.filename):
+            # Windows won't rename over an existing file.
+            os.remove(self.filename)
+        os.rename(tmp, self.filename)
+        self.dead = 0
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
@@ -133,7 +133,7 @@ static void init_socket_filename()
 static void process_argv(int argc,const char **argv)
 {
     int opt;
-    while(-1 != (opt = getopt(argc,argv,"hfgstGSd:p:o:a:A:k:y")))
+    while(-1 != (opt = getopt(argc,argv,"hfgstGSd:p:o:a:A:w:k:y")))
     {
         switch(opt)
         {
@@ -164,6 +164,10 @@ static void process_argv(int argc,const char **argv)
                 add_argv_to_server("-A");
                 add_argv_to_server(optarg);
                 break;
+            case 'w':
+                add_argv_to_server("-w");
+                add_argv_to_server(optarg);
+                break;
             case 'y':
                 add_argv_to_server("-y");
                 break;
@@ -0,0 +1,212 @@
+#! /usr/bin/env python
+"""bnload.py: Drive sb_bnserver with many sb_bnfilter clients at once.
+
+Usage: bnload.py [options]
+
+Trains a small pickle database on synthetic messages, then, for each
+number of workers, starts sb_bnserver with that -w option and has
+several clients at once send it messages to filter (and, if asked, to
+train on), in the same way as sb_bnfilter does.  For each run, the
+number of messages handled per second and the median and worst time a
+client waited for a response are printed.
+
+Options:
+    -c N
+        Number of clients.  Default is 8.
+
+    -n N
+        Number of messages each client sends.  Default is 25.
+
+    -k KBYTES
+        Size of each message.  Default is 20.
+
+    -t PERCENT
+        Percentage of the messages that are trained on (as ham or spam)
+        rather than filtered.  Default is 0.
+
+    -w SIZES
+        Comma separated list of worker counts.  Default is 1,2,4.
+"""
+
+import os
+import sys
+import time
+import errno
+import random
+import signal
+import socket
+import getopt
+import shutil
+import tempfile
+import threading
+
+from spambayes import storage
+from spambayes.tokenizer import tokenize
+
+WORDS = ("free offer viagra money click here unsubscribe now limited "
+         "time only the and of to a in is you that it for with on "
+         "meeting agenda minutes project report attached thanks regards "
+         "guaranteed winner account bank transfer million urgent").split()
+
+def usage(code, msg=''):
+    print >> sys.stderr, __doc__
+    if msg:
+        print >> sys.stderr, msg
+    sys.exit(code)
+
+def make_message(number, size, rand):
+    words = []
+    n = 0
+    while n < size:
+        word = rand.choice(WORDS) + rand.choice(["", "s", "ing", "ed"])
+        words.append(word)
+        n += len(word) + 1
+    lines = []
+    for i in range(0, len(words), 12):
+        lines.append(" ".join(words[i:i+12]))
+    return ("From: sender%d@example.com\nTo: recipient@example.org\n"
+            "Subject: Message number %d\n\n%s\n" %
+            (number, number, "\n".join(lines)))
+
+def make_database(filename, rand):
+    bayes = storage.PickledClassifier(filename)
+    for i in range(100):
+        bayes.learn(tokenize(make_message(i, 2000, rand)), i % 2)
+    bayes.store()
+    bayes.close()
+
+def server_script():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                        "scripts", "sb_bnserver.py")
+
+def start_server(database, filename, workers):
+    pid = os.fork()
+    if pid == 0:
+        # In a process group of its own, so that it and its workers can
+        # be stopped together.
+        os.setsid()
+        os.execv(sys.executable, [sys.executable, server_script(),
+                                  "-p", database, "-w", str(workers),
+                                  "-a", "60", "-A", "1000000", filename])
+        os._exit(1)
+    for i in range(100):
+        try:
+            request(filename, "-f", "Subject: are you there?\n\nHello.\n")
+        except socket.error, e:
+            if e[0] not in (errno.ENOENT, errno.ECONNREFUSED):
+                raise
+            time.sleep(0.1)
+        else:
+            return pid
+    raise RuntimeError("sb_bnserver didn't start")
+
+def stop_server(pid, filename):
+    os.killpg(pid, signal.SIGTERM)
+    os.waitpid(pid, 0)
+    try:
+        os.unlink(filename)
+    except OSError:
+        pass
+
+def request(filename, switches, message):
+    """Send one request, as sb_bnfilter does; return the time it took."""
+    start = time.time()
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(filename)
+    s.sendall(switches + "\n" + message)
+    s.shutdown(1)
+    f = s.makefile("rb")
+    error = int(f.readline())
+    size = int(f.readline())
+    response = f.read()
+    f.close()
+    s.close()
+    if error or len(response) != size:
+        raise RuntimeError("bad response: %r" % (response[:200],))
+    return time.time() - start
+
+def client(filename, messages, times, errors):
+    try:
+        for switches, message in messages:
+            times.append(request(filename, switches, message))
+    except:
+        errors.append(sys.exc_info()[1])
+
+def run(filename, work):
+    times = []
+    errors = []
+    threads = [threading.Thread(target=client,
+                                args=(filename, messages, times, errors))
+               for messages in work]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    if errors:
+        raise errors[0]
+    times.sort()
+    return len(times) / elapsed, times[len(times) // 2], times[-1]
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hc:n:k:t:w:')
+    except getopt.error, msg:
+        usage(1, msg)
+
+    nclients = 8
+    nmessages = 25
+    kbytes = 20
+    train = 0
+    sizes = [1, 2, 4]
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-c':
+            nclients = int(arg)
+        elif opt == '-n':
+            nmessages = int(arg)
+        elif opt == '-k':
+            kbytes = int(arg)
+        elif opt == '-t':
+            train = float(arg)
+        elif opt == '-w':
+            sizes = [int(s) for s in arg.split(',')]
+    if args:
+        usage(1, "Positional arguments not supported")
+
+    rand = random.Random(39)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        database = os.path.join(tmpdir, "bnload.db")
+        make_database(database, rand)
+        work = []
+        for i in range(nclients):
+            messages = []
+            for j in range(nmessages):
+                if rand.random() * 100 < train:
+                    switches = rand.choice(["-g", "-s"])
+                else:
+                    switches = "-f"
+                messages.append((switches, make_message(i * nmessages + j,
+                                                        kbytes * 1024,
+                                                        rand)))
+            work.append(messages)
+
+        print "%-8s %10s %9s %9s" % ("workers", "msgs/sec", "median",
+                                     "worst")
+        for workers in sizes:
+            filename = os.path.join(tmpdir, "sock-%d" % (workers,))
+            pid = start_server(database, filename, workers)
+            try:
+                rate, median, worst = run(filename, work)
+            finally:
+                stop_server(pid, filename)
+            print "%-8d %10.1f %8.3fs %8.3fs" % (workers, rate, median,
+                                                 worst)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    main()
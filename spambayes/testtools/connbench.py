@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+"""connbench.py: Time the POP3 proxy with many connections open at once.
+
+Usage: connbench.py [options]
+
+Runs sb_server's proxy in front of a stand-in POP3 server, opens a number
+of connections to it that sit idle (like mail clients that stay logged
+in), and has a few clients keep retrieving small messages through it.
+This is done with each of the given event loops (see the [globals]
+x-event_loop option) for each of the given numbers of idle connections,
+each in a process of its own.  For each run, the number of messages
+retrieved and the median, 95th percentile and worst time taken to
+retrieve one are printed.
+
+Everything runs in one process, so each idle connection uses four file
+descriptors (both ends of the client's connection to the proxy, and of
+the proxy's connection to the server).  "select" can't deal with file
+descriptors beyond FD_SETSIZE (usually 1024), so it fails at somewhat
+over 250 connections; that is reported, and the larger sizes are skipped.
+
+Options:
+    -a N
+        Number of clients retrieving messages.  Default is 4.
+
+    -n SIZES
+        Comma separated list of numbers of idle connections.  Default is
+        0,100,200,500,1000.
+
+    -e LOOPS
+        Comma separated list of event loops.  Default is all of select,
+        poll and epoll that are available.
+
+    -s SECONDS
+        How long each run lasts.  Default is 5.
+"""
+
+import os
+import sys
+import time
+import socket
+import getopt
+import shutil
+import tempfile
+import threading
+
+from spambayes.Options import options
+from spambayes import Dibbler
+from spambayes import asyncore
+
+# The stand-in server and the clients are the same as pop3bench's.
+import pop3bench
+from pop3bench import POP3Handler, free_port, client, make_large
+
+class POP3Server(pop3bench.POP3Server):
+    # Lots of connections arrive at once.
+    request_queue_size = socket.SOMAXCONN
+
+def usage(code, msg=''):
+    print >> sys.stderr, __doc__
+    if msg:
+        print >> sys.stderr, msg
+    sys.exit(code)
+
+def raise_file_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY:
+        hard = 65536
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def open_idle(port, proxy, count):
+    connections = []
+    for i in range(count):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.connect(("127.0.0.1", port))
+        connections.append(s)
+    # Wait until they're all connected through to the server.
+    for s in connections:
+        s.settimeout(1.0)
+        while True:
+            try:
+                s.recv(1024)
+                break
+            except socket.timeout:
+                if not proxy.isAlive():
+                    raise socket.error("the proxy has stopped")
+        s.settimeout(None)
+    return connections
+
+def run(port, proxy, nactive, seconds):
+    stop = threading.Event()
+    times = []
+    clients = []
+    for i in range(nactive):
+        # Message 1 is the large one; these only retrieve small ones.
+        thread = threading.Thread(target=client,
+                                  args=(port, i + 2, stop, times))
+        thread.setDaemon(True)
+        clients.append(thread)
+    for thread in clients:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in clients:
+        # If the proxy has died, the clients will wait for ever.
+        while thread.isAlive() and proxy.isAlive():
+            thread.join(0.5)
+    times.sort()
+    if not times:
+        times = [0.0]
+    return (len(times), times[len(times) // 2],
+            times[int(len(times) * 0.95)], times[-1])
+
+def bench(loop, nactive, size, seconds):
+    """Run the benchmark for one event loop and number of idle
+    connections, in this process.  Returns False if it fails."""
+    raise_file_limit()
+    tmpdir = tempfile.mkdtemp()
+    options["Storage", "persistent_use_database"] = "pickle"
+    options["Storage", "messageinfo_storage_file"] = \
+        os.path.join(tmpdir, "messageinfo.pickle")
+    options["Storage", "x-token_cache_size"] = 0
+    # Otherwise the proxy slows down as its cache grows, which would hide
+    # what this is measuring.
+    options["Storage", "cache_messages"] = False
+    options["globals", "verbose"] = False
+    # sb_server is in the scripts directory.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(
+        __file__)), "..", "scripts"))
+    import sb_server
+    try:
+        server = POP3Server(("127.0.0.1", 0), POP3Handler)
+        server.large = make_large(1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+
+        state = sb_server.state
+        state.isTest = True
+        state.createWorkers()
+        proxyPort = free_port()
+        sb_server.BayesProxyListener("127.0.0.1", server.server_address[1],
+                                     ("127.0.0.1", proxyPort))
+        proxy = threading.Thread(target=Dibbler.run,
+                                 kwargs={"eventLoop" : loop})
+        proxy.setDaemon(True)
+        proxy.start()
+
+        try:
+            idle = open_idle(proxyPort, proxy, size)
+        except socket.error, e:
+            print "%-8s %8d  failed: %s" % (loop, size, e)
+            return False
+        count, median, pc95, worst = run(proxyPort, proxy, nactive, seconds)
+        if not proxy.isAlive():
+            # The loop raised an exception, which will have been printed.
+            print "%-8s %8d  failed" % (loop, size)
+            return False
+        print "%-8s %8d %9d %8.4fs %8.4fs %8.4fs" % \
+              (loop, size, count, median, pc95, worst)
+        return True
+    finally:
+        shutil.rmtree(tmpdir)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'ha:n:e:s:')
+    except getopt.error, msg:
+        usage(1, msg)
+
+    nactive = 4
+    sizes = [0, 100, 200, 500, 1000]
+    loops = [loop for loop in ('select', 'poll', 'epoll')
+             if loop in asyncore.poll_functions]
+    seconds = 5.0
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-a':
+            nactive = int(arg)
+        elif opt == '-n':
+            sizes = [int(s) for s in arg.split(',')]
+        elif opt == '-e':
+            loops = arg.split(',')
+        elif opt == '-s':
+            seconds = float(arg)
+    if args:
+        usage(1, "Positional arguments not supported")
+
+    if len(loops) == 1 and len(sizes) == 1:
+        ok = bench(loops[0], nactive, sizes[0], seconds)
+        # Don't wait for the proxy, or anything else that's still running.
+        sys.stdout.flush()
+        os._exit(not ok)
+
+    print
+    print "%-8s %8s %9s %9s %9s %9s" % ("loop", "idle", "retrieved",
+          "median", "95%", "worst")
+    sys.stdout.flush()
+    # Each run gets a fresh process, so that one doesn't slow down the
+    # next (the proxy's message database grows as it goes), and one that
+    # fails doesn't leave anything behind.
+    for loop in loops:
+        for size in sizes:
+            command = [sys.executable, os.path.abspath(__file__),
+                       "-a", str(nactive), "-s", str(seconds),
+                       "-n", str(size), "-e", loop]
+            if os.spawnv(os.P_WAIT, sys.executable, command):
+                break
+
+if __name__ == "__main__":
+    main()
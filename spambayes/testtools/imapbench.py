@@ -0,0 +1,300 @@
+#! /usr/bin/env python
+"""imapbench.py: Time sb_imapfilter against a local IMAP server.
+
+Usage: imapbench.py [options]
+
+Runs a stand-in IMAP server holding a folder of synthetic messages, and
+trains on the folder (or, with -f, filters it) as sb_imapfilter does,
+first with the [imap] x-fetch_batch_size, x-body_batch_size and
+x-save_batch_size options at one (so that each message is fetched and
+saved with separate commands) and then with each of the given batch
+sizes.  For each run, the number of commands sent to the server, the
+time taken and the number of messages handled per second are printed.
+
+Options:
+    -n N
+        Number of messages in the folder.  Default is 1000.
+
+    -k KBYTES
+        Size of each message.  Default is 4.
+
+    -l MILLISECONDS
+        How long each response from the server takes to arrive, standing
+        in for the time a round trip to a real server takes.  Commands
+        that are sent without waiting for the previous response only pay
+        this once.  Default is 0.
+
+    -b SIZES
+        Comma separated list of batch sizes.  Default is 10,50,200.
+
+    -f
+        Filter the folder (so that every message is moved to the unsure
+        folder) rather than training on it.
+
+    -c CAPABILITIES
+        Comma separated list of extra capabilities (like LITERAL+) that
+        the server claims to have.
+"""
+
+import os
+import re
+import sys
+import time
+import Queue
+import random
+import socket
+import getopt
+import shutil
+import tempfile
+import threading
+import SocketServer
+
+from spambayes.Options import options
+from spambayes.classifier import Classifier
+from spambayes import Stats, message
+
+WORDS = ("free offer money click here unsubscribe now limited time only "
+         "the and of to a in is you that it for with on meeting agenda "
+         "minutes project report attached thanks regards").split()
+
+def usage(code, msg=''):
+    print >> sys.stderr, __doc__
+    if msg:
+        print >> sys.stderr, msg
+    sys.exit(code)
+
+def make_message(run, number, size, rand):
+    words = []
+    n = 0
+    while n < size:
+        word = rand.choice(WORDS)
+        words.append(word)
+        n += len(word) + 1
+    lines = []
+    for i in range(0, len(words), 12):
+        lines.append(" ".join(words[i:i+12]))
+    return ("From: sender%d@example.com\r\nTo: recipient@example.org\r\n"
+            "Subject: Message number %d\r\n"
+            "Message-ID: <run%d.%d@example.com>\r\n\r\n%s\r\n" %
+            (number, number, run, number, "\r\n".join(lines)))
+
+def expand(message_set, uids):
+    wanted = {}
+    for part in message_set.split(","):
+        if ":" in part:
+            start, end = part.split(":")
+            for uid in range(int(start), int(end) + 1):
+                wanted[uid] = True
+        else:
+            wanted[int(part)] = True
+    return [uid for uid in uids if uid in wanted]
+
+LITERAL_RE = re.compile(r"{(\d+)(\+?)}$")
+
+class IMAPHandler(SocketServer.StreamRequestHandler):
+    """An IMAP server that knows just enough for training on and filtering
+    a folder."""
+    def handle(self):
+        # Real servers do this too; without it, some responses wait for
+        # the client's delayed acknowledgement.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Responses are sent by another thread, after the latency has
+        # passed, so that commands that are sent together aren't each
+        # delayed in turn.
+        self.responses = Queue.Queue()
+        sender = threading.Thread(target=self.send_responses)
+        sender.setDaemon(True)
+        sender.start()
+        self.respond("* OK [CAPABILITY %s] ready\r\n" %
+                     (" ".join(["IMAP4REV1"] + self.server.capabilities),))
+        try:
+            self.handle_commands()
+        finally:
+            self.responses.put(None)
+            sender.join()
+
+    def respond(self, text):
+        self.responses.put((time.time() + self.server.latency, text))
+
+    def send_responses(self):
+        while True:
+            response = self.responses.get()
+            if response is None:
+                break
+            due, text = response
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.wfile.write(text)
+
+    def handle_commands(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            self.server.commands += 1
+            tag, command, args = (line.rstrip("\r\n").split(None, 2) +
+                                  [""])[:3]
+            command = command.upper()
+            if command == "UID":
+                command, args = args.split(None, 1)
+                command = command.upper()
+            messages = self.server.messages
+            uids = messages.keys()
+            uids.sort()
+            response = []
+            if command == "SELECT":
+                response.append("* %d EXISTS\r\n* 0 RECENT\r\n" %
+                                (len(uids),))
+            elif command == "NOOP":
+                # IMAPMessage.Save() waits for the server to mention the
+                # message it has just saved.
+                response.append("* 1 RECENT\r\n")
+            elif command == "SEARCH" and "HEADER" in args.upper():
+                # Save() looking for the message it has just saved, which
+                # isn't really kept in a folder.
+                response.append("* SEARCH %d\r\n" %
+                                (len(self.server.appended) + 1000000,))
+            elif command == "SEARCH":
+                response.append("* SEARCH %s\r\n" %
+                                (" ".join([str(uid) for uid in uids]),))
+            elif command == "FETCH":
+                message_set, items = args.split(None, 1)
+                for uid in expand(message_set, uids):
+                    text = messages[uid]
+                    if "FLAGS" in items:
+                        response.append('* %d FETCH (UID %d FLAGS (\\Seen) '
+                                        'INTERNALDATE "19-Oct-2006 12:00:00 '
+                                        '+0000")\r\n' %
+                                        (uids.index(uid) + 1, uid))
+                        continue
+                    if "RFC822.HEADER" in items:
+                        text = text.split("\r\n\r\n", 1)[0] + "\r\n\r\n"
+                        name = "RFC822.HEADER"
+                    else:
+                        name = "BODY[]"
+                    response.append("* %d FETCH (UID %d %s {%d}\r\n%s)\r\n" %
+                                    (uids.index(uid) + 1, uid, name,
+                                     len(text), text))
+            elif command == "APPEND":
+                mo = LITERAL_RE.search(args)
+                if not mo.group(2):
+                    self.respond("+ go ahead\r\n")
+                self.server.appended.append(self.rfile.read(int(mo.group(1))))
+                # The end of the command.
+                self.rfile.readline()
+            elif command == "LOGOUT":
+                response.append("* BYE\r\n")
+            response.append("%s OK %s completed\r\n" % (tag, command))
+            self.respond("".join(response))
+            if command == "LOGOUT":
+                break
+
+class IMAPServer(SocketServer.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class MemoryMessageInfo(message.MessageInfoPickle):
+    """Message information that is only kept in memory.
+
+    A pickle is rewritten each time a message is trained on, which would
+    swamp the time spent talking to the server (a dbm database doesn't
+    have this problem)."""
+    def store(self):
+        pass
+
+def run(server, tmpdir, run_number, nmessages, kbytes, size, filter):
+    from sb_imapfilter import IMAPSession, IMAPFolder
+
+    message.Message().message_info_db = MemoryMessageInfo(
+        os.path.join(tmpdir, "messageinfo%d.pickle" % (run_number,)))
+    rand = random.Random(42)
+    server.messages = {}
+    for i in range(nmessages):
+        server.messages[i + 1] = make_message(run_number, i, kbytes * 1024,
+                                              rand)
+    options["imap", "x-fetch_batch_size"] = size
+    options["imap", "x-body_batch_size"] = size
+    options["imap", "x-save_batch_size"] = size
+    session = IMAPSession("127.0.0.1:%d" % (server.server_address[1],))
+    session.login("user", "password")
+    stats = Stats.Stats(options, message.Message().message_info_db)
+    folder = IMAPFolder("INBOX", session, stats)
+    server.commands = 0
+    server.appended = []
+    start = time.time()
+    if filter:
+        count = folder.Filter(Classifier(),
+                              IMAPFolder("spam", session, stats),
+                              IMAPFolder("unsure", session, stats), None)
+        handled = count["ham"] + count["spam"] + count["unsure"]
+    else:
+        handled = folder.Train(Classifier(), True)
+    elapsed = time.time() - start
+    commands = server.commands
+    session.logout()
+    return commands, handled, elapsed
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:k:l:b:fc:')
+    except getopt.error, msg:
+        usage(1, msg)
+
+    nmessages = 1000
+    kbytes = 4
+    latency = 0.0
+    sizes = [10, 50, 200]
+    filter = False
+    capabilities = []
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            nmessages = int(arg)
+        elif opt == '-k':
+            kbytes = int(arg)
+        elif opt == '-l':
+            latency = float(arg) / 1000
+        elif opt == '-b':
+            sizes = [int(s) for s in arg.split(',')]
+        elif opt == '-f':
+            filter = True
+        elif opt == '-c':
+            capabilities = arg.upper().split(',')
+    if args:
+        usage(1, "Positional arguments not supported")
+
+    tmpdir = tempfile.mkdtemp()
+    options["globals", "verbose"] = False
+    # sb_imapfilter is in the scripts directory.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(
+        __file__)), "..", "scripts"))
+    try:
+        server = IMAPServer(("127.0.0.1", 0), IMAPHandler)
+        server.latency = latency
+        server.capabilities = capabilities
+        server.commands = 0
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+
+        if filter:
+            action = "filtered"
+        else:
+            action = "trained"
+        print "%-10s %9s %9s %9s %10s" % ("batch", "commands", action,
+                                          "time", "msgs/sec")
+        for run_number, size in enumerate([1] + sizes):
+            # Each run has different Message-IDs, so that none of the
+            # messages are remembered as already trained.
+            commands, handled, elapsed = run(server, tmpdir, run_number,
+                                             nmessages, kbytes, size, filter)
+            print "%-10d %9d %9d %8.2fs %10.1f" % (size, commands, handled,
+                                                   elapsed,
+                                                   handled / elapsed)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+"""ocrbench.py: Time OCRing messages' images with different pool sizes.
+
+Usage: ocrbench.py [options]
+
+Makes up a stream of messages, each with several images, some of which
+turn up in more than one message, and times ImageStripper's OCR of them,
+first one image at a time, then with the [Tokenizer] x-ocr_workers pool
+at each size.  A stub OCR program (which just sleeps, then prints some
+text) stands in for ocrad or gocr, so neither they nor PIL are needed.
+For each run, the total time, the slowest message and the number of
+messages that got "ocr timeout" tokens are printed.
+
+Options:
+    -n N
+        Number of messages.  Default is 20.
+
+    -i N
+        Number of images in each message.  Default is 6.
+
+    -d N
+        Number of different images to choose from.  Default is 60.
+
+    -s SECONDS
+        How long the stub OCR program takes on each image.  Default is
+        0.2.
+
+    -w SIZES
+        Comma separated list of pool sizes.  Default is 2,4,8.
+
+    -t SECONDS
+        x-ocr_message_timeout to use with the pool.  Default is 0 (no
+        limit).
+"""
+
+import os
+import sys
+import time
+import random
+import getopt
+import tempfile
+
+from spambayes.Options import options
+from spambayes import ImageStripper
+
+STUB_OCR = """import sys, time
+f = open(sys.argv[1])
+delay = float(f.readline())
+time.sleep(delay)
+sys.stdout.write(f.read())
+"""
+
+class StubEngine(ImageStripper.OCRExecutableEngine):
+    engine_name = "stub"
+
+    def __init__(self, script):
+        ImageStripper.OCRExecutableEngine.__init__(self)
+        self._program = script
+
+    def get_command_line(self, pnmfile):
+        return '"%s" "%s" "%s"' % (sys.executable, self.program, pnmfile)
+
+    def get_args(self, pnmfile):
+        return [sys.executable, self.program, pnmfile]
+
+def usage(code, msg=''):
+    print >> sys.stderr, __doc__
+    if msg:
+        print >> sys.stderr, msg
+    sys.exit(code)
+
+def make_image(delay, text):
+    fd, name = tempfile.mkstemp("-spambayes-image")
+    os.write(fd, "%s\n%s" % (delay, text))
+    os.close(fd)
+    return name
+
+def run(engine, messages, delay, workers, message_timeout):
+    options["Tokenizer", "x-ocr_workers"] = workers
+    options["Tokenizer", "x-ocr_message_timeout"] = message_timeout
+    stripper = ImageStripper.ImageStripper()
+    stripper.engine = engine
+    slowest = 0.0
+    timeouts = 0
+    start = time.time()
+    for images in messages:
+        files = [make_image(delay, "image number %d\nsome text" % (i,))
+                 for i in images]
+        begin = time.time()
+        text, tokens = stripper.extract_ocr_info(files)
+        slowest = max(slowest, time.time() - begin)
+        if "image-text:ocr timeout" in tokens:
+            timeouts += 1
+    elapsed = time.time() - start
+    # Let any OCR left running finish, so its files are cleaned up.
+    for job in stripper.inflight.values():
+        job.done.wait()
+    if stripper.pool is not None:
+        stripper.collect()
+    return elapsed, slowest, timeouts
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:i:d:s:w:t:')
+    except getopt.error, msg:
+        usage(1, msg)
+
+    nmessages = 20
+    nimages = 6
+    ndistinct = 60
+    delay = 0.2
+    sizes = [2, 4, 8]
+    message_timeout = 0.0
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            nmessages = int(arg)
+        elif opt == '-i':
+            nimages = int(arg)
+        elif opt == '-d':
+            ndistinct = int(arg)
+        elif opt == '-s':
+            delay = float(arg)
+        elif opt == '-w':
+            sizes = [int(s) for s in arg.split(',')]
+        elif opt == '-t':
+            message_timeout = float(arg)
+    if args:
+        usage(1, "Positional arguments not supported")
+
+    rand = random.Random(33)
+    messages = [[rand.randrange(ndistinct) for j in range(nimages)]
+                for i in range(nmessages)]
+
+    fd, script = tempfile.mkstemp(".py")
+    os.write(fd, STUB_OCR)
+    os.close(fd)
+    engine = StubEngine(script)
+    try:
+        print "%-10s %9s %9s %9s" % ("workers", "total", "slowest",
+                                     "timeouts")
+        for workers in [1] + sizes:
+            if workers == 1:
+                total, slowest, timeouts = run(engine, messages, delay, 1,
+                                               0.0)
+                label = "serial"
+            else:
+                total, slowest, timeouts = run(engine, messages, delay,
+                                               workers, message_timeout)
+                label = str(workers)
+            print "%-10s %8.2fs %8.2fs %9d" % (label, total, slowest,
+                                               timeouts)
+    finally:
+        os.remove(script)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#! /usr/bin/env python
+"""pop3bench.py: Time the POP3 proxy's responses to concurrent clients.
+
+Usage: pop3bench.py [options]
+
+Runs sb_server's proxy in front of a stand-in POP3 server, and several
+clients at once: one that keeps retrieving a large message and some that
+keep retrieving small ones.  Tokenizing the large message also waits for
+a while, standing in for slow DNS lookups or OCR.  This is done with the
+[pop3proxy] x-tokenizer_threads option at zero (so everything is done in
+the proxy's one asyncore thread) and then at each of the given sizes.
+For each run, the number of small messages retrieved and the median, 95th
+percentile and worst time taken to retrieve one are printed, along with
+the number of large messages retrieved and the average time each took.
+
+Options:
+    -c N
+        Number of clients retrieving small messages.  Default is 4.
+
+    -k KBYTES
+        Size of the large message.  Default is 200.
+
+    -d SECONDS
+        How long tokenizing the large message waits.  Default is 1.
+
+    -s SECONDS
+        How long each run lasts.  Default is 10.
+
+    -w SIZES
+        Comma separated list of thread counts.  Default is 1,2,4.
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import getopt
+import shutil
+import tempfile
+import threading
+import SocketServer
+
+from spambayes.Options import options
+from spambayes import Dibbler
+
+SMALL = """From: someone@example.com
+To: someone.else@example.org
+Subject: Message number %d
+
+Hello there, this is message number %d.  Nothing much to see here.
+"""
+
+def usage(code, msg=''):
+    print >> sys.stderr, __doc__
+    if msg:
+        print >> sys.stderr, msg
+    sys.exit(code)
+
+def make_large(kbytes):
+    rand = random.Random(36)
+    words = ["".join([rand.choice("abcdefghijklmnopqrstuvwxyz")
+                      for i in range(rand.randrange(3, 10))])
+             for j in range(5000)]
+    lines = []
+    size = 0
+    while size < kbytes * 1024:
+        line = " ".join([rand.choice(words) for i in range(10)])
+        lines.append(line)
+        size += len(line) + 2
+    return SMALL % (0, 0) + "\n".join(lines) + "\n"
+
+class POP3Handler(SocketServer.StreamRequestHandler):
+    """A POP3 server that only knows RETR; message 1 is the large one."""
+    def handle(self):
+        self.wfile.write("+OK ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            words = line.split()
+            command = words and words[0].upper()
+            if command == "RETR":
+                number = int(words[1])
+                if number == 1:
+                    text = self.server.large
+                else:
+                    text = SMALL % (number, number)
+                lines = []
+                for line in text.split("\n"):
+                    if line.startswith("."):
+                        line = "." + line
+                    lines.append(line)
+                self.wfile.write("+OK\r\n%s\r\n.\r\n" % ("\r\n".join(lines),))
+            elif command == "QUIT":
+                self.wfile.write("+OK bye\r\n")
+                break
+            else:
+                self.wfile.write("+OK\r\n")
+
+class POP3Server(SocketServer.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def client(port, number, stop, times):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.connect(("127.0.0.1", port))
+    f = s.makefile("rb")
+    f.readline()
+    while not stop.isSet():
+        start = time.time()
+        s.sendall("RETR %d\r\n" % (number,))
+        while f.readline() != ".\r\n":
+            pass
+        times.append(time.time() - start)
+    s.sendall("QUIT\r\n")
+    f.readline()
+    s.close()
+
+def slow_tokenize(tokenize, delay):
+    def slow(proxy, stream):
+        if stream.size > 10000:
+            time.sleep(delay)
+        return tokenize(proxy, stream)
+    return slow
+
+def run(port, threads, nclients, seconds):
+    import sb_server
+    state = sb_server.state
+    if state.tokenizerPool is not None:
+        state.tokenizerPool.close()
+        state.tokenizerPool = None
+    if threads:
+        state.tokenizerPool = Dibbler.WorkerPool(threads)
+    stop = threading.Event()
+    large = []
+    small = []
+    clients = [threading.Thread(target=client,
+                                args=(port, 1, stop, large))]
+    for i in range(nclients):
+        clients.append(threading.Thread(target=client,
+                                        args=(port, i + 2, stop, small)))
+    for thread in clients:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in clients:
+        thread.join()
+    small.sort()
+    if not small:
+        small = [0.0]
+    if large:
+        mean = sum(large) / len(large)
+    else:
+        mean = 0.0
+    return (len(small), small[len(small) // 2],
+            small[int(len(small) * 0.95)], small[-1], len(large), mean)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hc:k:d:s:w:')
+    except getopt.error, msg:
+        usage(1, msg)
+
+    nclients = 4
+    kbytes = 200
+    delay = 1.0
+    seconds = 10.0
+    sizes = [1, 2, 4]
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-c':
+            nclients = int(arg)
+        elif opt == '-k':
+            kbytes = int(arg)
+        elif opt == '-d':
+            delay = float(arg)
+        elif opt == '-s':
+            seconds = float(arg)
+        elif opt == '-w':
+            sizes = [int(s) for s in arg.split(',')]
+    if args:
+        usage(1, "Positional arguments not supported")
+
+    tmpdir = tempfile.mkdtemp()
+    options["Storage", "persistent_use_database"] = "pickle"
+    options["Storage", "messageinfo_storage_file"] = \
+        os.path.join(tmpdir, "messageinfo.pickle")
+    options["Storage", "x-token_cache_size"] = 0
+    options["globals", "verbose"] = False
+    # sb_server is in the scripts directory.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(
+        __file__)), "..", "scripts"))
+    import sb_server
+    sb_server.BayesProxy.tokenize = \
+        slow_tokenize(sb_server.BayesProxy.tokenize.im_func, delay)
+    try:
+        server = POP3Server(("127.0.0.1", 0), POP3Handler)
+        server.large = make_large(kbytes)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+
+        state = sb_server.state
+        state.isTest = True
+        state.createWorkers()
+        proxyPort = free_port()
+        sb_server.BayesProxyListener("127.0.0.1", server.server_address[1],
+                                     ("127.0.0.1", proxyPort))
+        thread = threading.Thread(target=Dibbler.run)
+        thread.setDaemon(True)
+        thread.start()
+
+        print
+        print "%-10s %8s %9s %9s %9s %8s %9s" % ("threads", "small",
+              "median", "95%", "worst", "large", "each")
+        for threads in [0] + sizes:
+            count, median, pc95, worst, nlarge, mean = \
+                   run(proxyPort, threads, nclients, seconds)
+            print "%-10s %8d %8.3fs %8.3fs %8.3fs %8d %8.3fs" % \
+                  (threads or "inline", count, median, pc95, worst,
+                   nlarge, mean)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    main()
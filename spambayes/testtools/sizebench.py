@@ -0,0 +1,140 @@
+#! /usr/bin/env python
+"""sizebench.py: Time tokenizing messages of increasing size.
+
+Usage: sizebench.py [options]
+
+Builds synthetic messages (a short text/plain part and a big base64
+encoded text/html part, plus an image attachment of the same size) of
+each size, and prints how long tokenizing each takes, first with no
+limits, then with the [Tokenizer] x-max_part_bytes, x-max_message_bytes
+and x-max_body_tokens limits set.  The time taken just to parse each
+message (which the limits can't help with) is shown too.
+
+Options:
+    -s SIZES
+        Comma separated list of body sizes, in kilobytes.  Default is
+        10,100,1000,4000.
+
+    -n N
+        Number of times to tokenize each message; the best time is
+        reported.  Default is 3.
+
+    -p BYTES
+        x-max_part_bytes to use for the limited runs.  Default is 65536.
+
+    -m BYTES
+        x-max_message_bytes to use for the limited runs.  Default is
+        131072.
+
+    -t TOKENS
+        x-max_body_tokens to use for the limited runs.  Default is 20000.
+"""
+
+import sys
+import time
+import random
+import getopt
+
+from email.MIMEMultipart import MIMEMultipart
+from email.MIMEText import MIMEText
+from email.MIMEImage import MIMEImage
+
+from spambayes.Options import options
+from spambayes.tokenizer import tokenize
+from spambayes.mboxutils import get_message
+
+def usage(code, msg=''):
+    print >> sys.stderr, __doc__
+    if msg:
+        print >> sys.stderr, msg
+    sys.exit(code)
+
+WORDS = ("free offer viagra money click here unsubscribe now limited "
+         "time only the and of to a in is you that it for with on "
+         "guaranteed winner account bank transfer million urgent").split()
+
+def make_message(size, rand):
+    words = []
+    n = 0
+    while n < size:
+        if rand.random() < 0.02:
+            word = '<a href="http://www.example%d.com/x">link</a>' % \
+                   rand.randrange(1000)
+        else:
+            word = rand.choice(WORDS)
+        words.append(word)
+        n += len(word) + 1
+    html = "<html><body><p>%s</p></body></html>" % (" ".join(words),)
+    msg = MIMEMultipart()
+    msg["Subject"] = "Test message of %d bytes" % (size,)
+    msg["From"] = "sender@example.com"
+    msg["To"] = "recipient@example.com"
+    msg.attach(MIMEText("A short covering note.\n"))
+    msg.attach(MIMEText(html, "html", "iso-8859-1"))
+    msg.attach(MIMEImage("GIF89a" + "\0" * size, "gif"))
+    return msg.as_string()
+
+def best_time(func, text, n):
+    best = None
+    for i in range(n):
+        start = time.time()
+        result = func(text)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def count_tokens(text):
+    return len(list(tokenize(text)))
+
+def set_limits(part_bytes, message_bytes, body_tokens):
+    options["Tokenizer", "x-max_part_bytes"] = part_bytes
+    options["Tokenizer", "x-max_message_bytes"] = message_bytes
+    options["Tokenizer", "x-max_body_tokens"] = body_tokens
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hs:n:p:m:t:')
+    except getopt.error, msg:
+        usage(1, msg)
+
+    sizes = [10, 100, 1000, 4000]
+    n = 3
+    limits = [65536, 131072, 20000]
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-s':
+            sizes = [int(s) for s in arg.split(',')]
+        elif opt == '-n':
+            n = int(arg)
+        elif opt == '-p':
+            limits[0] = int(arg)
+        elif opt == '-m':
+            limits[1] = int(arg)
+        elif opt == '-t':
+            limits[2] = int(arg)
+    if args:
+        usage(1, "Positional arguments not supported")
+
+    options["Tokenizer", "image_size"] = True
+    options["Tokenizer", "check_octets"] = True
+    rand = random.Random(101)
+    print "%8s %10s  %9s  %9s %8s  %9s %8s" % ("size KB", "msg bytes",
+                                               "parse", "no limit",
+                                               "tokens", "limited",
+                                               "tokens")
+    for size in sizes:
+        text = make_message(size * 1024, rand)
+        parse = best_time(get_message, text, n)[0]
+        set_limits(0, 0, 0)
+        full, full_tokens = best_time(count_tokens, text, n)
+        set_limits(*limits)
+        limited, limited_tokens = best_time(count_tokens, text, n)
+        print "%8d %10d  %8.3fs  %8.3fs %8d  %8.3fs %8d" % \
+              (size, len(text), parse, full, full_tokens, limited,
+               limited_tokens)
+    set_limits(0, 0, 0)
+
+if __name__ == "__main__":
+    main()
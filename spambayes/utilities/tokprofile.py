@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+
+"""Profile the stages of the tokenizer over one or more mailboxes.
+
+Usage: %(program)s [-h] [-n nbuckets] [-s] [-o section:option:value] path ...
+
+Every message in each path (anything mboxutils.getmbox() understands) is
+tokenized with per-stage profiling enabled, then the time and token count
+summary for each tokenizer stage is printed, followed by histograms of
+milliseconds and tokens per message for each stage.
+
+Options:
+    -h
+        Print this help message and exit.
+    -n nbuckets
+        Number of histogram buckets to display (default 20).
+    -s
+        Print only the summary table, not the histograms.
+    -o section:option:value
+        Set [section, option] in the options database to value.
+"""
+
+import sys
+import getopt
+
+from spambayes.Options import options
+from spambayes import mboxutils
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    print >> sys.stderr, __doc__ % globals()
+    if msg:
+        print >> sys.stderr, msg
+    sys.exit(code)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:so:',
+                                   ['help', 'option='])
+    except getopt.error, msg:
+        usage(1, msg)
+
+    nbuckets = 20
+    histograms = True
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt == '-n':
+            nbuckets = int(arg)
+        elif opt == '-s':
+            histograms = False
+        elif opt in ('-o', '--option'):
+            options.set_from_cmdline(arg, sys.stderr)
+    if not args:
+        usage(1, "No mailboxes given.")
+
+    # Import these after the options are set, since the tokenizer reads
+    # some of them at import time.
+    from spambayes import tokenprofile
+    from spambayes.tokenizer import tokenize
+
+    profiler = tokenprofile.profiler
+    profiler.enabled = True
+    for path in args:
+        for msg in mboxutils.getmbox(path):
+            for tok in tokenize(msg):
+                pass
+    profiler.display(nbuckets=nbuckets, histograms=histograms)
+
+if __name__ == '__main__':
+    main()